@@ -9,19 +9,45 @@ import os
 import sys
 import json
 import time
+import queue
 import logging
+import threading
+from collections import OrderedDict
 import base64
 import random
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Tuple, Any
 import requests
-import mysql.connector
-from mysql.connector import Error
 from urllib.parse import urlencode
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# 存储后端（MySQL / SQLite），与本文件同目录
+from storage import Error, connect_storage, translate_schema
+
+# listing 切片规划器（zhang/listing_planner.py，仅依赖标准库）
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zhang'))
+try:
+    from listing_planner import format_time, plan_time_slices
+    LISTING_PLANNER_AVAILABLE = True
+except ImportError:
+    LISTING_PLANNER_AVAILABLE = False
+
+# 时间序列压缩编码（alpha_timeseries 表）
+from timeseries_codec import decode_series, encode_series
+
+# 模版/算子/数据字段提取（alphas 表代码解析字段、template_performance 汇总表）
+from template_extractor import template_columns
+
+# 令牌桶限流器（zhang/brain_transport.py），替代翻页之间的固定 sleep
+try:
+    from brain_transport import RateLimiter
+    RATE_LIMITER_AVAILABLE = True
+except ImportError:
+    RATE_LIMITER_AVAILABLE = False
+
 # 尝试导入公共session管理器（可选，不影响现有功能）
 try:
     from common.session_manager import get_shared_session
@@ -44,6 +70,72 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 增量爬取任务类型（crawl_status.task_type），水位线保存在 task_params
+INCREMENTAL_TASK_TYPE = 'alpha_incremental'
+# 平台时间（美东 -04:00）
+BRAIN_TZ = timezone(timedelta(hours=-4))
+
+
+def parse_api_time(value: str) -> datetime:
+    """API 返回的 '2025-08-28T03:04:05-04:00' -> 带时区的 datetime"""
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=BRAIN_TZ)
+
+
+def _quantile(sorted_values: List[float], q: float) -> Optional[float]:
+    """线性插值分位数（sorted_values 已升序）"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _passed_checks(checks) -> bool:
+    """checks 非空且没有 FAIL 视为通过"""
+    checks = json.loads(checks) if isinstance(checks, (str, bytes, bytearray)) else checks
+    return bool(checks) and not any(check.get('result') == 'FAIL' for check in checks)
+
+
+def accumulate_template_delta(deltas: Dict, row: tuple, sign: int) -> None:
+    """
+    把一行Alpha对其 (模版, 区域, 股票池) 分组的贡献累加到 deltas（sign=-1 撤销旧贡献）
+
+    Args:
+        row: (template_hash, region, universe, template_expression, sharpe, fitness, checks_json, date_created)
+    """
+    template_hash, region, universe, template_expression, sharpe, fitness, checks, date_created = row
+    if not template_hash:
+        return
+    delta = deltas.setdefault((template_hash, region or '', universe or ''), {
+        'template_expression': None, 'alpha_count': 0, 'pass_count': 0,
+        'sharpe_sum': 0.0, 'sharpe_n': 0, 'fitness_sum': 0.0, 'fitness_n': 0, 'last_seen': None})
+    delta['alpha_count'] += sign
+    delta['pass_count'] += sign if _passed_checks(checks) else 0
+    if sharpe is not None:
+        delta['sharpe_sum'] += sign * float(sharpe)
+        delta['sharpe_n'] += sign
+    if fitness is not None:
+        delta['fitness_sum'] += sign * float(fitness)
+        delta['fitness_n'] += sign
+    if sign > 0:
+        delta['template_expression'] = template_expression or delta['template_expression']
+        if date_created is not None and (delta['last_seen'] is None or date_created > delta['last_seen']):
+            delta['last_seen'] = date_created
+
+
+TEMPLATE_DELTA_COLUMNS = ('template_expression', 'alpha_count', 'pass_count',
+                          'sharpe_sum', 'sharpe_n', 'fitness_sum', 'fitness_n', 'last_seen')
+
+TEMPLATE_STATS_COLUMNS = ('template_expression', 'alpha_count', 'pass_count', 'pass_rate',
+                          'sharpe_mean', 'sharpe_p25', 'sharpe_p50', 'sharpe_p75',
+                          'fitness_mean', 'fitness_p25', 'fitness_p50', 'fitness_p75', 'last_seen')
+
+# 分位数需要分组内全部指标，不随每页增量维护：每隔这么多页批量重算一次脏分组
+TEMPLATE_QUANTILE_INTERVAL = 50
+
+
 class AlphaCrawler:
     """Alpha数据爬虫 - 统一脚本"""
     
@@ -59,7 +151,7 @@ class AlphaCrawler:
         self.use_shared_session = use_shared_session
         
         # API配置 - 整合API客户端功能
-        self.base_url = "https://api.worldquantbrain.com"
+        self.base_url = self.config.get('base_url', "https://api.worldquantbrain.com")
         
         # 【重要】先创建一个基础session，确保self.session始终可用
         self.session = requests.Session()
@@ -77,8 +169,21 @@ class AlphaCrawler:
             # 'settings.region': 'EUR'
         }
         
-        # 数据库连接
+        # 数据库连接（后端由 credentials.json 的 database.backend 决定：mysql / sqlite）
         self.db_connection = None
+        self.db_backend = 'mysql'
+        
+        # 翻页限流（多个批次并发翻页时共用），认证锁保证并发翻页时只有一个线程重新认证
+        self.rate_limiter = RateLimiter(rate=2.0, burst=4) if RATE_LIMITER_AVAILABLE else None
+        self._auth_lock = threading.Lock()
+        
+        # 按需加载的时间序列缓存 {(alpha_id, series_type): data}
+        self._timeseries_cache = OrderedDict()
+        self.timeseries_cache_size = 256
+        
+        # 待重算分位数的 template_performance 分组 {(template_hash, region, universe)}
+        self._dirty_templates = set()
+        self._pages_since_quantiles = 0
         
         # 设置浏览器头（必须在session创建后）
         self.setup_browser_headers()
@@ -193,7 +298,7 @@ class AlphaCrawler:
             for auth_attempt in range(max_auth_retries):
                 try:
                     logger.info(f"尝试认证 (尝试 {auth_attempt + 1}/{max_auth_retries})")
-                    response = self.session.post('https://api.worldquantbrain.com/authentication', headers=headers)
+                    response = self.session.post(f'{self.base_url}/authentication', headers=headers)
                     
                     if response.status_code == 201:
                         logger.info("认证成功")
@@ -424,18 +529,13 @@ class AlphaCrawler:
             config = self.load_config()
             db_config = config.get('database', {})
             
-            self.db_connection = mysql.connector.connect(
-                host=db_config.get('host', 'localhost'),
-                port=db_config.get('port', 3306),
-                user=db_config.get('username', 'quant_user'),
-                password=db_config.get('password', 'quant_password'),
-                database=db_config.get('database', 'consultant_analytics')
-            )
+            self.db_backend = db_config.get('backend', 'mysql')
+            self.db_connection = connect_storage(db_config, base_dir=os.path.dirname(os.path.abspath(__file__)))
             
-            logger.info("数据库连接成功")
+            logger.info(f"数据库连接成功 ({self.db_backend})")
             return True
             
-        except Error as e:
+        except (*Error, ValueError, RuntimeError) as e:
             logger.error(f"数据库连接失败: {e}")
             return False
     
@@ -449,8 +549,11 @@ class AlphaCrawler:
             with open(sql_file, 'r', encoding='utf-8') as f:
                 sql_script = f.read()
             
-            # 分割SQL语句并执行
-            statements = sql_script.split(';')
+            # 旧库先补列，再建表/建索引
+            self.upgrade_schema()
+            
+            # 分割SQL语句并执行（SQLite 后端先翻译 MySQL 建表语句）
+            statements = translate_schema(sql_script) if self.db_backend == 'sqlite' else sql_script.split(';')
             for statement in statements:
                 statement = statement.strip()
                 if statement:
@@ -465,6 +568,45 @@ class AlphaCrawler:
             logger.error(f"创建数据库表失败: {e}")
             return False
     
+    def table_columns(self, table: str) -> List[str]:
+        """表的列名列表（表不存在时为空）"""
+        cursor = self.db_connection.cursor()
+        if self.db_backend == 'sqlite':
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns = [row[1] for row in cursor.fetchall()]
+        else:
+            cursor.execute("""
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION
+            """, (table,))
+            columns = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return columns
+    
+    def upgrade_schema(self) -> None:
+        """给已有的 alphas 表补上后来新增的列（CREATE TABLE IF NOT EXISTS 不会修改已有表）"""
+        columns = self.table_columns('alphas')
+        if columns and 'template_hash' not in columns:
+            cursor = self.db_connection.cursor()
+            cursor.execute("ALTER TABLE alphas ADD COLUMN template_hash CHAR(32)")
+            if self.db_backend != 'sqlite':
+                # SQLite 的索引由建表脚本的 CREATE INDEX IF NOT EXISTS 创建
+                cursor.execute("CREATE INDEX idx_template ON alphas (template_hash, region, universe)")
+            self.db_connection.commit()
+            cursor.close()
+            logger.info("alphas 表已添加 template_hash 列")
+        
+        columns = self.table_columns('template_performance')
+        if columns and 'sharpe_sum' not in columns:
+            cursor = self.db_connection.cursor()
+            for column, column_type in (('sharpe_sum', 'DOUBLE'), ('sharpe_n', 'INT'),
+                                        ('fitness_sum', 'DOUBLE'), ('fitness_n', 'INT')):
+                cursor.execute(f"ALTER TABLE template_performance ADD COLUMN {column} {column_type} DEFAULT 0")
+            self.db_connection.commit()
+            cursor.close()
+            self.rebuild_template_stats()
+            logger.info("template_performance 表已添加累计列并重建")
+    
     def parse_datetime(self, datetime_str: Optional[str]) -> Optional[str]:
         """解析日期时间，转换为北京时间并返回MySQL兼容的字符串格式"""
         if not datetime_str:
@@ -632,6 +774,8 @@ class AlphaCrawler:
                     'code': regular.get('code'),
                     'description': regular.get('description'),
                     'operator_count': regular.get('operatorCount'),
+                    # 模版/算子/数据字段（按代码MD5缓存，同一代码只解析一次）
+                    **template_columns(regular.get('code')),
                 })
             
             # 标签和分类信息
@@ -700,282 +844,302 @@ class AlphaCrawler:
             logger.error(f"解析Alpha数据失败: {e}")
             return {}
     
+    def build_alpha_upsert(self, alpha_data: Dict) -> Tuple[str, tuple]:
+        """构造alphas表的参数化upsert语句及参数（单行）"""
+        # 准备数据，处理None值
+        data = {
+            'id': alpha_data.get('id') or 'NULL',
+            'type': alpha_data.get('type') or 'NULL',
+            'author': alpha_data.get('author') or 'NULL',
+            'date_created': alpha_data.get('date_created') or 'NULL',
+            'date_submitted': alpha_data.get('date_submitted') or 'NULL',
+            'date_modified': alpha_data.get('date_modified') or 'NULL',
+            'name': alpha_data.get('name') or 'NULL',
+            'favorite': alpha_data.get('favorite') or 'NULL',
+            'hidden': alpha_data.get('hidden') or 'NULL',
+            'color': alpha_data.get('color') or 'NULL',
+            'category': alpha_data.get('category') or 'NULL',
+            'stage': alpha_data.get('stage') or 'NULL',
+            'status': alpha_data.get('status') or 'NULL',
+            'grade': alpha_data.get('grade') or 'NULL',
+            'instrument_type': alpha_data.get('instrument_type') or 'NULL',
+            # 未设置时存空串而不是NULL，template_performance 分组可直接按 idx_template 等值匹配
+            'region': alpha_data.get('region') or '',
+            'universe': alpha_data.get('universe') or '',
+            'delay': alpha_data.get('delay') if alpha_data.get('delay') is not None else 'NULL',
+            'decay': alpha_data.get('decay') if alpha_data.get('decay') is not None else 'NULL',
+            'neutralization': alpha_data.get('neutralization') or 'NULL',
+            'truncation': alpha_data.get('truncation') if alpha_data.get('truncation') is not None else 'NULL',
+            'pasteurization': alpha_data.get('pasteurization') or 'NULL',
+            'unit_handling': alpha_data.get('unit_handling') or 'NULL',
+            'nan_handling': alpha_data.get('nan_handling') or 'NULL',
+            'selection_handling': alpha_data.get('selection_handling') if alpha_data.get('selection_handling') is not None else 'NULL',  # SUPER类型特有字段
+            'selection_limit': alpha_data.get('selection_limit') if alpha_data.get('selection_limit') is not None else 'NULL',       # SUPER类型特有字段
+            'max_trade': alpha_data.get('max_trade') or 'NULL',
+            'language': alpha_data.get('language') or 'NULL',
+            'visualization': alpha_data.get('visualization') or 'NULL',
+            'start_date': alpha_data.get('start_date') or 'NULL',
+            'end_date': alpha_data.get('end_date') or 'NULL',
+            'component_activation': alpha_data.get('component_activation') if alpha_data.get('component_activation') is not None else 'NULL',  # SUPER类型特有字段
+            'test_period': alpha_data.get('test_period') if alpha_data.get('test_period') is not None else 'NULL',                    # SUPER类型特有字段
+            'code': alpha_data.get('code') or 'NULL',
+            'description': alpha_data.get('description') or 'NULL',
+            'operator_count': alpha_data.get('operator_count') or 'NULL',
+            # 代码解析字段（仅REGULAR类型，见 template_extractor.py）
+            'template_expression': alpha_data.get('template_expression') or 'NULL',
+            'operators_list': alpha_data.get('operators_list') or 'NULL',
+            'data_fields_list': alpha_data.get('data_fields_list') or 'NULL',
+            'datasets_list': alpha_data.get('datasets_list') or 'NULL',
+            'template_hash': alpha_data.get('template_hash') or 'NULL',
+            # 新增的combo和selection字段
+            'combo_code': alpha_data.get('combo_code') or 'NULL',
+            'combo_description': alpha_data.get('combo_description') or 'NULL',
+            'combo_operator_count': alpha_data.get('combo_operator_count') if alpha_data.get('combo_operator_count') is not None else 'NULL',
+            'selection_code': alpha_data.get('selection_code') or 'NULL',
+            'selection_description': alpha_data.get('selection_description') or 'NULL',
+            'selection_operator_count': alpha_data.get('selection_operator_count') if alpha_data.get('selection_operator_count') is not None else 'NULL',
+            'tags': alpha_data.get('tags') or 'NULL',
+            'classifications': alpha_data.get('classifications') or 'NULL',
+            'pnl': alpha_data.get('pnl') if alpha_data.get('pnl') is not None else 'NULL',
+            'book_size': alpha_data.get('book_size') if alpha_data.get('book_size') is not None else 'NULL',
+            'long_count': alpha_data.get('long_count') if alpha_data.get('long_count') is not None else 'NULL',
+            'short_count': alpha_data.get('short_count') if alpha_data.get('short_count') is not None else 'NULL',
+            'turnover': alpha_data.get('turnover') if alpha_data.get('turnover') is not None else 'NULL',
+            'returns': alpha_data.get('returns') if alpha_data.get('returns') is not None else 'NULL',
+            'drawdown': alpha_data.get('drawdown') if alpha_data.get('drawdown') is not None else 'NULL',
+            'margin': alpha_data.get('margin') if alpha_data.get('margin') is not None else 'NULL',
+            'sharpe': alpha_data.get('sharpe') if alpha_data.get('sharpe') is not None else 'NULL',
+            'fitness': alpha_data.get('fitness') if alpha_data.get('fitness') is not None else 'NULL',
+            'is_start_date': alpha_data.get('is_start_date') or 'NULL',
+            'investability_constrained_pnl': alpha_data.get('investability_constrained_pnl') if alpha_data.get('investability_constrained_pnl') is not None else 'NULL',
+            'investability_constrained_book_size': alpha_data.get('investability_constrained_book_size') if alpha_data.get('investability_constrained_book_size') is not None else 'NULL',
+            'investability_constrained_long_count': alpha_data.get('investability_constrained_long_count') if alpha_data.get('investability_constrained_long_count') is not None else 'NULL',
+            'investability_constrained_short_count': alpha_data.get('investability_constrained_short_count') if alpha_data.get('investability_constrained_short_count') is not None else 'NULL',
+            'investability_constrained_turnover': alpha_data.get('investability_constrained_turnover') if alpha_data.get('investability_constrained_turnover') is not None else 'NULL',
+            'investability_constrained_returns': alpha_data.get('investability_constrained_returns') if alpha_data.get('investability_constrained_returns') is not None else 'NULL',
+            'investability_constrained_drawdown': alpha_data.get('investability_constrained_drawdown') if alpha_data.get('investability_constrained_drawdown') is not None else 'NULL',
+            'investability_constrained_margin': alpha_data.get('investability_constrained_margin') if alpha_data.get('investability_constrained_margin') is not None else 'NULL',
+            'investability_constrained_fitness': alpha_data.get('investability_constrained_fitness') if alpha_data.get('investability_constrained_fitness') is not None else 'NULL',
+            'investability_constrained_sharpe': alpha_data.get('investability_constrained_sharpe') if alpha_data.get('investability_constrained_sharpe') is not None else 'NULL',
+            'risk_neutralized_pnl': alpha_data.get('risk_neutralized_pnl') if alpha_data.get('risk_neutralized_pnl') is not None else 'NULL',
+            'risk_neutralized_book_size': alpha_data.get('risk_neutralized_book_size') if alpha_data.get('risk_neutralized_book_size') is not None else 'NULL',
+            'risk_neutralized_long_count': alpha_data.get('risk_neutralized_long_count') if alpha_data.get('risk_neutralized_long_count') is not None else 'NULL',
+            'risk_neutralized_short_count': alpha_data.get('risk_neutralized_short_count') if alpha_data.get('risk_neutralized_short_count') is not None else 'NULL',
+            'risk_neutralized_turnover': alpha_data.get('risk_neutralized_turnover') if alpha_data.get('risk_neutralized_turnover') is not None else 'NULL',
+            'risk_neutralized_returns': alpha_data.get('risk_neutralized_returns') if alpha_data.get('risk_neutralized_returns') is not None else 'NULL',
+            'risk_neutralized_drawdown': alpha_data.get('risk_neutralized_drawdown') if alpha_data.get('risk_neutralized_drawdown') is not None else 'NULL',
+            'risk_neutralized_margin': alpha_data.get('risk_neutralized_margin') if alpha_data.get('risk_neutralized_margin') is not None else 'NULL',
+            'risk_neutralized_fitness': alpha_data.get('risk_neutralized_fitness') if alpha_data.get('risk_neutralized_fitness') is not None else 'NULL',
+            'risk_neutralized_sharpe': alpha_data.get('risk_neutralized_sharpe') if alpha_data.get('risk_neutralized_sharpe') is not None else 'NULL',
+            'checks': alpha_data.get('checks') or 'NULL',
+            'competitions': alpha_data.get('competitions') or 'NULL',
+            'pyramids': alpha_data.get('pyramids') or 'NULL',
+            'themes': alpha_data.get('themes') or 'NULL'
+        }
+        
+        # 转义单引号并包装字符串值
+        # JSON字段不需要额外的转义处理
+        json_fields = {'checks', 'competitions', 'pyramids', 'themes', 'tags', 'classifications',
+                       'operators_list', 'data_fields_list', 'datasets_list'}
+        
+        for key, value in data.items():
+            if value == 'NULL':
+                data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
+            elif key in ['date_created', 'date_submitted', 'date_modified']:
+                # 日期时间字段已经处理过，不需要再包装（使用参数化查询）
+                if value is not None:
+                    data[key] = str(value)
+                else:
+                    data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
+            elif key in ['start_date', 'end_date', 'is_start_date']:
+                # 日期字段已经处理过，不需要再包装（使用参数化查询）
+                if value is not None:
+                    data[key] = str(value)
+                else:
+                    data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
+            elif key in json_fields:
+                # JSON字段特殊处理，只需要确保是有效的JSON字符串
+                if isinstance(value, str) and value != 'NULL':
+                    # JSON字段需要转义单引号，但不能转义双引号（JSON中的双引号是有效的）
+                    # 使用参数化查询来正确处理JSON字段，避免手动转义
+                    data[key] = value
+                elif value == 'NULL':
+                    data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
+                else:
+                    # 其他情况转换为字符串
+                    data[key] = str(value)
+            elif isinstance(value, str):
+                # 普通字符串字段，不进行单引号包装（由参数化查询处理）
+                # 只需要确保字符串本身是有效的，不需要手动转义单引号
+                pass  # 依赖参数化查询自动处理字符串转义和包装
+            elif isinstance(value, (int, float)):
+                # 数值类型保持原样，让参数化查询处理
+                pass  # 不需要转换，保持原始数值类型
+            elif isinstance(value, bool):
+                # 布尔值保持原样，让参数化查询处理
+                pass  # 不需要转换，保持原始布尔类型
+            elif value is None:
+                data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
+            else:
+                # 其他类型保持原样或转换为字符串
+                pass  # 对于其他类型，依赖参数化查询的自动处理
+        
+        sql_template = """
+        INSERT INTO alphas (
+            id, type, author, date_created, date_submitted, date_modified, name,
+            favorite, hidden, color, category, stage, status, grade,
+            instrument_type, region, universe, delay, decay, neutralization,
+            truncation, pasteurization, unit_handling, nan_handling, selection_handling, selection_limit,
+            max_trade, language, visualization, start_date, end_date, component_activation, test_period,
+            code, description, operator_count,
+            template_expression, operators_list, data_fields_list, datasets_list, template_hash,
+            combo_code, combo_description, combo_operator_count,
+            selection_code, selection_description, selection_operator_count,
+            tags, classifications,
+            pnl, book_size, long_count, short_count, turnover, returns, drawdown,
+            margin, sharpe, fitness, is_start_date,
+            investability_constrained_pnl, investability_constrained_book_size,
+            investability_constrained_long_count, investability_constrained_short_count,
+            investability_constrained_turnover, investability_constrained_returns,
+            investability_constrained_drawdown, investability_constrained_margin,
+            investability_constrained_fitness, investability_constrained_sharpe,
+            risk_neutralized_pnl, risk_neutralized_book_size,
+            risk_neutralized_long_count, risk_neutralized_short_count,
+            risk_neutralized_turnover, risk_neutralized_returns,
+            risk_neutralized_drawdown, risk_neutralized_margin,
+            risk_neutralized_fitness, risk_neutralized_sharpe,
+            checks, competitions, pyramids, themes
+        ) VALUES (
+            {id}, {type}, {author}, {date_created}, {date_submitted}, {date_modified}, {name},
+            {favorite}, {hidden}, {color}, {category}, {stage}, {status}, {grade},
+            {instrument_type}, {region}, {universe}, {delay}, {decay}, {neutralization},
+            {truncation}, {pasteurization}, {unit_handling}, {nan_handling}, {selection_handling}, {selection_limit},
+            {max_trade}, {language}, {visualization}, {start_date}, {end_date}, {component_activation}, {test_period},
+            {code}, {description}, {operator_count},
+            {template_expression}, {operators_list}, {data_fields_list}, {datasets_list}, {template_hash},
+            {combo_code}, {combo_description}, {combo_operator_count},
+            {selection_code}, {selection_description}, {selection_operator_count},
+            {tags}, {classifications},
+            {pnl}, {book_size}, {long_count}, {short_count}, {turnover}, {returns}, {drawdown},
+            {margin}, {sharpe}, {fitness}, {is_start_date},
+            {investability_constrained_pnl}, {investability_constrained_book_size},
+            {investability_constrained_long_count}, {investability_constrained_short_count},
+            {investability_constrained_turnover}, {investability_constrained_returns},
+            {investability_constrained_drawdown}, {investability_constrained_margin},
+            {investability_constrained_fitness}, {investability_constrained_sharpe},
+            {risk_neutralized_pnl}, {risk_neutralized_book_size},
+            {risk_neutralized_long_count}, {risk_neutralized_short_count},
+            {risk_neutralized_turnover}, {risk_neutralized_returns},
+            {risk_neutralized_drawdown}, {risk_neutralized_margin},
+            {risk_neutralized_fitness}, {risk_neutralized_sharpe},
+            {checks}, {competitions}, {pyramids}, {themes}
+        ) ON DUPLICATE KEY UPDATE
+            type = VALUES(type), author = VALUES(author), date_created = VALUES(date_created),
+            date_submitted = VALUES(date_submitted), date_modified = VALUES(date_modified),
+            name = VALUES(name), favorite = VALUES(favorite), hidden = VALUES(hidden),
+            color = VALUES(color), category = VALUES(category), stage = VALUES(stage),
+            status = VALUES(status), grade = VALUES(grade), instrument_type = VALUES(instrument_type),
+            region = VALUES(region), universe = VALUES(universe), delay = VALUES(delay),
+            decay = VALUES(decay), neutralization = VALUES(neutralization), truncation = VALUES(truncation),
+            pasteurization = VALUES(pasteurization), unit_handling = VALUES(unit_handling),
+            nan_handling = VALUES(nan_handling), max_trade = VALUES(max_trade), language = VALUES(language),
+            visualization = VALUES(visualization), start_date = VALUES(start_date), end_date = VALUES(end_date),
+            code = VALUES(code), description = VALUES(description), operator_count = VALUES(operator_count),
+            template_expression = VALUES(template_expression), operators_list = VALUES(operators_list),
+            data_fields_list = VALUES(data_fields_list), datasets_list = VALUES(datasets_list), template_hash = VALUES(template_hash),
+            combo_code = VALUES(combo_code), combo_description = VALUES(combo_description), combo_operator_count = VALUES(combo_operator_count),
+            selection_code = VALUES(selection_code), selection_description = VALUES(selection_description), selection_operator_count = VALUES(selection_operator_count),
+            tags = VALUES(tags), classifications = VALUES(classifications), pnl = VALUES(pnl),
+            book_size = VALUES(book_size), long_count = VALUES(long_count), short_count = VALUES(short_count),
+            turnover = VALUES(turnover), returns = VALUES(returns), drawdown = VALUES(drawdown),
+            margin = VALUES(margin), sharpe = VALUES(sharpe), fitness = VALUES(fitness),
+            is_start_date = VALUES(is_start_date), investability_constrained_pnl = VALUES(investability_constrained_pnl),
+            investability_constrained_book_size = VALUES(investability_constrained_book_size),
+            investability_constrained_long_count = VALUES(investability_constrained_long_count),
+            investability_constrained_short_count = VALUES(investability_constrained_short_count),
+            investability_constrained_turnover = VALUES(investability_constrained_turnover),
+            investability_constrained_returns = VALUES(investability_constrained_returns),
+            investability_constrained_drawdown = VALUES(investability_constrained_drawdown),
+            investability_constrained_margin = VALUES(investability_constrained_margin),
+            investability_constrained_fitness = VALUES(investability_constrained_fitness),
+            investability_constrained_sharpe = VALUES(investability_constrained_sharpe),
+            risk_neutralized_pnl = VALUES(risk_neutralized_pnl),
+            risk_neutralized_book_size = VALUES(risk_neutralized_book_size),
+            risk_neutralized_long_count = VALUES(risk_neutralized_long_count),
+            risk_neutralized_short_count = VALUES(risk_neutralized_short_count),
+            risk_neutralized_turnover = VALUES(risk_neutralized_turnover),
+            risk_neutralized_returns = VALUES(risk_neutralized_returns),
+            risk_neutralized_drawdown = VALUES(risk_neutralized_drawdown),
+            risk_neutralized_margin = VALUES(risk_neutralized_margin),
+            risk_neutralized_fitness = VALUES(risk_neutralized_fitness),
+            risk_neutralized_sharpe = VALUES(risk_neutralized_sharpe),
+            checks = VALUES(checks), competitions = VALUES(competitions), pyramids = VALUES(pyramids),
+            themes = VALUES(themes), updated_at = CURRENT_TIMESTAMP
+        """
+        
+        # 提取所有值作为参数元组，保持与SQL模板中占位符的顺序一致
+        values = (
+            data['id'], data['type'], data['author'], data['date_created'], data['date_submitted'], data['date_modified'], data['name'],
+            data['favorite'], data['hidden'], data['color'], data['category'], data['stage'], data['status'], data['grade'],
+            data['instrument_type'], data['region'], data['universe'], data['delay'], data['decay'], data['neutralization'],
+            data['truncation'], data['pasteurization'], data['unit_handling'], data['nan_handling'], data['selection_handling'], data['selection_limit'],
+            data['max_trade'], data['language'], data['visualization'], data['start_date'], data['end_date'], data['component_activation'], data['test_period'],
+            data['code'], data['description'], data['operator_count'],
+            data['template_expression'], data['operators_list'], data['data_fields_list'], data['datasets_list'], data['template_hash'],
+            data['combo_code'], data['combo_description'], data['combo_operator_count'],
+            data['selection_code'], data['selection_description'], data['selection_operator_count'],
+            data['tags'], data['classifications'],
+            data['pnl'], data['book_size'], data['long_count'], data['short_count'], data['turnover'], data['returns'], data['drawdown'],
+            data['margin'], data['sharpe'], data['fitness'], data['is_start_date'],
+            data['investability_constrained_pnl'], data['investability_constrained_book_size'],
+            data['investability_constrained_long_count'], data['investability_constrained_short_count'],
+            data['investability_constrained_turnover'], data['investability_constrained_returns'],
+            data['investability_constrained_drawdown'], data['investability_constrained_margin'],
+            data['investability_constrained_fitness'], data['investability_constrained_sharpe'],
+            data['risk_neutralized_pnl'], data['risk_neutralized_book_size'],
+            data['risk_neutralized_long_count'], data['risk_neutralized_short_count'],
+            data['risk_neutralized_turnover'], data['risk_neutralized_returns'],
+            data['risk_neutralized_drawdown'], data['risk_neutralized_margin'],
+            data['risk_neutralized_fitness'], data['risk_neutralized_sharpe'],
+            data['checks'], data['competitions'], data['pyramids'], data['themes']
+        )
+        
+        # 使用参数化查询执行SQL语句
+        sql = sql_template.format(
+            id='%s', type='%s', author='%s', date_created='%s', date_submitted='%s', date_modified='%s', name='%s',
+            favorite='%s', hidden='%s', color='%s', category='%s', stage='%s', status='%s', grade='%s',
+            instrument_type='%s', region='%s', universe='%s', delay='%s', decay='%s', neutralization='%s',
+            truncation='%s', pasteurization='%s', unit_handling='%s', nan_handling='%s', selection_handling='%s', selection_limit='%s',
+            max_trade='%s', language='%s', visualization='%s', start_date='%s', end_date='%s', component_activation='%s', test_period='%s',
+            code='%s', description='%s', operator_count='%s',
+            template_expression='%s', operators_list='%s', data_fields_list='%s', datasets_list='%s', template_hash='%s',
+            combo_code='%s', combo_description='%s', combo_operator_count='%s',
+            selection_code='%s', selection_description='%s', selection_operator_count='%s',
+            tags='%s', classifications='%s',
+            pnl='%s', book_size='%s', long_count='%s', short_count='%s', turnover='%s', returns='%s', drawdown='%s',
+            margin='%s', sharpe='%s', fitness='%s', is_start_date='%s',
+            investability_constrained_pnl='%s', investability_constrained_book_size='%s',
+            investability_constrained_long_count='%s', investability_constrained_short_count='%s',
+            investability_constrained_turnover='%s', investability_constrained_returns='%s',
+            investability_constrained_drawdown='%s', investability_constrained_margin='%s',
+            investability_constrained_fitness='%s', investability_constrained_sharpe='%s',
+            risk_neutralized_pnl='%s', risk_neutralized_book_size='%s',
+            risk_neutralized_long_count='%s', risk_neutralized_short_count='%s',
+            risk_neutralized_turnover='%s', risk_neutralized_returns='%s',
+            risk_neutralized_drawdown='%s', risk_neutralized_margin='%s',
+            risk_neutralized_fitness='%s', risk_neutralized_sharpe='%s',
+            checks='%s', competitions='%s', pyramids='%s', themes='%s'
+        )
+        
+        return sql, values
+    
     def save_alpha_to_database(self, alpha_data: Dict) -> bool:
         """保存Alpha数据到数据库"""
+        sql = None
         try:
+            sql, values = self.build_alpha_upsert(alpha_data)
             cursor = self.db_connection.cursor()
             
-            # 准备数据，处理None值
-            data = {
-                'id': alpha_data.get('id') or 'NULL',
-                'type': alpha_data.get('type') or 'NULL',
-                'author': alpha_data.get('author') or 'NULL',
-                'date_created': alpha_data.get('date_created') or 'NULL',
-                'date_submitted': alpha_data.get('date_submitted') or 'NULL',
-                'date_modified': alpha_data.get('date_modified') or 'NULL',
-                'name': alpha_data.get('name') or 'NULL',
-                'favorite': alpha_data.get('favorite') or 'NULL',
-                'hidden': alpha_data.get('hidden') or 'NULL',
-                'color': alpha_data.get('color') or 'NULL',
-                'category': alpha_data.get('category') or 'NULL',
-                'stage': alpha_data.get('stage') or 'NULL',
-                'status': alpha_data.get('status') or 'NULL',
-                'grade': alpha_data.get('grade') or 'NULL',
-                'instrument_type': alpha_data.get('instrument_type') or 'NULL',
-                'region': alpha_data.get('region') or 'NULL',
-                'universe': alpha_data.get('universe') or 'NULL',
-                'delay': alpha_data.get('delay') if alpha_data.get('delay') is not None else 'NULL',
-                'decay': alpha_data.get('decay') if alpha_data.get('decay') is not None else 'NULL',
-                'neutralization': alpha_data.get('neutralization') or 'NULL',
-                'truncation': alpha_data.get('truncation') if alpha_data.get('truncation') is not None else 'NULL',
-                'pasteurization': alpha_data.get('pasteurization') or 'NULL',
-                'unit_handling': alpha_data.get('unit_handling') or 'NULL',
-                'nan_handling': alpha_data.get('nan_handling') or 'NULL',
-                'selection_handling': alpha_data.get('selection_handling') if alpha_data.get('selection_handling') is not None else 'NULL',  # SUPER类型特有字段
-                'selection_limit': alpha_data.get('selection_limit') if alpha_data.get('selection_limit') is not None else 'NULL',       # SUPER类型特有字段
-                'max_trade': alpha_data.get('max_trade') or 'NULL',
-                'language': alpha_data.get('language') or 'NULL',
-                'visualization': alpha_data.get('visualization') or 'NULL',
-                'start_date': alpha_data.get('start_date') or 'NULL',
-                'end_date': alpha_data.get('end_date') or 'NULL',
-                'component_activation': alpha_data.get('component_activation') if alpha_data.get('component_activation') is not None else 'NULL',  # SUPER类型特有字段
-                'test_period': alpha_data.get('test_period') if alpha_data.get('test_period') is not None else 'NULL',                    # SUPER类型特有字段
-                'code': alpha_data.get('code') or 'NULL',
-                'description': alpha_data.get('description') or 'NULL',
-                'operator_count': alpha_data.get('operator_count') or 'NULL',
-                # 新增的combo和selection字段
-                'combo_code': alpha_data.get('combo_code') or 'NULL',
-                'combo_description': alpha_data.get('combo_description') or 'NULL',
-                'combo_operator_count': alpha_data.get('combo_operator_count') if alpha_data.get('combo_operator_count') is not None else 'NULL',
-                'selection_code': alpha_data.get('selection_code') or 'NULL',
-                'selection_description': alpha_data.get('selection_description') or 'NULL',
-                'selection_operator_count': alpha_data.get('selection_operator_count') if alpha_data.get('selection_operator_count') is not None else 'NULL',
-                'tags': alpha_data.get('tags') or 'NULL',
-                'classifications': alpha_data.get('classifications') or 'NULL',
-                'pnl': alpha_data.get('pnl') if alpha_data.get('pnl') is not None else 'NULL',
-                'book_size': alpha_data.get('book_size') if alpha_data.get('book_size') is not None else 'NULL',
-                'long_count': alpha_data.get('long_count') if alpha_data.get('long_count') is not None else 'NULL',
-                'short_count': alpha_data.get('short_count') if alpha_data.get('short_count') is not None else 'NULL',
-                'turnover': alpha_data.get('turnover') if alpha_data.get('turnover') is not None else 'NULL',
-                'returns': alpha_data.get('returns') if alpha_data.get('returns') is not None else 'NULL',
-                'drawdown': alpha_data.get('drawdown') if alpha_data.get('drawdown') is not None else 'NULL',
-                'margin': alpha_data.get('margin') if alpha_data.get('margin') is not None else 'NULL',
-                'sharpe': alpha_data.get('sharpe') if alpha_data.get('sharpe') is not None else 'NULL',
-                'fitness': alpha_data.get('fitness') if alpha_data.get('fitness') is not None else 'NULL',
-                'is_start_date': alpha_data.get('is_start_date') or 'NULL',
-                'investability_constrained_pnl': alpha_data.get('investability_constrained_pnl') if alpha_data.get('investability_constrained_pnl') is not None else 'NULL',
-                'investability_constrained_book_size': alpha_data.get('investability_constrained_book_size') if alpha_data.get('investability_constrained_book_size') is not None else 'NULL',
-                'investability_constrained_long_count': alpha_data.get('investability_constrained_long_count') if alpha_data.get('investability_constrained_long_count') is not None else 'NULL',
-                'investability_constrained_short_count': alpha_data.get('investability_constrained_short_count') if alpha_data.get('investability_constrained_short_count') is not None else 'NULL',
-                'investability_constrained_turnover': alpha_data.get('investability_constrained_turnover') if alpha_data.get('investability_constrained_turnover') is not None else 'NULL',
-                'investability_constrained_returns': alpha_data.get('investability_constrained_returns') if alpha_data.get('investability_constrained_returns') is not None else 'NULL',
-                'investability_constrained_drawdown': alpha_data.get('investability_constrained_drawdown') if alpha_data.get('investability_constrained_drawdown') is not None else 'NULL',
-                'investability_constrained_margin': alpha_data.get('investability_constrained_margin') if alpha_data.get('investability_constrained_margin') is not None else 'NULL',
-                'investability_constrained_fitness': alpha_data.get('investability_constrained_fitness') if alpha_data.get('investability_constrained_fitness') is not None else 'NULL',
-                'investability_constrained_sharpe': alpha_data.get('investability_constrained_sharpe') if alpha_data.get('investability_constrained_sharpe') is not None else 'NULL',
-                'risk_neutralized_pnl': alpha_data.get('risk_neutralized_pnl') if alpha_data.get('risk_neutralized_pnl') is not None else 'NULL',
-                'risk_neutralized_book_size': alpha_data.get('risk_neutralized_book_size') if alpha_data.get('risk_neutralized_book_size') is not None else 'NULL',
-                'risk_neutralized_long_count': alpha_data.get('risk_neutralized_long_count') if alpha_data.get('risk_neutralized_long_count') is not None else 'NULL',
-                'risk_neutralized_short_count': alpha_data.get('risk_neutralized_short_count') if alpha_data.get('risk_neutralized_short_count') is not None else 'NULL',
-                'risk_neutralized_turnover': alpha_data.get('risk_neutralized_turnover') if alpha_data.get('risk_neutralized_turnover') is not None else 'NULL',
-                'risk_neutralized_returns': alpha_data.get('risk_neutralized_returns') if alpha_data.get('risk_neutralized_returns') is not None else 'NULL',
-                'risk_neutralized_drawdown': alpha_data.get('risk_neutralized_drawdown') if alpha_data.get('risk_neutralized_drawdown') is not None else 'NULL',
-                'risk_neutralized_margin': alpha_data.get('risk_neutralized_margin') if alpha_data.get('risk_neutralized_margin') is not None else 'NULL',
-                'risk_neutralized_fitness': alpha_data.get('risk_neutralized_fitness') if alpha_data.get('risk_neutralized_fitness') is not None else 'NULL',
-                'risk_neutralized_sharpe': alpha_data.get('risk_neutralized_sharpe') if alpha_data.get('risk_neutralized_sharpe') is not None else 'NULL',
-                'checks': alpha_data.get('checks') or 'NULL',
-                'competitions': alpha_data.get('competitions') or 'NULL',
-                'pyramids': alpha_data.get('pyramids') or 'NULL',
-                'themes': alpha_data.get('themes') or 'NULL'
-            }
-            
-            # 转义单引号并包装字符串值
-            # JSON字段不需要额外的转义处理
-            json_fields = {'checks', 'competitions', 'pyramids', 'themes', 'tags', 'classifications'}
-            
-            for key, value in data.items():
-                if value == 'NULL':
-                    data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
-                elif key in ['date_created', 'date_submitted', 'date_modified']:
-                    # 日期时间字段已经处理过，不需要再包装（使用参数化查询）
-                    if value is not None:
-                        data[key] = str(value)
-                    else:
-                        data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
-                elif key in ['start_date', 'end_date', 'is_start_date']:
-                    # 日期字段已经处理过，不需要再包装（使用参数化查询）
-                    if value is not None:
-                        data[key] = str(value)
-                    else:
-                        data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
-                elif key in json_fields:
-                    # JSON字段特殊处理，只需要确保是有效的JSON字符串
-                    if isinstance(value, str) and value != 'NULL':
-                        # JSON字段需要转义单引号，但不能转义双引号（JSON中的双引号是有效的）
-                        # 使用参数化查询来正确处理JSON字段，避免手动转义
-                        data[key] = value
-                    elif value == 'NULL':
-                        data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
-                    else:
-                        # 其他情况转换为字符串
-                        data[key] = str(value)
-                elif isinstance(value, str):
-                    # 普通字符串字段，不进行单引号包装（由参数化查询处理）
-                    # 只需要确保字符串本身是有效的，不需要手动转义单引号
-                    pass  # 依赖参数化查询自动处理字符串转义和包装
-                elif isinstance(value, (int, float)):
-                    # 数值类型保持原样，让参数化查询处理
-                    pass  # 不需要转换，保持原始数值类型
-                elif isinstance(value, bool):
-                    # 布尔值保持原样，让参数化查询处理
-                    pass  # 不需要转换，保持原始布尔类型
-                elif value is None:
-                    data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
-                else:
-                    # 其他类型保持原样或转换为字符串
-                    pass  # 对于其他类型，依赖参数化查询的自动处理
-            
-            sql_template = """
-            INSERT INTO alphas (
-                id, type, author, date_created, date_submitted, date_modified, name,
-                favorite, hidden, color, category, stage, status, grade,
-                instrument_type, region, universe, delay, decay, neutralization,
-                truncation, pasteurization, unit_handling, nan_handling, selection_handling, selection_limit,
-                max_trade, language, visualization, start_date, end_date, component_activation, test_period,
-                code, description, operator_count,
-                combo_code, combo_description, combo_operator_count,
-                selection_code, selection_description, selection_operator_count,
-                tags, classifications,
-                pnl, book_size, long_count, short_count, turnover, returns, drawdown,
-                margin, sharpe, fitness, is_start_date,
-                investability_constrained_pnl, investability_constrained_book_size,
-                investability_constrained_long_count, investability_constrained_short_count,
-                investability_constrained_turnover, investability_constrained_returns,
-                investability_constrained_drawdown, investability_constrained_margin,
-                investability_constrained_fitness, investability_constrained_sharpe,
-                risk_neutralized_pnl, risk_neutralized_book_size,
-                risk_neutralized_long_count, risk_neutralized_short_count,
-                risk_neutralized_turnover, risk_neutralized_returns,
-                risk_neutralized_drawdown, risk_neutralized_margin,
-                risk_neutralized_fitness, risk_neutralized_sharpe,
-                checks, competitions, pyramids, themes
-            ) VALUES (
-                {id}, {type}, {author}, {date_created}, {date_submitted}, {date_modified}, {name},
-                {favorite}, {hidden}, {color}, {category}, {stage}, {status}, {grade},
-                {instrument_type}, {region}, {universe}, {delay}, {decay}, {neutralization},
-                {truncation}, {pasteurization}, {unit_handling}, {nan_handling}, {selection_handling}, {selection_limit},
-                {max_trade}, {language}, {visualization}, {start_date}, {end_date}, {component_activation}, {test_period},
-                {code}, {description}, {operator_count},
-                {combo_code}, {combo_description}, {combo_operator_count},
-                {selection_code}, {selection_description}, {selection_operator_count},
-                {tags}, {classifications},
-                {pnl}, {book_size}, {long_count}, {short_count}, {turnover}, {returns}, {drawdown},
-                {margin}, {sharpe}, {fitness}, {is_start_date},
-                {investability_constrained_pnl}, {investability_constrained_book_size},
-                {investability_constrained_long_count}, {investability_constrained_short_count},
-                {investability_constrained_turnover}, {investability_constrained_returns},
-                {investability_constrained_drawdown}, {investability_constrained_margin},
-                {investability_constrained_fitness}, {investability_constrained_sharpe},
-                {risk_neutralized_pnl}, {risk_neutralized_book_size},
-                {risk_neutralized_long_count}, {risk_neutralized_short_count},
-                {risk_neutralized_turnover}, {risk_neutralized_returns},
-                {risk_neutralized_drawdown}, {risk_neutralized_margin},
-                {risk_neutralized_fitness}, {risk_neutralized_sharpe},
-                {checks}, {competitions}, {pyramids}, {themes}
-            ) ON DUPLICATE KEY UPDATE
-                type = VALUES(type), author = VALUES(author), date_created = VALUES(date_created),
-                date_submitted = VALUES(date_submitted), date_modified = VALUES(date_modified),
-                name = VALUES(name), favorite = VALUES(favorite), hidden = VALUES(hidden),
-                color = VALUES(color), category = VALUES(category), stage = VALUES(stage),
-                status = VALUES(status), grade = VALUES(grade), instrument_type = VALUES(instrument_type),
-                region = VALUES(region), universe = VALUES(universe), delay = VALUES(delay),
-                decay = VALUES(decay), neutralization = VALUES(neutralization), truncation = VALUES(truncation),
-                pasteurization = VALUES(pasteurization), unit_handling = VALUES(unit_handling),
-                nan_handling = VALUES(nan_handling), max_trade = VALUES(max_trade), language = VALUES(language),
-                visualization = VALUES(visualization), start_date = VALUES(start_date), end_date = VALUES(end_date),
-                code = VALUES(code), description = VALUES(description), operator_count = VALUES(operator_count),
-                combo_code = VALUES(combo_code), combo_description = VALUES(combo_description), combo_operator_count = VALUES(combo_operator_count),
-                selection_code = VALUES(selection_code), selection_description = VALUES(selection_description), selection_operator_count = VALUES(selection_operator_count),
-                tags = VALUES(tags), classifications = VALUES(classifications), pnl = VALUES(pnl),
-                book_size = VALUES(book_size), long_count = VALUES(long_count), short_count = VALUES(short_count),
-                turnover = VALUES(turnover), returns = VALUES(returns), drawdown = VALUES(drawdown),
-                margin = VALUES(margin), sharpe = VALUES(sharpe), fitness = VALUES(fitness),
-                is_start_date = VALUES(is_start_date), investability_constrained_pnl = VALUES(investability_constrained_pnl),
-                investability_constrained_book_size = VALUES(investability_constrained_book_size),
-                investability_constrained_long_count = VALUES(investability_constrained_long_count),
-                investability_constrained_short_count = VALUES(investability_constrained_short_count),
-                investability_constrained_turnover = VALUES(investability_constrained_turnover),
-                investability_constrained_returns = VALUES(investability_constrained_returns),
-                investability_constrained_drawdown = VALUES(investability_constrained_drawdown),
-                investability_constrained_margin = VALUES(investability_constrained_margin),
-                investability_constrained_fitness = VALUES(investability_constrained_fitness),
-                investability_constrained_sharpe = VALUES(investability_constrained_sharpe),
-                risk_neutralized_pnl = VALUES(risk_neutralized_pnl),
-                risk_neutralized_book_size = VALUES(risk_neutralized_book_size),
-                risk_neutralized_long_count = VALUES(risk_neutralized_long_count),
-                risk_neutralized_short_count = VALUES(risk_neutralized_short_count),
-                risk_neutralized_turnover = VALUES(risk_neutralized_turnover),
-                risk_neutralized_returns = VALUES(risk_neutralized_returns),
-                risk_neutralized_drawdown = VALUES(risk_neutralized_drawdown),
-                risk_neutralized_margin = VALUES(risk_neutralized_margin),
-                risk_neutralized_fitness = VALUES(risk_neutralized_fitness),
-                risk_neutralized_sharpe = VALUES(risk_neutralized_sharpe),
-                checks = VALUES(checks), competitions = VALUES(competitions), pyramids = VALUES(pyramids),
-                themes = VALUES(themes), updated_at = CURRENT_TIMESTAMP
-            """
-            
-            # 提取所有值作为参数元组，保持与SQL模板中占位符的顺序一致
-            values = (
-                data['id'], data['type'], data['author'], data['date_created'], data['date_submitted'], data['date_modified'], data['name'],
-                data['favorite'], data['hidden'], data['color'], data['category'], data['stage'], data['status'], data['grade'],
-                data['instrument_type'], data['region'], data['universe'], data['delay'], data['decay'], data['neutralization'],
-                data['truncation'], data['pasteurization'], data['unit_handling'], data['nan_handling'], data['selection_handling'], data['selection_limit'],
-                data['max_trade'], data['language'], data['visualization'], data['start_date'], data['end_date'], data['component_activation'], data['test_period'],
-                data['code'], data['description'], data['operator_count'],
-                data['combo_code'], data['combo_description'], data['combo_operator_count'],
-                data['selection_code'], data['selection_description'], data['selection_operator_count'],
-                data['tags'], data['classifications'],
-                data['pnl'], data['book_size'], data['long_count'], data['short_count'], data['turnover'], data['returns'], data['drawdown'],
-                data['margin'], data['sharpe'], data['fitness'], data['is_start_date'],
-                data['investability_constrained_pnl'], data['investability_constrained_book_size'],
-                data['investability_constrained_long_count'], data['investability_constrained_short_count'],
-                data['investability_constrained_turnover'], data['investability_constrained_returns'],
-                data['investability_constrained_drawdown'], data['investability_constrained_margin'],
-                data['investability_constrained_fitness'], data['investability_constrained_sharpe'],
-                data['risk_neutralized_pnl'], data['risk_neutralized_book_size'],
-                data['risk_neutralized_long_count'], data['risk_neutralized_short_count'],
-                data['risk_neutralized_turnover'], data['risk_neutralized_returns'],
-                data['risk_neutralized_drawdown'], data['risk_neutralized_margin'],
-                data['risk_neutralized_fitness'], data['risk_neutralized_sharpe'],
-                data['checks'], data['competitions'], data['pyramids'], data['themes']
-            )
-            
-            # 使用参数化查询执行SQL语句
-            sql = sql_template.format(
-                id='%s', type='%s', author='%s', date_created='%s', date_submitted='%s', date_modified='%s', name='%s',
-                favorite='%s', hidden='%s', color='%s', category='%s', stage='%s', status='%s', grade='%s',
-                instrument_type='%s', region='%s', universe='%s', delay='%s', decay='%s', neutralization='%s',
-                truncation='%s', pasteurization='%s', unit_handling='%s', nan_handling='%s', selection_handling='%s', selection_limit='%s',
-                max_trade='%s', language='%s', visualization='%s', start_date='%s', end_date='%s', component_activation='%s', test_period='%s',
-                code='%s', description='%s', operator_count='%s',
-                combo_code='%s', combo_description='%s', combo_operator_count='%s',
-                selection_code='%s', selection_description='%s', selection_operator_count='%s',
-                tags='%s', classifications='%s',
-                pnl='%s', book_size='%s', long_count='%s', short_count='%s', turnover='%s', returns='%s', drawdown='%s',
-                margin='%s', sharpe='%s', fitness='%s', is_start_date='%s',
-                investability_constrained_pnl='%s', investability_constrained_book_size='%s',
-                investability_constrained_long_count='%s', investability_constrained_short_count='%s',
-                investability_constrained_turnover='%s', investability_constrained_returns='%s',
-                investability_constrained_drawdown='%s', investability_constrained_margin='%s',
-                investability_constrained_fitness='%s', investability_constrained_sharpe='%s',
-                risk_neutralized_pnl='%s', risk_neutralized_book_size='%s',
-                risk_neutralized_long_count='%s', risk_neutralized_short_count='%s',
-                risk_neutralized_turnover='%s', risk_neutralized_returns='%s',
-                risk_neutralized_drawdown='%s', risk_neutralized_margin='%s',
-                risk_neutralized_fitness='%s', risk_neutralized_sharpe='%s',
-                checks='%s', competitions='%s', pyramids='%s', themes='%s'
-            )
-            
             # 记录完整的SQL语句以便调试
             logger.debug(f"准备执行的完整SQL语句: {sql}")
             
@@ -993,16 +1157,403 @@ class AlphaCrawler:
             # 在错误日志中显示实际执行的完整SQL语句
             logger.error(f"完整SQL语句: {sql}")
             return False
-    
-    def get_alphas_page(self, limit: int = 100, offset: int = 0, filters: Optional[Dict] = None) -> Optional[Dict]:
-        """获取一页Alpha数据"""
+
+    def save_rows_batch(self, sql: str, rows: List[tuple], label: str = 'Alpha') -> Tuple[int, int]:
+        """一页数据批量upsert，整页只commit一次
+
+        executemany 会被 mysql.connector 改写为一条多行 INSERT ... ON DUPLICATE KEY UPDATE；
+        SQLite 后端在同一个事务里逐行执行，同样只提交一次。
+        整批失败时回滚，再逐行写入以定位出错的行，其余行照常入库。
+
+        Args:
+            sql: 单行的参数化upsert语句（所有行共用）
+            rows: 参数元组列表，第一个元素为Alpha ID
+            label: 日志中的数据名称
+
+        Returns:
+            (成功数, 失败数)
+        """
+        if not rows:
+            return 0, 0
+
+        cursor = self.db_connection.cursor()
+        try:
+            cursor.executemany(sql, rows)
+            self.db_connection.commit()
+            return len(rows), 0
+        except Error as e:
+            logger.warning(f"批量保存{label}数据失败，逐行写入定位出错的行: {e}")
+            self.db_connection.rollback()
+        finally:
+            cursor.close()
+
+        success_count = 0
+        error_count = 0
+        for values in rows:
+            cursor = self.db_connection.cursor()
+            try:
+                cursor.execute(sql, values)
+                self.db_connection.commit()
+                success_count += 1
+            except Error as e:
+                self.db_connection.rollback()
+                logger.error(f"保存{label}数据失败 (ID: {values[0]}): {e}")
+                error_count += 1
+            finally:
+                cursor.close()
+        return success_count, error_count
+
+    def save_alphas_batch(self, parsed_list: List[Dict]) -> Tuple[int, int]:
+        """批量保存一页已解析的Alpha数据，返回 (成功数, 失败数)"""
+        sql = None
+        rows = []
+        build_errors = 0
+        for parsed_data in parsed_list:
+            try:
+                sql, values = self.build_alpha_upsert(parsed_data)
+                rows.append(values)
+            except Exception as e:
+                logger.error(f"构造Alpha数据SQL参数失败 (ID: {parsed_data.get('id')}): {e}")
+                build_errors += 1
+        alpha_ids = [parsed['id'] for parsed in parsed_list if parsed.get('id')]
+        before = self._template_rows(alpha_ids)
+        success_count, error_count = self.save_rows_batch(sql, rows, 'Alpha')
+        if success_count and before is not None:
+            self.refresh_template_stats(before, self._template_rows(alpha_ids))
+        return success_count, error_count + build_errors
+
+    def _template_rows(self, alpha_ids: List[str]) -> Optional[List[tuple]]:
+        """按主键取一页Alpha当前在库的模版分组字段（查询失败返回None）"""
+        if not alpha_ids:
+            return []
+        cursor = self.db_connection.cursor()
+        try:
+            cursor.execute(f"""
+            SELECT template_hash, region, universe, template_expression, sharpe, fitness, checks, date_created
+            FROM alphas WHERE id IN ({', '.join(['%s'] * len(alpha_ids))})
+            """, tuple(alpha_ids))
+            return cursor.fetchall()
+        except Error as e:
+            logger.warning(f"读取模版分组字段失败: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def refresh_template_stats(self, before: List[tuple], after: List[tuple]) -> int:
+        """
+        按页增量更新 template_performance 汇总表
+
+        只用本页Alpha入库前后的行算出各分组的增量（数量、通过数、指标累加和），
+        同一Alpha重复入库或指标变化都不会重复计数，也不再回读分组内其他Alpha。
+        分位数每 TEMPLATE_QUANTILE_INTERVAL 页由 refresh_template_quantiles 批量重算。
+
+        Returns:
+            更新的分组数
+        """
+        deltas = {}
+        for row in before:
+            accumulate_template_delta(deltas, row, -1)
+        for row in after:
+            accumulate_template_delta(deltas, row, 1)
+        updated = self._apply_template_deltas(deltas)
+
+        self._pages_since_quantiles += 1
+        if self._dirty_templates and self._pages_since_quantiles >= TEMPLATE_QUANTILE_INTERVAL:
+            self.refresh_template_quantiles()
+        return updated
+
+    def _apply_template_deltas(self, deltas: Dict) -> int:
+        """把分组增量累加进 template_performance，并重算均值/通过率"""
+        counters = [column for column in TEMPLATE_DELTA_COLUMNS if column not in ('template_expression', 'last_seen')]
+        # 原样重复入库的Alpha增量为0，不产生写入
+        changed = {key: delta for key, delta in deltas.items() if any(delta[column] for column in counters)}
+        if not changed:
+            return 0
+
+        upsert_sql = f"""
+        INSERT INTO template_performance (template_hash, region, universe, {', '.join(TEMPLATE_DELTA_COLUMNS)})
+        VALUES ({', '.join(['%s'] * (len(TEMPLATE_DELTA_COLUMNS) + 3))})
+        ON DUPLICATE KEY UPDATE {', '.join(f'{column} = {column} + VALUES({column})' for column in counters)},
+            template_expression = COALESCE(VALUES(template_expression), template_expression),
+            last_seen = CASE WHEN last_seen IS NULL OR VALUES(last_seen) > last_seen
+                             THEN COALESCE(VALUES(last_seen), last_seen) ELSE last_seen END,
+            updated_at = CURRENT_TIMESTAMP
+        """
+        # 派生列单独更新：SQLite 的 DO UPDATE 读到的是旧值，不能在同一语句里引用刚累加的列
+        derive_sql = """
+        UPDATE template_performance
+        SET pass_rate = pass_count * 1.0 / NULLIF(alpha_count, 0),
+            sharpe_mean = sharpe_sum / NULLIF(sharpe_n, 0),
+            fitness_mean = fitness_sum / NULLIF(fitness_n, 0)
+        WHERE template_hash = %s AND region = %s AND universe = %s
+        """
+        # 分组内Alpha全部迁走（代码修改换了模版）后删除空分组
+        prune_sql = """
+        DELETE FROM template_performance
+        WHERE template_hash = %s AND region = %s AND universe = %s AND alpha_count <= 0
+        """
+        cursor = self.db_connection.cursor()
+        try:
+            cursor.executemany(upsert_sql, [(*key, *(delta[column] for column in TEMPLATE_DELTA_COLUMNS))
+                                            for key, delta in changed.items()])
+            cursor.executemany(derive_sql, list(changed))
+            cursor.executemany(prune_sql, list(changed))
+            self.db_connection.commit()
+            self._dirty_templates.update(changed)
+            return len(changed)
+        except Error as e:
+            self.db_connection.rollback()
+            logger.warning(f"刷新模版汇总表失败: {e}")
+            return 0
+        finally:
+            cursor.close()
+
+    def refresh_template_quantiles(self) -> int:
+        """
+        重算脏分组的夏普/Fitness分位数
+
+        只读 sharpe、fitness 两列，按 (template_hash, region, universe) 等值走 idx_template 索引。
+
+        Returns:
+            重算的分组数
+        """
+        groups = list(self._dirty_templates)
+        if not groups:
+            return 0
+
+        cursor = self.db_connection.cursor()
+        try:
+            rows = []
+            for group in groups:
+                cursor.execute("""
+                SELECT sharpe, fitness FROM alphas
+                WHERE template_hash = %s AND region = %s AND universe = %s
+                """, group)
+                members = cursor.fetchall()
+                quantiles = []
+                for index in (0, 1):
+                    values = sorted(float(member[index]) for member in members if member[index] is not None)
+                    quantiles.extend(_quantile(values, q) for q in (0.25, 0.5, 0.75))
+                rows.append((*quantiles, *group))
+            cursor.executemany("""
+            UPDATE template_performance
+            SET sharpe_p25 = %s, sharpe_p50 = %s, sharpe_p75 = %s,
+                fitness_p25 = %s, fitness_p50 = %s, fitness_p75 = %s
+            WHERE template_hash = %s AND region = %s AND universe = %s
+            """, rows)
+            self.db_connection.commit()
+            self._dirty_templates.difference_update(groups)
+            self._pages_since_quantiles = 0
+            return len(rows)
+        except Error as e:
+            self.db_connection.rollback()
+            logger.warning(f"重算模版分位数失败: {e}")
+            return 0
+        finally:
+            cursor.close()
+
+    def rebuild_template_stats(self) -> int:
+        """从 alphas 表全量重建 template_performance（升级表结构时执行一次）"""
+        cursor = self.db_connection.cursor()
+        try:
+            # 旧数据的 region/universe 可能是NULL，统一成空串后分组才能直接等值匹配
+            cursor.execute("""
+            UPDATE alphas SET region = COALESCE(region, ''), universe = COALESCE(universe, '')
+            WHERE template_hash IS NOT NULL AND (region IS NULL OR universe IS NULL)
+            """)
+            cursor.execute("DELETE FROM template_performance")
+            cursor.execute("""
+            SELECT template_hash, region, universe, template_expression, sharpe, fitness, checks, date_created
+            FROM alphas WHERE template_hash IS NOT NULL
+            """)
+            deltas = {}
+            for row in cursor.fetchall():
+                accumulate_template_delta(deltas, row, 1)
+            self.db_connection.commit()
+        except Error as e:
+            self.db_connection.rollback()
+            logger.warning(f"重建模版汇总表失败: {e}")
+            return 0
+        finally:
+            cursor.close()
+        rebuilt = self._apply_template_deltas(deltas)
+        self.refresh_template_quantiles()
+        return rebuilt
+
+    def rank_templates(self, region: Optional[str] = None, universe: Optional[str] = None,
+                       min_count: int = 5, order_by: str = 'sharpe_p50', limit: int = 20) -> List[Dict]:
+        """从 template_performance 汇总表取表现最好的模版（不扫描 alphas 表）"""
+        if order_by not in TEMPLATE_STATS_COLUMNS:
+            raise ValueError(f"不支持的排序列: {order_by}")
+        self.refresh_template_quantiles()
+        conditions, params = ['alpha_count >= %s'], [min_count]
+        if region is not None:
+            conditions.append('region = %s')
+            params.append(region)
+        if universe is not None:
+            conditions.append('universe = %s')
+            params.append(universe)
+        params.append(limit)
+
+        columns = ('template_hash', 'region', 'universe') + TEMPLATE_STATS_COLUMNS
+        cursor = self.db_connection.cursor()
+        cursor.execute(f"""
+        SELECT {', '.join(columns)} FROM template_performance
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {order_by} DESC LIMIT %s
+        """, tuple(params))
+        rows = cursor.fetchall()
+        cursor.close()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def save_timeseries(self, alpha_id: str, series_type: str, data: Any) -> bool:
+        """
+        保存Alpha时间序列到 alpha_timeseries 表（压缩编码，见 timeseries_codec.py）
+
+        Args:
+            alpha_id: Alpha ID
+            series_type: 'pnl' / 'yearly_stats'
+            data: API 返回的序列（{'records': [...]} 或记录列表）
+        """
+        try:
+            encoding, blob, points = encode_series(data)
+            cursor = self.db_connection.cursor()
+            sql = """
+            INSERT INTO alpha_timeseries (alpha_id, series_type, encoding, points, data)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE encoding = VALUES(encoding), points = VALUES(points), data = VALUES(data)
+            """
+            cursor.execute(sql, (alpha_id, series_type, encoding, points, blob))
+            self.db_connection.commit()
+            cursor.close()
+            self._timeseries_cache.pop((alpha_id, series_type), None)
+            return True
+        except Error as e:
+            logger.error(f"保存时间序列失败 (ID: {alpha_id}, 类型: {series_type}): {e}")
+            return False
+
+    def get_timeseries(self, alpha_id: str, series_type: str) -> Optional[Any]:
+        """按需读取并解码Alpha时间序列（带LRU缓存），不存在时返回None"""
+        key = (alpha_id, series_type)
+        if key in self._timeseries_cache:
+            self._timeseries_cache.move_to_end(key)
+            return self._timeseries_cache[key]
+
+        try:
+            cursor = self.db_connection.cursor()
+            cursor.execute("SELECT encoding, data FROM alpha_timeseries WHERE alpha_id = %s AND series_type = %s",
+                           (alpha_id, series_type))
+            result = cursor.fetchone()
+            cursor.close()
+        except Error as e:
+            logger.error(f"读取时间序列失败 (ID: {alpha_id}, 类型: {series_type}): {e}")
+            return None
+        if not result:
+            return None
+
+        data = decode_series(result[0], bytes(result[1]))
+        self._timeseries_cache[key] = data
+        if len(self._timeseries_cache) > self.timeseries_cache_size:
+            self._timeseries_cache.popitem(last=False)
+        return data
+
+    def get_pnl(self, alpha_id: str) -> Optional[Any]:
+        """Alpha的PnL序列（原 alphas.pnl_data）"""
+        return self.get_timeseries(alpha_id, 'pnl')
+
+    def get_yearly_stats(self, alpha_id: str) -> Optional[Any]:
+        """Alpha的年度统计（原 alphas.yearly_stats_data）"""
+        return self.get_timeseries(alpha_id, 'yearly_stats')
+
+    def migrate_timeseries(self, batch_size: int = 200, drop_columns: bool = False) -> int:
+        """
+        迁移：把 alphas / submitted_alphas 中已有的 pnl_data / yearly_stats_data JSON
+        压缩写入 alpha_timeseries，并清空原列；drop_columns=True 时迁移完成后删除原列。
+        可重复执行（已迁移的行原列为NULL，不会再被选中）。
+
+        Returns:
+            迁移的序列条数
+        """
+        column_map = {'pnl_data': 'pnl', 'yearly_stats_data': 'yearly_stats'}
+        insert_sql = """
+        INSERT INTO alpha_timeseries (alpha_id, series_type, encoding, points, data)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE encoding = VALUES(encoding), points = VALUES(points), data = VALUES(data)
+        """
+        migrated = 0
+
+        for table in ('alphas', 'submitted_alphas'):
+            columns = [column for column in self.table_columns(table) if column in column_map]
+            if not columns:
+                logger.info(f"{table} 表没有需要迁移的时间序列列")
+                continue
+
+            not_null = ' OR '.join(f"{column} IS NOT NULL" for column in columns)
+            table_migrated = 0
+            while True:
+                cursor = self.db_connection.cursor()
+                cursor.execute(f"SELECT id, {', '.join(columns)} FROM {table} WHERE {not_null} LIMIT %s", (batch_size,))
+                rows = cursor.fetchall()
+                if not rows:
+                    cursor.close()
+                    break
+
+                series_rows = []
+                for row in rows:
+                    for column, value in zip(columns, row[1:]):
+                        if value is None:
+                            continue
+                        data = json.loads(value) if isinstance(value, (str, bytes, bytearray)) else value
+                        series_rows.append((row[0], column_map[column], *encode_series(data)))
+                try:
+                    if series_rows:
+                        cursor.executemany(insert_sql, [(alpha_id, series_type, encoding, points, blob)
+                                                        for alpha_id, series_type, encoding, blob, points in series_rows])
+                    ids = [row[0] for row in rows]
+                    placeholders = ', '.join(['%s'] * len(ids))
+                    cursor.execute(f"UPDATE {table} SET {', '.join(f'{column} = NULL' for column in columns)} "
+                                   f"WHERE id IN ({placeholders})", ids)
+                    self.db_connection.commit()
+                except Error:
+                    self.db_connection.rollback()
+                    raise
+                finally:
+                    cursor.close()
+
+                table_migrated += len(series_rows)
+                logger.info(f"{table}: 已迁移 {table_migrated} 条时间序列")
+
+            migrated += table_migrated
+            if drop_columns:
+                cursor = self.db_connection.cursor()
+                if self.db_backend == 'sqlite':
+                    # SQLite 的 ALTER TABLE 一次只能删除一列
+                    for column in columns:
+                        cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+                else:
+                    cursor.execute(f"ALTER TABLE {table} {', '.join(f'DROP COLUMN {column}' for column in columns)}")
+                self.db_connection.commit()
+                cursor.close()
+                logger.info(f"{table}: 已删除列 {', '.join(columns)}")
+
+        logger.info(f"时间序列迁移完成，共 {migrated} 条")
+        return migrated
+
+    def throttle(self):
+        """请求前占用一个限流令牌"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    def get_alphas_page(self, limit: int = 100, offset: int = 0, filters: Optional[Dict] = None,
+                        order: str = '-dateCreated') -> Optional[Dict]:
+        """获取一页Alpha数据（order: 排序字段，增量爬取时为 dateModified）"""
         if not self.is_authenticated:
             logger.error("未认证，请先调用authenticate方法")
             return None
         
         try:
             # 构建基础URL
-            api_url = f"{self.base_url}/users/self/alphas?limit={limit}&offset={offset}&hidden=false&order=-dateCreated"
+            api_url = f"{self.base_url}/users/self/alphas?limit={limit}&offset={offset}&hidden=false&order={order}"
             
             # 添加过滤条件
             if filters:
@@ -1038,6 +1589,7 @@ class AlphaCrawler:
                         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36'
                     }
                     
+                    self.throttle()
                     response = self.session.get(api_url, headers=headers, timeout=30)
                     
                     if response.status_code == 200:
@@ -1077,6 +1629,34 @@ class AlphaCrawler:
             logger.error(f"获取数据请求异常: {e}")
             return None
     
+    def ingest_page(self, results: List[Dict]) -> Tuple[int, int]:
+        """解析并批量入库一页Alpha数据，返回 (成功数, 失败数)"""
+        page_success = 0
+        page_error = 0
+        parsed_list = []
+
+        for alpha_data in results:
+            try:
+                # 解析数据
+                parsed_data = self.parse_alpha_data(alpha_data)
+
+                if not parsed_data:
+                    logger.warning(f"数据解析失败: {alpha_data.get('id')}")
+                    page_error += 1
+                    continue
+
+                parsed_list.append(parsed_data)
+
+            except Exception as e:
+                logger.error(f"处理Alpha数据异常: {e}")
+                page_error += 1
+
+        # 保存到数据库
+        saved, failed = self.save_alphas_batch(parsed_list)
+        page_success += saved
+        page_error += failed
+        return page_success, page_error
+
     def crawl_alphas(self, total_limit: Optional[int] = None, 
                     filters: Optional[Dict] = None, resume_from: int = None, 
                     task_id: str = 'default', crawl_status_id: Optional[int] = None) -> bool:
@@ -1104,12 +1684,7 @@ class AlphaCrawler:
         if crawl_status_id is not None:
             # 直接使用提供的批次记录ID
             logger.info(f"使用提供的批次记录 ID: {crawl_status_id}")
-            # 更新记录状态为running，并计算duration_seconds（从start_time到当前时间）
-            cursor = self.db_connection.cursor()
-            sql = "UPDATE crawl_status SET status = 'running', start_time = %s, duration_seconds = TIMESTAMPDIFF(SECOND, %s, NOW()) WHERE id = %s"
-            cursor.execute(sql, (start_time, start_time, crawl_status_id))
-            self.db_connection.commit()
-            cursor.close()
+            self.start_crawl_status(crawl_status_id, start_time)
         else:
             # 如果没有提供批次记录ID，则查找现有记录
             cursor = self.db_connection.cursor()
@@ -1121,12 +1696,7 @@ class AlphaCrawler:
             
             if result:
                 crawl_status_id = result[0]
-                # 更新记录状态为running，并计算duration_seconds（从start_time到当前时间）
-                cursor = self.db_connection.cursor()
-                sql = "UPDATE crawl_status SET status = 'running', start_time = %s, duration_seconds = TIMESTAMPDIFF(SECOND, %s, NOW()) WHERE id = %s"
-                cursor.execute(sql, (start_time, start_time, crawl_status_id))
-                self.db_connection.commit()
-                cursor.close()
+                self.start_crawl_status(crawl_status_id, start_time)
                 logger.info(f"使用现有批次记录 ID: {crawl_status_id}")
             else:
                 logger.warning(f"未找到匹配的批次记录，将创建新记录")
@@ -1159,29 +1729,8 @@ class AlphaCrawler:
                     logger.info("没有更多数据")
                     break
                 
-                # 处理本页数据
-                page_success = 0
-                page_error = 0
-                
-                for alpha_data in results:
-                    try:
-                        # 解析数据
-                        parsed_data = self.parse_alpha_data(alpha_data)
-                        
-                        if not parsed_data:
-                            logger.warning(f"数据解析失败: {alpha_data.get('id')}")
-                            page_error += 1
-                            continue
-                        
-                        # 保存到数据库
-                        if self.save_alpha_to_database(parsed_data):
-                            page_success += 1
-                        else:
-                            page_error += 1
-                            
-                    except Exception as e:
-                        logger.error(f"处理Alpha数据异常: {e}")
-                        page_error += 1
+                # 处理本页数据：先解析整页，再批量入库（一页一次commit）
+                page_success, page_error = self.ingest_page(results)
                 
                 # 更新统计
                 success_count += page_success
@@ -1204,11 +1753,8 @@ class AlphaCrawler:
                     logger.info("已获取所有数据")
                     break
                 
-                # 更新offset
+                # 更新offset（请求频率由 get_alphas_page 中的限流器控制）
                 offset += limit
-                
-                # 添加延迟避免频繁请求
-                time.sleep(2)
             
             # 记录结束时间
             end_time = datetime.now()
@@ -1232,6 +1778,156 @@ class AlphaCrawler:
             logger.error(f"爬取过程中发生异常: {e}")
             return False
     
+    def fetch_batch_page(self, limit: int, offset: int, filters: Optional[Dict]) -> Optional[Dict]:
+        """流水线翻页时获取一页数据（子类可覆盖）"""
+        return self.get_alphas_page(limit, offset, filters)
+
+    def _fetch_batch(self, batch: Dict, total_limit: Optional[int], page_queue: queue.Queue,
+                     stop_event: threading.Event, limit: int = 100) -> None:
+        """
+        生产者：顺序翻完一个批次，每页放入队列（队列满时阻塞，写库跟不上时自然减速）
+
+        队列消息为 (类型, 批次记录ID, 数据)：
+            ('start', id, None)
+            ('page', id, (offset, results))
+            ('done', id, (offset, 取数失败, 异常信息))
+        """
+        def _put(item) -> bool:
+            while not stop_event.is_set():
+                try:
+                    page_queue.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        crawl_status_id = batch['id']
+        offset = batch['offset']
+        fetched = 0
+        fetch_failed = False
+        error_message = None
+        _put(('start', crawl_status_id, None))
+        try:
+            while not stop_event.is_set():
+                with self._auth_lock:
+                    if not self.authenticate():
+                        raise RuntimeError("认证失败")
+
+                page_data = self.fetch_batch_page(limit, offset, batch['filters'])
+                if not page_data:
+                    logger.error(f"批次 {crawl_status_id} 第 {offset//limit + 1} 页数据获取失败")
+                    fetch_failed = True
+                    break
+
+                results = page_data.get('results', [])
+                if not results:
+                    break
+                if not _put(('page', crawl_status_id, (offset, results))):
+                    return
+                fetched += len(results)
+
+                if total_limit and fetched >= total_limit:
+                    logger.info(f"批次 {crawl_status_id} 达到总数限制 {total_limit}，停止爬取")
+                    break
+                if not page_data.get('next'):
+                    break
+                offset += limit
+        except Exception as e:
+            error_message = str(e)
+            logger.error(f"批次 {crawl_status_id} 翻页异常: {e}")
+        _put(('done', crawl_status_id, (offset, fetch_failed, error_message)))
+
+    def crawl_batches_pipelined(self, batches: List[Dict], total_limit: Optional[int] = None,
+                                max_fetchers: int = 4, queue_size: int = 8, limit: int = 100) -> Tuple[int, int]:
+        """
+        流水线爬取多个批次：多个批次并发翻页（共用限流器），页面经有界队列交给当前线程解析入库
+
+        翻页与写库重叠进行，总耗时约为 max(翻页, 写库)，不再是两者之和加固定 sleep。
+        数据库连接只在当前线程使用；每写完一页就把 offset 和统计写回 crawl_status（断点）。
+
+        Args:
+            batches: [{'id': 批次记录ID, 'filters': 过滤条件, 'offset': 起始offset,
+                       'total_count'/'success_count'/'error_count': 已有统计（断点续连时）}]
+            total_limit: 每批数据量限制
+            max_fetchers: 同时翻页的批次数
+            queue_size: 已取回但未入库的页数上限
+            limit: 每页条数
+
+        Returns:
+            (成功批次数量, 失败批次数量)，与 crawl_alphas 一致：有数据入库即算成功
+        """
+        if not batches:
+            return 0, 0
+
+        states = {}
+        for batch in batches:
+            states[batch['id']] = {
+                'start_time': None,
+                'total_count': batch.get('total_count', 0),
+                'success_count': batch.get('success_count', 0),
+                'error_count': batch.get('error_count', 0),
+                'offset': batch['offset'],
+            }
+
+        page_queue = queue.Queue(maxsize=queue_size)
+        stop_event = threading.Event()
+        total_success = 0
+        total_error = 0
+        finished = 0
+        executor = ThreadPoolExecutor(max_workers=max_fetchers)
+        try:
+            for batch in batches:
+                executor.submit(self._fetch_batch, batch, total_limit, page_queue, stop_event, limit)
+
+            while finished < len(batches):
+                kind, crawl_status_id, payload = page_queue.get()
+                state = states[crawl_status_id]
+
+                if kind == 'start':
+                    state['start_time'] = datetime.now()
+                    self.start_crawl_status(crawl_status_id, state['start_time'])
+                    continue
+
+                if kind == 'page':
+                    offset, results = payload
+                    page_success, page_error = self.ingest_page(results)
+                    state['success_count'] += page_success
+                    state['error_count'] += page_error
+                    state['total_count'] += len(results)
+                    state['offset'] = offset
+                    logger.info(f"批次 {crawl_status_id} 第 {offset//limit + 1} 页处理完成: "
+                                f"成功 {page_success}, 失败 {page_error} (队列中 {page_queue.qsize()} 页)")
+                    # 断点：已入库的最后一页
+                    self.update_crawl_status(crawl_status_id, state['total_count'], state['success_count'],
+                                             state['error_count'], offset)
+                    continue
+
+                offset, fetch_failed, error_message = payload
+                finished += 1
+                if fetch_failed:
+                    state['error_count'] += 1
+                end_time = datetime.now()
+                duration = (end_time - state['start_time']).total_seconds()
+                if error_message:
+                    self.error_crawl_status(crawl_status_id, state['total_count'], state['success_count'],
+                                            state['error_count'], state['offset'], end_time, duration, error_message)
+                else:
+                    self.complete_crawl_status(crawl_status_id, state['total_count'], state['success_count'],
+                                               state['error_count'], state['offset'], end_time, duration)
+
+                if not error_message and state['success_count'] > 0:
+                    total_success += 1
+                else:
+                    total_error += 1
+                logger.info(f"批次 {crawl_status_id} 完成 ({finished}/{len(batches)}): 总数 {state['total_count']}, "
+                            f"成功 {state['success_count']}, 失败 {state['error_count']}, 耗时 {duration:.0f} 秒")
+        finally:
+            # 写库异常时通知生产者退出，避免阻塞在满队列上
+            stop_event.set()
+            executor.shutdown(wait=True)
+
+        return total_success, total_error
+    
     def save_crawl_status(self, total_count: int, success_count: int, error_count: int, 
                          last_offset: int, task_id: str = 'default', task_type: str = 'alpha_crawl',
                          task_params: Optional[Dict] = None) -> bool:
@@ -1291,6 +1987,14 @@ class AlphaCrawler:
             logger.error(f"创建爬虫状态记录失败: {e}")
             return None
     
+    def start_crawl_status(self, crawl_status_id: int, start_time: datetime) -> None:
+        """将批次记录更新为running状态，并计算duration_seconds（从start_time到当前时间）"""
+        cursor = self.db_connection.cursor()
+        sql = "UPDATE crawl_status SET status = 'running', start_time = %s, duration_seconds = TIMESTAMPDIFF(SECOND, %s, NOW()) WHERE id = %s"
+        cursor.execute(sql, (start_time, start_time, crawl_status_id))
+        self.db_connection.commit()
+        cursor.close()
+    
     def update_crawl_status(self, crawl_status_id: int, total_count: int, success_count: int, 
                            error_count: int, last_offset: int) -> bool:
         """更新爬虫状态记录"""
@@ -1435,6 +2139,7 @@ class AlphaCrawler:
     def close(self):
         """关闭连接"""
         if self.db_connection and self.db_connection.is_connected():
+            self.refresh_template_quantiles()
             self.db_connection.close()
             logger.info("数据库连接已关闭")
 
@@ -1541,6 +2246,305 @@ class AlphaCrawler:
     
 
 
+    def count_alphas(self, filters: Dict) -> int:
+        """limit=1 只取 count，用于切片规划"""
+        data = self.get_alphas_page(limit=1, offset=0, filters=filters)
+        if data is None:
+            raise RuntimeError(f"count 探测失败: {filters}")
+        return int(data.get('count', 0))
+
+    def create_planned_batch_filters(self, start_date: str, end_date: str,
+                                     additional_filters: Optional[Dict] = None,
+                                     max_rows: int = 10000) -> List[Dict]:
+        """
+        按 count 探测二分 dateCreated 窗口生成分批过滤条件（见 zhang/listing_planner.py）
+
+        与 create_daily_batch_filters 的 天 × fitness 区间 固定切分不同，只在条数超过 offset 上限时才切分，
+        空窗口不生成批次，相邻小窗口合并，批次数最少且每批都能完整翻页。
+
+        Args:
+            start_date: 开始日期 (YYYY-MM-DD)
+            end_date: 结束日期 (YYYY-MM-DD)，包含当天（与 create_daily_batch_filters 一致）
+            additional_filters: 额外的过滤条件
+            max_rows: 单批最大条数（offset 上限）
+
+        Returns:
+            分批过滤条件列表，格式同 create_daily_batch_filters
+        """
+        base_filters = dict(self.base_filters)
+        if additional_filters:
+            base_filters.update(additional_filters)
+
+        def _window_filters(window_start, window_end):
+            filters = base_filters.copy()
+            filters['dateCreated>='] = format_time(window_start)
+            filters['dateCreated<'] = format_time(window_end)
+            return filters
+
+        try:
+            end_exclusive = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            slices = plan_time_slices(lambda s, e: self.count_alphas(_window_filters(s, e)),
+                                      f'{start_date}T00:00:00-04:00', f'{end_exclusive}T00:00:00-04:00',
+                                      max_rows=max_rows, max_workers=4)
+        except Exception as e:
+            logger.error(f"规划分批过滤条件失败: {e}")
+            return []
+
+        batch_filters = []
+        for window_start, window_end, count in slices:
+            batch_filters.append({
+                'filters': _window_filters(window_start, window_end),
+                'date': window_start.strftime('%Y-%m-%d'),
+                'fitness_range': None,
+                'fitness_min': None,
+                'fitness_max': None,
+                'expected_count': count,
+                'description': f"{format_time(window_start)} ~ {format_time(window_end)} ({count}条)"
+            })
+        logger.info(f"规划了 {len(batch_filters)} 个分批过滤条件，共 {sum(c for _, _, c in slices)} 条")
+        return batch_filters
+
+    def incremental_task_id(self, filters: Optional[Dict] = None) -> str:
+        """同一组过滤条件共用一个增量任务ID（水位线按过滤条件区分）"""
+        import hashlib
+        filters_json = json.dumps(filters or {}, sort_keys=True, ensure_ascii=False)
+        return f"incr_{hashlib.md5(filters_json.encode()).hexdigest()[:12]}"
+
+    def get_incremental_state(self, task_id: str) -> Optional[Dict]:
+        """读取最近一次记录的增量状态 {'filters', 'watermark', 'last_reconcile'}"""
+        try:
+            cursor = self.db_connection.cursor()
+            sql = """
+            SELECT task_params FROM crawl_status
+            WHERE task_id = %s AND task_type = %s AND task_params IS NOT NULL
+            ORDER BY id DESC
+            LIMIT 1
+            """
+            cursor.execute(sql, (task_id, INCREMENTAL_TASK_TYPE))
+            result = cursor.fetchone()
+            cursor.close()
+            return json.loads(result[0]) if result and result[0] else None
+        except Error as e:
+            logger.error(f"读取增量水位线失败: {e}")
+            return None
+
+    def save_incremental_state(self, crawl_status_id: int, state: Dict) -> bool:
+        """把增量状态写入本次任务记录的task_params（每页入库后调用，作为断点）"""
+        try:
+            cursor = self.db_connection.cursor()
+            sql = "UPDATE crawl_status SET task_params = %s, updated_at = NOW() WHERE id = %s"
+            cursor.execute(sql, (json.dumps(state, ensure_ascii=False), crawl_status_id))
+            self.db_connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            logger.error(f"保存增量水位线失败: {e}")
+            return False
+
+    def crawl_incremental(self, filters: Optional[Dict] = None, overlap_minutes: int = 10,
+                          reconcile_days: int = 7, total_limit: Optional[int] = None) -> bool:
+        """
+        增量爬取：只拉取 dateModified 不早于上次水位线的Alpha，按 dateModified 升序翻页并入库
+
+        翻页以水位线为游标（dateModified>=游标，offset 归零），不受 offset 上限限制；
+        首次运行没有水位线时即为按 dateModified 的全量爬取。每页入库后把水位线写回 crawl_status，
+        中途失败下次从已入库的位置继续；本次有入库失败的行时水位线不再前移，下次会重新拉取。
+        每隔 reconcile_days 天做一次按月的 count 对账（reconcile_counts）。
+
+        Args:
+            filters: 额外过滤条件（默认 base_filters），不同过滤条件各自维护水位线
+            overlap_minutes: 从水位线往前回退的分钟数，覆盖平台写入延迟，重复行由upsert去重
+            reconcile_days: 对账间隔天数，0 表示不对账
+            total_limit: 本次最多处理的条数
+
+        Returns:
+            是否没有失败的行
+        """
+        filters = dict(self.base_filters if filters is None else filters)
+        task_id = self.incremental_task_id(filters)
+        previous = self.get_incremental_state(task_id) or {}
+        state = {
+            'filters': filters,
+            'watermark': previous.get('watermark'),
+            'last_reconcile': previous.get('last_reconcile'),
+        }
+
+        cursor_time = None
+        if state['watermark']:
+            cursor_time = (parse_api_time(state['watermark']) - timedelta(minutes=overlap_minutes)).replace(microsecond=0)
+            logger.info(f"增量爬取 {task_id}: 水位线 {state['watermark']}，从 {cursor_time.isoformat()} 开始")
+        else:
+            logger.warning(f"增量爬取 {task_id}: 没有水位线，本次按 dateModified 全量爬取")
+
+        start_time = datetime.now()
+        crawl_status_id = self.create_crawl_status(start_time, filters, task_id, INCREMENTAL_TASK_TYPE, state)
+        if not crawl_status_id:
+            return False
+
+        total_count = 0
+        success_count = 0
+        error_count = 0
+        limit = 100
+        offset = 0
+        # 游标所在秒内已入库的ID（从游标重新翻页时跳过）
+        seen_at_cursor = set()
+        frozen = False
+
+        try:
+            while True:
+                with self._auth_lock:
+                    if not self.authenticate():
+                        raise RuntimeError("认证失败")
+
+                page_filters = dict(filters)
+                if cursor_time is not None:
+                    # 统一用 -04:00 表示，避免 URL 中出现 '+'
+                    page_filters['dateModified>='] = cursor_time.astimezone(BRAIN_TZ).isoformat()
+                page_data = self.get_alphas_page(limit, offset, page_filters, order='dateModified')
+                if not page_data:
+                    logger.error(f"增量爬取数据获取失败，游标 {page_filters.get('dateModified>=')}，offset {offset}")
+                    error_count += 1
+                    break
+
+                results = page_data.get('results', [])
+                fresh = [alpha for alpha in results if alpha.get('id') not in seen_at_cursor]
+                page_success, page_error = self.ingest_page(fresh)
+                success_count += page_success
+                error_count += page_error
+                total_count += len(fresh)
+
+                modified = [(parse_api_time(alpha['dateModified']), alpha.get('id'))
+                            for alpha in results if alpha.get('dateModified')]
+                if modified:
+                    page_max = max(dt for dt, _ in modified)
+                    page_cursor = page_max.replace(microsecond=0)
+                    if cursor_time is not None and page_cursor <= cursor_time:
+                        # 整页都在游标这一秒内：游标不变，继续往后翻
+                        offset += limit
+                        seen_at_cursor.update(alpha_id for _, alpha_id in modified)
+                    else:
+                        cursor_time = page_cursor
+                        offset = 0
+                        seen_at_cursor = {alpha_id for dt, alpha_id in modified
+                                          if dt.replace(microsecond=0) == page_cursor}
+
+                    if page_error and not frozen:
+                        frozen = True
+                        logger.warning(f"增量爬取有 {page_error} 条入库失败，本次水位线停在 {state['watermark']}")
+                    if not frozen:
+                        state['watermark'] = page_max.isoformat()
+
+                self.update_crawl_status(crawl_status_id, total_count, success_count, error_count, offset)
+                self.save_incremental_state(crawl_status_id, state)
+                logger.info(f"增量爬取: 本页 {len(fresh)} 条 (成功 {page_success}, 失败 {page_error})，水位线 {state['watermark']}")
+
+                if total_limit and total_count >= total_limit:
+                    logger.info(f"达到总数限制 {total_limit}，停止增量爬取")
+                    break
+                if len(results) < limit or not page_data.get('next'):
+                    break
+
+            if reconcile_days:
+                last_reconcile = datetime.fromisoformat(state['last_reconcile']) if state['last_reconcile'] else None
+                if not previous.get('watermark'):
+                    # 本次即全量爬取，无需对账
+                    state['last_reconcile'] = datetime.now().isoformat(timespec='seconds')
+                elif last_reconcile is None or datetime.now() - last_reconcile >= timedelta(days=reconcile_days):
+                    self.reconcile_counts(filters, task_id)
+                    state['last_reconcile'] = datetime.now().isoformat(timespec='seconds')
+                self.save_incremental_state(crawl_status_id, state)
+
+            end_time = datetime.now()
+            duration = (end_time - start_time).total_seconds()
+            self.complete_crawl_status(crawl_status_id, total_count, success_count, error_count, offset, end_time, duration)
+            logger.info(f"增量爬取完成: 总数 {total_count}, 成功 {success_count}, 失败 {error_count}, "
+                        f"水位线 {state['watermark']}, 耗时 {duration} 秒")
+            return error_count == 0
+
+        except Exception as e:
+            end_time = datetime.now()
+            duration = (end_time - start_time).total_seconds()
+            self.error_crawl_status(crawl_status_id, total_count, success_count, error_count, offset,
+                                    end_time, duration, str(e))
+            logger.error(f"增量爬取过程中发生异常: {e}")
+            return False
+
+    def reconcile_counts(self, filters: Optional[Dict] = None, task_id: str = 'reconcile',
+                         max_fetchers: int = 4) -> Tuple[int, int]:
+        """
+        按 dateCreated 月份对账：比较 API 的 count（limit=1 请求）与 alphas 表的条数
+
+        库中少于 API 的月份重新全量爬取（分批 + 流水线）；库中多于 API 的月份
+        （平台侧已删除或隐藏）只打印警告。库中计数不区分额外过滤条件，
+        filters 只含 base_filters 时对账是精确的。
+
+        Returns:
+            (检查月份数, 重新爬取月份数)
+        """
+        filters = dict(self.base_filters if filters is None else filters)
+
+        # 库中时间为北京时间，减 12 小时即平台时间（-04:00）
+        if self.db_backend == 'sqlite':
+            month_expr = "strftime('%Y-%m', date_created, '-12 hours')"
+        else:
+            month_expr = "DATE_FORMAT(DATE_SUB(date_created, INTERVAL 12 HOUR), '%Y-%m')"
+        cursor = self.db_connection.cursor()
+        cursor.execute(f"""
+        SELECT {month_expr} AS month, COUNT(*)
+        FROM alphas GROUP BY month
+        """)
+        db_counts = {month: count for month, count in cursor.fetchall()}
+        cursor.close()
+        if not db_counts:
+            logger.info("alphas表为空，跳过对账")
+            return 0, 0
+
+        months = []
+        month_start = datetime.strptime(min(db_counts), '%Y-%m').replace(tzinfo=BRAIN_TZ)
+        now = datetime.now(BRAIN_TZ)
+        while month_start <= now:
+            next_month = (month_start + timedelta(days=32)).replace(day=1)
+            months.append((month_start, next_month))
+            month_start = next_month
+
+        def _count(window):
+            window_filters = dict(filters)
+            window_filters['dateCreated>='] = window[0].isoformat()
+            window_filters['dateCreated<'] = window[1].isoformat()
+            return self.count_alphas(window_filters)
+
+        with ThreadPoolExecutor(max_workers=max_fetchers) as executor:
+            api_counts = list(executor.map(_count, months))
+
+        recrawl = []
+        for (month_start, next_month), api_count in zip(months, api_counts):
+            month = month_start.strftime('%Y-%m')
+            db_count = db_counts.get(month, 0)
+            if api_count > db_count:
+                logger.warning(f"对账 {month}: API {api_count} 条，库中 {db_count} 条，重新爬取该月")
+                recrawl.append((month_start, next_month))
+            elif api_count < db_count:
+                logger.warning(f"对账 {month}: API {api_count} 条少于库中 {db_count} 条（平台侧已删除或隐藏）")
+        logger.info(f"对账完成: 检查 {len(months)} 个月，{len(recrawl)} 个月需要重新爬取")
+
+        for month_start, next_month in recrawl:
+            start_date = month_start.strftime('%Y-%m-%d')
+            end_date = (next_month - timedelta(days=1)).strftime('%Y-%m-%d')
+            if LISTING_PLANNER_AVAILABLE:
+                batch_filters = self.create_planned_batch_filters(start_date, end_date, additional_filters=filters)
+            else:
+                batch_filters = self.create_daily_batch_filters(start_date, end_date, additional_filters=filters)
+            batches = []
+            for batch_info in batch_filters:
+                crawl_status_id = self.create_crawl_status(datetime.now(), batch_info['filters'], task_id,
+                                                           'alpha_reconcile_batch')
+                if crawl_status_id:
+                    batches.append({'id': crawl_status_id, 'filters': batch_info['filters'], 'offset': 0})
+            self.crawl_batches_pipelined(batches, max_fetchers=max_fetchers)
+
+        return len(months), len(recrawl)
+
+
 def initialize_crawler() -> Optional[AlphaCrawler]:
     """初始化爬虫实例"""
     crawler = AlphaCrawler()
@@ -1621,24 +2625,12 @@ def check_resume_point(crawler: AlphaCrawler, resume: bool) -> Tuple[str, bool]:
         logger.info(f"断点续连：前一个主任务 {previous_task_id} 所有批次已完成，使用新任务 {actual_task_id}")
         return actual_task_id, False
 
-def process_batch_data(crawler: AlphaCrawler, task_id: str, total_limit: int) -> Tuple[int, int]:
-    """处理分批数据
-    
-    Args:
-        crawler: 爬虫实例
-        task_id: 任务ID
-        total_limit: 每批数据量限制
-        
-    Returns:
-        (成功批次数量, 失败批次数量)
-    """
-    total_success = 0
-    total_error = 0
-    
-    # 从数据库读取批次信息，优先处理running状态的批次，然后是pending状态的批次
+def load_pending_batches(crawler: AlphaCrawler, task_id: str, limit: int = 100) -> List[Dict]:
+    """从数据库读取待处理批次，running状态的批次从断点（最后入库页的下一页）继续"""
+    # 优先处理running状态的批次，然后是pending状态的批次
     cursor = crawler.db_connection.cursor()
     sql = """
-    SELECT id, batch_info, status FROM crawl_status 
+    SELECT id, batch_info, status, last_offset, total_count, success_count, error_count FROM crawl_status 
     WHERE task_id = %s AND (status = 'running' OR status = 'pending') 
     ORDER BY 
         CASE WHEN status = 'running' THEN 1 ELSE 2 END,
@@ -1648,39 +2640,50 @@ def process_batch_data(crawler: AlphaCrawler, task_id: str, total_limit: int) ->
     batch_records = cursor.fetchall()
     cursor.close()
     
-    if not batch_records:
+    batches = []
+    for record_id, batch_info_json, status, last_offset, total_count, success_count, error_count in batch_records:
+        batch_info = json.loads(batch_info_json)  # batch_info字段
+        batch = {
+            'id': record_id,
+            'filters': batch_info.get('filters', {}),
+            'description': batch_info.get('description', '未知批次'),
+            'offset': 0,
+        }
+        if status == 'running' and total_count:
+            batch.update(offset=(last_offset or 0) + limit, total_count=total_count,
+                         success_count=success_count or 0, error_count=error_count or 0)
+            logger.info(f"批次 {record_id} 从断点 offset {batch['offset']} 继续: {batch['description']}")
+        batches.append(batch)
+    return batches
+
+def process_batch_data(crawler: AlphaCrawler, task_id: str, total_limit: int,
+                       max_fetchers: int = 4) -> Tuple[int, int]:
+    """处理分批数据（多个批次并发翻页，翻页与入库流水线进行）
+    
+    Args:
+        crawler: 爬虫实例
+        task_id: 任务ID
+        total_limit: 每批数据量限制
+        max_fetchers: 同时翻页的批次数
+        
+    Returns:
+        (成功批次数量, 失败批次数量)
+    """
+    batches = load_pending_batches(crawler, task_id)
+    
+    if not batches:
         logger.warning(f"未找到任务 {task_id} 的待处理批次记录")
         return 0, 0
     
-    logger.info(f"从数据库读取到 {len(batch_records)} 个待处理批次")
+    logger.info(f"从数据库读取到 {len(batches)} 个待处理批次，并发翻页数: {max_fetchers}")
     
-    for i, record in enumerate(batch_records):
-            
-        batch_info = json.loads(record[1])  # batch_info字段
-        
-        logger.info(f"=== 开始处理第 {i+1} 批数据 ===")
-        logger.info(f"批次描述: {batch_info.get('description', '未知批次')}")
-        logger.info(f"过滤条件: {batch_info.get('filters', {})}")
-        
-        # 使用从数据库读取的批次信息进行爬取，直接传递批次记录ID
-        success = crawler.crawl_alphas(total_limit=total_limit, filters=batch_info.get('filters', {}), task_id=task_id, crawl_status_id=record[0])
-        
-        if success:
-            logger.info(f"第 {i+1} 批数据爬取成功")
-            total_success += 1
-        else:
-            logger.error(f"第 {i+1} 批数据爬取失败")
-            total_error += 1
-        
-        # 批次间延迟
-        time.sleep(5)
-    
-    return total_success, total_error
+    return crawler.crawl_batches_pipelined(batches, total_limit=total_limit, max_fetchers=max_fetchers)
 
 def main(start_date: str = "2025-08-28", 
           end_date: str = None,
           total_limit: int = 10000,
-          resume: bool = True):
+          resume: bool = True,
+          incremental: bool = False):
     """主函数，支持断点续连
     
     Args:
@@ -1688,6 +2691,7 @@ def main(start_date: str = "2025-08-28",
         end_date: 结束日期，格式: 2025-10-24，如果为None则动态获取明天日期
         total_limit: 每批数据量限制
         resume: 是否断点续连，默认开启
+        incremental: 增量模式，只爬取上次水位线之后修改过的Alpha（忽略日期范围和断点续连）
     """
     # 如果end_date为None，则动态计算明天的日期
     if end_date is None:
@@ -1707,6 +2711,10 @@ def main(start_date: str = "2025-08-28",
         return False
     
     try:
+        if incremental:
+            logger.info("增量模式: 按 dateModified 水位线爬取")
+            return crawler.crawl_incremental(crawler.base_filters)
+        
         # 断点续连检查
         actual_task_id, should_resume = check_resume_point(crawler, resume)
         
@@ -1728,7 +2736,11 @@ def main(start_date: str = "2025-08-28",
         logger.info("步骤4: 创建每日分批过滤条件")
         start_date_only = start_date.split('T')[0]
         end_date_only = end_date.split('T')[0]
-        batch_filters = crawler.create_daily_batch_filters(start_date_only, end_date_only)
+        if LISTING_PLANNER_AVAILABLE:
+            # 按 count 探测二分时间窗口，只生成非空且不超过 offset 上限的批次
+            batch_filters = crawler.create_planned_batch_filters(start_date_only, end_date_only)
+        else:
+            batch_filters = crawler.create_daily_batch_filters(start_date_only, end_date_only)
         
         if not batch_filters:
             logger.error("创建分批过滤条件失败")
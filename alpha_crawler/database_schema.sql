@@ -55,6 +55,7 @@ CREATE TABLE IF NOT EXISTS alphas (
     data_fields_list JSON COMMENT '数据字段列表(JSON数组,表达式中使用的所有数据字段,如:["oth553_sal_yearspeakcnt"])',
     data_fields_type_list JSON COMMENT '数据字段类型列表(JSON数组,与data_fields_list一一对应,如:["MATRIX","VECTOR","GROUP"])',
     datasets_list JSON COMMENT '数据集列表(JSON数组,表达式中使用的所有数据集ID,从data_fields中提取,如:["oth553","fnd14"])',
+    template_hash CHAR(32) COMMENT '模版表达式MD5(template_performance汇总表的分组键)',
     
     -- ==================== SUPER类型特有字段 - Combo组合信息 ====================
     combo_code TEXT COMMENT 'Combo代码(SUPER类型:组合多个Alpha的代码)',
@@ -110,11 +111,7 @@ CREATE TABLE IF NOT EXISTS alphas (
     -- ==================== 相关性指标 ====================
     pc_value DECIMAL(10,6) COMMENT 'PC值(Production Correlation,与生产环境Alpha的相关性,越低越好)',
     
-    -- ==================== 时间序列数据(JSON格式) ====================
-    pnl_data JSON COMMENT 'PnL时间序列(JSON数组,包含每日PnL数据点)',
-    
-    -- 年度统计数据（JSON格式存储yearly-stats数据）
-    yearly_stats_data JSON COMMENT '年度统计数据（包含每年的sharpe/fitness/margin等指标）',
+    -- PnL / yearly-stats 时间序列存放在 alpha_timeseries 表(压缩编码),不在主表中
     
     -- 提交评分相关字段（因子提交前的综合质量评估，包含7大维度的详细评分数据）
     submission_scores JSON COMMENT '提交评分总分数据：基础分(200分)、PC加分(80分)、总分(280/200分)、评级(S/A/B/C/D/F)、各项加权分值',
@@ -167,7 +164,8 @@ CREATE TABLE IF NOT EXISTS alphas (
     INDEX idx_instrument_type (instrument_type) COMMENT '工具类型索引(用于筛选股票/期货等)',
     INDEX idx_sharpe (sharpe) COMMENT '夏普索引(用于按Sharpe排序)',
     INDEX idx_fitness (fitness) COMMENT 'Fitness索引(用于按Fitness排序)',
-    INDEX idx_robustness_score (robustness_score) COMMENT '稳健性评分索引(用于按稳健性排序)'
+    INDEX idx_robustness_score (robustness_score) COMMENT '稳健性评分索引(用于按稳健性排序)',
+    INDEX idx_template (template_hash, region, universe) COMMENT '模版索引(重算template_performance分位数时取分组内Alpha)'
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Alpha因子数据主表(存储所有Alpha的完整信息和性能数据)';
 
 -- ==================== 已提交Alpha数据表(专门存储已提交到生产环境的Alpha) ====================
@@ -289,11 +287,7 @@ CREATE TABLE IF NOT EXISTS submitted_alphas (
     risk_neutralized_fitness DECIMAL(10,4) COMMENT '风险中性化Fitness',
     risk_neutralized_sharpe DECIMAL(10,4) COMMENT '风险中性化夏普比率',
        
-    -- ==================== 时间序列数据(JSON格式) ====================
-    pnl_data JSON COMMENT 'PnL时间序列(JSON数组,包含每日PnL数据点)',
-    
-    -- 年度统计数据（JSON格式存储yearly-stats数据）
-    yearly_stats_data JSON COMMENT '年度统计数据（包含每年的sharpe/fitness/margin等指标）',
+    -- PnL / yearly-stats 时间序列存放在 alpha_timeseries 表(压缩编码),不在主表中
     
     -- 提交评分相关字段（因子提交前的综合质量评估，包含7大维度的详细评分数据）
     submission_scores JSON COMMENT '提交评分总分数据：基础分(200分)、PC加分(80分)、总分(280/200分)、评级(S/A/B/C/D/F)、各项加权分值',
@@ -371,3 +365,42 @@ CREATE TABLE IF NOT EXISTS crawl_status (
     INDEX idx_status (status) COMMENT '状态索引',
     INDEX idx_start_time (start_time) COMMENT '开始时间索引'
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='爬虫任务状态跟踪表(记录所有数据爬取任务的执行情况)';
+
+-- Alpha时间序列表(PnL / yearly-stats,从 alphas / submitted_alphas 主表中拆出)
+CREATE TABLE IF NOT EXISTS alpha_timeseries (
+    alpha_id VARCHAR(20) NOT NULL COMMENT 'Alpha唯一标识符(与alphas.id / submitted_alphas.id对应)',
+    series_type VARCHAR(20) NOT NULL COMMENT '序列类型(pnl:每日PnL/yearly_stats:年度统计)',
+    encoding VARCHAR(10) NOT NULL COMMENT '编码方式(f32z:日期偏移+float32矩阵的zlib压缩/jsonz:zlib压缩的JSON),见timeseries_codec.py',
+    points INT DEFAULT 0 COMMENT '数据点数',
+    data MEDIUMBLOB NOT NULL COMMENT '编码后的序列数据',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '记录更新时间',
+    PRIMARY KEY (alpha_id, series_type)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Alpha时间序列表(按Alpha懒加载,不参与主表扫描)';
+
+-- 模版表现汇总表(按 模版 × 区域 × 股票池 汇总alphas表,爬虫每入库一页只刷新涉及的分组)
+CREATE TABLE IF NOT EXISTS template_performance (
+    template_hash CHAR(32) NOT NULL COMMENT '模版表达式MD5(与alphas.template_hash对应)',
+    region VARCHAR(10) NOT NULL COMMENT '交易区域(Alpha未设置时为空串)',
+    universe VARCHAR(50) NOT NULL COMMENT '股票池(Alpha未设置时为空串)',
+    template_expression TEXT COMMENT '模版表达式',
+    alpha_count INT DEFAULT 0 COMMENT '使用该模版的Alpha数量',
+    pass_count INT DEFAULT 0 COMMENT '通过检查的Alpha数量(checks中没有FAIL)',
+    pass_rate DECIMAL(6,4) COMMENT '通过率(pass_count/alpha_count)',
+    sharpe_sum DOUBLE DEFAULT 0 COMMENT 'IS夏普累加和(按页增量维护,用于sharpe_mean)',
+    sharpe_n INT DEFAULT 0 COMMENT '有夏普值的Alpha数量',
+    fitness_sum DOUBLE DEFAULT 0 COMMENT 'IS Fitness累加和(按页增量维护,用于fitness_mean)',
+    fitness_n INT DEFAULT 0 COMMENT '有Fitness值的Alpha数量',
+    sharpe_mean DECIMAL(10,4) COMMENT 'IS夏普均值',
+    sharpe_p25 DECIMAL(10,4) COMMENT 'IS夏普25分位(定期批量重算)',
+    sharpe_p50 DECIMAL(10,4) COMMENT 'IS夏普中位数',
+    sharpe_p75 DECIMAL(10,4) COMMENT 'IS夏普75分位',
+    fitness_mean DECIMAL(10,4) COMMENT 'IS Fitness均值',
+    fitness_p25 DECIMAL(10,4) COMMENT 'IS Fitness 25分位(定期批量重算)',
+    fitness_p50 DECIMAL(10,4) COMMENT 'IS Fitness中位数',
+    fitness_p75 DECIMAL(10,4) COMMENT 'IS Fitness 75分位',
+    last_seen DATETIME COMMENT '最近一次出现(分组内最新Alpha的创建时间)',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '记录更新时间',
+    PRIMARY KEY (template_hash, region, universe),
+    INDEX idx_sharpe_p50 (sharpe_p50) COMMENT '夏普中位数索引(用于模版排名)',
+    INDEX idx_alpha_count (alpha_count) COMMENT 'Alpha数量索引'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='模版表现汇总表(模版排名查询不再全表扫描alphas)';
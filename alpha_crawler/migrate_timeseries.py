@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+一次性迁移：把 alphas / submitted_alphas 表中的 pnl_data / yearly_stats_data JSON
+压缩写入 alpha_timeseries 表
+
+用法：
+    python migrate_timeseries.py            # 迁移并清空原列（可重复执行）
+    python migrate_timeseries.py --drop     # 迁移完成后删除原列
+"""
+
+import sys
+
+from alpha_crawler import AlphaCrawler, logger
+
+
+def main(drop_columns: bool = False) -> bool:
+    crawler = AlphaCrawler(use_shared_session=False)
+    if not crawler.connect_database():
+        logger.error("数据库连接失败")
+        return False
+
+    try:
+        # 建表（CREATE TABLE IF NOT EXISTS，已有表不受影响）
+        if not crawler.create_tables():
+            return False
+        crawler.migrate_timeseries(drop_columns=drop_columns)
+        logger.info("迁移完成，可执行 OPTIMIZE TABLE alphas, submitted_alphas 回收空间")
+        return True
+    except Exception as e:
+        logger.error(f"时间序列迁移失败: {e}")
+        return False
+    finally:
+        crawler.close()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(drop_columns='--drop' in sys.argv) else 1)
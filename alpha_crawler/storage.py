@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+爬虫存储后端：MySQL（默认）/ SQLite（WAL，单机内嵌）
+
+credentials.json 的 database 段选择后端：
+    {"database": {"backend": "mysql", "host": ..., "port": ..., "username": ..., "password": ..., "database": ...}}
+    {"database": {"backend": "sqlite", "path": "data/alphas.db"}}      # 相对路径以 alpha_crawler 目录为准
+
+SQLite 连接包装为与 mysql.connector 相同的接口（cursor / execute / executemany / fetchone / fetchall /
+lastrowid / commit / rollback / is_connected / close），爬虫中的 SQL 不用改写，执行前翻译其中用到的 MySQL 方言：
+    %s                                   -> ?
+    NOW() / CURRENT_TIMESTAMP / CURDATE() -> datetime('now', 'localtime') / date('now', 'localtime')
+    TIMESTAMPDIFF(SECOND, x, NOW())      -> 按 julianday 计算的秒数
+    ON DUPLICATE KEY UPDATE c = VALUES(c) -> ON CONFLICT(主键) DO UPDATE SET c = excluded.c
+表结构由 database_schema.sql 翻译得到（translate_schema），两个后端共用一份定义。
+"""
+
+import os
+import re
+import sqlite3
+from datetime import date, datetime
+from typing import Dict, List
+
+try:
+    import mysql.connector
+    from mysql.connector import Error as MySQLError
+    MYSQL_AVAILABLE = True
+except ImportError:
+    MYSQL_AVAILABLE = False
+
+    class MySQLError(Exception):
+        """未安装 mysql.connector 时的占位异常"""
+
+# 两个后端的数据库异常（except Error 同时捕获）
+Error = (MySQLError, sqlite3.Error)
+
+DEFAULT_SQLITE_PATH = os.path.join('data', 'alphas.db')
+
+# 与 mysql.connector 一致：datetime 以 'YYYY-MM-DD HH:MM:SS' 文本存储，
+# 按列声明类型（DATETIME / TIMESTAMP / DATE）读回 datetime / date 对象
+sqlite3.register_adapter(datetime, lambda value: value.strftime('%Y-%m-%d %H:%M:%S'))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter('DATETIME', lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter('DATE', lambda raw: date.fromisoformat(raw.decode()[:10]))
+
+
+def connect_storage(db_config: Dict, base_dir: str = ''):
+    """按配置创建数据库连接（返回 mysql.connector 连接或 SQLiteConnection）"""
+    backend = db_config.get('backend', 'mysql')
+    if backend == 'sqlite':
+        path = db_config.get('path', DEFAULT_SQLITE_PATH)
+        if not os.path.isabs(path):
+            path = os.path.join(base_dir, path)
+        return SQLiteConnection(path)
+    if backend != 'mysql':
+        raise ValueError(f"未知的存储后端: {backend}")
+    if not MYSQL_AVAILABLE:
+        raise RuntimeError("未安装 mysql-connector-python，可在 credentials.json 中使用 \"backend\": \"sqlite\"")
+    return mysql.connector.connect(
+        host=db_config.get('host', 'localhost'),
+        port=db_config.get('port', 3306),
+        user=db_config.get('username', 'quant_user'),
+        password=db_config.get('password', 'quant_password'),
+        database=db_config.get('database', 'consultant_analytics')
+    )
+
+
+_UPSERT = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.I)
+_INSERT_TABLE = re.compile(r'\bINSERT\s+INTO\s+(\w+)', re.I)
+_VALUES_REF = re.compile(r'\bVALUES\((\w+)\)', re.I)
+_TIMESTAMPDIFF = re.compile(r'TIMESTAMPDIFF\(\s*SECOND\s*,\s*([^,()]+?)\s*,\s*NOW\(\)\s*\)', re.I)
+
+
+class SQLiteConnection:
+    """mysql.connector 连接接口的 SQLite 实现（WAL 模式）"""
+
+    backend = 'sqlite'
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
+        # WAL：读写互不阻塞；NORMAL：每次提交不强制 fsync（WAL 下掉电最多丢最后几个事务）
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._translated = {}
+        self._primary_keys = {}
+
+    def cursor(self) -> 'SQLiteCursor':
+        return SQLiteCursor(self)
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def rollback(self) -> None:
+        self._conn.rollback()
+
+    def is_connected(self) -> bool:
+        return self._conn is not None
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _primary_key(self, table: str) -> str:
+        if table not in self._primary_keys:
+            columns = self._conn.execute(f'PRAGMA table_info({table})').fetchall()
+            self._primary_keys[table] = ', '.join(row[1] for row in sorted(columns, key=lambda r: r[5]) if row[5])
+        return self._primary_keys[table]
+
+    def translate(self, sql: str) -> str:
+        """把爬虫使用的 MySQL 方言翻译为 SQLite（按语句缓存）"""
+        translated = self._translated.get(sql)
+        if translated is not None:
+            return translated
+
+        translated = sql
+        match = _UPSERT.search(translated)
+        if match:
+            table = _INSERT_TABLE.search(translated).group(1)
+            updates = _VALUES_REF.sub(r'excluded.\1', translated[match.end():])
+            translated = f"{translated[:match.start()]}ON CONFLICT({self._primary_key(table)}) DO UPDATE SET{updates}"
+        translated = _TIMESTAMPDIFF.sub(
+            r"CAST((julianday('now', 'localtime') - julianday(\1)) * 86400 AS INTEGER)", translated)
+        translated = re.sub(r'\bNOW\(\)|\bCURRENT_TIMESTAMP\b', "datetime('now', 'localtime')", translated, flags=re.I)
+        translated = re.sub(r'\bCURDATE\(\)', "date('now', 'localtime')", translated, flags=re.I)
+        translated = translated.replace('%s', '?')
+
+        self._translated[sql] = translated
+        return translated
+
+
+class SQLiteCursor:
+    """mysql.connector 游标接口的 SQLite 实现"""
+
+    def __init__(self, connection: SQLiteConnection):
+        self._connection = connection
+        self._cursor = connection._conn.cursor()
+
+    def execute(self, sql: str, params=()) -> None:
+        self._cursor.execute(self._connection.translate(sql), tuple(params or ()))
+
+    def executemany(self, sql: str, rows) -> None:
+        self._cursor.executemany(self._connection.translate(sql), [tuple(row) for row in rows])
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+_INLINE_INDEX = re.compile(r'^\s*(UNIQUE\s+)?(?:INDEX|KEY)\s+(\w+)\s*\(([^)]*)\)[^,\n]*,?[ \t]*$', re.I | re.M)
+
+
+def translate_schema(sql_script: str) -> List[str]:
+    """
+    把 database_schema.sql（MySQL）翻译为 SQLite 建表语句
+
+    去掉 CREATE DATABASE / USE、COMMENT、ENGINE 等表选项和 ON UPDATE CURRENT_TIMESTAMP，
+    AUTO_INCREMENT 主键改为 INTEGER PRIMARY KEY AUTOINCREMENT，表内 INDEX 改为单独的 CREATE INDEX。
+    """
+    statements = []
+    for statement in sql_script.split(';'):
+        body = '\n'.join(line for line in statement.splitlines() if not line.strip().startswith('--')).strip()
+        if not body or re.match(r'(CREATE\s+DATABASE|USE)\b', body, re.I):
+            continue
+
+        body = re.sub(r"\s+COMMENT\s*=?\s*'[^']*'", '', body, flags=re.I)
+        body = re.sub(r'\s+(ENGINE|DEFAULT\s+CHARSET|CHARSET|COLLATE)\s*=\s*\w+', '', body, flags=re.I)
+        body = re.sub(r'\s+(CHARACTER\s+SET|COLLATE)\s+\w+', '', body, flags=re.I)
+        body = re.sub(r'\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP', '', body, flags=re.I)
+        # SQLite 的 CURRENT_TIMESTAMP 是 UTC，MySQL 是会话本地时间
+        body = re.sub(r'\bDEFAULT\s+CURRENT_TIMESTAMP\b', "DEFAULT (datetime('now', 'localtime'))", body, flags=re.I)
+        body = re.sub(r'\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT', body, flags=re.I)
+
+        table_match = re.match(r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', body, re.I)
+        indexes = []
+        if table_match:
+            table = table_match.group(1)
+            for unique, name, columns in _INLINE_INDEX.findall(body):
+                indexes.append(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {table}_{name} "
+                               f"ON {table} ({columns})")
+            body = _INLINE_INDEX.sub('', body)
+            # 去掉索引后最后一列后面多出的逗号
+            body = re.sub(r',(\s*)\)\s*$', r'\1)', body)
+
+        statements.append(body)
+        statements.extend(indexes)
+    return statements
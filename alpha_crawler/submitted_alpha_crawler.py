@@ -11,14 +11,15 @@ import time
 from typing import Optional, Dict, List, Tuple
 from datetime import datetime
 import requests
-from mysql.connector import Error
 import sys
 import os
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from alpha_crawler import AlphaCrawler
+from alpha_crawler import AlphaCrawler, load_pending_batches
+from storage import Error
+from template_extractor import template_columns
 
 # 配置日志
 # 确保log目录存在
@@ -75,6 +76,7 @@ class SubmittedAlphaCrawler(AlphaCrawler):
                         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36'
                     }
                     
+                    self.throttle()
                     response = self.session.get(api_url, headers=headers, timeout=30)
                     
                     if response.status_code == 200:
@@ -232,6 +234,7 @@ class SubmittedAlphaCrawler(AlphaCrawler):
                     'code': regular.get('code', 'NULL'),
                     'description': regular.get('description', 'NULL'),
                     'operator_count': regular.get('operatorCount', 'NULL'),
+                    **template_columns(regular.get('code')),
                 })
             elif alpha_data.get('type') == 'SUPER':
                 # 处理SUPER类型Alpha的combo和selection信息
@@ -379,296 +382,314 @@ class SubmittedAlphaCrawler(AlphaCrawler):
             logger.error(f"解析已提交Alpha数据异常: {e}")
             return None
     
+    def build_submitted_alpha_upsert(self, alpha_data: Dict) -> Tuple[str, tuple]:
+        """构造submitted_alphas表的参数化upsert语句及参数（单行）"""
+        # 准备数据，处理None值
+        data = {
+            'id': alpha_data.get('id') or 'NULL',
+            'type': alpha_data.get('type') or 'NULL',
+            'author': alpha_data.get('author') or 'NULL',
+            'date_created': self.parse_datetime(alpha_data.get('date_created')) if alpha_data.get('date_created') else 'NULL',
+            'date_submitted': self.parse_datetime(alpha_data.get('date_submitted')) if alpha_data.get('date_submitted') else 'NULL',
+            'date_modified': self.parse_datetime(alpha_data.get('date_modified')) if alpha_data.get('date_modified') else 'NULL',
+            'name': alpha_data.get('name') or 'NULL',
+            'favorite': alpha_data.get('favorite') or 'NULL',
+            'hidden': alpha_data.get('hidden') or 'NULL',
+            'color': alpha_data.get('color') or 'NULL',
+            'category': alpha_data.get('category') or 'NULL',
+            'stage': alpha_data.get('stage') or 'NULL',
+            'status': alpha_data.get('status') or 'NULL',
+            'grade': alpha_data.get('grade') or 'NULL',
+            'instrument_type': alpha_data.get('instrument_type') or 'NULL',
+            'region': alpha_data.get('region') or 'NULL',
+            'universe': alpha_data.get('universe') or 'NULL',
+            'delay': alpha_data.get('delay') if alpha_data.get('delay') is not None else 'NULL',
+            'decay': alpha_data.get('decay') if alpha_data.get('decay') is not None else 'NULL',
+            'neutralization': alpha_data.get('neutralization') or 'NULL',
+            'truncation': alpha_data.get('truncation') if alpha_data.get('truncation') is not None else 'NULL',
+            'pasteurization': alpha_data.get('pasteurization') or 'NULL',
+            'unit_handling': alpha_data.get('unit_handling') or 'NULL',
+            'nan_handling': alpha_data.get('nan_handling') or 'NULL',
+            'selection_handling': alpha_data.get('selection_handling') if alpha_data.get('selection_handling') is not None else 'NULL',  # SUPER类型特有字段
+            'selection_limit': alpha_data.get('selection_limit') if alpha_data.get('selection_limit') is not None else 'NULL',       # SUPER类型特有字段
+            'max_trade': alpha_data.get('max_trade') or 'NULL',
+            'language': alpha_data.get('language') or 'NULL',
+            'visualization': alpha_data.get('visualization'),
+            'start_date': self.parse_date(alpha_data.get('start_date')) if alpha_data.get('start_date') else 'NULL',
+            'end_date': self.parse_date(alpha_data.get('end_date')) if alpha_data.get('end_date') else 'NULL',
+            'component_activation': alpha_data.get('component_activation') if alpha_data.get('component_activation') is not None else 'NULL',  # SUPER类型特有字段
+            'test_period': alpha_data.get('test_period') if alpha_data.get('test_period') is not None else 'NULL',                    # SUPER类型特有字段
+            'code': alpha_data.get('code') or 'NULL',
+            'description': alpha_data.get('description') or 'NULL',
+            'operator_count': alpha_data.get('operator_count') or 'NULL',
+            # 代码解析字段（仅REGULAR类型，见 template_extractor.py）
+            'template_expression': alpha_data.get('template_expression') or 'NULL',
+            'operators_list': alpha_data.get('operators_list') or 'NULL',
+            'data_fields_list': alpha_data.get('data_fields_list') or 'NULL',
+            'datasets_list': alpha_data.get('datasets_list') or 'NULL',
+            # 新增的combo和selection字段
+            'combo_code': alpha_data.get('combo_code') or 'NULL',
+            'combo_description': alpha_data.get('combo_description') or 'NULL',
+            'combo_operator_count': alpha_data.get('combo_operator_count') if alpha_data.get('combo_operator_count') is not None else 'NULL',
+            'selection_code': alpha_data.get('selection_code') or 'NULL',
+            'selection_description': alpha_data.get('selection_description') or 'NULL',
+            'selection_operator_count': alpha_data.get('selection_operator_count') if alpha_data.get('selection_operator_count') is not None else 'NULL',
+            'tags': alpha_data.get('tags') or 'NULL',
+            'classifications': alpha_data.get('classifications') or 'NULL',
+            'pnl': alpha_data.get('pnl') if alpha_data.get('pnl') is not None else 'NULL',
+            'book_size': alpha_data.get('book_size') if alpha_data.get('book_size') is not None else 'NULL',
+            'long_count': alpha_data.get('long_count') if alpha_data.get('long_count') is not None else 'NULL',
+            'short_count': alpha_data.get('short_count') if alpha_data.get('short_count') is not None else 'NULL',
+            'turnover': alpha_data.get('turnover') if alpha_data.get('turnover') is not None else 'NULL',
+            'returns': alpha_data.get('returns') if alpha_data.get('returns') is not None else 'NULL',
+            'drawdown': alpha_data.get('drawdown') if alpha_data.get('drawdown') is not None else 'NULL',
+            'margin': alpha_data.get('margin') if alpha_data.get('margin') is not None else 'NULL',
+            'sharpe': alpha_data.get('sharpe') if alpha_data.get('sharpe') is not None else 'NULL',
+            'fitness': alpha_data.get('fitness') if alpha_data.get('fitness') is not None else 'NULL',
+            'is_start_date': self.parse_date(alpha_data.get('is_start_date')) if alpha_data.get('is_start_date') else 'NULL',
+            'os_start_date': self.parse_date(alpha_data.get('os_start_date')) if alpha_data.get('os_start_date') else 'NULL',  # OS阶段特有字段
+            'self_correlation': alpha_data.get('self_correlation') if alpha_data.get('self_correlation') is not None else 'NULL',
+            'prod_correlation': alpha_data.get('prod_correlation') if alpha_data.get('prod_correlation') is not None else 'NULL',
+            'os_is_sharpe_ratio': alpha_data.get('os_is_sharpe_ratio') if alpha_data.get('os_is_sharpe_ratio') is not None else 'NULL',
+            'pre_close_sharpe_ratio': alpha_data.get('pre_close_sharpe_ratio') if alpha_data.get('pre_close_sharpe_ratio') is not None else 'NULL',
+            'investability_constrained_pnl': alpha_data.get('investability_constrained_pnl') if alpha_data.get('investability_constrained_pnl') is not None else 'NULL',
+            'investability_constrained_book_size': alpha_data.get('investability_constrained_book_size') if alpha_data.get('investability_constrained_book_size') is not None else 'NULL',
+            'investability_constrained_long_count': alpha_data.get('investability_constrained_long_count') if alpha_data.get('investability_constrained_long_count') is not None else 'NULL',
+            'investability_constrained_short_count': alpha_data.get('investability_constrained_short_count') if alpha_data.get('investability_constrained_short_count') is not None else 'NULL',
+            'investability_constrained_turnover': alpha_data.get('investability_constrained_turnover') if alpha_data.get('investability_constrained_turnover') is not None else 'NULL',
+            'investability_constrained_returns': alpha_data.get('investability_constrained_returns') if alpha_data.get('investability_constrained_returns') is not None else 'NULL',
+            'investability_constrained_drawdown': alpha_data.get('investability_constrained_drawdown') if alpha_data.get('investability_constrained_drawdown') is not None else 'NULL',
+            'investability_constrained_margin': alpha_data.get('investability_constrained_margin') if alpha_data.get('investability_constrained_margin') is not None else 'NULL',
+            'investability_constrained_fitness': alpha_data.get('investability_constrained_fitness') if alpha_data.get('investability_constrained_fitness') is not None else 'NULL',
+            'investability_constrained_sharpe': alpha_data.get('investability_constrained_sharpe') if alpha_data.get('investability_constrained_sharpe') is not None else 'NULL',
+            'risk_neutralized_pnl': alpha_data.get('risk_neutralized_pnl') if alpha_data.get('risk_neutralized_pnl') is not None else 'NULL',
+            'risk_neutralized_book_size': alpha_data.get('risk_neutralized_book_size') if alpha_data.get('risk_neutralized_book_size') is not None else 'NULL',
+            'risk_neutralized_long_count': alpha_data.get('risk_neutralized_long_count') if alpha_data.get('risk_neutralized_long_count') is not None else 'NULL',
+            'risk_neutralized_short_count': alpha_data.get('risk_neutralized_short_count') if alpha_data.get('risk_neutralized_short_count') is not None else 'NULL',
+            'risk_neutralized_turnover': alpha_data.get('risk_neutralized_turnover') if alpha_data.get('risk_neutralized_turnover') is not None else 'NULL',
+            'risk_neutralized_returns': alpha_data.get('risk_neutralized_returns') if alpha_data.get('risk_neutralized_returns') is not None else 'NULL',
+            'risk_neutralized_drawdown': alpha_data.get('risk_neutralized_drawdown') if alpha_data.get('risk_neutralized_drawdown') is not None else 'NULL',
+            'risk_neutralized_margin': alpha_data.get('risk_neutralized_margin') if alpha_data.get('risk_neutralized_margin') is not None else 'NULL',
+            'risk_neutralized_fitness': alpha_data.get('risk_neutralized_fitness') if alpha_data.get('risk_neutralized_fitness') is not None else 'NULL',
+            'risk_neutralized_sharpe': alpha_data.get('risk_neutralized_sharpe') if alpha_data.get('risk_neutralized_sharpe') is not None else 'NULL',
+            'checks': alpha_data.get('checks') or 'NULL',
+            'competitions': alpha_data.get('competitions') or 'NULL',
+            'pyramids': alpha_data.get('pyramids') or 'NULL',
+            'themes': alpha_data.get('themes') or 'NULL',
+            'pyramid_themes': alpha_data.get('pyramid_themes') or 'NULL'
+        }
+        
+        # 转义单引号并包装字符串值
+        # JSON字段不需要额外的转义处理
+        json_fields = {'checks', 'competitions', 'pyramids', 'themes', 'tags', 'classifications',
+                       'operators_list', 'data_fields_list', 'datasets_list', 'pyramid_themes'}
+        
+        for key, value in data.items():
+            if value == 'NULL':
+                data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
+            elif key in ['date_created', 'date_submitted', 'date_modified']:
+                # 日期时间字段已经处理过，不需要再包装（使用参数化查询）
+                if value is not None:
+                    data[key] = str(value)
+                else:
+                    data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
+            elif key in ['start_date', 'end_date', 'is_start_date', 'os_start_date']:
+                # 日期字段已经处理过，不需要再包装（使用参数化查询）
+                if value is not None:
+                    data[key] = str(value)
+                else:
+                    data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
+            elif key in json_fields:
+                # JSON字段特殊处理，只需要确保是有效的JSON字符串
+                if isinstance(value, str) and value != 'NULL':
+                    # JSON字段需要转义单引号，但不能转义双引号（JSON中的双引号是有效的）
+                    # 使用参数化查询来正确处理JSON字段，避免手动转义
+                    data[key] = value
+                elif value == 'NULL':
+                    data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
+                else:
+                    # 其他情况转换为字符串
+                    data[key] = str(value)
+            elif isinstance(value, str):
+                # 普通字符串字段，不进行单引号包装（由参数化查询处理）
+                # 只需要确保字符串本身是有效的，不需要手动转义单引号
+                pass  # 依赖参数化查询自动处理字符串转义和包装
+            elif isinstance(value, (int, float)):
+                # 数值类型保持原样，让参数化查询处理
+                pass  # 不需要转换，保持原始数值类型
+            elif isinstance(value, bool):
+                # 布尔值保持原样，让参数化查询处理
+                pass  # 不需要转换，保持原始布尔类型
+            elif value is None:
+                data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
+            else:
+                # 其他类型保持原样或转换为字符串
+                pass  # 对于其他类型，依赖参数化查询的自动处理
+        
+        # 构造SQL语句，使用format方式替换占位符，避免参数占位符与参数值对应问题
+        sql_template = """
+        INSERT INTO submitted_alphas (
+            id, type, author, date_created, date_submitted, date_modified, name,
+            favorite, hidden, color, category, stage, status, grade,
+            instrument_type, region, universe, delay, decay, neutralization,
+            truncation, pasteurization, unit_handling, nan_handling, selection_handling, selection_limit,
+            max_trade, language, visualization, start_date, end_date, component_activation, test_period,
+            code, description, operator_count,
+            template_expression, operators_list, data_fields_list, datasets_list,
+            combo_code, combo_description, combo_operator_count,
+            selection_code, selection_description, selection_operator_count,
+            tags, classifications,
+            pnl, book_size, long_count, short_count, turnover, returns, drawdown,
+            margin, sharpe, fitness, is_start_date, os_start_date,
+            self_correlation, prod_correlation, os_is_sharpe_ratio, pre_close_sharpe_ratio,
+            investability_constrained_pnl, investability_constrained_book_size,
+            investability_constrained_long_count, investability_constrained_short_count,
+            investability_constrained_turnover, investability_constrained_returns,
+            investability_constrained_drawdown, investability_constrained_margin,
+            investability_constrained_fitness, investability_constrained_sharpe,
+            risk_neutralized_pnl, risk_neutralized_book_size,
+            risk_neutralized_long_count, risk_neutralized_short_count,
+            risk_neutralized_turnover, risk_neutralized_returns,
+            risk_neutralized_drawdown, risk_neutralized_margin,
+            risk_neutralized_fitness, risk_neutralized_sharpe,
+            checks, competitions, pyramids, themes, pyramid_themes
+        ) VALUES (
+            {id}, {type}, {author}, {date_created}, {date_submitted}, {date_modified}, {name},
+            {favorite}, {hidden}, {color}, {category}, {stage}, {status}, {grade},
+            {instrument_type}, {region}, {universe}, {delay}, {decay}, {neutralization},
+            {truncation}, {pasteurization}, {unit_handling}, {nan_handling}, {selection_handling}, {selection_limit},
+            {max_trade}, {language}, {visualization}, {start_date}, {end_date}, {component_activation}, {test_period},
+            {code}, {description}, {operator_count},
+            {template_expression}, {operators_list}, {data_fields_list}, {datasets_list},
+            {combo_code}, {combo_description}, {combo_operator_count},
+            {selection_code}, {selection_description}, {selection_operator_count},
+            {tags}, {classifications},
+            {pnl}, {book_size}, {long_count}, {short_count}, {turnover}, {returns}, {drawdown},
+            {margin}, {sharpe}, {fitness}, {is_start_date}, {os_start_date},
+            {self_correlation}, {prod_correlation}, {os_is_sharpe_ratio}, {pre_close_sharpe_ratio},
+            {investability_constrained_pnl}, {investability_constrained_book_size},
+            {investability_constrained_long_count}, {investability_constrained_short_count},
+            {investability_constrained_turnover}, {investability_constrained_returns},
+            {investability_constrained_drawdown}, {investability_constrained_margin},
+            {investability_constrained_fitness}, {investability_constrained_sharpe},
+            {risk_neutralized_pnl}, {risk_neutralized_book_size},
+            {risk_neutralized_long_count}, {risk_neutralized_short_count},
+            {risk_neutralized_turnover}, {risk_neutralized_returns},
+            {risk_neutralized_drawdown}, {risk_neutralized_margin},
+            {risk_neutralized_fitness}, {risk_neutralized_sharpe},
+            {checks}, {competitions}, {pyramids}, {themes}, {pyramid_themes}
+        ) ON DUPLICATE KEY UPDATE
+            type = VALUES(type), author = VALUES(author), date_created = VALUES(date_created),
+            date_submitted = VALUES(date_submitted), date_modified = VALUES(date_modified),
+            name = VALUES(name), favorite = VALUES(favorite), hidden = VALUES(hidden),
+            color = VALUES(color), category = VALUES(category), stage = VALUES(stage),
+            status = VALUES(status), grade = VALUES(grade), instrument_type = VALUES(instrument_type),
+            region = VALUES(region), universe = VALUES(universe), delay = VALUES(delay),
+            decay = VALUES(decay), neutralization = VALUES(neutralization), truncation = VALUES(truncation),
+            pasteurization = VALUES(pasteurization), unit_handling = VALUES(unit_handling),
+            nan_handling = VALUES(nan_handling), max_trade = VALUES(max_trade), language = VALUES(language),
+            visualization = VALUES(visualization), start_date = VALUES(start_date), end_date = VALUES(end_date),
+            code = VALUES(code), description = VALUES(description), operator_count = VALUES(operator_count),
+            template_expression = VALUES(template_expression), operators_list = VALUES(operators_list),
+            data_fields_list = VALUES(data_fields_list), datasets_list = VALUES(datasets_list),
+            combo_code = VALUES(combo_code), combo_description = VALUES(combo_description), combo_operator_count = VALUES(combo_operator_count),
+            selection_code = VALUES(selection_code), selection_description = VALUES(selection_description), selection_operator_count = VALUES(selection_operator_count),
+            tags = VALUES(tags), classifications = VALUES(classifications), pnl = VALUES(pnl),
+            book_size = VALUES(book_size), long_count = VALUES(long_count), short_count = VALUES(short_count),
+            turnover = VALUES(turnover), returns = VALUES(returns), drawdown = VALUES(drawdown),
+            margin = VALUES(margin), sharpe = VALUES(sharpe), fitness = VALUES(fitness),
+            is_start_date = VALUES(is_start_date), os_start_date = VALUES(os_start_date),
+            self_correlation = VALUES(self_correlation), prod_correlation = VALUES(prod_correlation),
+            os_is_sharpe_ratio = VALUES(os_is_sharpe_ratio), pre_close_sharpe_ratio = VALUES(pre_close_sharpe_ratio),
+            investability_constrained_pnl = VALUES(investability_constrained_pnl),
+            investability_constrained_book_size = VALUES(investability_constrained_book_size),
+            investability_constrained_long_count = VALUES(investability_constrained_long_count),
+            investability_constrained_short_count = VALUES(investability_constrained_short_count),
+            investability_constrained_turnover = VALUES(investability_constrained_turnover),
+            investability_constrained_returns = VALUES(investability_constrained_returns),
+            investability_constrained_drawdown = VALUES(investability_constrained_drawdown),
+            investability_constrained_margin = VALUES(investability_constrained_margin),
+            investability_constrained_fitness = VALUES(investability_constrained_fitness),
+            investability_constrained_sharpe = VALUES(investability_constrained_sharpe),
+            risk_neutralized_pnl = VALUES(risk_neutralized_pnl),
+            risk_neutralized_book_size = VALUES(risk_neutralized_book_size),
+            risk_neutralized_long_count = VALUES(risk_neutralized_long_count),
+            risk_neutralized_short_count = VALUES(risk_neutralized_short_count),
+            risk_neutralized_turnover = VALUES(risk_neutralized_turnover),
+            risk_neutralized_returns = VALUES(risk_neutralized_returns),
+            risk_neutralized_drawdown = VALUES(risk_neutralized_drawdown),
+            risk_neutralized_margin = VALUES(risk_neutralized_margin),
+            risk_neutralized_fitness = VALUES(risk_neutralized_fitness),
+            risk_neutralized_sharpe = VALUES(risk_neutralized_sharpe),
+            checks = VALUES(checks), competitions = VALUES(competitions), pyramids = VALUES(pyramids),
+            themes = VALUES(themes), pyramid_themes = VALUES(pyramid_themes), updated_at = CURRENT_TIMESTAMP
+        """
+        
+        # 提取所有值作为参数元组，保持与SQL模板中占位符的顺序一致
+        values = (
+            data['id'], data['type'], data['author'], data['date_created'], data['date_submitted'], data['date_modified'], data['name'],
+            data['favorite'], data['hidden'], data['color'], data['category'], data['stage'], data['status'], data['grade'],
+            data['instrument_type'], data['region'], data['universe'], data['delay'], data['decay'], data['neutralization'],
+            data['truncation'], data['pasteurization'], data['unit_handling'], data['nan_handling'], data['selection_handling'], data['selection_limit'],
+            data['max_trade'], data['language'], data['visualization'], data['start_date'], data['end_date'], data['component_activation'], data['test_period'],
+            data['code'], data['description'], data['operator_count'],
+            data['template_expression'], data['operators_list'], data['data_fields_list'], data['datasets_list'],
+            data['combo_code'], data['combo_description'], data['combo_operator_count'],
+            data['selection_code'], data['selection_description'], data['selection_operator_count'],
+            data['tags'], data['classifications'],
+            data['pnl'], data['book_size'], data['long_count'], data['short_count'], data['turnover'], data['returns'], data['drawdown'],
+            data['margin'], data['sharpe'], data['fitness'], data['is_start_date'], data['os_start_date'],
+            data['self_correlation'], data['prod_correlation'], data['os_is_sharpe_ratio'], data['pre_close_sharpe_ratio'],
+            data['investability_constrained_pnl'], data['investability_constrained_book_size'],
+            data['investability_constrained_long_count'], data['investability_constrained_short_count'],
+            data['investability_constrained_turnover'], data['investability_constrained_returns'],
+            data['investability_constrained_drawdown'], data['investability_constrained_margin'],
+            data['investability_constrained_fitness'], data['investability_constrained_sharpe'],
+            data['risk_neutralized_pnl'], data['risk_neutralized_book_size'],
+            data['risk_neutralized_long_count'], data['risk_neutralized_short_count'],
+            data['risk_neutralized_turnover'], data['risk_neutralized_returns'],
+            data['risk_neutralized_drawdown'], data['risk_neutralized_margin'],
+            data['risk_neutralized_fitness'], data['risk_neutralized_sharpe'],
+            data['checks'], data['competitions'], data['pyramids'], data['themes'], data['pyramid_themes']
+        )
+        
+        # 使用参数化查询执行SQL语句
+        sql = sql_template.format(
+            id='%s', type='%s', author='%s', date_created='%s', date_submitted='%s', date_modified='%s', name='%s',
+            favorite='%s', hidden='%s', color='%s', category='%s', stage='%s', status='%s', grade='%s',
+            instrument_type='%s', region='%s', universe='%s', delay='%s', decay='%s', neutralization='%s',
+            truncation='%s', pasteurization='%s', unit_handling='%s', nan_handling='%s', selection_handling='%s', selection_limit='%s',
+            max_trade='%s', language='%s', visualization='%s', start_date='%s', end_date='%s', component_activation='%s', test_period='%s',
+            code='%s', description='%s', operator_count='%s',
+            template_expression='%s', operators_list='%s', data_fields_list='%s', datasets_list='%s',
+            combo_code='%s', combo_description='%s', combo_operator_count='%s',
+            selection_code='%s', selection_description='%s', selection_operator_count='%s',
+            tags='%s', classifications='%s',
+            pnl='%s', book_size='%s', long_count='%s', short_count='%s', turnover='%s', returns='%s', drawdown='%s',
+            margin='%s', sharpe='%s', fitness='%s', is_start_date='%s', os_start_date='%s',
+            self_correlation='%s', prod_correlation='%s', os_is_sharpe_ratio='%s', pre_close_sharpe_ratio='%s',
+            investability_constrained_pnl='%s', investability_constrained_book_size='%s',
+            investability_constrained_long_count='%s', investability_constrained_short_count='%s',
+            investability_constrained_turnover='%s', investability_constrained_returns='%s',
+            investability_constrained_drawdown='%s', investability_constrained_margin='%s',
+            investability_constrained_fitness='%s', investability_constrained_sharpe='%s',
+            risk_neutralized_pnl='%s', risk_neutralized_book_size='%s',
+            risk_neutralized_long_count='%s', risk_neutralized_short_count='%s',
+            risk_neutralized_turnover='%s', risk_neutralized_returns='%s',
+            risk_neutralized_drawdown='%s', risk_neutralized_margin='%s',
+            risk_neutralized_fitness='%s', risk_neutralized_sharpe='%s',
+            checks='%s', competitions='%s', pyramids='%s', themes='%s', pyramid_themes='%s'
+        )
+        
+        return sql, values
+    
     def save_submitted_alpha_to_database(self, alpha_data: Dict) -> bool:
         """保存已提交Alpha数据到数据库的submitted_alphas表"""
+        sql = None
         try:
+            sql, values = self.build_submitted_alpha_upsert(alpha_data)
             cursor = self.db_connection.cursor()
             
-            # 准备数据，处理None值
-            data = {
-                'id': alpha_data.get('id') or 'NULL',
-                'type': alpha_data.get('type') or 'NULL',
-                'author': alpha_data.get('author') or 'NULL',
-                'date_created': self.parse_datetime(alpha_data.get('date_created')) if alpha_data.get('date_created') else 'NULL',
-                'date_submitted': self.parse_datetime(alpha_data.get('date_submitted')) if alpha_data.get('date_submitted') else 'NULL',
-                'date_modified': self.parse_datetime(alpha_data.get('date_modified')) if alpha_data.get('date_modified') else 'NULL',
-                'name': alpha_data.get('name') or 'NULL',
-                'favorite': alpha_data.get('favorite') or 'NULL',
-                'hidden': alpha_data.get('hidden') or 'NULL',
-                'color': alpha_data.get('color') or 'NULL',
-                'category': alpha_data.get('category') or 'NULL',
-                'stage': alpha_data.get('stage') or 'NULL',
-                'status': alpha_data.get('status') or 'NULL',
-                'grade': alpha_data.get('grade') or 'NULL',
-                'instrument_type': alpha_data.get('instrument_type') or 'NULL',
-                'region': alpha_data.get('region') or 'NULL',
-                'universe': alpha_data.get('universe') or 'NULL',
-                'delay': alpha_data.get('delay') if alpha_data.get('delay') is not None else 'NULL',
-                'decay': alpha_data.get('decay') if alpha_data.get('decay') is not None else 'NULL',
-                'neutralization': alpha_data.get('neutralization') or 'NULL',
-                'truncation': alpha_data.get('truncation') if alpha_data.get('truncation') is not None else 'NULL',
-                'pasteurization': alpha_data.get('pasteurization') or 'NULL',
-                'unit_handling': alpha_data.get('unit_handling') or 'NULL',
-                'nan_handling': alpha_data.get('nan_handling') or 'NULL',
-                'selection_handling': alpha_data.get('selection_handling') if alpha_data.get('selection_handling') is not None else 'NULL',  # SUPER类型特有字段
-                'selection_limit': alpha_data.get('selection_limit') if alpha_data.get('selection_limit') is not None else 'NULL',       # SUPER类型特有字段
-                'max_trade': alpha_data.get('max_trade') or 'NULL',
-                'language': alpha_data.get('language') or 'NULL',
-                'visualization': alpha_data.get('visualization'),
-                'start_date': self.parse_date(alpha_data.get('start_date')) if alpha_data.get('start_date') else 'NULL',
-                'end_date': self.parse_date(alpha_data.get('end_date')) if alpha_data.get('end_date') else 'NULL',
-                'component_activation': alpha_data.get('component_activation') if alpha_data.get('component_activation') is not None else 'NULL',  # SUPER类型特有字段
-                'test_period': alpha_data.get('test_period') if alpha_data.get('test_period') is not None else 'NULL',                    # SUPER类型特有字段
-                'code': alpha_data.get('code') or 'NULL',
-                'description': alpha_data.get('description') or 'NULL',
-                'operator_count': alpha_data.get('operator_count') or 'NULL',
-                # 新增的combo和selection字段
-                'combo_code': alpha_data.get('combo_code') or 'NULL',
-                'combo_description': alpha_data.get('combo_description') or 'NULL',
-                'combo_operator_count': alpha_data.get('combo_operator_count') if alpha_data.get('combo_operator_count') is not None else 'NULL',
-                'selection_code': alpha_data.get('selection_code') or 'NULL',
-                'selection_description': alpha_data.get('selection_description') or 'NULL',
-                'selection_operator_count': alpha_data.get('selection_operator_count') if alpha_data.get('selection_operator_count') is not None else 'NULL',
-                'tags': alpha_data.get('tags') or 'NULL',
-                'classifications': alpha_data.get('classifications') or 'NULL',
-                'pnl': alpha_data.get('pnl') if alpha_data.get('pnl') is not None else 'NULL',
-                'book_size': alpha_data.get('book_size') if alpha_data.get('book_size') is not None else 'NULL',
-                'long_count': alpha_data.get('long_count') if alpha_data.get('long_count') is not None else 'NULL',
-                'short_count': alpha_data.get('short_count') if alpha_data.get('short_count') is not None else 'NULL',
-                'turnover': alpha_data.get('turnover') if alpha_data.get('turnover') is not None else 'NULL',
-                'returns': alpha_data.get('returns') if alpha_data.get('returns') is not None else 'NULL',
-                'drawdown': alpha_data.get('drawdown') if alpha_data.get('drawdown') is not None else 'NULL',
-                'margin': alpha_data.get('margin') if alpha_data.get('margin') is not None else 'NULL',
-                'sharpe': alpha_data.get('sharpe') if alpha_data.get('sharpe') is not None else 'NULL',
-                'fitness': alpha_data.get('fitness') if alpha_data.get('fitness') is not None else 'NULL',
-                'is_start_date': self.parse_date(alpha_data.get('is_start_date')) if alpha_data.get('is_start_date') else 'NULL',
-                'os_start_date': self.parse_date(alpha_data.get('os_start_date')) if alpha_data.get('os_start_date') else 'NULL',  # OS阶段特有字段
-                'self_correlation': alpha_data.get('self_correlation') if alpha_data.get('self_correlation') is not None else 'NULL',
-                'prod_correlation': alpha_data.get('prod_correlation') if alpha_data.get('prod_correlation') is not None else 'NULL',
-                'os_is_sharpe_ratio': alpha_data.get('os_is_sharpe_ratio') if alpha_data.get('os_is_sharpe_ratio') is not None else 'NULL',
-                'pre_close_sharpe_ratio': alpha_data.get('pre_close_sharpe_ratio') if alpha_data.get('pre_close_sharpe_ratio') is not None else 'NULL',
-                'investability_constrained_pnl': alpha_data.get('investability_constrained_pnl') if alpha_data.get('investability_constrained_pnl') is not None else 'NULL',
-                'investability_constrained_book_size': alpha_data.get('investability_constrained_book_size') if alpha_data.get('investability_constrained_book_size') is not None else 'NULL',
-                'investability_constrained_long_count': alpha_data.get('investability_constrained_long_count') if alpha_data.get('investability_constrained_long_count') is not None else 'NULL',
-                'investability_constrained_short_count': alpha_data.get('investability_constrained_short_count') if alpha_data.get('investability_constrained_short_count') is not None else 'NULL',
-                'investability_constrained_turnover': alpha_data.get('investability_constrained_turnover') if alpha_data.get('investability_constrained_turnover') is not None else 'NULL',
-                'investability_constrained_returns': alpha_data.get('investability_constrained_returns') if alpha_data.get('investability_constrained_returns') is not None else 'NULL',
-                'investability_constrained_drawdown': alpha_data.get('investability_constrained_drawdown') if alpha_data.get('investability_constrained_drawdown') is not None else 'NULL',
-                'investability_constrained_margin': alpha_data.get('investability_constrained_margin') if alpha_data.get('investability_constrained_margin') is not None else 'NULL',
-                'investability_constrained_fitness': alpha_data.get('investability_constrained_fitness') if alpha_data.get('investability_constrained_fitness') is not None else 'NULL',
-                'investability_constrained_sharpe': alpha_data.get('investability_constrained_sharpe') if alpha_data.get('investability_constrained_sharpe') is not None else 'NULL',
-                'risk_neutralized_pnl': alpha_data.get('risk_neutralized_pnl') if alpha_data.get('risk_neutralized_pnl') is not None else 'NULL',
-                'risk_neutralized_book_size': alpha_data.get('risk_neutralized_book_size') if alpha_data.get('risk_neutralized_book_size') is not None else 'NULL',
-                'risk_neutralized_long_count': alpha_data.get('risk_neutralized_long_count') if alpha_data.get('risk_neutralized_long_count') is not None else 'NULL',
-                'risk_neutralized_short_count': alpha_data.get('risk_neutralized_short_count') if alpha_data.get('risk_neutralized_short_count') is not None else 'NULL',
-                'risk_neutralized_turnover': alpha_data.get('risk_neutralized_turnover') if alpha_data.get('risk_neutralized_turnover') is not None else 'NULL',
-                'risk_neutralized_returns': alpha_data.get('risk_neutralized_returns') if alpha_data.get('risk_neutralized_returns') is not None else 'NULL',
-                'risk_neutralized_drawdown': alpha_data.get('risk_neutralized_drawdown') if alpha_data.get('risk_neutralized_drawdown') is not None else 'NULL',
-                'risk_neutralized_margin': alpha_data.get('risk_neutralized_margin') if alpha_data.get('risk_neutralized_margin') is not None else 'NULL',
-                'risk_neutralized_fitness': alpha_data.get('risk_neutralized_fitness') if alpha_data.get('risk_neutralized_fitness') is not None else 'NULL',
-                'risk_neutralized_sharpe': alpha_data.get('risk_neutralized_sharpe') if alpha_data.get('risk_neutralized_sharpe') is not None else 'NULL',
-                'checks': alpha_data.get('checks') or 'NULL',
-                'competitions': alpha_data.get('competitions') or 'NULL',
-                'pyramids': alpha_data.get('pyramids') or 'NULL',
-                'themes': alpha_data.get('themes') or 'NULL',
-                'pyramid_themes': alpha_data.get('pyramid_themes') or 'NULL'
-            }
-            
-            # 转义单引号并包装字符串值
-            # JSON字段不需要额外的转义处理
-            json_fields = {'checks', 'competitions', 'pyramids', 'themes', 'tags', 'classifications', 'pyramid_themes'}
-            
-            for key, value in data.items():
-                if value == 'NULL':
-                    data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
-                elif key in ['date_created', 'date_submitted', 'date_modified']:
-                    # 日期时间字段已经处理过，不需要再包装（使用参数化查询）
-                    if value is not None:
-                        data[key] = str(value)
-                    else:
-                        data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
-                elif key in ['start_date', 'end_date', 'is_start_date', 'os_start_date']:
-                    # 日期字段已经处理过，不需要再包装（使用参数化查询）
-                    if value is not None:
-                        data[key] = str(value)
-                    else:
-                        data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
-                elif key in json_fields:
-                    # JSON字段特殊处理，只需要确保是有效的JSON字符串
-                    if isinstance(value, str) and value != 'NULL':
-                        # JSON字段需要转义单引号，但不能转义双引号（JSON中的双引号是有效的）
-                        # 使用参数化查询来正确处理JSON字段，避免手动转义
-                        data[key] = value
-                    elif value == 'NULL':
-                        data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
-                    else:
-                        # 其他情况转换为字符串
-                        data[key] = str(value)
-                elif isinstance(value, str):
-                    # 普通字符串字段，不进行单引号包装（由参数化查询处理）
-                    # 只需要确保字符串本身是有效的，不需要手动转义单引号
-                    pass  # 依赖参数化查询自动处理字符串转义和包装
-                elif isinstance(value, (int, float)):
-                    # 数值类型保持原样，让参数化查询处理
-                    pass  # 不需要转换，保持原始数值类型
-                elif isinstance(value, bool):
-                    # 布尔值保持原样，让参数化查询处理
-                    pass  # 不需要转换，保持原始布尔类型
-                elif value is None:
-                    data[key] = None  # 将'NULL'字符串改为None，让参数化查询正确处理NULL值
-                else:
-                    # 其他类型保持原样或转换为字符串
-                    pass  # 对于其他类型，依赖参数化查询的自动处理
-            
-            # 构造SQL语句，使用format方式替换占位符，避免参数占位符与参数值对应问题
-            sql_template = """
-            INSERT INTO submitted_alphas (
-                id, type, author, date_created, date_submitted, date_modified, name,
-                favorite, hidden, color, category, stage, status, grade,
-                instrument_type, region, universe, delay, decay, neutralization,
-                truncation, pasteurization, unit_handling, nan_handling, selection_handling, selection_limit,
-                max_trade, language, visualization, start_date, end_date, component_activation, test_period,
-                code, description, operator_count,
-                combo_code, combo_description, combo_operator_count,
-                selection_code, selection_description, selection_operator_count,
-                tags, classifications,
-                pnl, book_size, long_count, short_count, turnover, returns, drawdown,
-                margin, sharpe, fitness, is_start_date, os_start_date,
-                self_correlation, prod_correlation, os_is_sharpe_ratio, pre_close_sharpe_ratio,
-                investability_constrained_pnl, investability_constrained_book_size,
-                investability_constrained_long_count, investability_constrained_short_count,
-                investability_constrained_turnover, investability_constrained_returns,
-                investability_constrained_drawdown, investability_constrained_margin,
-                investability_constrained_fitness, investability_constrained_sharpe,
-                risk_neutralized_pnl, risk_neutralized_book_size,
-                risk_neutralized_long_count, risk_neutralized_short_count,
-                risk_neutralized_turnover, risk_neutralized_returns,
-                risk_neutralized_drawdown, risk_neutralized_margin,
-                risk_neutralized_fitness, risk_neutralized_sharpe,
-                checks, competitions, pyramids, themes, pyramid_themes
-            ) VALUES (
-                {id}, {type}, {author}, {date_created}, {date_submitted}, {date_modified}, {name},
-                {favorite}, {hidden}, {color}, {category}, {stage}, {status}, {grade},
-                {instrument_type}, {region}, {universe}, {delay}, {decay}, {neutralization},
-                {truncation}, {pasteurization}, {unit_handling}, {nan_handling}, {selection_handling}, {selection_limit},
-                {max_trade}, {language}, {visualization}, {start_date}, {end_date}, {component_activation}, {test_period},
-                {code}, {description}, {operator_count},
-                {combo_code}, {combo_description}, {combo_operator_count},
-                {selection_code}, {selection_description}, {selection_operator_count},
-                {tags}, {classifications},
-                {pnl}, {book_size}, {long_count}, {short_count}, {turnover}, {returns}, {drawdown},
-                {margin}, {sharpe}, {fitness}, {is_start_date}, {os_start_date},
-                {self_correlation}, {prod_correlation}, {os_is_sharpe_ratio}, {pre_close_sharpe_ratio},
-                {investability_constrained_pnl}, {investability_constrained_book_size},
-                {investability_constrained_long_count}, {investability_constrained_short_count},
-                {investability_constrained_turnover}, {investability_constrained_returns},
-                {investability_constrained_drawdown}, {investability_constrained_margin},
-                {investability_constrained_fitness}, {investability_constrained_sharpe},
-                {risk_neutralized_pnl}, {risk_neutralized_book_size},
-                {risk_neutralized_long_count}, {risk_neutralized_short_count},
-                {risk_neutralized_turnover}, {risk_neutralized_returns},
-                {risk_neutralized_drawdown}, {risk_neutralized_margin},
-                {risk_neutralized_fitness}, {risk_neutralized_sharpe},
-                {checks}, {competitions}, {pyramids}, {themes}, {pyramid_themes}
-            ) ON DUPLICATE KEY UPDATE
-                type = VALUES(type), author = VALUES(author), date_created = VALUES(date_created),
-                date_submitted = VALUES(date_submitted), date_modified = VALUES(date_modified),
-                name = VALUES(name), favorite = VALUES(favorite), hidden = VALUES(hidden),
-                color = VALUES(color), category = VALUES(category), stage = VALUES(stage),
-                status = VALUES(status), grade = VALUES(grade), instrument_type = VALUES(instrument_type),
-                region = VALUES(region), universe = VALUES(universe), delay = VALUES(delay),
-                decay = VALUES(decay), neutralization = VALUES(neutralization), truncation = VALUES(truncation),
-                pasteurization = VALUES(pasteurization), unit_handling = VALUES(unit_handling),
-                nan_handling = VALUES(nan_handling), max_trade = VALUES(max_trade), language = VALUES(language),
-                visualization = VALUES(visualization), start_date = VALUES(start_date), end_date = VALUES(end_date),
-                code = VALUES(code), description = VALUES(description), operator_count = VALUES(operator_count),
-                combo_code = VALUES(combo_code), combo_description = VALUES(combo_description), combo_operator_count = VALUES(combo_operator_count),
-                selection_code = VALUES(selection_code), selection_description = VALUES(selection_description), selection_operator_count = VALUES(selection_operator_count),
-                tags = VALUES(tags), classifications = VALUES(classifications), pnl = VALUES(pnl),
-                book_size = VALUES(book_size), long_count = VALUES(long_count), short_count = VALUES(short_count),
-                turnover = VALUES(turnover), returns = VALUES(returns), drawdown = VALUES(drawdown),
-                margin = VALUES(margin), sharpe = VALUES(sharpe), fitness = VALUES(fitness),
-                is_start_date = VALUES(is_start_date), os_start_date = VALUES(os_start_date),
-                self_correlation = VALUES(self_correlation), prod_correlation = VALUES(prod_correlation),
-                os_is_sharpe_ratio = VALUES(os_is_sharpe_ratio), pre_close_sharpe_ratio = VALUES(pre_close_sharpe_ratio),
-                investability_constrained_pnl = VALUES(investability_constrained_pnl),
-                investability_constrained_book_size = VALUES(investability_constrained_book_size),
-                investability_constrained_long_count = VALUES(investability_constrained_long_count),
-                investability_constrained_short_count = VALUES(investability_constrained_short_count),
-                investability_constrained_turnover = VALUES(investability_constrained_turnover),
-                investability_constrained_returns = VALUES(investability_constrained_returns),
-                investability_constrained_drawdown = VALUES(investability_constrained_drawdown),
-                investability_constrained_margin = VALUES(investability_constrained_margin),
-                investability_constrained_fitness = VALUES(investability_constrained_fitness),
-                investability_constrained_sharpe = VALUES(investability_constrained_sharpe),
-                risk_neutralized_pnl = VALUES(risk_neutralized_pnl),
-                risk_neutralized_book_size = VALUES(risk_neutralized_book_size),
-                risk_neutralized_long_count = VALUES(risk_neutralized_long_count),
-                risk_neutralized_short_count = VALUES(risk_neutralized_short_count),
-                risk_neutralized_turnover = VALUES(risk_neutralized_turnover),
-                risk_neutralized_returns = VALUES(risk_neutralized_returns),
-                risk_neutralized_drawdown = VALUES(risk_neutralized_drawdown),
-                risk_neutralized_margin = VALUES(risk_neutralized_margin),
-                risk_neutralized_fitness = VALUES(risk_neutralized_fitness),
-                risk_neutralized_sharpe = VALUES(risk_neutralized_sharpe),
-                checks = VALUES(checks), competitions = VALUES(competitions), pyramids = VALUES(pyramids),
-                themes = VALUES(themes), pyramid_themes = VALUES(pyramid_themes), updated_at = CURRENT_TIMESTAMP
-            """
-            
-            # 提取所有值作为参数元组，保持与SQL模板中占位符的顺序一致
-            values = (
-                data['id'], data['type'], data['author'], data['date_created'], data['date_submitted'], data['date_modified'], data['name'],
-                data['favorite'], data['hidden'], data['color'], data['category'], data['stage'], data['status'], data['grade'],
-                data['instrument_type'], data['region'], data['universe'], data['delay'], data['decay'], data['neutralization'],
-                data['truncation'], data['pasteurization'], data['unit_handling'], data['nan_handling'], data['selection_handling'], data['selection_limit'],
-                data['max_trade'], data['language'], data['visualization'], data['start_date'], data['end_date'], data['component_activation'], data['test_period'],
-                data['code'], data['description'], data['operator_count'],
-                data['combo_code'], data['combo_description'], data['combo_operator_count'],
-                data['selection_code'], data['selection_description'], data['selection_operator_count'],
-                data['tags'], data['classifications'],
-                data['pnl'], data['book_size'], data['long_count'], data['short_count'], data['turnover'], data['returns'], data['drawdown'],
-                data['margin'], data['sharpe'], data['fitness'], data['is_start_date'], data['os_start_date'],
-                data['self_correlation'], data['prod_correlation'], data['os_is_sharpe_ratio'], data['pre_close_sharpe_ratio'],
-                data['investability_constrained_pnl'], data['investability_constrained_book_size'],
-                data['investability_constrained_long_count'], data['investability_constrained_short_count'],
-                data['investability_constrained_turnover'], data['investability_constrained_returns'],
-                data['investability_constrained_drawdown'], data['investability_constrained_margin'],
-                data['investability_constrained_fitness'], data['investability_constrained_sharpe'],
-                data['risk_neutralized_pnl'], data['risk_neutralized_book_size'],
-                data['risk_neutralized_long_count'], data['risk_neutralized_short_count'],
-                data['risk_neutralized_turnover'], data['risk_neutralized_returns'],
-                data['risk_neutralized_drawdown'], data['risk_neutralized_margin'],
-                data['risk_neutralized_fitness'], data['risk_neutralized_sharpe'],
-                data['checks'], data['competitions'], data['pyramids'], data['themes'], data['pyramid_themes']
-            )
-            
-            # 使用参数化查询执行SQL语句
-            sql = sql_template.format(
-                id='%s', type='%s', author='%s', date_created='%s', date_submitted='%s', date_modified='%s', name='%s',
-                favorite='%s', hidden='%s', color='%s', category='%s', stage='%s', status='%s', grade='%s',
-                instrument_type='%s', region='%s', universe='%s', delay='%s', decay='%s', neutralization='%s',
-                truncation='%s', pasteurization='%s', unit_handling='%s', nan_handling='%s', selection_handling='%s', selection_limit='%s',
-                max_trade='%s', language='%s', visualization='%s', start_date='%s', end_date='%s', component_activation='%s', test_period='%s',
-                code='%s', description='%s', operator_count='%s',
-                combo_code='%s', combo_description='%s', combo_operator_count='%s',
-                selection_code='%s', selection_description='%s', selection_operator_count='%s',
-                tags='%s', classifications='%s',
-                pnl='%s', book_size='%s', long_count='%s', short_count='%s', turnover='%s', returns='%s', drawdown='%s',
-                margin='%s', sharpe='%s', fitness='%s', is_start_date='%s', os_start_date='%s',
-                self_correlation='%s', prod_correlation='%s', os_is_sharpe_ratio='%s', pre_close_sharpe_ratio='%s',
-                investability_constrained_pnl='%s', investability_constrained_book_size='%s',
-                investability_constrained_long_count='%s', investability_constrained_short_count='%s',
-                investability_constrained_turnover='%s', investability_constrained_returns='%s',
-                investability_constrained_drawdown='%s', investability_constrained_margin='%s',
-                investability_constrained_fitness='%s', investability_constrained_sharpe='%s',
-                risk_neutralized_pnl='%s', risk_neutralized_book_size='%s',
-                risk_neutralized_long_count='%s', risk_neutralized_short_count='%s',
-                risk_neutralized_turnover='%s', risk_neutralized_returns='%s',
-                risk_neutralized_drawdown='%s', risk_neutralized_margin='%s',
-                risk_neutralized_fitness='%s', risk_neutralized_sharpe='%s',
-                checks='%s', competitions='%s', pyramids='%s', themes='%s', pyramid_themes='%s'
-            )
-            
             # 记录完整的SQL语句以便调试
             logger.debug(f"准备执行的完整SQL语句: {sql}")
             
@@ -687,6 +708,53 @@ class SubmittedAlphaCrawler(AlphaCrawler):
             logger.error(f"完整SQL语句: {sql}")
             return False
 
+    def save_submitted_alphas_batch(self, parsed_list: List[Dict]) -> Tuple[int, int]:
+        """批量保存一页已解析的已提交Alpha数据，返回 (成功数, 失败数)"""
+        sql = None
+        rows = []
+        build_errors = 0
+        for parsed_data in parsed_list:
+            try:
+                sql, values = self.build_submitted_alpha_upsert(parsed_data)
+                rows.append(values)
+            except Exception as e:
+                logger.error(f"构造已提交Alpha数据SQL参数失败 (ID: {parsed_data.get('id')}): {e}")
+                build_errors += 1
+        success_count, error_count = self.save_rows_batch(sql, rows, '已提交Alpha')
+        return success_count, error_count + build_errors
+
+    def fetch_batch_page(self, limit: int, offset: int, filters: Optional[Dict]) -> Optional[Dict]:
+        """流水线翻页：已提交Alpha数据不使用过滤条件"""
+        return self.get_submitted_alphas_page(limit, offset)
+
+    def ingest_page(self, results: List[Dict]) -> Tuple[int, int]:
+        """解析并批量入库一页已提交Alpha数据，返回 (成功数, 失败数)"""
+        page_success = 0
+        page_error = 0
+        parsed_list = []
+
+        for alpha_data in results:
+            try:
+                # 解析数据
+                parsed_data = self.parse_submitted_alpha_data(alpha_data)
+
+                if not parsed_data:
+                    logger.warning(f"已提交Alpha数据解析失败: {alpha_data.get('id')}")
+                    page_error += 1
+                    continue
+
+                parsed_list.append(parsed_data)
+
+            except Exception as e:
+                logger.error(f"处理已提交Alpha数据异常: {e}")
+                page_error += 1
+
+        # 保存到数据库（整页一次commit）
+        saved, failed = self.save_submitted_alphas_batch(parsed_list)
+        page_success += saved
+        page_error += failed
+        return page_success, page_error
+
     def crawl_submitted_alphas(self, total_limit: Optional[int] = None, filters: Optional[Dict] = None, 
                               task_id: str = 'default', crawl_status_id: Optional[int] = None) -> bool:
         """爬取已提交Alpha数据 - 支持分批处理和断点续连
@@ -705,11 +773,7 @@ class SubmittedAlphaCrawler(AlphaCrawler):
         
         # 如果提供了批次记录ID，则更新状态为running并计算duration_seconds
         if crawl_status_id:
-            cursor = self.db_connection.cursor()
-            sql = "UPDATE crawl_status SET status = 'running', start_time = %s, duration_seconds = TIMESTAMPDIFF(SECOND, %s, NOW()) WHERE id = %s"
-            cursor.execute(sql, (start_time, start_time, crawl_status_id))
-            self.db_connection.commit()
-            cursor.close()
+            self.start_crawl_status(crawl_status_id, start_time)
             logger.info(f"使用现有批次记录 ID: {crawl_status_id}")
         else:
             # 创建新的爬虫状态记录（已提交Alpha数据不需要过滤条件）
@@ -746,29 +810,8 @@ class SubmittedAlphaCrawler(AlphaCrawler):
                     logger.info("没有更多已提交Alpha数据")
                     break
                 
-                # 处理本页数据
-                page_success = 0
-                page_error = 0
-                
-                for alpha_data in results:
-                    try:
-                        # 解析数据
-                        parsed_data = self.parse_submitted_alpha_data(alpha_data)
-                        
-                        if not parsed_data:
-                            logger.warning(f"已提交Alpha数据解析失败: {alpha_data.get('id')}")
-                            page_error += 1
-                            continue
-                        
-                        # 保存到数据库
-                        if self.save_submitted_alpha_to_database(parsed_data):
-                            page_success += 1
-                        else:
-                            page_error += 1
-                            
-                    except Exception as e:
-                        logger.error(f"处理已提交Alpha数据异常: {e}")
-                        page_error += 1
+                # 处理本页数据：先解析整页，再批量入库（一页一次commit）
+                page_success, page_error = self.ingest_page(results)
                 
                 # 更新统计
                 success_count += page_success
@@ -791,11 +834,8 @@ class SubmittedAlphaCrawler(AlphaCrawler):
                     logger.info("已获取所有已提交Alpha数据")
                     break
                 
-                # 更新offset
+                # 更新offset（请求频率由 get_submitted_alphas_page 中的限流器控制）
                 offset += limit
-                
-                # 添加延迟避免频繁请求
-                time.sleep(2)
             
             # 记录结束时间
             end_time = datetime.now()
@@ -926,7 +966,7 @@ def check_resume_point(crawler: SubmittedAlphaCrawler, resume: bool) -> Tuple[st
 
 
 def process_batch_data(crawler: SubmittedAlphaCrawler, task_id: str, total_limit: Optional[int] = None) -> Tuple[int, int]:
-    """处理分批数据
+    """处理分批数据（翻页与入库流水线进行，running状态的批次从断点继续）
     
     Args:
         crawler: 爬虫实例
@@ -936,49 +976,15 @@ def process_batch_data(crawler: SubmittedAlphaCrawler, task_id: str, total_limit
     Returns:
         (成功批次数量, 失败批次数量)
     """
-    total_success = 0
-    total_error = 0
+    batches = load_pending_batches(crawler, task_id)
     
-    # 从数据库读取批次信息，优先处理running状态的批次，然后是pending状态的批次
-    cursor = crawler.db_connection.cursor()
-    sql = """
-    SELECT id, batch_info, status FROM crawl_status 
-    WHERE task_id = %s AND (status = 'running' OR status = 'pending') 
-    ORDER BY 
-        CASE WHEN status = 'running' THEN 1 ELSE 2 END,
-        id
-    """
-    cursor.execute(sql, (task_id,))
-    batch_records = cursor.fetchall()
-    cursor.close()
-    
-    if not batch_records:
+    if not batches:
         logger.warning(f"未找到任务 {task_id} 的待处理批次记录")
         return 0, 0
     
-    logger.info(f"从数据库读取到 {len(batch_records)} 个待处理批次")
-    
-    for i, record in enumerate(batch_records):
-        
-        batch_info = json.loads(record[1])  # batch_info字段
-        
-        logger.info(f"=== 开始处理第 {i+1} 批数据 ===")
-        logger.info(f"批次描述: {batch_info.get('description', '未知批次')}")
-        
-        # 使用从数据库读取的批次信息进行爬取，直接传递批次记录ID
-        success = crawler.crawl_submitted_alphas(total_limit=total_limit, filters=batch_info, task_id=task_id, crawl_status_id=record[0])
-        
-        if success:
-            logger.info(f"第 {i+1} 批数据爬取成功")
-            total_success += 1
-        else:
-            logger.error(f"第 {i+1} 批数据爬取失败")
-            total_error += 1
-        
-        # 批次间延迟
-        time.sleep(5)
+    logger.info(f"从数据库读取到 {len(batches)} 个待处理批次")
     
-    return total_success, total_error
+    return crawler.crawl_batches_pipelined(batches, total_limit=total_limit)
 
 
 def initialize_submitted_crawler() -> Optional[SubmittedAlphaCrawler]:
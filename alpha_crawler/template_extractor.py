@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Alpha表达式的模版/算子/数据字段提取（alphas 表的代码解析字段）
+
+    ts_rank(oth553_sal_yearspeakcnt, 120) + rank(close)
+    -> template_expression: ts_rank([vec], 120)+rank([vec])
+       operators_list:      ["ts_rank", "rank"]
+       data_fields_list:    ["oth553_sal_yearspeakcnt", "close"]
+       datasets_list:       ["oth553"]
+
+模版表达式去掉了空白和注释（逗号、分号后保留一个空格），书写习惯不同的同一模版归为一组。
+同一段代码会被反复爬到（模版批量回测、增量爬取的重叠窗口），提取结果按代码的 MD5
+缓存，每个不同的代码串只解析一次。只依赖标准库。
+"""
+
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+TEMPLATE_PLACEHOLDER = '[vec]'
+
+# 字符串常量 / 注释 / 数字 / 标识符 / 空白 / 其它单字符，按出现顺序切分
+_TOKEN = re.compile(r'"[^"]*"|\'[^\']*\'|#[^\n]*|(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|[A-Za-z_]\w*|\s+|.', re.S)
+_IDENTIFIER = re.compile(r'[A-Za-z_]\w*$')
+# 数据集ID：字段名的第一段，形如 oth553 / fnd14 / pv1
+_DATASET = re.compile(r'([a-z]+\d+)_')
+# 表达式里出现的非字段标识符
+_CONSTANTS = {'true', 'false', 'nan', 'NaN', 'inf', 'NAN', 'INF', 'TRUE', 'FALSE'}
+
+_cache = OrderedDict()
+CACHE_SIZE = 4096
+
+
+def code_hash(code: str) -> str:
+    return hashlib.md5(code.encode('utf-8')).hexdigest()
+
+
+def _next_significant(tokens: List[str], start: int) -> int:
+    """start 及之后第一个非空白、非注释 token 的下标（没有时返回 len(tokens)）"""
+    for i in range(start, len(tokens)):
+        if not tokens[i].isspace() and not tokens[i].startswith('#'):
+            return i
+    return len(tokens)
+
+
+def _token_at(tokens: List[str], i: int) -> str:
+    return tokens[i] if i < len(tokens) else ''
+
+
+def _extract(code: str) -> Dict:
+    tokens = _TOKEN.findall(code)
+
+    def assigned(i: int) -> bool:
+        """tokens[i] 后面紧跟赋值号（= 而不是 ==）"""
+        j = _next_significant(tokens, i + 1)
+        return _token_at(tokens, j) == '=' and _token_at(tokens, j + 1) != '='
+
+    # 多语句表达式里赋值的局部变量（a = rank(x); ...）不算数据字段
+    local_names = {token for i, token in enumerate(tokens) if _IDENTIFIER.match(token) and assigned(i)}
+
+    operators, fields, parts = [], [], []
+    for i, token in enumerate(tokens):
+        # 规范化书写差异：去掉注释和空白，逗号/分号后统一一个空格
+        if token.startswith('#') or token.isspace():
+            continue
+        if token in (',', ';'):
+            token += ' '
+
+        if _IDENTIFIER.match(token):
+            following = _token_at(tokens, _next_significant(tokens, i + 1))
+            if following == '(':
+                if token not in operators:
+                    operators.append(token)
+            elif not assigned(i) and token not in local_names and token not in _CONSTANTS:
+                # 关键字参数名（std=4）、局部变量和常量之外的标识符都是数据字段
+                if token not in fields:
+                    fields.append(token)
+                token = TEMPLATE_PLACEHOLDER
+        parts.append(token)
+
+    template = ''.join(parts).strip()
+    datasets = []
+    for field in fields:
+        match = _DATASET.match(field)
+        if match and match.group(1) not in datasets:
+            datasets.append(match.group(1))
+
+    return {
+        'template_expression': template,
+        'template_hash': code_hash(template),
+        'operators_list': operators,
+        'data_fields_list': fields,
+        'datasets_list': datasets,
+    }
+
+
+def extract_template(code: Optional[str]) -> Optional[Dict]:
+    """
+    提取模版表达式、算子、数据字段和数据集（按代码MD5缓存）
+
+    Returns:
+        {'template_expression', 'template_hash', 'operators_list', 'data_fields_list', 'datasets_list'}，
+        代码为空时返回 None。返回的是缓存对象，调用方不要修改。
+    """
+    if not code:
+        return None
+    key = code_hash(code)
+    result = _cache.get(key)
+    if result is not None:
+        _cache.move_to_end(key)
+        return result
+
+    result = _extract(code)
+    _cache[key] = result
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return result
+
+
+def template_columns(code: Optional[str]) -> Dict:
+    """
+    alphas / submitted_alphas 表代码解析字段的取值（JSON 列为字符串，代码为空时全部为 None）
+    """
+    result = extract_template(code)
+    if result is None:
+        return {'template_expression': None, 'template_hash': None, 'operators_list': None,
+                'data_fields_list': None, 'datasets_list': None}
+    return {
+        'template_expression': result['template_expression'],
+        'template_hash': result['template_hash'],
+        'operators_list': json.dumps(result['operators_list']),
+        'data_fields_list': json.dumps(result['data_fields_list']),
+        'datasets_list': json.dumps(result['datasets_list']),
+    }
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Alpha时间序列的紧凑编码（alpha_timeseries 表的 data 列）
+
+原来 pnl_data / yearly_stats_data 以 JSON 文本存放在 alphas 表里，一条 PnL 有几千个
+["2012-01-03", 123.45] 数据点，行宽被撑大，扫描标量列时缓冲池里全是没人要的时间序列。
+
+这里把 [日期, 数值, 数值...] 形式的序列编码为：
+    zlib( 头部长度(uint32) + 头部JSON + int32 日期偏移(相对 base 的天数) + float32 数值矩阵 )
+空值存为 NaN。其它形式（例如 yearly-stats 的记录字典）编码为 zlib 压缩的 JSON。
+只依赖标准库。
+"""
+
+import json
+import math
+import struct
+import sys
+import zlib
+from array import array
+from datetime import date, timedelta
+from typing import Any, Optional, Tuple
+
+ENCODING_F32 = 'f32z'
+ENCODING_JSON = 'jsonz'
+
+
+def _records_of(data: Any) -> Tuple[Optional[list], Optional[dict]]:
+    """取出记录列表：[[日期, 数值...]] 或 {'records': [...], 其它字段}"""
+    if isinstance(data, dict) and isinstance(data.get('records'), list):
+        return data['records'], {key: value for key, value in data.items() if key != 'records'}
+    if isinstance(data, list):
+        return data, None
+    return None, None
+
+
+def _is_numeric_rows(records: list) -> bool:
+    if not records or not isinstance(records[0], (list, tuple)) or len(records[0]) < 2:
+        return False
+    width = len(records[0])
+    for row in records:
+        if not isinstance(row, (list, tuple)) or len(row) != width or not isinstance(row[0], str):
+            return False
+        for value in row[1:]:
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                return False
+    try:
+        date.fromisoformat(records[0][0][:10])
+        date.fromisoformat(records[-1][0][:10])
+    except ValueError:
+        return False
+    return True
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, raw: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(raw)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def encode_series(data: Any) -> Tuple[str, bytes, int]:
+    """
+    编码时间序列。
+
+    Returns:
+        (编码方式, 二进制数据, 数据点数)
+    """
+    records, meta = _records_of(data)
+    if records is not None and _is_numeric_rows(records):
+        base = date.fromisoformat(records[0][0][:10])
+        offsets = array('i', ((date.fromisoformat(row[0][:10]) - base).days for row in records))
+        values = array('f', (math.nan if value is None else float(value) for row in records for value in row[1:]))
+        header = json.dumps({'v': 1, 'base': base.isoformat(), 'rows': len(records),
+                             'cols': len(records[0]) - 1, 'meta': meta}, ensure_ascii=False).encode('utf-8')
+        payload = struct.pack('<I', len(header)) + header + _little_endian(offsets) + _little_endian(values)
+        return ENCODING_F32, zlib.compress(payload, 6), len(records)
+
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    points = len(records) if records is not None else 0
+    return ENCODING_JSON, zlib.compress(payload, 6), points
+
+
+def decode_series(encoding: str, blob: bytes) -> Any:
+    """encode_series 的逆操作（float32 编码的数值精度为 7 位有效数字）"""
+    payload = zlib.decompress(blob)
+    if encoding == ENCODING_JSON:
+        return json.loads(payload.decode('utf-8'))
+    if encoding != ENCODING_F32:
+        raise ValueError(f"未知的时间序列编码: {encoding}")
+
+    header_len = struct.unpack_from('<I', payload)[0]
+    header = json.loads(payload[4:4 + header_len].decode('utf-8'))
+    rows, cols = header['rows'], header['cols']
+    start = 4 + header_len
+    offsets = _from_little_endian('i', payload[start:start + 4 * rows])
+    values = _from_little_endian('f', payload[start + 4 * rows:start + 4 * rows + 4 * rows * cols])
+
+    base = date.fromisoformat(header['base'])
+    records = []
+    for i, offset in enumerate(offsets):
+        row = [(base + timedelta(days=offset)).isoformat()]
+        for value in values[i * cols:(i + 1) * cols]:
+            # 按 float32 的有效位数还原，避免 0.1 -> 0.10000000149011612
+            row.append(None if math.isnan(value) else float(f'{value:.7g}'))
+        records.append(row)
+
+    if header.get('meta') is not None:
+        return {**header['meta'], 'records': records}
+    return records
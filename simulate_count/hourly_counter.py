@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按小时的模拟数量计数存储（JSON 文件）
+
+每个整点小时一条记录：
+    {"2025-07-11T00:00:00-04:00": {"count": 123, "closed": true, "source": "api", "fetched_at": "..."}}
+小时结束并过了 settle_minutes 之后写入的计数标记为 closed，之后的运行直接复用，
+只有未 closed 的小时（当前小时、刚结束的小时、上次查询失败的小时）才需要重新查询。
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+
+class HourlyCounterStore:
+    """按小时的计数存储，已结束的小时不再重复查询"""
+
+    def __init__(self, path: str, settle_minutes: int = 10, keep_days: int = 7):
+        self.path = path
+        self.settle = timedelta(minutes=settle_minutes)
+        self.keep = timedelta(days=keep_days)
+        self.hours: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.hours = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                # 计数文件损坏时重新统计
+                self.hours = {}
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.hours.get(key)
+
+    def needs_refresh(self, key: str) -> bool:
+        entry = self.hours.get(key)
+        return entry is None or not entry.get('closed')
+
+    def record(self, key: str, count: int, hour_end: datetime, now: datetime, source: str = 'api') -> None:
+        """写入一个小时的计数，hour_end 之后过了 settle 时间才算最终结果"""
+        self.hours[key] = {
+            'count': count,
+            'closed': now >= hour_end + self.settle,
+            'source': source,
+            'fetched_at': now.isoformat(timespec='seconds'),
+        }
+
+    def save(self, now: datetime) -> None:
+        """清理过期的小时后原子写回文件"""
+        cutoff = now - self.keep
+        self.hours = {key: entry for key, entry in self.hours.items()
+                      if datetime.fromisoformat(key) >= cutoff}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.hours, f, indent=2, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_path, self.path)
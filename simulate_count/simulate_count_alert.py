@@ -4,9 +4,10 @@
 import requests
 import json
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 import pytz
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
@@ -20,6 +21,8 @@ import io
 import base64
 import glob
 
+from hourly_counter import HourlyCounterStore
+
 # 设置中文字体
 rcParams['font.sans-serif'] = ['SimHei', 'Arial Unicode MS', 'DejaVu Sans']
 rcParams['axes.unicode_minus'] = False
@@ -54,6 +57,10 @@ print(config_file)
 config = load_config(config_file)
 user=config["user"]
 passwd=config["password"]
+# 每小时计数文件（已结束的小时不再重复查询）
+COUNTER_FILE = os.path.join(BASE_DIR, 'hourly_counts.json')
+# 可选：爬虫本地库（与 alpha_crawler 的 credentials.json 中 database 段格式相同），增量水位线覆盖的小时直接从库里统计
+LOCAL_DB_CONFIG = config.get("local_db")
 def login():
     username = user
     password =  passwd
@@ -85,7 +92,7 @@ def login():
     return None
 s = login()
 
-def get_alpha_count_by_time_range(start_time: str, end_time: str) -> int:
+def get_alpha_count_by_time_range(start_time: str, end_time: str) -> Optional[int]:
     """
     获取指定时间范围内的alpha表达式数量
 
@@ -94,7 +101,7 @@ def get_alpha_count_by_time_range(start_time: str, end_time: str) -> int:
         end_time: 结束时间 (格式: 2025-07-11T01:00:00-04:00)
 
     Returns:
-        int: alpha表达式数量
+        int: alpha表达式数量，请求失败时返回 None（不写入计数文件，下次重新查询）
     """
     baseurl="https://api.worldquantbrain.com/users/self/alphas?limit=100&offset=0&status=UNSUBMITTED%1FIS_FAIL"
     url=f"{baseurl}&dateCreated%3E={start_time}&dateCreated%3C={end_time}&order=-dateCreated"
@@ -121,13 +128,13 @@ def get_alpha_count_by_time_range(start_time: str, end_time: str) -> int:
 
     except requests.exceptions.RequestException as e:
         logging.error(f"请求失败: {e}")
-        return 0
+        return None
     except json.JSONDecodeError as e:
         logging.error(f"JSON解析失败: {e}")
-        return 0
+        return None
     except Exception as e:
         logging.error(f"未知错误: {e}")
-        return 0
+        return None
 
 def get_server_timezone() -> str:
     """
@@ -153,50 +160,130 @@ def format_time_for_api( dt: datetime, timezone_offset: str) -> str:
     """
     return dt.strftime(f"%Y-%m-%dT%H:%M:%S{timezone_offset}")
 
-def get_hourly_stats_last_24h() -> List[Dict]:
+def format_with_colon(dt: datetime) -> str:
+    """带时区的时间 -> 2025-07-11T00:00:00-04:00"""
+    s = dt.strftime("%Y-%m-%dT%H:%M:%S%z")
+    return s[:-2] + ":" + s[-2:]
+
+def get_local_db_counts(windows: List[Tuple[datetime, datetime]]) -> Dict[str, int]:
     """
-    获取最近24小时（以服务器当前时间为基准）每个小时的alpha表达式数量统计
+    从爬虫本地库统计各小时的表达式数量（仅限增量爬取水位线已经覆盖的小时）
+
+    Args:
+        windows: [(小时开始, 小时结束)]，带时区
+
     Returns:
-        List[Dict]: 每小时统计结果列表
+        Dict[str, int]: {小时开始字符串: 数量}，未配置 local_db 或库中数据不够新时为空
+    """
+    if not LOCAL_DB_CONFIG:
+        return {}
+
+    crawler_dir = os.path.join(os.path.dirname(BASE_DIR), 'alpha_crawler')
+    try:
+        sys.path.append(crawler_dir)
+        from storage import connect_storage
+        connection = connect_storage(LOCAL_DB_CONFIG, base_dir=crawler_dir)
+    except Exception as e:
+        logging.warning(f"连接爬虫本地库失败，改用API统计: {e}")
+        return {}
+
+    counts = {}
+    try:
+        cursor = connection.cursor()
+        # 全量过滤条件（filters 为空）的增量任务水位线：dateModified 早于水位线的Alpha都已入库
+        cursor.execute(
+            "SELECT task_params FROM crawl_status WHERE task_type = 'alpha_incremental' "
+            "AND task_params IS NOT NULL ORDER BY id DESC LIMIT 20"
+        )
+        fresh_until = None
+        for (task_params,) in cursor.fetchall():
+            state = json.loads(task_params)
+            if not state.get('filters') and state.get('watermark'):
+                watermark = datetime.fromisoformat(state['watermark'])
+                fresh_until = watermark if fresh_until is None else max(fresh_until, watermark)
+        if fresh_until is None:
+            return {}
+
+        # 库中 date_created 为北京时间
+        beijing = timezone(timedelta(hours=8))
+        for hour_start, hour_end in windows:
+            if hour_end > fresh_until:
+                continue
+            cursor.execute(
+                "SELECT COUNT(*) FROM alphas WHERE date_created >= %s AND date_created < %s "
+                "AND status IN ('UNSUBMITTED', 'IS_FAIL')",
+                (hour_start.astimezone(beijing).strftime('%Y-%m-%d %H:%M:%S'),
+                 hour_end.astimezone(beijing).strftime('%Y-%m-%d %H:%M:%S'))
+            )
+            counts[format_with_colon(hour_start)] = cursor.fetchone()[0]
+        cursor.close()
+        logging.info(f"本地库水位线 {fresh_until.isoformat()}，{len(counts)} 个小时从本地库统计")
+    except Exception as e:
+        logging.warning(f"读取爬虫本地库失败，改用API统计: {e}")
+        return {}
+    finally:
+        connection.close()
+    return counts
+
+def get_hourly_stats_last_24h(max_workers: int = 4) -> List[Dict]:
     """
-    # 获取服务器时区
-    timezone_offset = get_server_timezone()
+    获取最近24个整点小时（以服务器当前时间为基准，最后一个为当前小时）每个小时的alpha表达式数量统计
+
+    已结束的小时计数保存在 hourly_counts.json 并标记为 closed，之后的运行直接复用；
+    只有未 closed 的小时才查询（优先本地库，其余并发请求API）。
 
+    Returns:
+        List[Dict]: 每小时统计结果列表
+    """
     # 直接获取美国东部时间的当前时刻
     server_tz = pytz.timezone('America/New_York')
     server_now = datetime.now(server_tz)
+    current_hour = server_now.replace(minute=0, second=0, microsecond=0)
+
+    # 24个整点小时窗口（normalize 处理夏令时切换）
+    windows = []
+    for i in range(23, -1, -1):
+        hour_start = server_tz.normalize(current_hour - timedelta(hours=i))
+        windows.append((hour_start, server_tz.normalize(hour_start + timedelta(hours=1))))
+
+    store = HourlyCounterStore(COUNTER_FILE)
+    pending = [(hour_start, hour_end) for hour_start, hour_end in windows
+               if store.needs_refresh(format_with_colon(hour_start))]
+    logging.info(f"24个小时中 {len(windows) - len(pending)} 个已有最终计数，需查询 {len(pending)} 个")
+
+    local_counts = get_local_db_counts(pending)
+    for hour_start, hour_end in pending:
+        key = format_with_colon(hour_start)
+        if key in local_counts:
+            store.record(key, local_counts[key], hour_end, server_now, source='local_db')
+
+    api_windows = [(hour_start, hour_end) for hour_start, hour_end in pending
+                   if format_with_colon(hour_start) not in local_counts]
+    if api_windows:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                lambda window: get_alpha_count_by_time_range(format_with_colon(window[0]), format_with_colon(window[1])),
+                api_windows
+            ))
+        for (hour_start, hour_end), count in zip(api_windows, results):
+            if count is not None:
+                store.record(format_with_colon(hour_start), count, hour_end, server_now)
 
-    # 计算24小时前的时间
-    start_time = server_now - timedelta(hours=24)
+    try:
+        store.save(server_now)
+    except OSError as e:
+        logging.error(f"保存小时计数文件失败: {e}")
 
     hourly_stats = []
-
-    # 遍历每个小时
-    for i in range(24):
-        hour_start = start_time + timedelta(hours=i)
-        hour_end = hour_start + timedelta(hours=1)
-
-        # 格式化为API需要的字符串（带时区）
-        def format_with_colon(dt):
-            s = dt.strftime("%Y-%m-%dT%H:%M:%S%z")
-            return s[:-2] + ":" + s[-2:]
+    for hour_start, hour_end in windows:
         start_str = format_with_colon(hour_start)
-        end_str = format_with_colon(hour_end)
-
-        # 获取该小时的表达式数量
-        count = get_alpha_count_by_time_range(start_str, end_str)
-
-        # 记录统计结果
-        hour_stat = {
+        entry = store.get(start_str)
+        hourly_stats.append({
             'hour': hour_start.strftime('%Y-%m-%d %H:00'),
             'start_time': start_str,
-            'end_time': end_str,
-            'count': count
-        }
-        hourly_stats.append(hour_stat)
-
-        # 添加延迟避免请求过于频繁
-        time.sleep(0.5)
+            'end_time': format_with_colon(hour_end),
+            'count': entry['count'] if entry else 0
+        })
 
     return hourly_stats
 
@@ -16,78 +16,50 @@ from pathlib import Path
 import json
 import os
 
+from sc_engine import NeighborReport, get_engine
+from sc_service import SCClient
+from check_pipeline import CheckPipeline
+from precheck import run_precheck
+from retry_scheduler import RetryLater, RetryScheduler, drain
+from result_cache import get_result_cache, os_pool_watermark
+from property_queue import PropertyUpdateQueue, requests_sender
+from auth_manager import AuthManager
+from brain_transport import GLOBAL_RATE_LIMITER, BrainTransport, sign_in as transport_sign_in
+
 
 def sign_in(username, password):
-    s = requests.Session()
-    s.auth = (username, password)
-    try:
-        response = s.post('https://api.worldquantbrain.com/authentication')
-        response.raise_for_status()
-        logging.info("Successfully signed in")
-        return s
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Login failed: {e}")
+    # 带连接池和 gzip 的 session（见 brain_transport.py）
+    s = transport_sign_in(username, password)
+    if s is None:
+        logging.error("Login failed")
         return None
+    logging.info("Successfully signed in")
+    return s
 
 
-class SessionManager:
+class SessionManager(AuthManager):
     """
     统一的session管理器，避免重复登录
+
+    基于 auth_manager.AuthManager：并发的重新登录只执行一次，新 cookie 替换进原 session 对象，
+    session 快过期时提前刷新。
     """
 
     def __init__(self, username, password):
+        super().__init__(lambda: sign_in(username, password), name='SessionManager')
         self.username = username
         self.password = password
-        self.session = None
-        self.last_login_time = None
-        self.login_count = 0
-        self._lock = False  # 简单的锁，防止并发登录
 
-    def get_session(self, force_refresh=False):
-        """
-        获取有效的session，如果过期或不存在则重新登录
-        """
-        # 如果session存在且未强制刷新，直接返回
-        if self.session and not force_refresh:
-            return self.session
-
-        # 防止并发登录
-        if self._lock:
-            # 等待其他线程完成登录
-            while self._lock:
-                time.sleep(0.1)
-            return self.session
-
-        self._lock = True
-        try:
-            new_session = sign_in(self.username, self.password)
-            if new_session:
-                self.session = new_session
-                self.last_login_time = time.time()
-                self.login_count += 1
-                print(f"   🔐 [SessionManager] 登录成功 (总登录次数: {self.login_count})")
-                return self.session
-            else:
-                print("   ❌ [SessionManager] 登录失败")
-                return None
-        finally:
-            self._lock = False
+    @property
+    def last_login_time(self):
+        return self.login_time
 
-    def refresh_on_401(self):
+    def refresh_on_401(self, generation=None):
         """
-        在遇到401错误时刷新session
+        在遇到401错误时刷新session（generation 为发请求时的 self.generation，已被别人刷新过则不再登录）
         """
         print("   🔄 [SessionManager] 检测到401错误，刷新session...")
-        return self.get_session(force_refresh=True)
-
-    def update_session(self, new_session):
-        """
-        更新session（用于外部已经登录的情况）
-        """
-        if new_session:
-            self.session = new_session
-            self.last_login_time = time.time()
-            self.login_count += 1
+        return self.refresh(generation)
 
 
 def save_obj(obj: object, name: str) -> None:
@@ -134,19 +106,8 @@ def wait_get(url: str, max_retries: int = 10) -> "requests.Response":
     Returns:
         Response: 请求的响应对象。
     """
-    retries = 0
-    while retries < max_retries:
-        while True:
-            simulation_progress = sess.get(url)
-            if simulation_progress.headers.get("Retry-After", 0) == 0:
-                break
-            time.sleep(float(simulation_progress.headers["Retry-After"]))
-        if simulation_progress.status_code < 400:
-            break
-        else:
-            time.sleep(2 ** retries)
-            retries += 1
-    return simulation_progress
+    # 统一的 Retry-After / 429 / 401 处理（见 brain_transport.py）
+    return cfg.transport.wait_get(url, max_retries=max_retries)
 
 
 def _get_alpha_pnl(alpha_id: str) -> pd.DataFrame:
@@ -393,19 +354,41 @@ def calc_self_corr(
 
         # 获取当前区域的其他alpha收益率数据
         region = alpha_result['settings']['region']
+
+        # 优先走本地 SC 服务；服务不可用时再加载本地 OS 池计算
+        if cfg.sc_client is not None:
+            service_result = cfg.sc_client.query(region, {alpha_id: alpha_rets}, top_k=cfg.neighbor_report.top_k)
+            if service_result is not None and alpha_id in service_result:
+                service_corr = service_result[alpha_id]['max']
+                cfg.neighbor_report.add_pairs(alpha_id, region, service_result[alpha_id]['neighbors'])
+                return service_corr if not return_alpha_pnls else (service_corr, alpha_pnls)
+        if os_alpha_rets is None or os_alpha_ids is None:
+            os_alpha_ids, os_alpha_rets = load_data()
+
         if region not in os_alpha_ids or len(os_alpha_ids[region]) == 0:
             print(f"   ⚠️  [calc_self_corr] 区域 {region} 没有可用的OS alpha数据")
             return 0.0 if not return_alpha_pnls else (0.0, alpha_pnls)
 
-        region_os_rets = os_alpha_rets[os_alpha_ids[region]]
+        # 检查目标alpha的标准差是否有效
+        if len(alpha_rets.dropna()) > 0 and alpha_rets.std() > 1e-10 and cfg.sc_prefilter:
+            # 低秩预筛选：只对可能超过阈值的OS alpha做精确相关性计算
+            engine = get_engine(os_alpha_rets, os_alpha_ids[region], key=region,
+                                method=cfg.sc_prefilter_method, rank=cfg.sc_prefilter_rank,
+                                top_k=cfg.sc_prefilter_top_k)
+            corr_results = engine.query(alpha_rets)
+            if len(corr_results) > 0:
+                cfg.neighbor_report.add(alpha_id, region, corr_results)
+                self_corr = corr_results.max()
+            else:
+                self_corr = 0
+        elif len(alpha_rets.dropna()) > 0 and alpha_rets.std() > 1e-10:
+            region_os_rets = os_alpha_rets[os_alpha_ids[region]]
 
-        # 过滤掉标准差为0或NaN的alpha（避免除以零警告）
-        valid_cols = region_os_rets.columns[
-            (region_os_rets.std() > 1e-10) & (region_os_rets.std().notna())
-            ]
+            # 过滤掉标准差为0或NaN的alpha（避免除以零警告）
+            valid_cols = region_os_rets.columns[
+                (region_os_rets.std() > 1e-10) & (region_os_rets.std().notna())
+                ]
 
-        # 检查目标alpha的标准差是否有效
-        if len(alpha_rets.dropna()) > 0 and alpha_rets.std() > 1e-10:
             # 只计算与有效alpha的相关性
             if len(valid_cols) > 0:
                 region_os_rets_valid = region_os_rets[valid_cols]
@@ -417,8 +400,7 @@ def calc_self_corr(
                     corr_results = corr_results.dropna()  # 移除NaN结果
 
                     if len(corr_results) > 0:
-                        corr_results.sort_values(ascending=False).round(4).to_csv(
-                            str(cfg.data_path / 'os_alpha_corr.csv'))
+                        cfg.neighbor_report.add(alpha_id, region, corr_results.sort_values(ascending=False))
                         self_corr = corr_results.max()
                     else:
                         self_corr = 0
@@ -616,23 +598,111 @@ def get_prod_corr(s, alpha_id):
     return prod_corr_df
 
 
-def set_alpha_properties(
-        s,
-        alpha_id,
+def fetch_prod_corrs(s, alpha_ids, max_wait_time=10 * 60, max_attempts=20, cache=None):
+    """
+    批量获取生产相关性（max 值）。
+
+    所有 alpha 放进同一个重试调度器：服务器要求等待（Retry-After）或返回 412/其它错误的 alpha
+    按各自的到期时间重新排队，其间继续请求其它 alpha，不再让一个 alpha 阻塞整个循环。
+    传入 cache（ResultCache）时，有效期内获取过的生产相关性直接返回，不再请求。
+
+    Returns:
+        Dict[str, Tuple[str, object]]: {alpha_id: (status, value)}，status 为
+            "ok"（value 为 max，可能为 None）/ "timeout"（超过 max_wait_time 或重试次数）/ "error"（value 为错误信息）
+    """
+    scheduler = RetryScheduler(base_delay=30, max_delay=3 * 60, max_attempts=max_attempts)
+    start_times = {}
+    error_count = defaultdict(int)
+
+    def _log_timeout(alpha_id):
+        elapsed_minutes = (time.time() - start_times[alpha_id]) / 60
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] alpha_id: {alpha_id} "
+              f"检查生产相关性超时（已等待 {elapsed_minutes:.1f} 分钟），直接进入提交检查")
+        return "timeout", None
+
+    def _fetch(alpha_id, attempts):
+        elapsed_time = time.time() - start_times.setdefault(alpha_id, time.time())
+        if elapsed_time > max_wait_time:
+            return _log_timeout(alpha_id)
+        try:
+            response = s.get(
+                "https://api.worldquantbrain.com/alphas/" + alpha_id + "/correlations/prod",
+                timeout=5 * 60  # 5分钟 = 300秒
+            )
+        except requests.exceptions.Timeout:
+            return "error", "获取生产相关性请求超时"
+        except Exception as e:
+            return "error", str(e)[:50]
+
+        count = True
+        if response.status_code == 429:
+            # 检查响应消息是否包含 rate limit exceeded
+            if "rate limit exceeded" in response.text.lower():
+                print(f"   🔄 [429] 检测到API速率限制，重新登录...")
+                if cfg.session_manager:
+                    new_session = cfg.session_manager.refresh_on_401()
+                else:
+                    new_session = sign_in(cfg.username, cfg.password)
+                if not new_session:
+                    print("   ❌ 重新登录失败，跳过此alpha")
+                    return "timeout", None
+                s.cookies.update(new_session.cookies)
+                print("   ✅ 重新登录成功，继续获取生产相关性...")
+            wait_time = float(response.headers.get("Retry-After", 60))
+            print(f"   ⚠️  [429] API速率限制，{wait_time:.1f} 秒后重试 {alpha_id}")
+            count = False
+        elif "retry-after" in response.headers:
+            # 服务器仍在计算，按 Retry-After 轮询，不计入重试次数
+            wait_time = float(response.headers["Retry-After"])
+            count = False
+        elif response.status_code == 200:
+            prod_corr_value = response.json().get('max', None)
+            if cache is not None and prod_corr_value is not None:
+                cache.set(alpha_id, 'prod', prod_corr_value)
+            return "ok", prod_corr_value
+        else:
+            # 412 等错误按抖动指数退避重新排队（30秒起步，最多3分钟）
+            status_code = response.status_code
+            error_count[status_code] += 1
+            wait_time = scheduler.backoff(attempts + 1)
+            if error_count[status_code] == 1 or error_count[status_code] % 5 == 0:
+                print(f"   ⚠️  [{status_code}] 获取生产相关性失败（累计 {error_count[status_code]} 次），"
+                      f"{alpha_id} 在 {wait_time:.1f} 秒后重试...")
+
+        if elapsed_time + wait_time > max_wait_time:
+            return _log_timeout(alpha_id)
+        raise RetryLater(f"HTTP {response.status_code}", delay=wait_time, count=count)
+
+    results = {}
+    tickets = {}
+    for alpha_id in alpha_ids:
+        value = cache.get(alpha_id, 'prod') if cache is not None else None
+        if value is not None:
+            results[alpha_id] = ("ok", value)
+        else:
+            tickets[scheduler.push(alpha_id)] = alpha_id
+    if results:
+        print(f"   ♻️ {len(results)} 个alpha使用缓存的生产相关性")
+    for ticket, result in drain(scheduler, _fetch).items():
+        results[tickets[ticket]] = result
+    for alpha_id, attempts, reason in scheduler.dead_letters:
+        print(f"   ⚠️  {alpha_id}: 获取生产相关性重试 {attempts} 次仍失败（{reason}），直接进入提交检查")
+        results[alpha_id] = ("timeout", None)
+    return results
+
+
+def alpha_properties_params(
         name: str = None,
         color: str = None,
         selection_desc: str = "311111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111",
         combo_desc: str = "322222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222",
         description: str = 'None',
         tags=['c1'],
-):
-    """
-    Function changes alpha's description parameters
-    """
-
+) -> dict:
+    """set_alpha_properties / queue_alpha_properties 共用的 PATCH 字段"""
     if tags is None:
         tags = ["c2"]
-    params = {
+    return {
         "color": color,
         "name": name,
         "tags": tags,
@@ -642,6 +712,31 @@ def set_alpha_properties(
         "selection": {"description": selection_desc},
     }
 
+
+def queue_alpha_properties(alpha_id, **kwargs):
+    """
+    参数与 set_alpha_properties 相同，但只把更新放进后台队列（见 property_queue.py）后立即返回。
+    合并窗口内对同一 alpha 的多次更新合并为一个 PATCH，限流/认证失败由队列重试。
+    """
+    cfg.property_queue.update(alpha_id, alpha_properties_params(**kwargs))
+
+
+def set_alpha_properties(
+        s,
+        alpha_id,
+        name: str = None,
+        color: str = None,
+        selection_desc: str = "311111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111",
+        combo_desc: str = "322222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222",
+        description: str = 'None',
+        tags=['c1'],
+):
+    """
+    Function changes alpha's description parameters
+    """
+
+    params = alpha_properties_params(name, color, selection_desc, combo_desc, description, tags)
+
     max_retries = 5
     base_timeout = 600
 
@@ -704,27 +799,15 @@ def check_submission(alpha_bag, gold_bag, start, sess=None, c_d=None, s_d=None,
     if sess is None:
         sess = s
 
-    for idx, g in enumerate(alpha_bag):
-        if idx < start:
-            continue
-        if idx % 5 == 0:
-            print(idx)
-        # 移除每200个alpha的定期重新登录，改为在401时统一处理
-        # if idx % 200 == 0:
-        #     s = sign_in(cfg.username, cfg.password)
-        # print(idx)
-        status, payload = get_check_submission(s, g)
-        if status == "sleep":
-            time.sleep(100)
-            # 使用SessionManager刷新session
-            if hasattr(cfg, 'session_manager') and cfg.session_manager:
-                s = cfg.session_manager.refresh_on_401()
-                sess = s
-            else:
-                s = sign_in(cfg.username, cfg.password)
-                sess = s
-            alpha_bag.append(g)
-        elif status == "fail":
+    # 并发提交检查：多个alpha的服务器等待时间重叠，单个alpha超过10分钟记为overtime
+    if hasattr(cfg, 'session_manager') and cfg.session_manager:
+        refresh_session = cfg.session_manager.refresh_on_401
+    else:
+        refresh_session = lambda: sign_in(cfg.username, cfg.password)
+    pipeline = CheckPipeline(s, max_concurrent=cfg.check_concurrency, refresh_session=refresh_session,
+                             cache=cfg.result_cache, watermark=cfg.os_watermark)
+    for g, status, payload in pipeline.run(alpha_bag[start:]):
+        if status == "fail":
             continue
         elif status == "error":
             depot.append(g)
@@ -732,14 +815,7 @@ def check_submission(alpha_bag, gold_bag, start, sess=None, c_d=None, s_d=None,
             # 提交检查超时，记录到overtime_alphas列表
             overtime_alphas.append(g)
         elif status == "success":
-            info = payload or {}
-            pc_value = info.get("pc")
-            if pc_value is not None and pd.isna(pc_value):
-                print("check self-corrlation error")
-                time.sleep(100)
-                alpha_bag.append(g)
-                continue
-            gold_bag.append((g, info))
+            gold_bag.append((g, payload or {}))
         else:
             print(f"   ⚠️ 未知状态 {status}，跳过 {g}")
             continue
@@ -750,16 +826,16 @@ def check_submission(alpha_bag, gold_bag, start, sess=None, c_d=None, s_d=None,
         overtime_time = datetime.now().strftime("%Y%m%d_%H%M%S")
         for alpha_id in overtime_alphas:
             try:
-                response = set_alpha_properties(sess, alpha_id,
-                                                name=f"{overtime_time}_OVERTIME",
-                                                description="提交检查超时（超过10分钟）",
-                                                combo_desc=c_d,
-                                                selection_desc=s_d,
-                                                color='YELLOW',
-                                                tags=['overtime'])
+                queue_alpha_properties(alpha_id,
+                                       name=f"{overtime_time}_OVERTIME",
+                                       description="提交检查超时（超过10分钟）",
+                                       combo_desc=c_d,
+                                       selection_desc=s_d,
+                                       color='YELLOW',
+                                       tags=['overtime'])
                 if all_yellow_alphas is not None and alpha_id not in all_yellow_alphas:
                     all_yellow_alphas.append(alpha_id)
-                print(f"   🟡 {alpha_id[:8]}... → YELLOW (overtime, 状态: {response.status_code})")
+                print(f"   🟡 {alpha_id[:8]}... → YELLOW (overtime, 已加入更新队列)")
             except Exception as e:
                 print(f"   ⚠️ 标记YELLOW失败 {alpha_id[:8]}...: {str(e)[:120]}")
         print(f"   ⏰ OVERTIME标记完成: {len(overtime_alphas)} 个alpha")
@@ -769,161 +845,7 @@ def check_submission(alpha_bag, gold_bag, start, sess=None, c_d=None, s_d=None,
     return gold_bag
 
 
-def get_check_submission(s, alpha_id, max_retries=3):
-    """
-    获取alpha的提交检查结果，包含重试逻辑
-
-    Args:
-        s: session对象
-        alpha_id: alpha ID
-        max_retries: 最大重试次数，默认3次
-
-    Returns:
-        Tuple[str, dict | None]: 第一个元素是状态（"sleep"/"fail"/"error"/"success"/"overtime"），第二个元素是success时的额外数据
-    """
-    check_start_time = time.time()
-    max_check_time = 10 * 60  # 10分钟 = 600秒
-
-    for attempt in range(max_retries):
-        try:
-            # 获取检查结果（带重试等待）
-            while True:
-                # 检查是否超过10分钟
-                elapsed_time = time.time() - check_start_time
-                if elapsed_time > max_check_time:
-                    elapsed_minutes = elapsed_time / 60
-                    print(f"   ⚠️  {alpha_id}: 提交检查超时（已等待 {elapsed_minutes:.1f} 分钟）")
-                    return "overtime", None
-
-                result = s.get("https://api.worldquantbrain.com/alphas/" + alpha_id + "/check")
-
-                # 检查429状态码和rate limit exceeded消息
-                if result.status_code == 429:
-                    try:
-                        response_text = result.text.lower()
-                        if "rate limit exceeded" in response_text or "api rate limit exceeded" in response_text:
-                            print(f"   🔄 [429] 检测到API速率限制，重新登录...")
-                            # 尝试从全局session_manager获取新session
-                            if hasattr(cfg, 'session_manager') and cfg.session_manager:
-                                new_session = cfg.session_manager.refresh_on_401()
-                                if new_session:
-                                    s.cookies.update(new_session.cookies)
-                                    print("   ✅ 重新登录成功，继续检查...")
-                                else:
-                                    print("   ❌ 重新登录失败")
-                                    return "error", None
-                            else:
-                                new_session = sign_in(cfg.username, cfg.password)
-                                if new_session:
-                                    s.cookies.update(new_session.cookies)
-                                    print("   ✅ 重新登录成功，继续检查...")
-                                else:
-                                    print("   ❌ 重新登录失败")
-                                    return "error", None
-                    except:
-                        pass  # 如果解析响应失败，继续原有逻辑
-
-                retry_after = result.headers.get("retry-after")
-
-                if retry_after:
-                    retry_after_float = float(retry_after)
-                    # 检查等待后是否超过10分钟
-                    if elapsed_time + retry_after_float > max_check_time:
-                        elapsed_minutes = elapsed_time / 60
-                        print(f"   ⚠️  {alpha_id}: 提交检查超时（已等待 {elapsed_minutes:.1f} 分钟）")
-                        return "overtime", None
-                    time.sleep(retry_after_float)
-                elif result.status_code == 429:
-                    # 429但没有retry-after头，等待默认时间
-                    default_wait = 60
-                    if elapsed_time + default_wait > max_check_time:
-                        elapsed_minutes = elapsed_time / 60
-                        print(f"   ⚠️  {alpha_id}: 提交检查超时（已等待 {elapsed_minutes:.1f} 分钟）")
-                        return "overtime", None
-                    print(f"   ⚠️  [429] API速率限制，等待 {default_wait} 秒...")
-                    time.sleep(default_wait)
-                else:
-                    break
-
-            # 检查是否登出
-            if result.json().get("is", 0) == 0:
-                print(f"   ⚠️  {alpha_id}: logged out")
-                return "sleep", None
-
-            # 解析检查结果
-            checks_df = pd.DataFrame(
-                result.json()["is"]["checks"]
-            )
-
-            # 获取PROD_CORRELATION值
-            pc_rows = checks_df[checks_df.name == "PROD_CORRELATION"]
-            if len(pc_rows) == 0:
-                raise ValueError("PROD_CORRELATION field not found in checks")
-
-            pc = pc_rows["value"].values[0]
-
-            false_flag = False
-            for field in ("result", "value"):
-                if field not in checks_df.columns:
-                    continue
-                for cell in checks_df[field]:
-                    if isinstance(cell, (bool, np.bool_)):
-                        if cell is False:
-                            false_flag = True
-                            break
-                    elif isinstance(cell, str) and "false" in cell.lower():
-                        false_flag = True
-                        break
-                if false_flag:
-                    break
-
-            # 检查是否有FAIL结果
-            if not any(checks_df["result"] == "FAIL"):
-                if false_flag:
-                    print(f"   🟡 {alpha_id}: PC={pc} 包含 False 检查项")
-                else:
-                    print(f"   ✅ {alpha_id}: PC={pc}")
-                return "success", {"pc": pc, "has_false": false_flag}
-            else:
-                print(f"   ❌ {alpha_id}: 检查失败 (PC={pc})")
-                return "fail", None
-
-        except KeyError as e:
-            # 数据结构错误
-            print(f"   ⚠️  catch {alpha_id} (尝试 {attempt + 1}/{max_retries}): 字段缺失 {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)  # 指数退避：1秒、2秒、4秒
-                print(f"   🔄 等待 {2 ** attempt} 秒后重试...")
-            else:
-                print(f"   ❌ {alpha_id}: 重试失败，返回error")
-                return "error", None
-
-        except ValueError as e:
-            # PROD_CORRELATION字段不存在
-            print(f"   ⚠️  catch {alpha_id} (尝试 {attempt + 1}/{max_retries}): {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-                print(f"   🔄 等待 {2 ** attempt} 秒后重试...")
-            else:
-                print(f"   ❌ {alpha_id}: 重试失败，返回error")
-                return "error", None
-
-        except Exception as e:
-            # 其他未知错误
-            error_type = type(e).__name__
-            print(f"   ⚠️  catch {alpha_id} (尝试 {attempt + 1}/{max_retries}): {error_type} - {str(e)[:50]}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-                print(f"   🔄 等待 {2 ** attempt} 秒后重试...")
-            else:
-                print(f"   ❌ {alpha_id}: 重试失败，返回error")
-                return "error", None
-
-    # 理论上不会到这里
-    return "error", None
-
-
-def get_alphas_posit(start_date, end_date, sharpe_th, fitness_th, region, alpha_num):
+def get_alphas_posit(start_date, end_date, sharpe_th, fitness_th, region, alpha_num, raw_alphas=None):
     print(
         f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] get_alphas_posit开始处理地区 {region}，目标数量: {alpha_num}")
     # 使用SessionManager统一管理登录
@@ -1032,6 +954,8 @@ def get_alphas_posit(start_date, end_date, sharpe_th, fitness_th, region, alpha_
                         elif turnover > 0.3:
                             rec.append(decay + 2)
                         output.append(rec)
+                        if raw_alphas is not None:
+                            raw_alphas.append(alpha_list[j])
 
                 offset_time = time.time() - offset_start
                 print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] offset={i} 处理完成，耗时: {offset_time:.2f}秒")
@@ -1102,6 +1026,30 @@ class cfg:
     
     data_path = Path('.')
     session_manager = None  # 全局SessionManager实例
+    transport = None  # 全局BrainTransport，与SessionManager共用session
+
+    # 自相关预筛选（见 sc_engine.py），OS 池较小时会自动退化为全量精确计算
+    sc_prefilter = True
+    sc_prefilter_method = 'pca'  # 'pca' 或 'random'
+    sc_prefilter_rank = 32
+    sc_prefilter_top_k = 20
+    # 本地 SC 服务（见 sc_service.py，--data-path 与上面的 data_path 一致），设为 None 则始终在进程内计算
+    sc_service_url = 'http://127.0.0.1:8765'
+    sc_client = SCClient(sc_service_url, data_path) if sc_service_url else None
+    # 每个候选的 top-k 相关邻居，每轮结束时落盘一次
+    neighbor_report = NeighborReport(top_k=10)
+
+    # 同时处于提交检查中的alpha数量
+    check_concurrency = 8
+    # 本地预检查并发计算SC的线程数
+    precheck_workers = 10
+
+    # /check 与生产相关性结果缓存（见 result_cache.py），设为 None 则不缓存
+    result_cache = get_result_cache()
+    # OS 池水位，每轮 download_data 后更新；变化后缓存的检查结果失效
+    os_watermark = None
+    # alpha 属性后台更新队列，在 SessionManager 初始化后创建
+    property_queue = None
 
 
 def get_date_range_from_user():
@@ -1198,6 +1146,10 @@ def get_date_range_from_user():
 # 初始化全局SessionManager，统一管理登录，避免重复登录
 cfg.session_manager = SessionManager(cfg.username, cfg.password)
 sess = cfg.session_manager.get_session()
+# 共用进程级限流器：预检查并发拉 PnL 等请求统一节流，避免 429
+cfg.transport = BrainTransport(auth=cfg.session_manager, rate_limiter=GLOBAL_RATE_LIMITER)
+cfg.property_queue = PropertyUpdateQueue(requests_sender(cfg.session_manager.get_session,
+                                                         relogin=cfg.session_manager.refresh_on_401))
 
 # 在循环开始前获取日期范围设置
 print("\n" + "🎯" * 40)
@@ -1219,6 +1171,12 @@ while True:
 
     # 每轮开始时更新数据
     download_data(flag_increment=True)
+    if cfg.sc_client is not None:
+        cfg.sc_client.refresh()
+    try:
+        cfg.os_watermark = os_pool_watermark(load_obj(str(cfg.data_path / 'os_alpha_ids')))
+    except FileNotFoundError:
+        cfg.os_watermark = None
 
     # 如果是滚动窗口模式，每轮更新日期范围
     if rolling_window and isinstance(rolling_window, int):
@@ -1235,7 +1193,8 @@ while True:
     random.shuffle(region_list)
     region_summaries = {}
     for region in region_list:
-        alpha_records = get_alphas_posit(start_date, end_date, 1, 0.5, region, 100)
+        raw_alphas = []
+        alpha_records = get_alphas_posit(start_date, end_date, 1, 0.5, region, 100, raw_alphas=raw_alphas)
 
         # 提取alpha ID（第一个元素）并去重保序
         alpha_ids = []
@@ -1246,9 +1205,24 @@ while True:
 
         print(f"地区 {region} 获取到 {len(alpha_ids)} 个唯一alpha")
 
+        # 本地预检查：用listing里的JSON整页判定检查项，并发算本地SC，省掉逐个GET /alphas/{id}
+        if cfg.sc_client is not None and cfg.sc_client.available():
+            os_alpha_ids, os_alpha_rets = None, None
+        else:
+            os_alpha_ids, os_alpha_rets = load_data()
+        raw_by_id = {alpha['id']: alpha for alpha in raw_alphas}
+        precheck = run_precheck(
+            raw_alphas,
+            sc_fn=lambda alpha: calc_self_corr(alpha_id=alpha['id'], os_alpha_rets=os_alpha_rets,
+                                               os_alpha_ids=os_alpha_ids, alpha_result=alpha),
+            sc_cutoff=0.7,
+            max_workers=cfg.precheck_workers,
+        )
+
         alpha_bag = []
         gold_bag = []
         prod_corr_dict = {}  # 存储每个alpha的生产相关性值
+        pc_candidates = []  # 自相关性符合条件、待获取生产相关性的 (idx, alpha_id)
         all_yellow_alphas = []  # 跟踪所有被标记为YELLOW的alpha（包括筛选阶段和提交检查阶段）
         project_spec = "Idea: 111111111111111\n" + \
                        "Rationale for data used: 11111111111111\n" + \
@@ -1260,20 +1234,24 @@ while True:
         for idx, alpha_id in enumerate(alpha_ids, 1):
             current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             try:
-                # 添加请求延迟，避免触发429速率限制（每10个请求后延迟稍长）
-                if idx > 1 and idx % 10 == 1:
-                    time.sleep(2)  # 每10个请求后延迟2秒
-                elif idx > 1:
-                    time.sleep(0.5)  # 每个请求之间延迟0.5秒
-
-                result_fail = get_simulation_result_json(sess, alpha_id, session_manager=cfg.session_manager)
-                # 检查是否包含FAIL：只有当result_fail不为空且明确包含"FAIL"时才跳过
-                # 空字典或None表示获取失败，不应该被误判为包含FAIL
-                has_fail = False
-                if result_fail:
-                    result_str = str(result_fail).upper()
-                    if "FAIL" in result_str:
-                        has_fail = True
+                if alpha_id in precheck.index:
+                    # 已在本地预检查中判定，无需再请求
+                    result_fail = raw_by_id[alpha_id]
+                    has_fail = bool(precheck.at[alpha_id, 'fail'])
+                else:
+                    # 添加请求延迟，避免触发429速率限制（每10个请求后延迟稍长）
+                    if idx > 1 and idx % 10 == 1:
+                        time.sleep(2)  # 每10个请求后延迟2秒
+                    elif idx > 1:
+                        time.sleep(0.5)  # 每个请求之间延迟0.5秒
+                    result_fail = get_simulation_result_json(sess, alpha_id, session_manager=cfg.session_manager)
+                    # 检查是否包含FAIL：只有当result_fail不为空且明确包含"FAIL"时才跳过
+                    # 空字典或None表示获取失败，不应该被误判为包含FAIL
+                    has_fail = False
+                    if result_fail:
+                        result_str = str(result_fail).upper()
+                        if "FAIL" in result_str:
+                            has_fail = True
 
                 # 如果result_fail为空，可能是获取失败，跳过但不说是"包含 FAIL"
                 if not result_fail:
@@ -1282,215 +1260,34 @@ while True:
 
                 if not has_fail:
                     print(f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 不包含 FAIL，继续")
-                    os_alpha_ids, os_alpha_rets = load_data()
-                    self_corr = calc_self_corr(
-                        alpha_id=alpha_id,
-                        os_alpha_rets=os_alpha_rets,
-                        os_alpha_ids=os_alpha_ids,
-                    )
+                    if alpha_id in precheck.index and pd.notna(precheck.at[alpha_id, 'self_corr']):
+                        self_corr = precheck.at[alpha_id, 'self_corr']
+                    else:
+                        self_corr = calc_self_corr(
+                            alpha_id=alpha_id,
+                            os_alpha_rets=os_alpha_rets,
+                            os_alpha_ids=os_alpha_ids,
+                            alpha_result=result_fail,
+                        )
                     if self_corr < 0.7:
                         print(
                             f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 自相关性: {self_corr} 符合条件")
-                        # 直接调用 API 获取生产相关性
-                        try:
-                            prod_corr_start_time = time.time()
-                            max_wait_time = 10 * 60  # 10分钟 = 600秒
-                            prod_corr_value = None
-                            error_count = {}  # 记录不同状态码的错误次数
-                            last_error_time = {}  # 记录上次输出错误的时间
-
-                            prod_corr_timeout = False  # 标记生产相关性检查是否超时
-                            while True:
-                                # 检查是否超过10分钟
-                                elapsed_time = time.time() - prod_corr_start_time
-                                if elapsed_time > max_wait_time:
-                                    elapsed_minutes = elapsed_time / 60
-                                    print(
-                                        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 检查生产相关性超时（已等待 {elapsed_minutes:.1f} 分钟），直接进入提交检查")
-                                    prod_corr_timeout = True
-                                    break
-
-                                response = sess.get(
-                                    "https://api.worldquantbrain.com/alphas/" + alpha_id + "/correlations/prod",
-                                    timeout=5 * 60  # 5分钟 = 300秒
-                                )
-
-                                # 处理429速率限制错误
-                                if response.status_code == 429:
-                                    # 检查响应消息是否包含 rate limit exceeded
-                                    try:
-                                        response_text = response.text.lower()
-                                        if "rate limit exceeded" in response_text or "api rate limit exceeded" in response_text:
-                                            print(f"   🔄 [429] 检测到API速率限制，重新登录...")
-                                            # 使用SessionManager刷新session
-                                            if cfg.session_manager:
-                                                new_session = cfg.session_manager.refresh_on_401()
-                                                if new_session:
-                                                    sess.cookies.update(new_session.cookies)
-                                                    print("   ✅ 重新登录成功，继续获取生产相关性...")
-                                                else:
-                                                    print("   ❌ 重新登录失败，跳过此alpha")
-                                                    prod_corr_timeout = True
-                                                    break
-                                            else:
-                                                # 兼容旧代码，直接登录
-                                                new_session = sign_in(cfg.username, cfg.password)
-                                                if new_session:
-                                                    sess.cookies.update(new_session.cookies)
-                                                    print("   ✅ 重新登录成功，继续获取生产相关性...")
-                                                else:
-                                                    print("   ❌ 重新登录失败，跳过此alpha")
-                                                    prod_corr_timeout = True
-                                                    break
-                                    except:
-                                        pass  # 如果解析响应失败，继续原有逻辑
-
-                                    retry_after = float(response.headers.get("Retry-After", 60))
-                                    if elapsed_time + retry_after > max_wait_time:
-                                        elapsed_minutes = elapsed_time / 60
-                                        print(
-                                            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 检查生产相关性超时（已等待 {elapsed_minutes:.1f} 分钟），直接进入提交检查")
-                                        prod_corr_timeout = True
-                                        break
-                                    print(f"   ⚠️  [429] API速率限制，等待 {retry_after:.1f} 秒...")
-                                    time.sleep(retry_after)
-                                    continue  # 重试请求
-
-                                if "retry-after" in response.headers:
-                                    retry_after = float(response.headers["Retry-After"])
-                                    # 检查等待时间加上已用时间是否超过10分钟
-                                    if elapsed_time + retry_after > max_wait_time:
-                                        elapsed_minutes = elapsed_time / 60
-                                        print(
-                                            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 检查生产相关性超时（已等待 {elapsed_minutes:.1f} 分钟），直接进入提交检查")
-                                        prod_corr_timeout = True
-                                        break
-                                    time.sleep(retry_after)
-                                elif response.status_code == 200:
-                                    prod_corr_data = response.json()
-                                    prod_corr_value = prod_corr_data.get('max', None)
-                                    break
-                                elif response.status_code == 412:
-                                    # 412 Precondition Failed - 特殊处理
-                                    status_code = response.status_code
-                                    error_count[status_code] = error_count.get(status_code, 0) + 1
-                                    count = error_count[status_code]
-
-                                    # 检查是否有Retry-After头
-                                    retry_after = response.headers.get("Retry-After")
-                                    if retry_after:
-                                        wait_time = float(retry_after)
-                                    else:
-                                        # 412错误通常需要等待更长时间，使用递增等待时间
-                                        wait_time = min(30 + (count - 1) * 5, 120)  # 30秒起步，每次增加5秒，最多120秒
-
-                                    # 检查等待时间加上已用时间是否超过10分钟
-                                    if elapsed_time + wait_time > max_wait_time:
-                                        elapsed_minutes = elapsed_time / 60
-                                        print(
-                                            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 检查生产相关性超时（已等待 {elapsed_minutes:.1f} 分钟），直接进入提交检查")
-                                        prod_corr_timeout = True
-                                        break
-
-                                    # 只在特定次数输出（减少日志噪音）
-                                    if count == 1 or count % 5 == 0:
-                                        elapsed_minutes = elapsed_time / 60
-                                        print(
-                                            f"   ⚠️  [412] 前置条件不满足（已重试 {count} 次，已等待 {elapsed_minutes:.1f} 分钟），等待 {wait_time:.1f} 秒后重试...")
-
-                                    time.sleep(wait_time)
-                                    continue
-                                else:
-                                    # 其他错误状态码，等待后重试
-                                    status_code = response.status_code
-                                    error_count[status_code] = error_count.get(status_code, 0) + 1
-                                    current_time = time.time()
-
-                                    # 智能输出策略：减少重复输出
-                                    count = error_count[status_code]
-                                    # 定义输出里程碑：1, 10, 50, 100, 200, 500, 1000, 2000...
-                                    milestones = [1, 10, 50, 100, 200, 500, 1000, 2000, 5000]
-                                    is_milestone = count in milestones
-
-                                    # 时间间隔：第一次后，每60秒输出一次（而不是30秒）
-                                    time_since_last = (current_time - last_error_time.get(status_code,
-                                                                                          0)) if status_code in last_error_time else float(
-                                        'inf')
-                                    time_threshold = 60 if count > 1 else 0  # 第一次立即输出，之后每60秒
-
-                                    # 只在里程碑或时间间隔达到时输出
-                                    should_print = (
-                                            is_milestone or  # 达到里程碑次数
-                                            (count == 1) or  # 第一次
-                                            (time_since_last >= time_threshold and count > 1)  # 达到时间间隔且不是第一次
-                                    )
-
-                                    if should_print:
-                                        if count > 1:
-                                            print(
-                                                f"   ⚠️  获取生产相关性返回状态码 {status_code}（已重试 {count} 次），等待3分钟后继续重试...")
-                                        else:
-                                            print(f"   ⚠️  获取生产相关性返回状态码 {status_code}，等待3分钟后重试...")
-                                        last_error_time[status_code] = current_time
-
-                                    time.sleep(3 * 60)  # 3分钟 = 180秒
-                                    continue
-
-                            # 如果生产相关性检查超时，直接进入提交检查
-                            if prod_corr_timeout:
-                                print(
-                                    f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性检查超时，直接进入提交检查")
-                                alpha_bag.append(alpha_id)
-                                prod_corr_dict[alpha_id] = None  # 标记为超时，未获取到生产相关性值
-                            elif prod_corr_value is not None:
-                                if float(prod_corr_value) < 0.7:
-                                    print(
-                                        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性: {prod_corr_value} 符合条件")
-                                    alpha_bag.append(alpha_id)
-                                    prod_corr_dict[alpha_id] = prod_corr_value  # 保存生产相关性值
-                                else:
-                                    print(
-                                        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性: {prod_corr_value} 不符合条件")
-                                    # 生产相关性 > 0.7，标记为黄色
-                                    try:
-                                        yellow_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-                                        yellow_tag = "PROD_CORR_HIGH"
-                                        response = set_alpha_properties(sess,
-                                                                        alpha_id,
-                                                                        name=f"{yellow_time}_{yellow_tag}",
-                                                                        description=f"生产相关性>0.7 ({prod_corr_value:.3f})",
-                                                                        combo_desc=c_d,
-                                                                        selection_desc=s_d,
-                                                                        color='YELLOW',
-                                                                        tags=[yellow_tag])
-                                        if alpha_id not in all_yellow_alphas:
-                                            all_yellow_alphas.append(alpha_id)
-                                        print(
-                                            f"   🟡 {alpha_id[:8]}... → YELLOW (生产相关性: {prod_corr_value:.3f}, 状态: {response.status_code})")
-                                    except Exception as e:
-                                        print(f"   ⚠️ 标记YELLOW失败 {alpha_id[:8]}...: {str(e)[:120]}")
-
-                        except requests.exceptions.Timeout:
-                            print(
-                                f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 获取生产相关性请求超时，跳过")
-                        except Exception as e:
-                            print(
-                                f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 获取生产相关性失败: {str(e)[:50]}")
+                        # 生产相关性在循环结束后统一获取（见 fetch_prod_corrs），不阻塞后续 alpha
+                        pc_candidates.append((idx, alpha_id))
                     else:
                         print(
                             f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 自相关性: {self_corr} 不符合条件")
                         try:
                             purple_time = datetime.now().strftime("%Y%m%d_%H%M%S")
                             purple_tag = "SELF_CORR_FAIL"
-                            response = set_alpha_properties(sess,
-                                                            alpha_id,
-                                                            name=f"{purple_time}_{purple_tag}",
-                                                            description="自相关性过高，暂不提交",
-                                                            combo_desc=c_d,
-                                                            selection_desc=s_d,
-                                                            color='PURPLE',
-                                                            tags=[purple_tag])
-                            print(f"   🟣 {alpha_id[:8]}... → PURPLE (状态: {response.status_code})")
+                            queue_alpha_properties(alpha_id,
+                                                   name=f"{purple_time}_{purple_tag}",
+                                                   description="自相关性过高，暂不提交",
+                                                   combo_desc=c_d,
+                                                   selection_desc=s_d,
+                                                   color='PURPLE',
+                                                   tags=[purple_tag])
+                            print(f"   🟣 {alpha_id[:8]}... → PURPLE (已加入更新队列)")
                         except Exception as e:
                             print(f"   ⚠️ 标记PURPLE失败 {alpha_id[:8]}...: {str(e)[:120]}")
                         continue
@@ -1500,17 +1297,15 @@ while True:
                     try:
                         fail_mark_time = datetime.now().strftime("%Y%m%d_%H%M%S")
                         fail_tag = "FAIL_CHECK"
-                        response = set_alpha_properties(
-                            sess,
-                            alpha_id,
-                            name=f"{fail_mark_time}_{fail_tag}",
-                            color='YELLOW',
-                            description="包含 FAIL 检查项，暂时跳过",
-                            selection_desc="包含 FAIL 检查项，未提交",
-                            tags=[fail_tag])
+                        queue_alpha_properties(alpha_id,
+                                               name=f"{fail_mark_time}_{fail_tag}",
+                                               color='YELLOW',
+                                               description="包含 FAIL 检查项，暂时跳过",
+                                               selection_desc="包含 FAIL 检查项，未提交",
+                                               tags=[fail_tag])
                         if alpha_id not in all_yellow_alphas:
                             all_yellow_alphas.append(alpha_id)
-                        print(f"   🟡 {alpha_id[:8]}... → YELLOW (状态: {response.status_code})")
+                        print(f"   🟡 {alpha_id[:8]}... → YELLOW (已加入更新队列)")
                     except Exception as e:
                         print(f"   ⚠️ 标记YELLOW失败 {alpha_id[:8]}...: {str(e)[:120]}")
                     continue  # 包含FAIL，跳过后续处理
@@ -1521,9 +1316,49 @@ while True:
                     f"[{current_time}] [{idx}/{len(alpha_ids)}] ❌ 处理 alpha_id: {alpha_id} 时出错: {type(e).__name__} - {str(e)[:100]}")
                 continue
 
+        # 批量获取生产相关性：所有候选 alpha 共用一个重试调度器
+        prod_corr_results = fetch_prod_corrs(sess, [alpha_id for _, alpha_id in pc_candidates],
+                                             cache=cfg.result_cache) if pc_candidates else {}
+        for idx, alpha_id in pc_candidates:
+            status, prod_corr_value = prod_corr_results.get(alpha_id, ("timeout", None))
+            if status == "error":
+                print(
+                    f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 获取生产相关性失败: {prod_corr_value}")
+            elif status == "timeout":
+                print(
+                    f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性检查超时，直接进入提交检查")
+                alpha_bag.append(alpha_id)
+                prod_corr_dict[alpha_id] = None  # 标记为超时，未获取到生产相关性值
+            elif prod_corr_value is not None:
+                if float(prod_corr_value) < 0.7:
+                    print(
+                        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性: {prod_corr_value} 符合条件")
+                    alpha_bag.append(alpha_id)
+                    prod_corr_dict[alpha_id] = prod_corr_value  # 保存生产相关性值
+                else:
+                    print(
+                        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性: {prod_corr_value} 不符合条件")
+                    # 生产相关性 > 0.7，标记为黄色
+                    try:
+                        yellow_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+                        yellow_tag = "PROD_CORR_HIGH"
+                        queue_alpha_properties(alpha_id,
+                                               name=f"{yellow_time}_{yellow_tag}",
+                                               description=f"生产相关性>0.7 ({prod_corr_value:.3f})",
+                                               combo_desc=c_d,
+                                               selection_desc=s_d,
+                                               color='YELLOW',
+                                               tags=[yellow_tag])
+                        if alpha_id not in all_yellow_alphas:
+                            all_yellow_alphas.append(alpha_id)
+                        print(
+                            f"   🟡 {alpha_id[:8]}... → YELLOW (生产相关性: {prod_corr_value:.3f}, 已加入更新队列)")
+                    except Exception as e:
+                        print(f"   ⚠️ 标记YELLOW失败 {alpha_id[:8]}...: {str(e)[:120]}")
+
         print("添加描述")
         for alpha_id in alpha_bag:
-            set_alpha_properties(sess, alpha_id, description=project_spec)
+            queue_alpha_properties(alpha_id, description=project_spec)
         print("添加描述完成")
 
         print("提交检查")
@@ -1550,32 +1385,25 @@ while True:
         if failed_alphas:
             print(f"🔴 标记 {len(failed_alphas)} 个失败的alpha为RED...")
             current_time_name = datetime.now().strftime("%Y%m%d_%H%M%S")  # 在循环外生成时间戳
-            red_success_count = 0
-            red_fail_count = 0
+            red_queued_count = 0
+            red_error_count = 0
             for alpha in failed_alphas:
                 try:
-                    response = set_alpha_properties(sess, alpha,
-                                                    name=current_time_name,
-                                                    description=project_spec,
-                                                    combo_desc=c_d,
-                                                    color='RED',
-                                                    selection_desc=s_d,
-                                                    tags=['SUBMISSION_FAIL'])  # 标记为提交检查失败
-                    red_success_count += 1
-                    print(f"   🔴 {alpha[:8]}... → RED (状态: {response.status_code})")
+                    queue_alpha_properties(alpha,
+                                           name=current_time_name,
+                                           description=project_spec,
+                                           combo_desc=c_d,
+                                           color='RED',
+                                           selection_desc=s_d,
+                                           tags=['SUBMISSION_FAIL'])  # 标记为提交检查失败
+                    red_queued_count += 1
+                    print(f"   🔴 {alpha[:8]}... → RED (已加入更新队列)")
                 except Exception as e:
-                    red_fail_count += 1
+                    red_error_count += 1
                     error_msg = str(e)
                     print(f"   ❌ 标记RED失败 {alpha[:8]}...: {error_msg[:100]}")
-                    # 如果是401或403，尝试重新登录（使用SessionManager）
-                    if "401" in error_msg or "403" in error_msg:
-                        print(f"   🔄 检测到认证错误，尝试重新登录...")
-                        if cfg.session_manager:
-                            sess = cfg.session_manager.refresh_on_401()
-                        else:
-                            sess = sign_in(cfg.username, cfg.password)
                     continue
-            print(f"   🔴 RED标记完成: 成功 {red_success_count}/{len(failed_alphas)}，失败 {red_fail_count}")
+            print(f"   🔴 RED标记已加入更新队列: {red_queued_count}/{len(failed_alphas)}，出错 {red_error_count}")
 
         # 显示最终选中的alpha列表
         print(f"\n🌟 地区 {region} 最终选中的 Alpha 列表（共 {len(alpha_lis)} 个）:")
@@ -1588,8 +1416,8 @@ while True:
         if yellow_alphas:
             print(f"\n🟡 开始标记YELLOW (包含 False 的 alpha)...")
             yellow_time_name = datetime.now().strftime("%Y%m%d_%H%M%S")
-            yellow_success_count = 0
-            yellow_fail_count = 0
+            yellow_queued_count = 0
+            yellow_error_count = 0
             for alpha in yellow_alphas:
                 try:
                     info = result_info.get(alpha, {})
@@ -1602,38 +1430,32 @@ while True:
                     prod_corr_value = prod_corr_dict.get(alpha, 0.0)
                     alpha_name = f"{yellow_time_name}_{prod_corr_value:.3f}"
 
-                    response = set_alpha_properties(sess, alpha,
-                                                    name=alpha_name,
-                                                    description=project_spec,
-                                                    combo_desc=c_d,
-                                                    selection_desc=s_d,
-                                                    color='YELLOW',
-                                                    tags=[tag_name])
+                    queue_alpha_properties(alpha,
+                                           name=alpha_name,
+                                           description=project_spec,
+                                           combo_desc=c_d,
+                                           selection_desc=s_d,
+                                           color='YELLOW',
+                                           tags=[tag_name])
                     if alpha not in all_yellow_alphas:
                         all_yellow_alphas.append(alpha)
-                    yellow_success_count += 1
-                    if yellow_success_count <= 5:
+                    yellow_queued_count += 1
+                    if yellow_queued_count <= 5:
                         print(
-                            f"   🟡 {alpha[:8]}... → YELLOW | Name: {alpha_name} | Tag: {tag_name} (状态: {response.status_code})")
+                            f"   🟡 {alpha[:8]}... → YELLOW | Name: {alpha_name} | Tag: {tag_name} (已加入更新队列)")
 
                 except Exception as e:
-                    yellow_fail_count += 1
+                    yellow_error_count += 1
                     error_msg = str(e)
                     print(f"   ❌ 标记YELLOW失败 {alpha[:8]}...: {error_msg[:100]}")
-                    if "401" in error_msg or "403" in error_msg:
-                        print(f"   🔄 检测到认证错误，尝试重新登录...")
-                        if cfg.session_manager:
-                            sess = cfg.session_manager.refresh_on_401()
-                        else:
-                            sess = sign_in(cfg.username, cfg.password)
                     continue
-            print(f"   🟡 YELLOW标记完成: 成功 {yellow_success_count}/{len(yellow_alphas)}，失败 {yellow_fail_count}")
+            print(f"   🟡 YELLOW标记已加入更新队列: {yellow_queued_count}/{len(yellow_alphas)}，出错 {yellow_error_count}")
 
         # ✅ 标记为绿色 (通过检查的alpha)
         print(f"\n🟢 开始标记GREEN...")
         current_time_name = datetime.now().strftime("%Y%m%d_%H%M%S")  # 在循环外生成时间戳
-        green_success_count = 0
-        green_fail_count = 0
+        green_queued_count = 0
+        green_error_count = 0
         for alpha in green_alphas:
             try:
                 info = result_info.get(alpha, {})
@@ -1646,30 +1468,24 @@ while True:
                 prod_corr_value = prod_corr_dict.get(alpha, 0.0)
                 alpha_name = f"{current_time_name}_{prod_corr_value:.3f}"
 
-                response = set_alpha_properties(sess, alpha,
-                                                name=alpha_name,
-                                                description=project_spec,
-                                                combo_desc=c_d,
-                                                selection_desc=s_d,
-                                                color='GREEN',  # ✅ 确保是GREEN
-                                                tags=[tag_name])
-                green_success_count += 1
-                if green_success_count <= 5:
+                queue_alpha_properties(alpha,
+                                       name=alpha_name,
+                                       description=project_spec,
+                                       combo_desc=c_d,
+                                       selection_desc=s_d,
+                                       color='GREEN',  # ✅ 确保是GREEN
+                                       tags=[tag_name])
+                green_queued_count += 1
+                if green_queued_count <= 5:
                     print(
-                        f"   ✅ {alpha[:8]}... → GREEN | Name: {alpha_name} | Tag: {tag_name} (状态: {response.status_code})")
+                        f"   ✅ {alpha[:8]}... → GREEN | Name: {alpha_name} | Tag: {tag_name} (已加入更新队列)")
             except Exception as e:
-                green_fail_count += 1
+                green_error_count += 1
                 error_msg = str(e)
                 print(f"   ❌ 标记GREEN失败 {alpha[:8]}...: {error_msg[:100]}")
-                if "401" in error_msg or "403" in error_msg:
-                    print(f"   🔄 检测到认证错误，尝试重新登录...")
-                    if cfg.session_manager:
-                        sess = cfg.session_manager.refresh_on_401()
-                    else:
-                        sess = sign_in(cfg.username, cfg.password)
                 continue
 
-        print(f"   🟢 GREEN标记完成: 成功 {green_success_count}/{len(green_alphas)}，失败 {green_fail_count}")
+        print(f"   🟢 GREEN标记已加入更新队列: {green_queued_count}/{len(green_alphas)}，出错 {green_error_count}")
 
         print(f"\n✅ 地区 {region} 完成: 通过 {len(alpha_lis)} 个，失败 {len(failed_alphas)} 个")
         region_summaries[region] = {
@@ -1692,6 +1508,17 @@ while True:
     print(f"🎉 第 {loop_count} 轮所有地区处理完成！- {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 80)
 
+    # 等待本轮的属性更新全部发出，实际 PATCH 结果以队列统计为准（上面的颜色标记只是入队数）
+    cfg.property_queue.flush()
+    print(f"📮 属性更新累计: 成功 {cfg.property_queue.sent} 个PATCH，失败 {cfg.property_queue.failed} 个")
+
+    cfg.transport.metrics.print_summary()
+
+    # 本轮所有候选的相关邻居一次性落盘
+    report_path = cfg.neighbor_report.flush(cfg.data_path / 'os_alpha_neighbors')
+    if report_path:
+        print(f"📁 相关邻居报告已保存: {report_path}")
+
     # 等待30分钟后开始下一轮（可根据需要调整）
     wait_minutes = 300
     print(f"\n⏰ 等待 {wait_minutes} 分钟后开始下一轮...")
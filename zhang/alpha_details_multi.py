@@ -1,181 +1,256 @@
 import pandas as pd
+import asyncio
 import json
 import time
 import os
 from datetime import datetime
-from machine_lib import login
+from requests.adapters import HTTPAdapter
+from machine_lib import get_os_watermark, login
+from result_cache import get_result_cache
+from auth_manager import AuthManager
+
+# CSV 统一列顺序
+COLUMN_ORDER = [
+    'Alpha_ID', 'Status', 'Color', 'Date_Created', 'Tags',
+    'Region', 'Universe', 'Delay', 'Decay', 'Neutralization', 'Truncation',
+    'Start_Date', 'End_Date',
+    'IS_Sharpe', 'IS_Turnover', 'IS_Fitness', 'IS_Returns',
+    'IS_Drawdown', 'IS_Margin', 'IS_Pnl',
+    'INV_Sharpe', 'INV_Turnover', 'INV_Fitness', 'INV_Returns',
+    'INV_Drawdown', 'INV_Margin', 'INV_Pnl',
+    'Self_Correlation', 'Power_Pool_Correlation', 'Prod_Correlation',
+    'Low_Robust_Sharpe', 'Sub_Universe_Sharpe', 'Two_Year_Sharpe',
+    'Concentrated_Weight', 'Code'
+]
 
 class AlphaDetailFetcher:
     """Alpha详细信息获取器 - 支持批量处理（修复类属性问题）"""
    
     # ========== 关键修复：将brain_api_url定义为类属性 ==========
     brain_api_url = "https://api.worldquantbrain.com"
-    _session = None
-    _session_time = None
-   
+    # 进程内共用的单飞登录管理（见 auth_manager.py）
+    _auth = None
+
+    @classmethod
+    def _login(cls):
+        """登录并校验会话（修复brain_api_url访问）"""
+        session = login()
+        # 新增：校验登录是否成功
+        if session is None:
+            print("❌ 登录失败：返回空会话")
+            raise Exception("INVALID_CREDENTIALS - 登录凭证无效")
+
+        # 验证会话有效性（现在能正确访问类属性cls.brain_api_url）
+        try:
+            test_response = session.get(f"{cls.brain_api_url}/user/me")
+            if test_response.status_code == 401:
+                raise Exception("INVALID_CREDENTIALS - 会话未授权")
+        except Exception as e:
+            print(f"❌ 会话验证失败：{e}")
+            raise
+
+        print("🔄 创建新会话（验证通过）")
+        return session
+
     @classmethod
     def get_session(cls):
-        """获取或创建会话 - 增加登录校验（修复brain_api_url访问）"""
-        if cls._session is None or cls._session_time is None:
-            cls._session = login()
-            # 新增：校验登录是否成功
-            if cls._session is None:
-                print("❌ 登录失败：返回空会话")
-                raise Exception("INVALID_CREDENTIALS - 登录凭证无效")
-            
-            # 验证会话有效性（现在能正确访问类属性cls.brain_api_url）
-            try:
-                test_response = cls._session.get(f"{cls.brain_api_url}/user/me")
-                if test_response.status_code == 401:
-                    raise Exception("INVALID_CREDENTIALS - 会话未授权")
-            except Exception as e:
-                print(f"❌ 会话验证失败：{e}")
-                raise
-            
-            cls._session_time = time.time()
-            print("🔄 创建新会话（验证通过）")
-        else:
-            elapsed = time.time() - cls._session_time
-            if elapsed > 4 * 3600:
-                print("🔄 会话过期，创建新会话")
-                cls._session = login()
-                cls._session_time = time.time()
-            else:
-                print(f"♻️ 复用会话 (已使用 {elapsed/3600:.1f} 小时)")
-       
-        return cls._session
+        """获取会话：4 小时有效期，快过期时提前刷新，多个调用方同时刷新只登录一次"""
+        if cls._auth is None:
+            cls._auth = AuthManager(cls._login, expiry=4 * 3600, name='AlphaDetailFetcher')
+        session = cls._auth.get_session()
+        if session is None:
+            raise Exception("INVALID_CREDENTIALS - 登录失败")
+        return session
    
-    def __init__(self):
-        """初始化获取器（移除实例属性brain_api_url）"""
+    def __init__(self, max_concurrent=8):
+        """
+        初始化获取器（移除实例属性brain_api_url）
+
+        Args:
+            max_concurrent: 全局同时进行的请求数上限（所有 alpha 共用）。
+        """
+        self.max_concurrent = max_concurrent
         self.session = self.get_session()
+        self._tune_pool(self.session)
         # 批量处理的结果存储
         self.batch_results = []
-   
+        # 批量结果边完成边写入的汇总文件
+        self.batch_file = None
+        # 相关性结果缓存（见 result_cache.py），有效期内不再请求
+        self.result_cache = get_result_cache()
+        # OS 池水位：提交新 alpha 后缓存的自相关失效
+        self.os_watermark = get_os_watermark(self.session) if self.result_cache else None
+
+    def _tune_pool(self, session):
+        """连接池大小与并发数一致，避免并发请求时反复建连"""
+        adapter = HTTPAdapter(pool_connections=self.max_concurrent, pool_maxsize=self.max_concurrent)
+        session.mount("https://", adapter)
+
+    async def _request(self, url, **kwargs):
+        """经全局限流器发起 GET（在线程中执行，所有协程共用同一个 requests.Session 连接池）"""
+        async with self._limiter:
+            return await asyncio.to_thread(self.session.get, url, **kwargs)
+
+    async def _relogin(self, generation):
+        """单飞重新登录：同一代会话失效时只登录一次，新 cookie 替换进 self.session（连接池不变）"""
+        await asyncio.to_thread(self._auth.refresh, generation)
+
+    def run(self, coro):
+        """在新的事件循环中执行协程（限流器绑定到该循环）"""
+        async def _main():
+            self._limiter = asyncio.Semaphore(self.max_concurrent)
+            return await coro
+        return asyncio.run(_main())
+
     def get_alpha_details(self, alpha_id):
         """获取单个Alpha详细信息"""
+        return self.run(self.get_alpha_details_async(alpha_id))
+
+    async def get_alpha_details_async(self, alpha_id):
+        """获取单个Alpha详细信息：基础数据与三种相关性同时请求"""
         print(f"\n📡 获取Alpha: {alpha_id}")
-       
+
+        corr_task = asyncio.create_task(self._get_correlation_data_robust(alpha_id))
         # 获取基本数据
-        base_details = self._get_base_alpha_data(alpha_id)
+        base_details = await self._get_base_alpha_data(alpha_id)
         if not base_details:
+            corr_task.cancel()
             print(f"❌ Alpha {alpha_id} 基础数据获取失败，跳过")
             return None
-       
-        # 获取相关性数据 - 使用稳健的方法
-        correlation_data = self._get_correlation_data_robust(alpha_id)
-       
-        # 合并数据
+
+        # 合并相关性数据
+        correlation_data = await corr_task
         if correlation_data:
             base_details.update(correlation_data)
-       
+
         return base_details
-   
-    def _get_base_alpha_data(self, alpha_id):
+
+    async def _get_base_alpha_data(self, alpha_id, max_retries=3):
         """获取基本Alpha数据"""
-        try:
-            # 访问类属性：self.__class__.brain_api_url 或 AlphaDetailFetcher.brain_api_url
-            response = self.session.get(f"{self.__class__.brain_api_url}/alphas/{alpha_id}")
-           
-            if response.status_code == 200:
-                alpha_data = response.json()
-                print("✅ 基础数据获取成功")
-                return self._parse_base_data(alpha_data)
-            elif response.status_code == 404:
-                print(f"❌ Alpha {alpha_id} 不存在")
-                return None
-            elif response.status_code == 429:
-                print(f"⚠️ 基础数据请求触发速率限制 (429)，等待10秒后重试")
-                time.sleep(10)
-                return self._get_base_alpha_data(alpha_id)  # 重试一次
-            else:
-                print(f"⚠️ 基础数据请求失败 ({response.status_code})")
+        for retry in range(max_retries):
+            try:
+                # 访问类属性：self.__class__.brain_api_url 或 AlphaDetailFetcher.brain_api_url
+                generation = self._auth.generation
+                response = await self._request(f"{self.__class__.brain_api_url}/alphas/{alpha_id}", timeout=30)
+
+                if response.status_code == 200:
+                    alpha_data = response.json()
+                    print(f"✅ {alpha_id} 基础数据获取成功")
+                    return self._parse_base_data(alpha_data)
+                elif response.status_code == 404:
+                    print(f"❌ Alpha {alpha_id} 不存在")
+                    return None
+                elif response.status_code == 429:
+                    print(f"⚠️ {alpha_id} 基础数据请求触发速率限制 (429)，等待10秒后重试")
+                    await asyncio.sleep(10)
+                elif response.status_code == 401:
+                    print(f"❌ {alpha_id} 基础数据请求未授权，重新登录")
+                    await self._relogin(generation)
+                else:
+                    print(f"⚠️ {alpha_id} 基础数据请求失败 ({response.status_code})")
+                    return None
+
+            except Exception as e:
+                print(f"❌ {alpha_id} 基础数据请求出错: {str(e)}")
                 return None
-               
-        except Exception as e:
-            print(f"❌ 基础数据请求出错: {str(e)}")
-            return None
-   
-    def _get_correlation_data_robust(self, alpha_id):
-        """稳健获取相关性数据 - 延长内部延迟"""
-        correlation_data = {}
-       
-        # 逐个获取相关性数据，延长延迟至1秒避免请求过快
-        correlation_data['Self_Correlation'] = self._get_correlation_with_retry(alpha_id, "self")
-        time.sleep(1)  # 延长延迟
-       
-        correlation_data['Power_Pool_Correlation'] = self._get_correlation_with_retry(alpha_id, "power-pool")
-        time.sleep(1)  # 延长延迟
-       
-        correlation_data['Prod_Correlation'] = self._get_correlation_with_retry(alpha_id, "prod")
-       
-        return correlation_data
-   
-    def _get_correlation_with_retry(self, alpha_id, corr_type):
-        """带重试的获取相关性值 - 增强429处理"""
+        return None
+
+    async def _get_correlation_data_robust(self, alpha_id):
+        """稳健获取相关性数据 - 三种相关性同时请求，由全局限流器控制总并发"""
+        self_corr, power_pool_corr, prod_corr = await asyncio.gather(
+            self._get_correlation_with_retry(alpha_id, "self"),
+            self._get_correlation_with_retry(alpha_id, "power-pool"),
+            self._get_correlation_with_retry(alpha_id, "prod"),
+        )
+        return {
+            'Self_Correlation': self_corr,
+            'Power_Pool_Correlation': power_pool_corr,
+            'Prod_Correlation': prod_corr,
+        }
+
+    async def _get_correlation_with_retry(self, alpha_id, corr_type, max_poll_time=300):
+        """带重试的获取相关性值 - 增强429处理；服务器仍在计算时按 Retry-After 轮询（不计入重试次数）"""
         # 访问类属性
         url = f"{self.__class__.brain_api_url}/alphas/{alpha_id}/correlations/{corr_type}"
-       
-        for retry in range(3):
+        label = f"{alpha_id} {corr_type.upper()}"
+
+        # 只有自相关随 OS 池变化：按水位失效，获取不到水位时不使用缓存
+        watermark = self.os_watermark if corr_type == 'self' else None
+        use_cache = self.result_cache is not None and (corr_type != 'self' or watermark is not None)
+        cached = self.result_cache.get(alpha_id, corr_type, watermark) if use_cache else None
+        if cached is not None:
+            print(f"♻️  {label}: {cached} (缓存)")
+            return cached
+
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Accept': 'application/json',
+            'Accept-Language': 'en-US,en;q=0.9',
+        }
+        poll_deadline = time.time() + max_poll_time
+        retry = 0
+        while retry < 3:
             try:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                    'Accept': 'application/json',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                }
-               
-                response = self.session.get(url, headers=headers, timeout=30)
-               
-                print(f"🔍 {corr_type.upper()} API状态: {response.status_code}")
-               
+                generation = self._auth.generation
+                response = await self._request(url, headers=headers, timeout=30)
+
+                retry_after = response.headers.get('Retry-After')
+                if response.status_code == 200 and retry_after and time.time() < poll_deadline:
+                    # 相关性仍在计算中
+                    await asyncio.sleep(float(retry_after))
+                    continue
+
                 if response.status_code == 200:
                     content = response.text.strip()
-                   
+
                     if not content or content == "null":
-                        print(f"⚠️  {corr_type.upper()}: 空响应")
-                        time.sleep(3)
+                        print(f"⚠️  {label}: 空响应")
+                        retry += 1
+                        await asyncio.sleep(3)
                         continue
-                   
+
                     value = self._extract_correlation_value(content, corr_type)
                     if value is not None:
-                        print(f"✅  {corr_type.upper()}: {value}")
+                        print(f"✅  {label}: {value}")
+                        if use_cache:
+                            self.result_cache.set(alpha_id, corr_type, value, watermark)
                         return value
                     else:
-                        print(f"⚠️  {corr_type.upper()}: 无法提取值, 内容: {content[:100]}")
-               
+                        print(f"⚠️  {label}: 无法提取值, 内容: {content[:100]}")
+
                 elif response.status_code == 404:
-                    print(f"⚠️  {corr_type.upper()} API不存在 (404)")
+                    print(f"⚠️  {label} API不存在 (404)")
                     break
-               
+
                 elif response.status_code == 429:
                     # 指数退避等待
-                    retry_after = response.headers.get('Retry-After', 5 * (retry + 1))
-                    wait_time = int(retry_after) + 10
-                    print(f"⏳  {corr_type.upper()} 速率限制，等待 {wait_time} 秒 (重试 {retry+1}/3)")
-                    time.sleep(wait_time)
+                    wait_time = int(float(retry_after or 5 * (retry + 1))) + 10
+                    print(f"⏳  {label} 速率限制，等待 {wait_time} 秒 (重试 {retry+1}/3)")
+                    retry += 1
+                    await asyncio.sleep(wait_time)
                     continue
-               
+
                 elif response.status_code == 401:
-                    print(f"❌  {corr_type.upper()} 未授权，重新登录")
-                    self.__class__._session = None
-                    self.__class__._session_time = None
-                    self.session = self.get_session()
-                    time.sleep(5)
+                    print(f"❌  {label} 未授权，重新登录")
+                    await self._relogin(generation)
+                    retry += 1
                     continue
-               
+
                 else:
-                    print(f"⚠️  {corr_type.upper()} 请求失败 ({response.status_code})")
-               
+                    print(f"⚠️  {label} 请求失败 ({response.status_code})")
+
                 # 指数退避等待
                 wait_time = 2 **(retry + 1)
-                print(f"⏳  重试前等待 {wait_time} 秒 (重试 {retry+1}/3)")
-                time.sleep(wait_time)
-               
+                print(f"⏳  {label} 重试前等待 {wait_time} 秒 (重试 {retry+1}/3)")
+                retry += 1
+                await asyncio.sleep(wait_time)
+
             except Exception as e:
-                print(f"❌  {corr_type.upper()} 请求出错: {str(e)}")
-                wait_time = 3 * (retry + 1)
-                time.sleep(wait_time)
-       
-        print(f"❌  获取{corr_type.upper()}失败")
+                print(f"❌  {label} 请求出错: {str(e)}")
+                retry += 1
+                await asyncio.sleep(3 * retry)
+
+        print(f"❌  获取{label}失败")
         return 'N/A'
    
     def _extract_correlation_value(self, content, corr_type):
@@ -447,20 +522,7 @@ class AlphaDetailFetcher:
         try:
             df = pd.DataFrame([details])
            
-            column_order = [
-                'Alpha_ID', 'Status', 'Color', 'Date_Created', 'Tags',
-                'Region', 'Universe', 'Delay', 'Decay', 'Neutralization', 'Truncation',
-                'Start_Date', 'End_Date',
-                'IS_Sharpe', 'IS_Turnover', 'IS_Fitness', 'IS_Returns',
-                'IS_Drawdown', 'IS_Margin', 'IS_Pnl',
-                'INV_Sharpe', 'INV_Turnover', 'INV_Fitness', 'INV_Returns',
-                'INV_Drawdown', 'INV_Margin', 'INV_Pnl',
-                'Self_Correlation', 'Power_Pool_Correlation', 'Prod_Correlation',
-                'Low_Robust_Sharpe', 'Sub_Universe_Sharpe', 'Two_Year_Sharpe',
-                'Concentrated_Weight', 'Code'
-            ]
-           
-            existing_cols = [col for col in column_order if col in df.columns]
+            existing_cols = [col for col in COLUMN_ORDER if col in df.columns]
             df = df[existing_cols]
            
             df.to_csv(filepath, index=False, encoding='utf-8-sig')
@@ -472,16 +534,33 @@ class AlphaDetailFetcher:
             print(f"❌ 保存CSV失败: {str(e)}")
             return None
     
+    def _batch_filepath(self):
+        if self.batch_file is None:
+            os.makedirs("alpha_details", exist_ok=True)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self.batch_file = os.path.join("alpha_details", f"alpha_batch_results_{timestamp}.csv")
+        return self.batch_file
+
+    def append_batch_result(self, details):
+        """单个Alpha完成后立即追加到批量汇总文件（中途中断也不丢已完成的结果）"""
+        if not details:
+            return
+        filepath = self._batch_filepath()
+        try:
+            df = pd.DataFrame([details]).reindex(columns=COLUMN_ORDER)
+            write_header = not os.path.exists(filepath)
+            df.to_csv(filepath, mode='a', header=write_header, index=False,
+                      encoding='utf-8-sig' if write_header else 'utf-8')
+        except Exception as e:
+            print(f"❌ 追加批量CSV失败: {str(e)}")
+
     def save_batch_results(self):
-        """保存批量处理的所有Alpha数据到一个CSV文件"""
+        """保存批量处理的所有Alpha数据到一个CSV文件（覆盖流式写入的汇总文件，按输入顺序）"""
         if not self.batch_results:
             print("❌ 无批量数据可保存")
             return None
         
-        os.makedirs("alpha_details", exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"alpha_batch_results_{timestamp}.csv"
-        filepath = os.path.join("alpha_details", filename)
+        filepath = self._batch_filepath()
         
         try:
             # 过滤掉None的结果
@@ -493,20 +572,7 @@ class AlphaDetailFetcher:
             df = pd.DataFrame(valid_results)
             
             # 统一列顺序
-            column_order = [
-                'Alpha_ID', 'Status', 'Color', 'Date_Created', 'Tags',
-                'Region', 'Universe', 'Delay', 'Decay', 'Neutralization', 'Truncation',
-                'Start_Date', 'End_Date',
-                'IS_Sharpe', 'IS_Turnover', 'IS_Fitness', 'IS_Returns',
-                'IS_Drawdown', 'IS_Margin', 'IS_Pnl',
-                'INV_Sharpe', 'INV_Turnover', 'INV_Fitness', 'INV_Returns',
-                'INV_Drawdown', 'INV_Margin', 'INV_Pnl',
-                'Self_Correlation', 'Power_Pool_Correlation', 'Prod_Correlation',
-                'Low_Robust_Sharpe', 'Sub_Universe_Sharpe', 'Two_Year_Sharpe',
-                'Concentrated_Weight', 'Code'
-            ]
-            
-            existing_cols = [col for col in column_order if col in df.columns]
+            existing_cols = [col for col in COLUMN_ORDER if col in df.columns]
             df = df[existing_cols]
             
             df.to_csv(filepath, index=False, encoding='utf-8-sig')
@@ -539,39 +605,51 @@ def fetch_alpha_details(alpha_id, fetcher=None):
     return details
 
 
-def fetch_batch_alpha_details(alpha_ids, batch_delay=5):
-    """批量获取多个Alpha详情"""
+def fetch_batch_alpha_details(alpha_ids, max_concurrent=8, max_alphas_in_flight=16):
+    """
+    批量获取多个Alpha详情
+
+    多个 alpha 同时处理，所有请求共用一个全局限流器（max_concurrent）；
+    每个 alpha 完成后立即显示并追加到批量汇总文件。
+    """
     print("=" * 70)
     print("🧠 Brain平台Alpha批量详情查询工具")
     print("=" * 70)
     print(f"🎯 待处理Alpha数量: {len(alpha_ids)}")
-    print(f"⏱️  Alpha之间延迟: {batch_delay} 秒")
+    print(f"⚡ 全局并发请求数: {max_concurrent}，同时处理Alpha数: {max_alphas_in_flight}")
     print("=" * 70)
     
     # 创建单个fetcher实例（复用会话）
-    fetcher = AlphaDetailFetcher()
-    success_count = 0
-    fail_count = 0
-    
-    for idx, alpha_id in enumerate(alpha_ids, 1):
-        print(f"\n{'='*20} 处理第 {idx}/{len(alpha_ids)} 个Alpha {'='*20}")
-        try:
-            details = fetch_alpha_details(alpha_id, fetcher)
-            if details:
-                success_count += 1
-            else:
-                fail_count += 1
-        except Exception as e:
-            print(f"❌ 处理Alpha {alpha_id} 时发生异常: {str(e)}")
-            fail_count += 1
-            fetcher.batch_results.append(None)
-        
-        # 最后一个Alpha不添加延迟
-        if idx < len(alpha_ids):
-            print(f"\n⏳ 等待 {batch_delay} 秒后处理下一个Alpha...")
-            time.sleep(batch_delay)
+    fetcher = AlphaDetailFetcher(max_concurrent=max_concurrent)
+    results = [None] * len(alpha_ids)
+    finished = 0
+
+    async def _fetch_one(idx, alpha_id, in_flight):
+        nonlocal finished
+        async with in_flight:
+            try:
+                details = await fetcher.get_alpha_details_async(alpha_id)
+            except Exception as e:
+                print(f"❌ 处理Alpha {alpha_id} 时发生异常: {str(e)}")
+                details = None
+        finished += 1
+        print(f"\n{'='*20} 完成 {finished}/{len(alpha_ids)}: {alpha_id} {'='*20}")
+        if details:
+            fetcher.display_results(details)
+            fetcher.save_to_csv(details, is_batch=True)
+            fetcher.append_batch_result(details)
+        results[idx] = details
+
+    async def _fetch_all():
+        in_flight = asyncio.Semaphore(max_alphas_in_flight)
+        await asyncio.gather(*(_fetch_one(idx, alpha_id, in_flight) for idx, alpha_id in enumerate(alpha_ids)))
+
+    fetcher.run(_fetch_all())
+    fetcher.batch_results = results
+    success_count = sum(1 for res in results if res)
+    fail_count = len(results) - success_count
     
-    # 保存批量汇总文件
+    # 保存批量汇总文件（按输入顺序重写）
     batch_file = fetcher.save_batch_results()
     
     # 输出批量处理统计
@@ -602,12 +680,12 @@ def main():
         "e78Lv9zz",
         "O0wog72R"
     ]
-    # 批量处理时每个Alpha之间的延迟（秒），建议5-10秒
-    BATCH_DELAY = 5
+    # 全局同时进行的请求数（所有Alpha共用），过大容易触发429
+    MAX_CONCURRENT = 8
     # ============================================
     
     # 批量模式
-    batch_results = fetch_batch_alpha_details(ALPHA_IDS, BATCH_DELAY)
+    batch_results = fetch_batch_alpha_details(ALPHA_IDS, MAX_CONCURRENT)
     
     return batch_results
 
@@ -0,0 +1,210 @@
+"""
+单飞（single-flight）登录管理
+
+原来各个工具各有一套会话管理（machine_lib_new / 1check_regluar / robust_sharpe_optimizer 的
+SessionManager、optimize_climbing 的 BrainClient._sign_in、alpha_details_multi 的 get_session），
+3 小时过期或遇到 401 时，每个线程/协程各自重新登录，同时打到 /authentication；
+machine_lib_new 的 refresh_session 还会先 close 掉正在被其它请求使用的会话。
+
+这里统一为：
+    - 同一时刻只有一个登录在进行，其余调用方等待它的结果（不再各自登录）；
+    - 每次登录成功 generation 加一。调用方在发请求前记下 generation，遇到 401 时带上它调用 refresh，
+      如果期间已经有人重新登录过，直接返回，不会再登录一次；不带 generation 的调用方
+      在上次登录后 min_interval 秒内也不会再登录（处理同一批 401 中稍晚到达的请求）；
+    - 距过期不到 refresh_margin 时提前刷新：由一个调用方去登录，其余调用方继续用旧会话（此时仍有效）；
+    - 登录得到的 cookie 原子替换进原有会话对象，会话对象本身不变也不关闭，进行中的请求不受影响。
+
+AuthManager 用于 requests.Session（线程），AsyncAuthManager 用于 aiohttp.ClientSession（协程）。
+"""
+import asyncio
+import threading
+import time
+
+BRAIN_API_URL = 'https://api.worldquantbrain.com'
+
+
+class AuthManager:
+    """requests.Session 的单飞登录管理（线程安全）"""
+
+    def __init__(self, login_fn, expiry: float = 3 * 3600, refresh_margin: float = 15 * 60,
+                 min_interval: float = 10.0, name: str = 'Auth'):
+        """
+        Args:
+            login_fn: 无参函数，登录并返回新的 requests.Session，失败返回 None 或抛异常。
+            expiry: 会话有效期（秒）。
+            refresh_margin: 提前多少秒开始刷新。
+            min_interval: 不带 generation 的 refresh 在上次登录后多少秒内直接返回当前会话。
+            name: 日志前缀。
+        """
+        self.login_fn = login_fn
+        self.expiry = expiry
+        self.refresh_margin = refresh_margin
+        self.min_interval = min_interval
+        self.name = name
+        self.generation = 0
+        self.login_time = None
+        self.login_count = 0
+        self._session = None
+        self._refreshing = False
+        self._cond = threading.Condition()
+
+    @property
+    def session(self):
+        return self.get_session()
+
+    def expiring(self) -> bool:
+        return self.login_time is not None and time.time() - self.login_time > self.expiry - self.refresh_margin
+
+    def expired(self) -> bool:
+        return self.login_time is not None and time.time() - self.login_time > self.expiry
+
+    def _just_refreshed(self) -> bool:
+        return self.login_time is not None and time.time() - self.login_time < self.min_interval
+
+    def get_session(self, force_refresh: bool = False):
+        """返回当前会话；不存在、已过期或 force_refresh 时等待登录，快过期时提前刷新"""
+        if force_refresh or self._session is None or self.expired():
+            return self.refresh(self.generation)
+        if self.expiring():
+            # 会话仍有效：只由一个调用方去刷新，其余调用方不等待
+            self.refresh(self.generation, wait=False)
+        return self._session
+
+    def refresh(self, generation: int | None = None, wait: bool = True):
+        """
+        重新登录。
+
+        Args:
+            generation: 调用方看到失效时的 generation；已有更新的登录则直接返回当前会话。
+                None 表示不比较 generation，仅在 min_interval 内刚登录过时跳过。
+            wait: 已有其它调用方在登录时是否等待其完成；False 则直接返回当前会话。
+        Returns:
+            当前会话（登录失败时为旧会话，可能为 None）。
+        """
+        with self._cond:
+            if generation is not None and generation != self.generation:
+                return self._session
+            if generation is None and self._session is not None and self._just_refreshed():
+                return self._session
+            if self._refreshing:
+                if wait:
+                    self._cond.wait_for(lambda: not self._refreshing)
+                return self._session
+            self._refreshing = True
+
+        new_session = None
+        try:
+            new_session = self.login_fn()
+        except Exception as e:
+            print(f"   ❌ [{self.name}] 登录异常: {e}")
+        finally:
+            with self._cond:
+                if new_session is not None:
+                    self._swap(new_session)
+                    print(f"   🔐 [{self.name}] 登录成功 (总登录次数: {self.login_count})")
+                else:
+                    print(f"   ❌ [{self.name}] 登录失败")
+                self._refreshing = False
+                self._cond.notify_all()
+        return self._session
+
+    def update_session(self, new_session) -> None:
+        """外部已经登录得到的会话"""
+        if new_session is not None:
+            with self._cond:
+                self._swap(new_session)
+
+    def _swap(self, new_session) -> None:
+        if self._session is None:
+            self._session = new_session
+        elif new_session is not self._session:
+            # 整体替换 cookie jar（单次赋值），进行中的请求继续使用旧 jar
+            self._session.cookies = new_session.cookies
+            self._session.auth = new_session.auth
+            new_session.close()
+        self.generation += 1
+        self.login_time = time.time()
+        self.login_count += 1
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+
+
+class AsyncAuthManager:
+    """aiohttp.ClientSession 的单飞登录管理（同一事件循环内的协程共用）"""
+
+    def __init__(self, login_coro, expiry: float = 3 * 3600, refresh_margin: float = 15 * 60,
+                 min_interval: float = 10.0, name: str = 'Auth'):
+        """
+        Args:
+            login_coro: 无参协程函数，登录并返回新的 aiohttp.ClientSession，失败抛异常。
+            其余参数同 AuthManager。
+        """
+        self.login_coro = login_coro
+        self.expiry = expiry
+        self.refresh_margin = refresh_margin
+        self.min_interval = min_interval
+        self.name = name
+        self.generation = 0
+        self.login_time = None
+        self.login_count = 0
+        self.session = None
+        self._lock = asyncio.Lock()
+        self._refresh_task = None
+
+    def expiring(self) -> bool:
+        return self.login_time is not None and time.time() - self.login_time > self.expiry - self.refresh_margin
+
+    def expired(self) -> bool:
+        return self.login_time is not None and time.time() - self.login_time > self.expiry
+
+    def _just_refreshed(self) -> bool:
+        return self.login_time is not None and time.time() - self.login_time < self.min_interval
+
+    async def get_session(self, force_refresh: bool = False):
+        """返回当前会话；不存在、已过期或 force_refresh 时等待登录，快过期时在后台提前刷新"""
+        if force_refresh or self.session is None or self.expired():
+            return await self.refresh(self.generation)
+        if self.expiring() and not self._lock.locked() and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self.refresh(self.generation))
+            self._refresh_task.add_done_callback(self._clear_refresh_task)
+        return self.session
+
+    def _clear_refresh_task(self, task) -> None:
+        self._refresh_task = None
+
+    async def refresh(self, generation: int | None = None):
+        """重新登录，参数含义同 AuthManager.refresh（总是等待正在进行的登录）"""
+        async with self._lock:
+            if generation is not None and generation != self.generation:
+                return self.session
+            if generation is None and self.session is not None and self._just_refreshed():
+                return self.session
+            try:
+                new_session = await self.login_coro()
+            except Exception as e:
+                print(f"   ❌ [{self.name}] 登录异常: {e}")
+                return self.session
+            await self._swap(new_session)
+            print(f"   🔐 [{self.name}] 登录成功 (总登录次数: {self.login_count})")
+            return self.session
+
+    async def _swap(self, new_session) -> None:
+        if self.session is None:
+            self.session = new_session
+        elif new_session is not self.session:
+            from yarl import URL  # aiohttp 的依赖
+            url = URL(BRAIN_API_URL)
+            # 新 cookie 一次性写入原会话的 jar，原会话不关闭
+            self.session.cookie_jar.update_cookies(new_session.cookie_jar.filter_cookies(url), response_url=url)
+            await new_session.close()
+        self.generation += 1
+        self.login_time = time.time()
+        self.login_count += 1
+
+    async def close(self) -> None:
+        if self._refresh_task is not None:
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+        if self.session is not None:
+            await self.session.close()
@@ -0,0 +1,448 @@
+"""
+BRAIN API 统一请求层
+
+各脚本各自实现 login() / wait_get / 重试循环 / Retry-After 处理，超时、连接池大小、退避策略都不一样，
+wait_get 遇到 401 也不会重新登录。这里统一为：
+    - new_session / sign_in：带连接池（keep-alive、连接数上限）和 gzip 的 requests.Session；
+    - RateLimiter：令牌桶限流器，线程和协程共用，可替换为任何带 acquire() 的对象；
+    - EndpointMetrics：按接口（路径中的 id 归一为 {id}）统计请求数、状态码、429/401、重试、耗时；
+    - BrainTransport：在同一个连接池上提供同步（request / wait_get）和异步（request_async / wait_get_async）
+      两套接口，统一处理：
+        * 429：按 Retry-After（没有则指数退避）等待后重试；
+        * 401：经 auth_manager.AuthManager 单飞重新登录后重试；
+        * 5xx / 网络异常：指数退避重试；
+        * wait_get：200 + Retry-After 表示仍在计算，按 Retry-After 轮询直到出结果。
+
+异步接口在线程中执行同步请求（asyncio.to_thread），与同步接口共用连接池、限流器和统计。
+"""
+import asyncio
+import re
+import threading
+import time
+import weakref
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from auth_manager import AuthManager
+from listing_planner import format_time, parse_time, plan_time_slices
+
+BRAIN_API_URL = 'https://api.worldquantbrain.com'
+DEFAULT_POOL_SIZE = 16
+DEFAULT_TIMEOUT = (10, 60)  # (连接, 读取)
+
+
+def new_session(pool_size: int = DEFAULT_POOL_SIZE, auth=None) -> requests.Session:
+    """带连接池和 gzip 的 Session；pool_block=True 使并发超过 pool_size 时排队而不是新建连接"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+    if auth is not None:
+        session.auth = auth
+    return session
+
+
+def sign_in(username, password, pool_size: int = DEFAULT_POOL_SIZE, max_attempts: int = 3):
+    """
+    登录并返回带连接池的 Session，失败返回 None。
+
+    429 按 Retry-After 等待，其余失败指数退避，最多 max_attempts 次。
+    """
+    session = new_session(pool_size, auth=(username, password))
+    for attempt in range(max_attempts):
+        try:
+            response = session.post(f'{BRAIN_API_URL}/authentication', timeout=DEFAULT_TIMEOUT)
+            if response.status_code < 400:
+                return session
+            print(f"   ⚠️ 登录返回状态码: {response.status_code}, 内容: {response.text[:100]}")
+            wait = float(response.headers.get('Retry-After', 0)) or 2 ** attempt * 5
+        except requests.exceptions.RequestException as e:
+            print(f"   ❌ 登录网络异常: {e}")
+            wait = 2 ** attempt * 5
+        if attempt + 1 < max_attempts:
+            time.sleep(wait)
+    session.close()
+    return None
+
+
+class RateLimiter:
+    """令牌桶：平均每秒 rate 个请求，允许 burst 个突发（线程安全）"""
+
+    def __init__(self, rate: float = 8.0, burst: int = 16):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """占用一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+# 进程内共用的默认限流器（transport_for 与并发翻页默认使用）
+GLOBAL_RATE_LIMITER = RateLimiter(rate=5.0, burst=10)
+
+
+_ID_SEGMENT = re.compile(r'^(?=.*[0-9A-Z])[A-Za-z0-9_-]{4,}$')
+
+
+def endpoint_of(method: str, url: str) -> str:
+    """'GET /alphas/{id}/check'：路径中的 id 段归一为 {id}，去掉查询参数"""
+    path = urlsplit(url).path
+    segments = ['{id}' if _ID_SEGMENT.match(seg) else seg for seg in path.split('/')]
+    return f"{method.upper()} {'/'.join(segments) or '/'}"
+
+
+class EndpointMetrics:
+    """按接口统计请求（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'requests': 0, 'errors': 0, 'retries': 0, 'rate_limited': 0,
+                                           'unauthorized': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                           'status': defaultdict(int)})
+
+    def record(self, endpoint: str, status=None, elapsed: float = 0.0, retry: bool = False) -> None:
+        with self._lock:
+            stats = self._stats[endpoint]
+            stats['requests'] += 1
+            stats['seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+            stats['retries'] += int(retry)
+            if status is None:
+                stats['errors'] += 1
+            else:
+                stats['status'][status] += 1
+                stats['rate_limited'] += int(status == 429)
+                stats['unauthorized'] += int(status == 401)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {endpoint: {**stats, 'status': dict(stats['status'])} for endpoint, stats in self._stats.items()}
+
+    def print_summary(self) -> None:
+        snapshot = self.snapshot()
+        if not snapshot:
+            return
+        print("   📶 接口统计:")
+        for endpoint, stats in sorted(snapshot.items(), key=lambda kv: -kv[1]['requests']):
+            avg = stats['seconds'] / stats['requests']
+            print(f"      {endpoint}: {stats['requests']} 次, 平均 {avg:.2f}s, 最长 {stats['max_seconds']:.2f}s, "
+                  f"重试 {stats['retries']}, 429 {stats['rate_limited']}, 401 {stats['unauthorized']}, "
+                  f"异常 {stats['errors']}, 状态码 {stats['status']}")
+
+
+class BrainTransport:
+    """同步 / 异步共用连接池的 BRAIN API 客户端"""
+
+    def __init__(self, session=None, auth: AuthManager | None = None, username=None, password=None,
+                 pool_size: int = DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, max_retries: int = 5,
+                 backoff: float = 2.0, max_backoff: float = 120.0, rate_limiter=None,
+                 metrics: EndpointMetrics | None = None):
+        """
+        Args:
+            session: 已登录的 Session；401 时无法重新登录（除非同时给出 auth 或用户名密码）。
+            auth: AuthManager，优先使用。
+            username, password: 没有 auth 时用于登录。
+            pool_size: 新建 Session 的连接池大小。
+            timeout: 默认超时（秒，或 (连接, 读取)）。
+            max_retries: 429 / 401 / 5xx / 网络异常的重试次数。
+            backoff, max_backoff: 指数退避的基数和上限（秒）。
+            rate_limiter: 带 acquire()（异步接口另需 acquire_async()）的限流器，None 表示不限流。
+            metrics: 共用的统计对象，None 则新建。
+        """
+        if auth is None:
+            if username is not None:
+                auth = AuthManager(lambda: sign_in(username, password, pool_size), name='BrainTransport')
+            else:
+                # 只有外部给的 session：不会过期刷新，401 时也无法重新登录
+                auth = AuthManager(lambda: None, expiry=float('inf'), name='BrainTransport')
+            if session is not None:
+                auth.update_session(session)
+        self.auth = auth
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics or EndpointMetrics()
+
+    @property
+    def session(self):
+        return self.auth.get_session()
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.backoff * 2 ** attempt, self.max_backoff)
+
+    def _send(self, method, url, **kwargs):
+        """发送一次请求，返回 (response 或 None, 发送时的 generation, 异常, 耗时)"""
+        kwargs.setdefault('timeout', self.timeout)
+        generation = self.auth.generation
+        start = time.time()
+        try:
+            response = self.session.request(method.upper(), url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            return None, generation, e, time.time() - start
+        return response, generation, None, time.time() - start
+
+    def _retry_wait(self, response, generation, error, attempt):
+        """
+        判断一次请求的结果是否需要重试，返回等待秒数；None 表示直接返回该结果。
+        401 在这里重新登录。
+        """
+        if error is not None:
+            print(f"   ⚠️ 请求异常 (第 {attempt + 1} 次): {str(error)[:100]}")
+            return self._backoff(attempt)
+        if response.status_code == 429:
+            return float(response.headers.get('Retry-After', 0)) or self._backoff(attempt)
+        if response.status_code == 401:
+            self.auth.refresh(generation)
+            return 0.0
+        if response.status_code >= 500:
+            return self._backoff(attempt)
+        return None
+
+    def request(self, method: str, url: str, max_retries: int | None = None, **kwargs):
+        """
+        发送请求，统一处理 429 / 401 / 5xx / 网络异常。
+
+        Args:
+            url: 完整 URL 或以 / 开头的路径。
+        Returns:
+            最后一次的 Response；重试用尽且最后一次为网络异常时返回 None。
+        """
+        return self._request(method, url, max_retries, False, kwargs)
+
+    def _request(self, method, url, max_retries, acquired, kwargs):
+        """acquired 表示第一次请求的令牌已由调用方（异步接口）取得"""
+        if url.startswith('/'):
+            url = BRAIN_API_URL + url
+        endpoint = endpoint_of(method, url)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        response = None
+        for attempt in range(max_retries + 1):
+            if self.rate_limiter is not None and not (acquired and attempt == 0):
+                self.rate_limiter.acquire()
+            response, generation, error, elapsed = self._send(method, url, **kwargs)
+            self.metrics.record(endpoint, None if response is None else response.status_code, elapsed, attempt > 0)
+            wait = self._retry_wait(response, generation, error, attempt)
+            if wait is None or attempt == max_retries:
+                break
+            time.sleep(wait)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('get', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('post', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('patch', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('delete', url, **kwargs)
+
+    def wait_get(self, url: str, max_retries: int = 10, max_wait: float | None = None, **kwargs):
+        """
+        GET 并按 Retry-After 轮询直到结果就绪（模拟进度、/check、相关性、recordsets 等）。
+
+        Args:
+            max_retries: 返回 >=400 时的重试次数（与原 wait_get 一致）。
+            max_wait: 轮询的总时长上限（秒），None 表示不限；超时返回最后一次的 Response。
+        """
+        deadline = None if max_wait is None else time.time() + max_wait
+        response = None
+        for retries in range(max_retries):
+            while True:
+                response = self.get(url, **kwargs)
+                retry_after = 0 if response is None else float(response.headers.get('Retry-After', 0))
+                if retry_after == 0 or (deadline is not None and time.time() + retry_after > deadline):
+                    break
+                time.sleep(retry_after)
+            if response is not None and (response.status_code < 400 or response.headers.get('Retry-After')):
+                break
+            time.sleep(min(2 ** retries, self.max_backoff))
+        return response
+
+    async def request_async(self, method: str, url: str, max_retries: int | None = None, **kwargs):
+        """异步版 request：首个令牌在事件循环中等待，请求在线程中执行（共用连接池和统计）"""
+        acquired = False
+        if self.rate_limiter is not None and hasattr(self.rate_limiter, 'acquire_async'):
+            await self.rate_limiter.acquire_async()
+            acquired = True
+        return await asyncio.to_thread(self._request, method, url, max_retries, acquired, kwargs)
+
+    async def wait_get_async(self, url: str, max_retries: int = 10, max_wait: float | None = None, **kwargs):
+        """异步版 wait_get：Retry-After 轮询的等待不占用线程"""
+        deadline = None if max_wait is None else time.time() + max_wait
+        response = None
+        for retries in range(max_retries):
+            while True:
+                response = await self.request_async('get', url, **kwargs)
+                retry_after = 0 if response is None else float(response.headers.get('Retry-After', 0))
+                if retry_after == 0 or (deadline is not None and time.time() + retry_after > deadline):
+                    break
+                await asyncio.sleep(retry_after)
+            if response is not None and (response.status_code < 400 or response.headers.get('Retry-After')):
+                break
+            await asyncio.sleep(min(2 ** retries, self.max_backoff))
+        return response
+
+
+_TRANSPORTS = weakref.WeakKeyDictionary()
+_TRANSPORTS_LOCK = threading.Lock()
+
+
+def transport_for(session, login=None, **kwargs) -> BrainTransport:
+    """
+    为已有的 Session 取得（或创建）对应的 BrainTransport，同一个 Session 共用一个实例（统计累积在一起）。
+    供原来以 session 为参数的 wait_get 等函数使用。
+
+    Args:
+        login: 调用方原有的登录函数（无参，返回新 Session）。给出时 401 / 会话过期会经 AuthManager
+            重新登录，新 cookie 替换进 session；不给则 session 过期后无法恢复。
+    """
+    with _TRANSPORTS_LOCK:
+        transport = _TRANSPORTS.get(session)
+        if transport is None:
+            kwargs.setdefault('rate_limiter', GLOBAL_RATE_LIMITER)
+            if login is not None and 'auth' not in kwargs:
+                auth = AuthManager(login, name='BrainTransport')
+                auth.update_session(session)
+                kwargs['auth'] = auth
+            transport = _TRANSPORTS[session] = BrainTransport(session=session, **kwargs)
+        return transport
+
+
+def _map_window(executor, fn, items, window: int):
+    """
+    有界的 executor.map：最多 window 个任务在途，按 items 顺序产出结果。
+
+    executor.map 会一次提交全部任务，先完成的后续页只能堆在内存里等前面的慢页；
+    这里队首完成才补交下一个，积压的结果不超过 window 页。生成器提前关闭时取消未开始的任务。
+    """
+    pending = deque()
+    try:
+        for item in items:
+            if len(pending) >= window:
+                yield pending.popleft().result()
+            pending.append(executor.submit(fn, item))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def iter_pages(transport: BrainTransport, url_for_offset, page_size: int = 100, max_offset: int = 9900,
+               max_workers: int = 8):
+    """
+    并发翻页的 listing（/users/self/alphas 等带 count 的接口）。
+
+    第一页拿到 count 后，其余 offset 以滑动窗口并发请求（最多 max_workers * 2 页在途，经 transport 的限流器），
+    按 offset 顺序逐页产出，调用方边收边处理，不必把所有页攒在内存里。
+    某一页重试用尽仍失败时打印警告并跳过该页。
+
+    Args:
+        url_for_offset: offset -> URL。
+        max_offset: 接口允许的最大 offset（不含）。
+    Yields:
+        (offset, results, count)
+    """
+    def _fetch(offset):
+        response = transport.get(url_for_offset(offset))
+        if response is None or response.status_code >= 400:
+            status = None if response is None else response.status_code
+            print(f"   ⚠️ 获取 offset={offset} 失败 (状态码: {status})，跳过该页")
+            return {}
+        return response.json()
+
+    first = _fetch(0)
+    count = int(first.get('count', 0))
+    yield 0, first.get('results', []), count
+    offsets = range(page_size, min(count, max_offset), page_size)
+    if not offsets:
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for offset, page in zip(offsets, _map_window(executor, _fetch, offsets, max_workers * 2)):
+            yield offset, page.get('results', []), count
+
+
+def iter_listing(transport: BrainTransport, url_for, start, end, page_size: int = 100, max_offset: int = 9900,
+                 max_workers: int = 8):
+    """
+    完整拉取 dateCreated 在 [start, end) 内的 listing，不受 offset 上限截断。
+
+    第一页的 count 不超过上限时与 iter_pages 相同；超过时用 limit=1 的探测按 dateCreated 二分出切片
+    （见 listing_planner.py），所有切片的所有页以同样的滑动窗口并发请求，按切片时间顺序逐页产出。
+
+    Args:
+        url_for: url_for(start, end, offset, limit) -> URL，start / end 为 format_time 格式的字符串。
+        start, end: 起止时间（字符串或 datetime）。
+    Yields:
+        (已产出的条数, results, count)
+    """
+    start, end = parse_time(start), parse_time(end)
+    start_str, end_str = format_time(start), format_time(end)
+    max_rows = max_offset + page_size
+    done = 0
+
+    pages = iter_pages(transport, lambda offset: url_for(start_str, end_str, offset, page_size),
+                       page_size=page_size, max_offset=max_offset, max_workers=max_workers)
+    _, results, count = next(pages)
+    if count <= max_rows:
+        yield done, results, count
+        done += len(results)
+        for _, results, count in pages:
+            yield done, results, count
+            done += len(results)
+        return
+    pages.close()
+    print(f"   🗂️ 共 {count} 条，超过 offset 上限 {max_rows}，按 dateCreated 切片拉取")
+
+    def _count(window_start, window_end):
+        response = transport.get(url_for(format_time(window_start), format_time(window_end), 0, 1))
+        if response is None or response.status_code >= 400:
+            raise RuntimeError(f"count 探测失败: {format_time(window_start)} ~ {format_time(window_end)}")
+        return int(response.json().get('count', 0))
+
+    slices = plan_time_slices(_count, start, end, max_rows=max_rows, max_workers=max_workers)
+    total = sum(slice_count for _, _, slice_count in slices)
+    tasks = [(format_time(slice_start), format_time(slice_end), page_offset)
+             for slice_start, slice_end, slice_count in slices
+             for page_offset in range(0, min(slice_count, max_rows), page_size)]
+
+    def _fetch(task):
+        response = transport.get(url_for(*task, page_size))
+        if response is None or response.status_code >= 400:
+            status = None if response is None else response.status_code
+            print(f"   ⚠️ 获取切片 {task[0]} ~ {task[1]} offset={task[2]} 失败 (状态码: {status})，跳过该页")
+            return []
+        return response.json().get('results', [])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for results in _map_window(executor, _fetch, tasks, max_workers * 2):
+            yield done, results, total
+            done += len(results)
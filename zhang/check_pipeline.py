@@ -0,0 +1,235 @@
+"""
+提交检查（/alphas/{id}/check）并发流水线
+
+原来的 get_check_submission 对单个 alpha 最多要等 10 分钟（服务器按 Retry-After 让我们轮询），
+check_submission 逐个串行调用，100 个 alpha 要跑好几个小时，服务器同一时间只在算一个。
+
+这里用 asyncio 同时推进多个 alpha 的检查：
+    - 同时处于检查中的 alpha 数量由工作协程数限制（max_concurrent）；
+    - 每个 alpha 单独计算 10 分钟截止时间，超时返回 "overtime"；
+    - 登出 / PC 为 NaN 的 alpha 交给重试调度器（retry_scheduler.py），按抖动指数退避重新排队，
+      超过次数上限返回 "error"，等待期间不占用检查槽位；
+    - Retry-After 的等待用 asyncio.sleep，不占用其它 alpha 的时间；
+    - HTTP 请求仍走调用方传入的 requests.Session（在线程里执行），登录态/cookie 与原逻辑共用；
+    - 429 "rate limit exceeded" 或登出时只由一个协程重新登录，其余协程等待结果。
+
+结果状态与原来的 get_check_submission 一致："sleep" / "fail" / "error" / "success" / "overtime"。
+/check 结果缓存（result_cache.py）只在这里读写。
+"""
+import asyncio
+import time
+
+import numpy as np
+import pandas as pd
+
+from retry_scheduler import RetryLater, RetryScheduler, drain_async
+
+CHECK_URL = "https://api.worldquantbrain.com/alphas/{}/check"
+MAX_CHECK_TIME = 10 * 60  # 单个alpha最长等待10分钟
+
+
+def parse_check_result(data: dict, alpha_id: str):
+    """
+    解析 /check 返回的 JSON。
+
+    Returns:
+        Tuple[str, dict | None]: ("sleep", None) 表示已登出；("fail", None)；
+            ("success", {"pc": pc, "has_false": bool})
+    Raises:
+        KeyError / ValueError: 返回结构不完整（调用方按原逻辑重试）
+    """
+    if data.get("is", 0) == 0:
+        print(f"   ⚠️  {alpha_id}: logged out")
+        return "sleep", None
+
+    checks_df = pd.DataFrame(data["is"]["checks"])
+
+    # 获取PROD_CORRELATION值
+    pc_rows = checks_df[checks_df.name == "PROD_CORRELATION"]
+    if len(pc_rows) == 0:
+        raise ValueError("PROD_CORRELATION field not found in checks")
+    pc = pc_rows["value"].values[0]
+
+    false_flag = False
+    for field in ("result", "value"):
+        if field not in checks_df.columns:
+            continue
+        for cell in checks_df[field]:
+            if isinstance(cell, (bool, np.bool_)):
+                if cell is False:
+                    false_flag = True
+                    break
+            elif isinstance(cell, str) and "false" in cell.lower():
+                false_flag = True
+                break
+        if false_flag:
+            break
+
+    # 检查是否有FAIL结果
+    if not any(checks_df["result"] == "FAIL"):
+        if false_flag:
+            print(f"   🟡 {alpha_id}: PC={pc} 包含 False 检查项")
+        else:
+            print(f"   ✅ {alpha_id}: PC={pc}")
+        return "success", {"pc": pc, "has_false": false_flag}
+    print(f"   ❌ {alpha_id}: 检查失败 (PC={pc})")
+    return "fail", None
+
+
+def _load_cached_check(cache, alpha_id, watermark=None):
+    """从结果缓存读取 /check 结果（见 result_cache.py），命中时返回 parse_check_result 的结果，否则 None"""
+    if cache is None:
+        return None
+    data = cache.get(alpha_id, "check", watermark)
+    if data is None:
+        return None
+    print(f"   ♻️ {alpha_id}: 使用缓存的提交检查结果")
+    return parse_check_result(data, alpha_id)
+
+
+def _cache_check_result(cache, alpha_id, data, status, payload, watermark=None):
+    """只缓存确定的结果：fail，或 PC 不为 NaN 的 success"""
+    if cache is None:
+        return
+    if status == "fail" or (status == "success" and not pd.isna(payload.get("pc"))):
+        cache.set(alpha_id, "check", data, watermark)
+
+
+class CheckPipeline:
+    """并发提交检查"""
+
+    def __init__(self, session, max_concurrent=8, max_check_time=MAX_CHECK_TIME, refresh_session=None,
+                 logout_wait=100, nan_wait=100, max_requeue=10, max_retries=3, cache=None, watermark=None):
+        """
+        Args:
+            session: requests.Session，登录后的会话。重新登录时原地更新其 cookie。
+            max_concurrent: 同时处于检查中的 alpha 数量上限。
+            max_check_time: 单个 alpha 单次检查的截止时间（秒）。
+            refresh_session: 重新登录的回调，返回新的 session（失败返回 None）。
+            logout_wait: 登出后第一次重新检查前的等待时间（秒），对应原逻辑的 sleep(100)，之后指数退避。
+            nan_wait: PROD_CORRELATION 为 NaN 时第一次重新检查前的等待时间（秒），之后指数退避。
+            max_requeue: 登出 / NaN 重新排队的次数上限，超过记为 "error"。
+            max_retries: 返回结构异常时的重试次数。
+            cache: ResultCache，命中时不再请求 /check。
+            watermark: 当前 OS 池水位，与缓存写入时不同则重新检查。
+        """
+        self.session = session
+        self.max_concurrent = max_concurrent
+        self.max_check_time = max_check_time
+        self.refresh_session = refresh_session
+        self.logout_wait = logout_wait
+        self.nan_wait = nan_wait
+        self.max_requeue = max_requeue
+        self.max_retries = max_retries
+        self.cache = cache
+        self.watermark = watermark
+        self._generation = 0
+        self._done = 0
+        self._total = 0
+
+    async def _refresh(self, generation) -> bool:
+        """单飞重新登录：同一代 session 失效时只登录一次"""
+        async with self._refresh_lock:
+            if generation != self._generation:
+                return True
+            if self.refresh_session is None:
+                return False
+            new_session = await asyncio.to_thread(self.refresh_session)
+            if not new_session:
+                print("   ❌ 重新登录失败")
+                return False
+            self.session.cookies.update(new_session.cookies)
+            self._generation += 1
+            print("   ✅ 重新登录成功，继续检查...")
+            return True
+
+    async def _poll(self, alpha_id):
+        """轮询单个 alpha 直到出结果或超时"""
+        deadline = time.time() + self.max_check_time
+        for attempt in range(self.max_retries):
+            try:
+                while True:
+                    if time.time() > deadline:
+                        print(f"   ⚠️  {alpha_id}: 提交检查超时（已等待 {self.max_check_time / 60:.1f} 分钟）")
+                        return "overtime", None
+
+                    generation = self._generation
+                    result = await asyncio.to_thread(self.session.get, CHECK_URL.format(alpha_id))
+
+                    if result.status_code == 429 and "rate limit exceeded" in result.text.lower():
+                        print(f"   🔄 [429] 检测到API速率限制，重新登录...")
+                        if not await self._refresh(generation):
+                            return "error", None
+
+                    retry_after = result.headers.get("retry-after")
+                    if retry_after:
+                        wait = float(retry_after)
+                    elif result.status_code == 429:
+                        wait = 60
+                        print(f"   ⚠️  [429] API速率限制，等待 {wait} 秒...")
+                    else:
+                        break
+
+                    if time.time() + wait > deadline:
+                        elapsed_minutes = (self.max_check_time - (deadline - time.time())) / 60
+                        print(f"   ⚠️  {alpha_id}: 提交检查超时（已等待 {elapsed_minutes:.1f} 分钟）")
+                        return "overtime", None
+                    await asyncio.sleep(wait)
+
+                data = result.json()
+                status, payload = parse_check_result(data, alpha_id)
+                _cache_check_result(self.cache, alpha_id, data, status, payload, self.watermark)
+                return status, payload
+
+            except Exception as e:
+                print(f"   ⚠️  catch {alpha_id} (尝试 {attempt + 1}/{self.max_retries}): "
+                      f"{type(e).__name__} - {str(e)[:50]}")
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(2 ** attempt)
+                else:
+                    print(f"   ❌ {alpha_id}: 重试失败，返回error")
+        return "error", None
+
+    async def _check(self, alpha_id, attempts):
+        """单个 alpha 的一次检查：登出或 PC 为 NaN 时抛出 RetryLater，由调度器按退避时间重新排队"""
+        generation = self._generation
+        cached = _load_cached_check(self.cache, alpha_id, self.watermark) if attempts == 0 else None
+        status, payload = cached if cached is not None else await self._poll(alpha_id)
+
+        if status == "sleep":
+            if not await self._refresh(generation):
+                status = "error"
+            else:
+                raise RetryLater("logged out", delay=self._scheduler.backoff(attempts + 1, base=self.logout_wait))
+        elif status == "success" and payload.get("pc") is not None and pd.isna(payload.get("pc")):
+            print("check self-corrlation error")
+            raise RetryLater("PROD_CORRELATION is NaN", delay=self._scheduler.backoff(attempts + 1, base=self.nan_wait))
+
+        self._done += 1
+        if self._done % 5 == 0 or self._done == self._total:
+            print(f"   📊 提交检查进度: {self._done}/{self._total}")
+        return status, payload
+
+    async def run_async(self, alpha_ids):
+        self._refresh_lock = asyncio.Lock()
+        self._scheduler = RetryScheduler(max_attempts=self.max_requeue, max_delay=4 * self.max_check_time)
+        self._done = 0
+        self._total = len(alpha_ids)
+        tickets = [self._scheduler.push(alpha_id) for alpha_id in alpha_ids]
+
+        # 同时处于检查中的 alpha 数量即协程数；等待重新排队的 alpha 留在堆里，不占用槽位
+        results = await drain_async(self._scheduler, self._check, concurrency=self.max_concurrent)
+        for alpha_id, attempts, reason in self._scheduler.dead_letters:
+            print(f"   ❌ {alpha_id}: 重新排队 {attempts} 次仍未得到结果（{reason}），返回error")
+        return [(alpha_id, *results.get(ticket, ("error", None))) for alpha_id, ticket in zip(alpha_ids, tickets)]
+
+    def run(self, alpha_ids):
+        """
+        并发检查一批 alpha。
+
+        Returns:
+            List[Tuple[str, str, dict | None]]: 与输入顺序一致的 (alpha_id, status, payload)
+        """
+        if not alpha_ids:
+            return []
+        return asyncio.run(self.run_async(list(alpha_ids)))
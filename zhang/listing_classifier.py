@@ -0,0 +1,151 @@
+"""
+get_alphas 的 listing 批量分类（machine_lib / machine_lib_new / machine_lib_0GLB 共用）
+
+原来每个 alpha 在 Python 循环里用 next(...) 把 checks 扫四遍，再走一遍换手率阶梯选新 decay。
+这里把一批 listing 结果一遍扫描规整成列（每个 alpha 一行，用到的检查项透视成列，
+每个 alpha 的 checks 只扫一遍），筛选条件按列用 numpy 一次算完，新 decay 按换手率阶梯查表：
+    turnover > 0.7  -> decay * 4        turnover > 0.4  -> decay * 2
+    turnover > 0.6  -> decay * 3 + 3    turnover > 0.35 -> decay + 4
+    turnover > 0.5  -> decay * 3        turnover > 0.3  -> decay + 2
+    其余不调整 decay
+输出的 rec 与原来逐个构造的完全一致（字段取自原始 JSON，不是 numpy 标量）。
+列直接用 numpy 数组而不是 DataFrame：一页只有 100 个 alpha，DataFrame 的构造开销比计算本身还大。
+"""
+import numpy as np
+
+# 透视成列的检查项：检查项名 -> (列名, 缺省值)，缺省值与原 next(..., default) 一致
+CHECK_COLUMNS = {
+    'CONCENTRATED_WEIGHT': ('concentrated_weight', 0),
+    'LOW_SUB_UNIVERSE_SHARPE': ('sub_universe_sharpe', 99),
+    'LOW_2Y_SHARPE': ('two_year_sharpe', 99),
+    'IS_LADDER_SHARPE': ('ladder_sharpe', 99),
+}
+
+# 换手率阶梯查表：下标为 turnover 超过的阈值个数（0 表示不调整）
+DECAY_THRESHOLDS = np.array([0.3, 0.35, 0.4, 0.5, 0.6, 0.7])
+DECAY_MULTIPLIER = np.array([1, 1, 1, 2, 3, 3, 4])
+DECAY_OFFSET = np.array([0, 2, 4, 0, 0, 3, 0])
+
+IS_COLUMNS = ['sharpe', 'fitness', 'turnover', 'margin', 'longCount', 'shortCount']
+
+
+def listing_columns(alphas: list) -> dict:
+    """
+    listing 结果规整成列（行顺序与 alphas 一致）
+
+    Returns:
+        dict: 列名 -> numpy 数组，包括 region / decay / IS 指标 / CHECK_COLUMNS 的检查项值 /
+        any_fail（任一检查项 result == FAIL）
+    """
+    n = len(alphas)
+    checks = {column: np.full(n, float(default)) for column, default in CHECK_COLUMNS.values()}
+    any_fail = np.zeros(n, dtype=bool)
+    for i, alpha in enumerate(alphas):
+        seen = set()
+        for check in alpha['is'].get('checks', []):
+            name = check.get('name')
+            # 同名检查项取第一个（与 next(...) 一致）
+            if name in CHECK_COLUMNS and name not in seen:
+                seen.add(name)
+                column, default = CHECK_COLUMNS[name]
+                checks[column][i] = check.get('value', default)
+            if check.get('result') == 'FAIL':
+                any_fail[i] = True
+
+    columns = {
+        'region': np.array([alpha['settings']['region'] for alpha in alphas], dtype=object),
+        'decay': np.array([alpha['settings']['decay'] for alpha in alphas]),
+    }
+    for column in IS_COLUMNS:
+        columns[column] = np.array([alpha['is'][column] for alpha in alphas], dtype=float)
+    columns.update(checks)
+    columns['any_fail'] = any_fail
+    return columns
+
+
+def adjusted_decay(turnover: np.ndarray, decay: np.ndarray):
+    """
+    按换手率阶梯计算新 decay
+
+    Returns:
+        (是否需要调整 decay 的掩码, 新 decay 数组)
+    """
+    step = np.searchsorted(DECAY_THRESHOLDS, turnover, side='left')
+    step = np.where(np.isnan(turnover), 0, step)
+    return step > 0, decay * DECAY_MULTIPLIER[step] + DECAY_OFFSET[step]
+
+
+def _negated_code(alpha: dict, negate: bool) -> str:
+    code = alpha['regular']['code']
+    return "-%s" % code if negate else code
+
+
+def classify_next(alphas: list, sharpe_th: float):
+    """
+    machine_lib_new 模拟用途的筛选分桶
+
+    Returns:
+        (next_recs, decay_recs)：
+        rec = [alpha_id, exp, sharpe, turnover, fitness, margin, longCount, shortCount, dateCreated, decay]，
+        decay_recs 的 rec 末尾另加新 decay；sharpe < 0 的表达式取负。
+    """
+    if not alphas:
+        return [], []
+    cols = listing_columns(alphas)
+    sharpe = cols['sharpe']
+    keep = (((cols['longCount'] > 100) | (cols['shortCount'] > 100))
+            & (cols['concentrated_weight'] < 0.2)
+            & (np.abs(cols['sub_universe_sharpe']) > sharpe_th / 1.66)
+            & (np.abs(cols['two_year_sharpe']) > sharpe_th)
+            & (np.abs(cols['ladder_sharpe']) > sharpe_th)
+            & ~((cols['region'] == 'CHN') & (sharpe < 0)))
+    to_decay, new_decay = adjusted_decay(cols['turnover'], cols['decay'])
+    new_decay = new_decay.tolist()
+
+    next_recs, decay_recs = [], []
+    for i in np.flatnonzero(keep):
+        alpha = alphas[i]
+        iss = alpha['is']
+        rec = [alpha['id'], _negated_code(alpha, sharpe[i] < 0), iss['sharpe'], iss['turnover'], iss['fitness'],
+               iss['margin'], iss['longCount'], iss['shortCount'], alpha['dateCreated'], alpha['settings']['decay']]
+        if to_decay[i]:
+            rec.append(new_decay[i])
+            decay_recs.append(rec)
+        else:
+            next_recs.append(rec)
+    return next_recs, decay_recs
+
+
+def classify_basic(alphas: list, sharpe_th: float) -> list:
+    """
+    machine_lib / machine_lib_0GLB 的筛选：多空持仓数之和 > 100
+
+    Returns:
+        rec = [alpha_id, exp, sharpe, turnover, fitness, margin, dateCreated, decay]，
+        turnover > 0.3 时末尾另加新 decay；sharpe < -sharpe_th 的表达式取负。
+    """
+    if not alphas:
+        return []
+    cols = listing_columns(alphas)
+    sharpe = cols['sharpe']
+    keep = (cols['longCount'] + cols['shortCount']) > 100
+    to_decay, new_decay = adjusted_decay(cols['turnover'], cols['decay'])
+    new_decay = new_decay.tolist()
+
+    output = []
+    for i in np.flatnonzero(keep):
+        alpha = alphas[i]
+        iss = alpha['is']
+        rec = [alpha['id'], _negated_code(alpha, sharpe[i] < -sharpe_th), iss['sharpe'], iss['turnover'],
+               iss['fitness'], iss['margin'], alpha['dateCreated'], alpha['settings']['decay']]
+        if to_decay[i]:
+            rec.append(new_decay[i])
+        output.append(rec)
+    return output
+
+
+def check_failed(alphas: list) -> np.ndarray:
+    """提交用途：每个 alpha 是否有检查项 result == FAIL（与 alphas 顺序一致）"""
+    if not alphas:
+        return np.zeros(0, dtype=bool)
+    return listing_columns(alphas)['any_fail']
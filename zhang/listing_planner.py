@@ -0,0 +1,95 @@
+"""
+listing 切片规划：按 dateCreated 二分时间窗口，使每个切片都不超过服务器的 offset 上限
+
+/users/self/alphas 最多只能翻到 offset 9900（1 万条）。原来的做法：
+    - machine_lib_new.get_alphas 翻到 9900 就停，超出部分被静默截断；
+    - AlphaCrawler.create_daily_batch_filters 固定按 天 × 13 个 fitness 区间切分，大部分切片是空的，
+      每个空切片也要请求一次。
+
+这里先用 limit=1 的请求只取 count（很便宜），超过上限的窗口一分为二，继续探测，
+直到每个切片都不超过 max_rows；同一层的探测并发进行。最后把相邻的小切片合并，
+在不超过上限的前提下让切片数（即翻页的起点数）最少。
+
+本模块只依赖标准库，count 的获取方式由调用方提供（machine_lib_new、alpha_crawler 共用）。
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+MAX_ROWS = 10000
+# 平台时间统一使用美东时间（与原来的 -04:00 写法一致）
+BRAIN_TZ = timezone(timedelta(hours=-4))
+
+
+def parse_time(value, tz=BRAIN_TZ) -> datetime:
+    """'2025-01-01' / '2025-01-01T00:00:00-04:00' / datetime -> 带时区的 datetime"""
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        dt = datetime.fromisoformat(str(value))
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=tz)
+
+
+def format_time(dt: datetime) -> str:
+    """datetime -> '2025-01-01T00:00:00-04:00'（listing 过滤条件的格式）"""
+    return dt.isoformat(timespec='seconds')
+
+
+def plan_time_slices(count_fn, start, end, max_rows: int = MAX_ROWS, min_span: timedelta = timedelta(seconds=1),
+                     max_workers: int = 8, merge: bool = True) -> list:
+    """
+    规划 [start, end) 的时间切片。
+
+    Args:
+        count_fn: count_fn(start, end) -> int，返回 dateCreated 在 [start, end) 内的条数（例如 limit=1 请求的 count）。
+        start, end: 起止时间（字符串或 datetime，无时区时按 BRAIN_TZ）。
+        max_rows: 单个切片允许的最大条数。
+        min_span: 窗口不再继续二分的最小时长；此时仍超限的切片会保留并打印警告。
+        max_workers: 并发探测数。
+        merge: 是否合并相邻的小切片。
+    Returns:
+        [(start, end, count)]，按时间升序，不含空切片。
+    """
+    start, end = parse_time(start), parse_time(end)
+    slices = []
+    probes = 0
+    pending = [(start, end)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending:
+            counts = list(executor.map(lambda window: count_fn(*window), pending))
+            probes += len(pending)
+            next_pending = []
+            for (window_start, window_end), count in zip(pending, counts):
+                if count <= 0:
+                    continue
+                if count <= max_rows:
+                    slices.append((window_start, window_end, count))
+                elif window_end - window_start <= min_span:
+                    logging.warning(f"⚠️ 时间窗口 {format_time(window_start)} ~ {format_time(window_end)} "
+                                    f"有 {count} 条，超过 {max_rows} 且无法继续切分，超出部分会被截断")
+                    slices.append((window_start, window_end, count))
+                else:
+                    # 取整秒，保证 format_time 后的边界与探测时一致
+                    middle = window_start + timedelta(seconds=int((window_end - window_start).total_seconds() // 2))
+                    next_pending += [(window_start, middle), (middle, window_end)]
+            pending = next_pending
+
+    slices.sort(key=lambda item: item[0])
+    if merge:
+        slices = merge_slices(slices, max_rows)
+    print(f"   🗂️ listing 规划: 探测 {probes} 次，{len(slices)} 个切片，共 {sum(c for _, _, c in slices)} 条")
+    return slices
+
+
+def merge_slices(slices: list, max_rows: int = MAX_ROWS) -> list:
+    """
+    合并相邻切片，合并后条数不超过 max_rows。
+    切片之间的空隙都是探测过的空窗口，合并时把空隙一并包含进去不影响条数。
+    """
+    merged = []
+    for window_start, window_end, count in slices:
+        if merged and merged[-1][2] + count <= max_rows:
+            merged[-1] = (merged[-1][0], window_end, merged[-1][2] + count)
+        else:
+            merged.append((window_start, window_end, count))
+    return merged
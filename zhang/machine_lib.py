@@ -11,6 +11,11 @@ from itertools import product
 from itertools import combinations
 from collections import defaultdict
 import pickle
+
+from check_pipeline import CheckPipeline
+from result_cache import get_result_cache, os_pool_watermark
+from brain_transport import new_session
+from listing_classifier import classify_basic
  
  
  
@@ -27,7 +32,7 @@ def login():
     password = ""
  
     # Create a session to persistently store the headers
-    s = requests.Session()
+    s = new_session()  # 带连接池和 gzip（见 brain_transport.py）
  
     # Save credentials into session
     s.auth = (username, password)
@@ -318,38 +323,11 @@ def get_alphas(start_date, end_date, sharpe_th, fitness_th, region, alpha_num, u
             try:
                 alpha_list = response.json()["results"]
                 #print(response.json())
-                for j in range(len(alpha_list)):
-                    alpha_id = alpha_list[j]["id"]
-                    name = alpha_list[j]["name"]
-                    dateCreated = alpha_list[j]["dateCreated"]
-                    sharpe = alpha_list[j]["is"]["sharpe"]
-                    fitness = alpha_list[j]["is"]["fitness"]
-                    turnover = alpha_list[j]["is"]["turnover"]
-                    margin = alpha_list[j]["is"]["margin"]
-                    longCount = alpha_list[j]["is"]["longCount"]
-                    shortCount = alpha_list[j]["is"]["shortCount"]
-                    decay = alpha_list[j]["settings"]["decay"]
-                    exp = alpha_list[j]['regular']['code']
-                    count += 1
-                    #if (sharpe > 1.2 and sharpe < 1.6) or (sharpe < -1.2 and sharpe > -1.6):
-                    if (longCount + shortCount) > 100:
-                        if sharpe < -sharpe_th:
-                            exp = "-%s"%exp
-                        rec = [alpha_id, exp, sharpe, turnover, fitness, margin, dateCreated, decay]
-                        print(rec)
-                        if turnover > 0.7:
-                            rec.append(decay*4)
-                        elif turnover > 0.6:
-                            rec.append(decay*3+3)
-                        elif turnover > 0.5:
-                            rec.append(decay*3)
-                        elif turnover > 0.4:
-                            rec.append(decay*2)
-                        elif turnover > 0.35:
-                            rec.append(decay+4)
-                        elif turnover > 0.3:
-                            rec.append(decay+2)
-                        output.append(rec)
+                count += len(alpha_list)
+                # 整页一次性筛选、计算新 decay（listing_classifier）
+                for rec in classify_basic(alpha_list, sharpe_th):
+                    print(rec)
+                    output.append(rec)
             except:
                 print("%d finished re-login"%i)
                 s = login()
@@ -584,34 +562,44 @@ def trade_when_factory(op,field,region):
     return output
 
 
-def check_submission(alpha_bag, gold_bag, start):
+def get_os_watermark(s):
+    """
+    从服务器的 OS alpha 列表计算 OS 池水位（见 result_cache.os_pool_watermark），
+    提交了新 alpha 后水位变化，缓存的检查/自相关结果随之失效。获取失败返回 None。
+    """
+    alpha_ids = []
+    offset = 0
+    while True:
+        url = "https://api.worldquantbrain.com/users/self/alphas?stage=OS&limit=100&offset=%d&order=-dateSubmitted" % offset
+        try:
+            response = s.get(url)
+            results = response.json()["results"]
+        except Exception as e:
+            print("get OS alphas failed: %s" % e)
+            return None
+        alpha_ids.extend(alpha["id"] for alpha in results)
+        if len(results) < 100:
+            return os_pool_watermark(alpha_ids)
+        offset += 100
+
+
+def check_submission(alpha_bag, gold_bag, start, max_concurrent=8):
     depot = []
     s = login()
-    for idx, g in enumerate(alpha_bag):
-        if idx < start:
+    # 缓存的检查结果按 OS 池水位失效；获取不到水位时不使用缓存，避免拿到提交新 alpha 之前的结果
+    watermark = get_os_watermark(s)
+    cache = get_result_cache() if watermark is not None else None
+    # 并发提交检查，多个alpha的服务器等待时间重叠（见 check_pipeline.py）
+    pipeline = CheckPipeline(s, max_concurrent=max_concurrent, refresh_session=login, cache=cache,
+                             watermark=watermark)
+    for g, status, payload in pipeline.run(alpha_bag[start:]):
+        if status == "fail":
             continue
-        if idx % 5 == 0:
-            print(idx)
-        if idx % 200 == 0:
-            s = login()
-        #print(idx)
-        pc = get_check_submission(s, g)
-        if pc == "sleep":
-            sleep(100)
-            s = login()
-            alpha_bag.append(g)
-        elif pc != pc:
-            # pc is nan
-            print("check self-corrlation error")
-            sleep(100)
-            alpha_bag.append(g)
-        elif pc == "fail":
-            continue
-        elif pc == "error":
+        elif status in ("error", "overtime"):
             depot.append(g)
-        else:
+        elif status == "success":
             print(g)
-            gold_bag.append((g, pc))
+            gold_bag.append((g, payload["pc"]))
     print(depot)
     return gold_bag
 
@@ -727,7 +715,7 @@ def login_hk():
     password = ""
     
     # Create a session to persistently store the headers
-    s = requests.Session()
+    s = new_session()  # 带连接池和 gzip（见 brain_transport.py）
     
     # Save credentials into session
     s.auth = (username, password)
@@ -14,6 +14,9 @@ import pickle
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from retry_scheduler import RetryLater, RetryScheduler, drain
+from listing_classifier import classify_basic
+
 # ===================== 全局频率控制配置 =====================
 GLOBAL_REQUEST_DELAY = 1.0
 MAX_RETRIES = 5
@@ -324,38 +327,11 @@ def get_alphas(start_date, end_date, sharpe_th, fitness_th, region, alpha_num, u
                 response.raise_for_status()
                 alpha_list = response.json().get("results", [])
                 
-                for j in range(len(alpha_list)):
-                    alpha_id = alpha_list[j]["id"]
-                    name = alpha_list[j]["name"]
-                    dateCreated = alpha_list[j]["dateCreated"]
-                    sharpe = alpha_list[j]["is"]["sharpe"]
-                    fitness = alpha_list[j]["is"]["fitness"]
-                    turnover = alpha_list[j]["is"]["turnover"]
-                    margin = alpha_list[j]["is"]["margin"]
-                    longCount = alpha_list[j]["is"]["longCount"]
-                    shortCount = alpha_list[j]["is"]["shortCount"]
-                    decay = alpha_list[j]["settings"]["decay"]
-                    exp = alpha_list[j]['regular']['code']
-                    count += 1
-                    
-                    if (longCount + shortCount) > 100:
-                        if sharpe < -sharpe_th:
-                            exp = "-%s"%exp
-                        rec = [alpha_id, exp, sharpe, turnover, fitness, margin, dateCreated, decay]
-                        print(rec)
-                        if turnover > 0.7:
-                            rec.append(decay*4)
-                        elif turnover > 0.6:
-                            rec.append(decay*3+3)
-                        elif turnover > 0.5:
-                            rec.append(decay*3)
-                        elif turnover > 0.4:
-                            rec.append(decay*2)
-                        elif turnover > 0.35:
-                            rec.append(decay+4)
-                        elif turnover > 0.3:
-                            rec.append(decay+2)
-                        output.append(rec)
+                count += len(alpha_list)
+                # 整页一次性筛选、计算新 decay（listing_classifier）
+                for rec in classify_basic(alpha_list, sharpe_th):
+                    print(rec)
+                    output.append(rec)
             except Exception as e:
                 print(f"{i} finished re-login: {e}")
                 time.sleep(60)
@@ -557,34 +533,41 @@ def trade_when_factory(op,field,region):
             output.append(alpha)
     return output
 
-def check_submission(alpha_bag, gold_bag, start):
-    """检查提交状态"""
+def check_submission(alpha_bag, gold_bag, start, max_requeue=10):
+    """检查提交状态（登出 / PC 为 NaN 的 alpha 交给重试调度器按退避时间重新排队）"""
     depot = []
     s = login()
-    for idx, g in enumerate(alpha_bag):
-        if idx < start:
-            continue
-        if idx % 5 == 0:
-            print(idx)
-        if idx % 200 == 0:
+    checked = 0
+    scheduler = RetryScheduler(base_delay=100, max_attempts=max_requeue)
+    tickets = {scheduler.push(g): g for g in alpha_bag[start:]}
+
+    def _check(g, attempts):
+        nonlocal s, checked
+        checked += 1
+        if checked % 5 == 0:
+            print(checked)
+        if checked % 200 == 0:
             time.sleep(60)
             s = login()
         pc = get_check_submission(s, g)
         if pc == "sleep":
-            sleep(100)
             s = login()
-            alpha_bag.append(g)
+            raise RetryLater("logged out")
         elif pc != pc:
             print("check self-corrlation error")
-            sleep(100)
-            alpha_bag.append(g)
-        elif pc == "fail":
+            raise RetryLater("PROD_CORRELATION is NaN")
+        return pc
+
+    for ticket, pc in sorted(drain(scheduler, _check).items()):
+        g = tickets[ticket]
+        if pc == "fail":
             continue
         elif pc == "error":
             depot.append(g)
         else:
             print(g)
             gold_bag.append((g, pc))
+    depot.extend(g for g, _, _ in scheduler.dead_letters)
     print(depot)
     return gold_bag
 
@@ -4,7 +4,6 @@
 import os
 import sys
 
-import requests
 from time import sleep
 import time
 import json
@@ -16,6 +15,12 @@ import aiofiles
 import aiohttp
 import asyncio
 
+from retry_scheduler import RetryLater, RetryScheduler, drain_async
+from property_queue import PropertyUpdateQueue, aiohttp_sender, build_params
+from auth_manager import AsyncAuthManager, AuthManager
+from brain_transport import BrainTransport, GLOBAL_RATE_LIMITER, iter_listing, new_session
+from listing_classifier import check_failed, classify_next
+
 def login():
     # 从txt文件解密并读取数据
     # txt格式:
@@ -33,7 +38,7 @@ def login():
     username, password = load_decrypted_data("user_info.txt")
 
     # Create a session to persistently store the headers
-    s = requests.Session()
+    s = new_session()  # 带连接池和 gzip（见 brain_transport.py）
 
     # Save credentials into session
     s.auth = (username, password)
@@ -195,228 +200,168 @@ def process_datafields(df, data_type, min_start_date: str = "2016-01-01"):
     return tb_fields
 
 
+def _listing_check_rec(alpha_detail):
+    """
+    提交用途：整理完整信息字典（检查项是否 FAIL 由 listing_classifier.check_failed 整批判定）
+    """
+    id = alpha_detail["id"]
+    type = alpha_detail["type"]
+    author = alpha_detail["author"]
+    instrumentType = alpha_detail["settings"]["instrumentType"]
+    region = alpha_detail["settings"]["region"]
+    universe = alpha_detail["settings"]["universe"]
+    delay = alpha_detail["settings"]["delay"]
+    decay = alpha_detail["settings"]["decay"]
+    neutralization = alpha_detail["settings"]["neutralization"]
+    truncation = alpha_detail["settings"]["truncation"]
+    pasteurization = alpha_detail["settings"]["pasteurization"]
+    unitHandling = alpha_detail["settings"]["unitHandling"]
+    nanHandling = alpha_detail["settings"]["nanHandling"]
+    language = alpha_detail["settings"]["language"]
+    visualization = alpha_detail["settings"]["visualization"]
+    code = alpha_detail["regular"]["code"]
+    description = alpha_detail["regular"]["description"]
+    operatorCount = alpha_detail["regular"]["operatorCount"]
+    dateCreated = alpha_detail["dateCreated"]
+    dateSubmitted = alpha_detail["dateSubmitted"]
+    dateModified = alpha_detail["dateModified"]
+    name = alpha_detail["name"]
+    favorite = alpha_detail["favorite"]
+    hidden = alpha_detail["hidden"]
+    color = alpha_detail["color"]
+    category = alpha_detail["category"]
+    tags = alpha_detail["tags"]
+    classifications = alpha_detail["classifications"]
+    grade = alpha_detail["grade"]
+    stage = alpha_detail["stage"]
+    status = alpha_detail["status"]
+    pnl = alpha_detail["is"]["pnl"]
+    bookSize = alpha_detail["is"]["bookSize"]
+    longCount = alpha_detail["is"]["longCount"]
+    shortCount = alpha_detail["is"]["shortCount"]
+    turnover = alpha_detail["is"]["turnover"]
+    returns = alpha_detail["is"]["returns"]
+    drawdown = alpha_detail["is"]["drawdown"]
+    margin = alpha_detail["is"]["margin"]
+    fitness = alpha_detail["is"]["fitness"]
+    sharpe = alpha_detail["is"]["sharpe"]
+    startDate = alpha_detail["is"]["startDate"]
+    checks = alpha_detail["is"]["checks"]
+    os = alpha_detail["os"]
+    train = alpha_detail["train"]
+    test = alpha_detail["test"]
+    prod = alpha_detail["prod"]
+    competitions = alpha_detail["competitions"]
+    themes = alpha_detail["themes"]
+    team = alpha_detail["team"]
+    pyramids = next(
+        ([y['name'] for y in item['pyramids']] for item in checks if item['name'] == 'MATCHES_PYRAMID'), None)
+
+    # 把全部的信息以字典的形式返回
+    return {"id": id, "type": type, "author": author, "instrumentType": instrumentType, "region": region,
+            "universe": universe, "delay": delay, "decay": decay, "neutralization": neutralization,
+            "truncation": truncation, "pasteurization": pasteurization, "unitHandling": unitHandling,
+            "nanHandling": nanHandling, "language": language, "visualization": visualization, "code": code,
+            "description": description, "operatorCount": operatorCount, "dateCreated": dateCreated,
+            "dateSubmitted": dateSubmitted, "dateModified": dateModified, "name": name, "favorite": favorite,
+            "hidden": hidden, "color": color, "category": category, "tags": tags,
+            "classifications": classifications, "grade": grade, "stage": stage, "status": status, "pnl": pnl,
+            "bookSize": bookSize, "longCount": longCount, "shortCount": shortCount, "turnover": turnover,
+            "returns": returns, "drawdown": drawdown, "margin": margin, "fitness": fitness, "sharpe": sharpe,
+            "startDate": startDate, "checks": checks, "os": os, "train": train, "test": test, "prod": prod,
+            "competitions": competitions, "themes": themes, "team": team, "pyramids": pyramids}
+
+
 def get_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortCount_th, region, universe, delay,
-               instrumentType, alpha_num, usage, tag: str = '', color_exclude='', s=None):
+               instrumentType, alpha_num, usage, tag: str = '', color_exclude='', s=None, max_workers=8):
+    """
+    按 IS 指标分页拉取未提交的 alpha。
 
+    第一页拿到 count 后其余页并发请求（brain_transport.iter_pages，经全局限流器），
+    每页到达后立即筛选分桶，不保留整页原始 JSON。
+    超过 1 万条（offset 上限）时按 dateCreated 二分切片完整拉取（brain_transport.iter_listing）。
+    """
 
     # color None, RED, YELLOW, GREEN, BLUE, PURPLE CYX专用
     if s is None:
         s = login()
-    alpha_list = []
+    # 401 时重新登录（新 cookie 替换进 s），429 / 5xx 统一退避重试
+    auth = AuthManager(login, name='get_alphas')
+    auth.update_session(s)
+    transport = BrainTransport(auth=auth, rate_limiter=GLOBAL_RATE_LIMITER)
+
     next_alphas = []
     decay_alphas = []
     check_alphas = []
+    fetched = 0
+
+    seen = set()
+
+    def _consume(alphas):
+        nonlocal fetched
+        # 切片边界上的 alpha 可能被相邻两个切片各返回一次
+        fresh = []
+        for alpha in alphas:
+            if alpha["id"] not in seen:
+                seen.add(alpha["id"])
+                fresh.append(alpha)
+        fetched += len(fresh)
+        # 整页一次性筛选分桶（listing_classifier）
+        if usage != "submit":
+            page_next, page_decay = classify_next(fresh, sharpe_th)
+            next_alphas.extend(page_next)
+            decay_alphas.extend(page_decay)
+        else:
+            for alpha, failed in zip(fresh, check_failed(fresh)):
+                if failed:
+                    # 最基础的项目不通过
+                    set_alpha_properties(s, alpha["id"], color='RED')
+                else:
+                    check_alphas.append(_listing_check_rec(alpha))
+
+    def _run_query(sharpe_fitness):
+        """拉取一个方向（正/负 sharpe）的全部 alpha；超过 offset 上限时按 dateCreated 切片，不再截断"""
+        def url_for(window_start, window_end, offset, limit):
+            return (f"https://api.worldquantbrain.com/users/self/alphas?limit={limit}&offset={offset}"
+                    f"&tag%3D{tag}&is.longCount%3E={longCount_th}&is.shortCount%3E={shortCount_th}"
+                    f"&settings.region={region}&{sharpe_fitness}"
+                    f"&settings.universe={universe}&status=UNSUBMITTED&dateCreated%3E={window_start}"
+                    f"&dateCreated%3C={window_end}&type=REGULAR&color!={color_exclude}&"
+                    f"settings.delay={delay}&settings.instrumentType={instrumentType}&order=-is.sharpe&hidden=false&type!=SUPER")
+
+        next_start, decay_start = len(next_alphas), len(decay_alphas)
+        query_count = 0
+        for done, alphas, query_count in iter_listing(transport, url_for, f"{start_date}T00:00:00-04:00",
+                                                      f"{end_date}T00:00:00-04:00", max_workers=max_workers):
+            print(f"一共有{query_count}个因子等待被获取，已经获取了{done}个")
+            _consume(alphas)
+        if query_count > 10000:
+            # 切片之间不再整体按 sharpe 排序，这里恢复 -is.sharpe 的顺序
+            next_alphas[next_start:] = sorted(next_alphas[next_start:], key=lambda rec: -rec[2])
+            decay_alphas[decay_start:] = sorted(decay_alphas[decay_start:], key=lambda rec: -rec[2])
+            check_alphas.sort(key=lambda rec: -rec["sharpe"])
+        return query_count
+
     # 3E large 3C less
     # 正的
-    i = 0
-    while True:
-        url_e = (f"https://api.worldquantbrain.com/users/self/alphas?limit=100&offset={i}"
-                 f"&tag%3D{tag}&is.longCount%3E={longCount_th}&is.shortCount%3E={shortCount_th}"
-                 f"&settings.region={region}&is.sharpe%3E={sharpe_th}&is.fitness%3E={fitness_th}"
-                 f"&settings.universe={universe}&status=UNSUBMITTED&dateCreated%3E={start_date}"
-                 f"T00:00:00-04:00&dateCreated%3C{end_date}T00:00:00-04:00&type=REGULAR&color!={color_exclude}&"
-                 f"settings.delay={delay}&settings.instrumentType={instrumentType}&order=-is.sharpe&hidden=false&type!=SUPER")
-
-        response = s.get(url_e)
-        # print(response.json())
-        try:
-            i += 100
-            count = int(response.json()["count"])
-            print(f"一共有{count}个因子等待被获取，已经获取了{i-100}个")
-            alpha_list.extend(response.json()["results"])
-            if i >= count or i == 9900:
-                break
-            time.sleep(3)
-        except Exception as e:
-            print(f"Failed to get alphas: {e}")
-            i -= 100
-            time.sleep(60)
-            s = login()
-            print("%d finished re-login" % i)
+    _run_query(f"is.sharpe%3E={sharpe_th}&is.fitness%3E={fitness_th}")
 
     # 负的
     if usage != "submit":
-        i = 0
-        while True:
-            url_c = (f"https://api.worldquantbrain.com/users/self/alphas?limit=100&offset={i}"
-                     f"&tag%3D{tag}&is.longCount%3E={longCount_th}&is.shortCount%3E={shortCount_th}"
-                     f"&settings.region={region}&is.sharpe%3C=-{sharpe_th}&is.fitness%3C=-{fitness_th}"
-                     f"&settings.universe={universe}&status=UNSUBMITTED&dateCreated%3E={start_date}"
-                     f"T00:00:00-04:00&dateCreated%3C{end_date}T00:00:00-04:00&type=REGULAR&color!={color_exclude}&"
-                     f"settings.delay={delay}&settings.instrumentType={instrumentType}&order=-is.sharpe&hidden=false&type!=SUPER")
-
-            response = s.get(url_c)
-            # print(response.json())
-            try:
-                count = response.json()["count"]
-                if i >= count or i == 9900:
-                    break
-                alpha_list.extend(response.json()["results"])
-                i += 100
-            except Exception as e:
-                print(f"Failed to get alphas: {e}")
-                time.sleep(5)
-                s = login()
-                print("%d finished re-login" % i)
+        _run_query(f"is.sharpe%3C=-{sharpe_th}&is.fitness%3C=-{fitness_th}")
 
-    # print(alpha_list)
-    if len(alpha_list) == 0:
+    if fetched == 0:
         if usage != "submit":
             return {"next": [], "decay": []}
         else:
             return {"check": []}
 
-    # print(response.json())
     if usage != "submit":
-        for j in range(len(alpha_list)):
-            alpha_id = alpha_list[j]["id"]
-            name = alpha_list[j]["name"]
-            dateCreated = alpha_list[j]["dateCreated"]
-            sharpe = alpha_list[j]["is"]["sharpe"]
-            fitness = alpha_list[j]["is"]["fitness"]
-            turnover = alpha_list[j]["is"]["turnover"]
-            margin = alpha_list[j]["is"]["margin"]
-            longCount = alpha_list[j]["is"]["longCount"]
-            shortCount = alpha_list[j]["is"]["shortCount"]
-            decay = alpha_list[j]["settings"]["decay"]
-            exp = alpha_list[j]['regular']['code']
-            region = alpha_list[j]["settings"]["region"]
-
-            concentrated_weight = next(
-                (check.get('value', 0) for check in alpha_list[j]["is"]["checks"] if
-                 check["name"] == "CONCENTRATED_WEIGHT"), 0)
-            sub_universe_sharpe = next(
-                (check.get('value', 99) for check in alpha_list[j]["is"]["checks"] if
-                 check["name"] == "LOW_SUB_UNIVERSE_SHARPE"), 99)
-            two_year_sharpe = next(
-                (check.get('value', 99) for check in alpha_list[j]["is"]["checks"] if check["name"] == "LOW_2Y_SHARPE"),
-                99)
-            ladder_sharpe = next(
-                (check.get('value', 99) for check in alpha_list[j]["is"]["checks"] if
-                 check["name"] == "IS_LADDER_SHARPE"), 99)
-
-            conditions = ((longCount > 100 or shortCount > 100) and
-                          (concentrated_weight < 0.2) and
-                          (abs(sub_universe_sharpe) > sharpe_th / 1.66) and
-                          (abs(two_year_sharpe) > sharpe_th) and
-                          (abs(ladder_sharpe) > sharpe_th) and
-                          (not (region == "CHN" and sharpe < 0))
-                          )
-            # if (sharpe > 1.2 and sharpe < 1.6) or (sharpe < -1.2 and sharpe > -1.6):
-            if conditions:
-                if sharpe < 0:
-                    exp = "-%s" % exp
-                rec = [alpha_id, exp, sharpe, turnover, fitness, margin, longCount, shortCount, dateCreated, decay]
-                # print(rec)
-                if turnover > 0.7:
-                    rec.append(decay * 4)
-                    decay_alphas.append(rec)
-                elif turnover > 0.6:
-                    rec.append(decay * 3 + 3)
-                    decay_alphas.append(rec)
-                elif turnover > 0.5:
-                    rec.append(decay * 3)
-                    decay_alphas.append(rec)
-                elif turnover > 0.4:
-                    rec.append(decay * 2)
-                    decay_alphas.append(rec)
-                elif turnover > 0.35:
-                    rec.append(decay + 4)
-                    decay_alphas.append(rec)
-                elif turnover > 0.3:
-                    rec.append(decay + 2)
-                    decay_alphas.append(rec)
-                else:
-                    next_alphas.append(rec)
         output_dict = {"next": next_alphas, "decay": decay_alphas}
         print("获取到了%d个因子" % (len(next_alphas) + len(decay_alphas)))
     else:
-        for alpha_detail in alpha_list:
-            id = alpha_detail["id"]
-            type = alpha_detail["type"]
-            author = alpha_detail["author"]
-            instrumentType = alpha_detail["settings"]["instrumentType"]
-            region = alpha_detail["settings"]["region"]
-            universe = alpha_detail["settings"]["universe"]
-            delay = alpha_detail["settings"]["delay"]
-            decay = alpha_detail["settings"]["decay"]
-            neutralization = alpha_detail["settings"]["neutralization"]
-            truncation = alpha_detail["settings"]["truncation"]
-            pasteurization = alpha_detail["settings"]["pasteurization"]
-            unitHandling = alpha_detail["settings"]["unitHandling"]
-            nanHandling = alpha_detail["settings"]["nanHandling"]
-            language = alpha_detail["settings"]["language"]
-            visualization = alpha_detail["settings"]["visualization"]
-            code = alpha_detail["regular"]["code"]
-            description = alpha_detail["regular"]["description"]
-            operatorCount = alpha_detail["regular"]["operatorCount"]
-            dateCreated = alpha_detail["dateCreated"]
-            dateSubmitted = alpha_detail["dateSubmitted"]
-            dateModified = alpha_detail["dateModified"]
-            name = alpha_detail["name"]
-            favorite = alpha_detail["favorite"]
-            hidden = alpha_detail["hidden"]
-            color = alpha_detail["color"]
-            category = alpha_detail["category"]
-            tags = alpha_detail["tags"]
-            classifications = alpha_detail["classifications"]
-            grade = alpha_detail["grade"]
-            stage = alpha_detail["stage"]
-            status = alpha_detail["status"]
-            pnl = alpha_detail["is"]["pnl"]
-            bookSize = alpha_detail["is"]["bookSize"]
-            longCount = alpha_detail["is"]["longCount"]
-            shortCount = alpha_detail["is"]["shortCount"]
-            turnover = alpha_detail["is"]["turnover"]
-            returns = alpha_detail["is"]["returns"]
-            drawdown = alpha_detail["is"]["drawdown"]
-            margin = alpha_detail["is"]["margin"]
-            fitness = alpha_detail["is"]["fitness"]
-            sharpe = alpha_detail["is"]["sharpe"]
-            startDate = alpha_detail["is"]["startDate"]
-            checks = alpha_detail["is"]["checks"]
-            os = alpha_detail["os"]
-            train = alpha_detail["train"]
-            test = alpha_detail["test"]
-            prod = alpha_detail["prod"]
-            competitions = alpha_detail["competitions"]
-            themes = alpha_detail["themes"]
-            team = alpha_detail["team"]
-            checks_df = pd.DataFrame(checks)
-            pyramids = next(
-                ([y['name'] for y in item['pyramids']] for item in checks if item['name'] == 'MATCHES_PYRAMID'), None)
-
-            if any(checks_df["result"] == "FAIL"):
-                # 最基础的项目不通过
-                set_alpha_properties(s, id, color='RED')
-                continue
-            else:
-                # 通过了最基础的项目
-                # 把全部的信息以字典的形式返回
-                rec = {"id": id, "type": type, "author": author, "instrumentType": instrumentType, "region": region,
-                       "universe": universe, "delay": delay, "decay": decay, "neutralization": neutralization,
-                       "truncation": truncation, "pasteurization": pasteurization, "unitHandling": unitHandling,
-                       "nanHandling": nanHandling, "language": language, "visualization": visualization, "code": code,
-                       "description": description, "operatorCount": operatorCount, "dateCreated": dateCreated,
-                       "dateSubmitted": dateSubmitted, "dateModified": dateModified, "name": name, "favorite": favorite,
-                       "hidden": hidden, "color": color, "category": category, "tags": tags,
-                       "classifications": classifications, "grade": grade, "stage": stage, "status": status, "pnl": pnl,
-                       "bookSize": bookSize, "longCount": longCount, "shortCount": shortCount, "turnover": turnover,
-                       "returns": returns, "drawdown": drawdown, "margin": margin, "fitness": fitness, "sharpe": sharpe,
-                       "startDate": startDate, "checks": checks, "os": os, "train": train, "test": test, "prod": prod,
-                       "competitions": competitions, "themes": themes, "team": team, "pyramids": pyramids}
-                check_alphas.append(rec)
         output_dict = {"check": check_alphas}
 
-    # 超过了限制
-    if usage == 'submit' and count >= 9900:
-        if len(output_dict['check']) < len(alpha_list):
-            # 那么就再来一遍
-            output_dict = get_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortCount_th,
-                                     region, universe, delay, instrumentType, alpha_num, usage, tag, color_exclude)
-        else:
-            raise Exception("Too many alphas to check!! over 10000, universe: %s, region: %s" % (universe, region))
-
     return output_dict
 
 
@@ -701,9 +646,8 @@ async def simulate_single(session_manager, alpha_expression, region_info, name,
     单次模拟一个alpha表达式对应的某个地区的信息
     """
     async with semaphore:
-        # 每个任务在执行前都检查会话时间
-        if time.time() - session_manager.start_time > session_manager.expiry_time:
-            await session_manager.refresh_session()
+        # 每个任务在执行前都检查会话时间（快过期时后台提前刷新，已过期时等待唯一的一次登录）
+        await session_manager.get_session()
 
         region, uni = region_info
         alpha = "%s" % (alpha_expression)
@@ -848,31 +792,48 @@ async def async_set_alpha_properties(
 
 
 
-class SessionManager:
+class SessionManager(AsyncAuthManager):
+    """
+    异步会话管理（单飞登录，见 auth_manager.py）：过期前在后台提前刷新，
+    刷新只替换 cookie，不关闭正在被其它协程使用的会话。
+    """
     def __init__(self, session, start_time, expiry_time):
+        super().__init__(async_login, expiry=expiry_time, name='SessionManager')
         self.session = session
-        self.start_time = start_time
-        self.expiry_time = expiry_time
+        self.login_time = start_time
+
+    @property
+    def start_time(self):
+        return self.login_time
+
+    @property
+    def expiry_time(self):
+        return self.expiry
 
     async def refresh_session(self):
         print(datetime.now(),"Session expired, logging in again...")
-        await self.session.close()
-        self.session = await async_login()
-        self.start_time = time.time()
+        await self.refresh(self.generation)
 
 
 async def simulate_multi(session_manager, alpha_expression_list: list, region_info, name, neut, decay, delay, stone_bag,
 
-                         tags=['None'], semaphore=None):
+                         tags=['None'], semaphore=None, max_retries=5, property_queue=None,
+                         fetch_semaphore=None, record_writer=None):
     """
     单次模拟一个alpha表达式对应的某个地区的信息
+
+    max_retries 为提交失败时在本函数内的重试次数；由重试调度器驱动时传 1，
+    失败直接返回 1，交给调度器按退避时间重新排队，不在持有信号量时 sleep。
+    传入 property_queue（见 property_queue.py）时子 alpha 的属性更新放进后台队列，不在这里等待 PATCH。
+
+    semaphore 只在提交和等待模拟完成期间持有；之后子 alpha 的获取/属性更新用 asyncio.gather 并发，
+    受 fetch_semaphore（各 pool 共享）限制，表达式交给 record_writer（RecordWriter）统一写文件。
     """
     brain_api_url = 'https://api.worldquantbrain.com'
 
     async with semaphore:
-        # 每个任务在执行前都检查会话时间
-        if time.time() - session_manager.start_time > session_manager.expiry_time:
-            await session_manager.refresh_session()
+        # 每个任务在执行前都检查会话时间（快过期时后台提前刷新，已过期时等待唯一的一次登录）
+        await session_manager.get_session()
 
         if len(alpha_expression_list) > 10:
             raise ValueError("The number of alpha expressions in a pool should be less than 10")
@@ -907,7 +868,6 @@ async def simulate_multi(session_manager, alpha_expression_list: list, region_in
             sim_data_list.append(simulation_data)
 
         # 一次性提交10个alpha作为单个task
-        max_retries = 5  # 最大重试次数
         retry_count = 0
         while retry_count < max_retries:
             try:
@@ -977,34 +937,104 @@ async def simulate_multi(session_manager, alpha_expression_list: list, region_in
                     return 2  # 新增错误码
                 await asyncio.sleep(30)  # 平方退避
 
-        # alpha_id = simulation_progress.json()["alpha"]
-        children_list = []
-        for child in children:
-            try:
-                async with session_manager.session.get(brain_api_url + "/simulations/" + child) as child_progress:
-                    json_data = await child_progress.json()
-                    alpha_id = json_data["alpha"]
-                    alpha_express = json_data["regular"]
-
-                    await async_set_alpha_properties(session_manager.session,
-                                                     alpha_id,
-                                                     name="%s" % name,
-                                                     description="""Idea: 11111111111111111111111111111111.
+    # 模拟已完成，信号量（模拟名额）已释放；子 alpha 的后续处理并发进行，只受 fetch_semaphore 限制
+    if fetch_semaphore is None:
+        fetch_semaphore = asyncio.Semaphore(len(children) or 1)
+    record_path = f'records/{name}_simulated_alpha_expression.txt'
+    results = await asyncio.gather(*(_process_child(session_manager, child, name, tags, fetch_semaphore,
+                                                    property_queue) for child in children))
+    alpha_expressions = [alpha_express for alpha_express in results if alpha_express is not None]
+    # 将alpha保存到文件
+    if record_writer is not None:
+        for alpha_express in alpha_expressions:
+            record_writer.write(record_path, alpha_express)
+    elif alpha_expressions:
+        async with aiofiles.open(record_path, mode='a') as f:
+            await f.write(''.join(alpha_express + '\n' for alpha_express in alpha_expressions))
+
+    return 0
+
+
+async def _process_child(session_manager, child, name, tags, fetch_semaphore, property_queue=None):
+    """获取一个子模拟的 alpha 并设置属性，返回表达式；失败返回 None"""
+    child_url = "https://api.worldquantbrain.com/simulations/" + child
+    try:
+        async with fetch_semaphore:
+            async with session_manager.session.get(child_url) as child_progress:
+                json_data = await child_progress.json()
+            alpha_id = json_data["alpha"]
+            alpha_express = json_data["regular"]
+
+            description = """Idea: 11111111111111111111111111111111.
 Rationale for data used: 22222222222222222222222222222222222222.
-Rationale for operators used: 33333333333333333333333333333333333333.""",
-                                                     color=None,
-                                                     tags=tags)
+Rationale for operators used: 33333333333333333333333333333333333333."""
+            if property_queue is not None:
+                property_queue.update(alpha_id, build_params(name="%s" % name, description=description,
+                                                             tags=tags))
+            else:
+                await async_set_alpha_properties(session_manager.session,
+                                                 alpha_id,
+                                                 name="%s" % name,
+                                                 description=description,
+                                                 color=None,
+                                                 tags=tags)
+        return alpha_express
+
+    except KeyError:
+        print(datetime.now(),"Failed to retrieve alpha ID for: {}".format(child_url))
+    except Exception as e:
+        print(datetime.now(),"An error occurred while setting alpha properties:" + str(e))
+    return None
 
-                    # 将alpha保存到文件
-                    async with aiofiles.open(f'records/{name}_simulated_alpha_expression.txt', mode='a') as f:
-                        await f.write(alpha_express + '\n')
 
-            except KeyError:
-                print(datetime.now(),"Failed to retrieve alpha ID for: {}".format(brain_api_url + "/simulations/" + child))
-            except Exception as e:
-                print(datetime.now(),"An error occurred while setting alpha properties:" + str(e))
+class RecordWriter:
+    """
+    records 文件的缓冲写入任务
+
+    simulate_multi 的各个子 alpha 不再各自打开文件追加，而是把行放进队列，
+    由单个协程按文件分组批量写入，关闭时写完剩余的行。
+    """
+
+    def __init__(self, flush_interval=1.0):
+        self.flush_interval = flush_interval
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def write(self, path, line):
+        self._queue.put_nowait((path, line))
+
+    async def _run(self):
+        closing = False
+        while not closing:
+            batch = [await self._queue.get()]
+            await asyncio.sleep(self.flush_interval)
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            lines = defaultdict(list)
+            for item in batch:
+                if item is None:
+                    closing = True
+                else:
+                    lines[item[0]].append(item[1])
+            for path, path_lines in lines.items():
+                try:
+                    async with aiofiles.open(path, mode='a') as f:
+                        await f.write(''.join(line + '\n' for line in path_lines))
+                except Exception as e:
+                    print(datetime.now(),f"Failed to write {len(path_lines)} records to {path}: {e}")
+
+    async def close(self):
+        """写完队列中剩余的行并结束写入任务"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
 
-        return 0
 
 def prune(next_alpha_recs, prefix, keep_num):
     output = []
@@ -1041,23 +1071,43 @@ async def simulate_multiple_tasks(alpha_list, region_list, decay_list, delay_lis
     decay_chunks = [decay_list[i:i + chunk_size] for i in range(0, len(decay_list), chunk_size)]
     delay_chunks = [delay_list[i:i + chunk_size] for i in range(0, len(delay_list), chunk_size)]
 
-    for i, (alpha_chunks, region_chunk, decay_chunk, delay_chunk) in enumerate(
-            zip(task_chunks, region_chunks, decay_chunks, delay_chunks)):
-        # 获取当前 chunk 对应的 session_manager
-        current_session_manager = session_manager
-        for alpha_chunk, region, decay, delay in zip(alpha_chunks, region_chunk, decay_chunk, delay_chunk):
-            # 将任务与当前的 session_manager 关联
-            task = simulate_multi(current_session_manager, alpha_chunk, region, name, neut, decay, delay, stone_bag,
-                                  tags, semaphore)
-            tasks.append(task)
+    pools = []
+    for alpha_chunks, region_chunk, decay_chunk, delay_chunk in zip(task_chunks, region_chunks, decay_chunks,
+                                                                    delay_chunks):
+        pools.extend(zip(alpha_chunks, region_chunk, decay_chunk, delay_chunk))
+
+    # 子 alpha 的属性更新合并后在后台发送（PATCH 经当前事件循环里的 aiohttp 会话发出）
+    property_queue = PropertyUpdateQueue(aiohttp_sender(lambda: session_manager.session, asyncio.get_running_loop()))
+    # 模拟完成后子 alpha 的获取共用一个限流，表达式由单个任务缓冲写入 records
+    fetch_semaphore = asyncio.Semaphore(n)
+    record_writer = RecordWriter().start()
+
+    # 提交失败的 pool 放进重试调度器，按抖动指数退避重新排队，不阻塞其它 pool
+    scheduler = RetryScheduler(base_delay=60, max_delay=15 * 60, max_attempts=4)
+    for pool_idx in range(len(pools)):
+        scheduler.push(pool_idx)
+
+    async def _run_pool(pool_idx, attempts):
+        alpha_chunk, region, decay, delay = pools[pool_idx]
+        code = await simulate_multi(session_manager, alpha_chunk, region, name, neut, decay, delay, stone_bag,
+                                    tags, semaphore, max_retries=1, property_queue=property_queue,
+                                    fetch_semaphore=fetch_semaphore, record_writer=record_writer)
+        if code == 1:
+            raise RetryLater("simulation submit failed")
+        return code
 
     try:
-        await asyncio.wait_for(asyncio.gather(*tasks), timeout=6*60*60)  # 改为6小时与注释一致
+        await asyncio.wait_for(drain_async(scheduler, _run_pool, concurrency=n), timeout=6*60*60)  # 改为6小时与注释一致
     except asyncio.TimeoutError:
         print(datetime.now(),"Task group timed out after 6 hours")
     finally:  # 添加finally块确保资源释放
+        for pool_idx, attempts, reason in scheduler.dead_letters:
+            print(datetime.now(),f"Pool dropped after {attempts} retries ({reason}): {pools[pool_idx][0]}")
+        # 关闭会话前发出所有排队中的属性更新（在线程里等待，事件循环继续执行 PATCH）
+        await asyncio.to_thread(property_queue.close)
+        await record_writer.close()
         try:
-            await session_manager.session.close()
+            await session_manager.close()
         except Exception as e:
             print(datetime.now(),f"Error closing session: {str(e)}")
 
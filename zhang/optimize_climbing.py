@@ -17,6 +17,14 @@ import smtplib
 from email.mime.text import MIMEText
 from email.header import Header
 
+from sc_engine import NeighborReport, get_engine, pnl_to_rets
+from sc_service import ALL_REGIONS
+from result_cache import get_result_cache, os_pool_watermark
+from property_queue import PropertyUpdateQueue
+from retry_scheduler import RetryLater
+from auth_manager import AuthManager
+from brain_transport import new_session
+
 # ==================== 用户配置区域 ====================
 # 运行模式配置
 # RUN_MODE = 1: 重新开始，删除旧的日志和检查点文件
@@ -47,6 +55,10 @@ print(f"📧 邮件通知功能: {'已启用' if EMAIL_CONFIG.get('enabled') els
 # 最大并发数设置（卡槽数量）
 MAX_CONCURRENT = 8
 
+# 坐标搜索同时推进的位置数：按当前最优公式一次生成这几个位置的候选并发回测，按位置顺序判定上位；
+# 某个位置上位后，后面位置的候选作废并按新公式重新生成（设为 1 即逐个位置推进）
+POSITION_WINDOW = 3
+
 # 爬山起始位置配置
 START_OPTIMIZATION_FROM = {
     'data_field': 0,
@@ -72,6 +84,12 @@ CANDIDATE_DECAYS = [0, 1, 4, 16, 64, 128, 256, 512]
 MARGIN_THRESHOLD = 0.000
 SC_CUTOFF = 0.7
 
+# 本地 SC 低秩预筛选（见 sc_engine.py），OS 池较小时自动退化为全量精确计算
+SC_PREFILTER = True
+SC_PREFILTER_METHOD = 'pca'  # 'pca' 或 'random'
+SC_PREFILTER_RANK = 32
+SC_PREFILTER_TOP_K = 20
+
 # 运算符池分类
 OPERATOR_GROUPS = {
     'group': [
@@ -192,14 +210,23 @@ class BrainClient:
 
     def __init__(self, alpha_id=None):
         self.alpha_id = alpha_id
-        self.auth_lock = threading.Lock()
         self.stop_requested = False
         signal.signal(signal.SIGINT, self._signal_handler)
         
-        self.sess = self._sign_in()
+        # 单飞登录（见 auth_manager.py）：并发 401 只重新登录一次，cookie 替换进 self.sess，快过期时提前刷新
+        self.auth = AuthManager(self._sign_in, name='BrainClient')
+        self.sess = self.auth.get_session()
+        if self.sess is None:
+            raise Exception("登录失败：已达到最大重试次数")
         self.history = self._load_history()
         self.dataset_cache = self._load_dataset_cache()
-        self.last_auth_time = time.time()
+        # 每个候选的 top-k 相关邻居，运行结束时落盘一次
+        self.neighbor_report = NeighborReport(top_k=10)
+        # PC / SC 结果缓存（见 result_cache.py），OS 池水位在同步 OS 列表后更新
+        self.result_cache = get_result_cache()
+        self.os_watermark = None
+        # name / color 更新的后台合并队列，运行结束时 flush
+        self.property_queue = PropertyUpdateQueue(self._patch_alpha)
 
     def _sign_in(self):
         cred_path = 'brain_credentials.txt'
@@ -212,8 +239,7 @@ class BrainClient:
             print(f"❌ 读取凭据失败: {e}")
             raise
 
-        sess = requests.Session()
-        sess.auth = HTTPBasicAuth(username, password)
+        sess = new_session(auth=HTTPBasicAuth(username, password))  # 带连接池和 gzip（见 brain_transport.py）
         for attempt in range(5):
             try:
                 print(f"📡 正在向 API 发送登录请求 (第 {attempt+1}/5 次)...")
@@ -262,10 +288,11 @@ class BrainClient:
 
         for attempt in range(max_retries):
             try:
-                resp = getattr(self.sess, method)(url, **kwargs)
+                generation = self.auth.generation
+                resp = getattr(self.auth.get_session(), method)(url, **kwargs)
                 if resp.status_code == 401:
                     logging.warning(f"请求返回 401，尝试重新登录...")
-                    self.sess = self._sign_in()
+                    self.auth.refresh(generation)
                     continue
                 return resp
             except Exception as e:
@@ -502,30 +529,27 @@ class BrainClient:
             return False
 
     def set_alpha_color(self, alpha_id, color):
-        """设置 Alpha 颜色"""
-        url = f'https://api.worldquantbrain.com/alphas/{alpha_id}'
-        try:
-            self._make_request_with_retry('patch', url, json={'color': color})
-        except Exception as e:
-            logging.warning(f"设置颜色失败: {e}")
+        """设置 Alpha 颜色（放进后台更新队列，与同一 Alpha 的其它字段合并发送）"""
+        self.property_queue.update(alpha_id, {'color': color})
 
     def set_alpha_name(self, alpha_id, name):
-        """设置 Alpha 名称"""
-        url = f'https://api.worldquantbrain.com/alphas/{alpha_id}'
-        try:
-            self._make_request_with_retry('patch', url, json={'name': name})
-        except Exception as e:
-            logging.warning(f"设置名称失败: {e}")
+        """设置 Alpha 名称（放进后台更新队列，与同一 Alpha 的其它字段合并发送）"""
+        self.property_queue.update(alpha_id, {'name': name})
 
     def get_product_correlation(self, alpha_id, max_attempts=40):
         """获取 Alpha 的 Product Correlation (PC) - 强力取回版"""
         url = f"https://api.worldquantbrain.com/alphas/{alpha_id}/correlations/prod"
+        cached = self.result_cache.get(alpha_id, 'prod') if self.result_cache else None
+        if cached is not None:
+            return float(cached)
         for i in range(max_attempts):
             try:
                 resp = self._make_request_with_retry('get', url, timeout=15)
                 if resp and resp.status_code == 200:
                     data = resp.json()
                     if "max" in data:
+                        if self.result_cache and data["max"] is not None:
+                            self.result_cache.set(alpha_id, 'prod', float(data["max"]))
                         return float(data["max"])
                 elif resp and resp.status_code == 404:
                     pass
@@ -589,6 +613,7 @@ class BrainClient:
             return pd.DataFrame()
 
         server_ids = [a['id'] for a in all_os_alphas]
+        self.os_watermark = os_pool_watermark(server_ids)
         print(f"✅ 列表同步完成！服务器共有 {len(server_ids)} 个 OS Alpha。")
 
         # --- 增量逻辑开始 ---
@@ -649,6 +674,14 @@ class BrainClient:
         
         new_pnl = self.get_alpha_pnl_df(alpha_id)
         if new_pnl is None: return None
+
+        if SC_PREFILTER:
+            # 低秩预筛选：OS 池只准备一次，每个候选只对可能超过 SC_CUTOFF 的 Alpha 做精确计算
+            engine = get_engine(os_pool, key='os_pool', prepare=pnl_to_rets, cutoff=SC_CUTOFF,
+                                method=SC_PREFILTER_METHOD, rank=SC_PREFILTER_RANK, top_k=SC_PREFILTER_TOP_K)
+            corr = engine.query(new_pnl[alpha_id].ffill().diff(), exclude=alpha_id)
+            self.neighbor_report.add(alpha_id, ALL_REGIONS, corr)
+            return float(corr.iloc[0]) if len(corr) > 0 else 0.0
         
         # 对齐数据：取最近 4 年数据 (参考 C3 逻辑)
         combined = pd.concat([os_pool, new_pnl], axis=1)
@@ -665,34 +698,46 @@ class BrainClient:
         if alpha_id in corr_matrix.columns:
             # 提取该 Alpha 与池中其他 Alpha 的相关性
             sc_series = corr_matrix[alpha_id].drop(alpha_id)
+            self.neighbor_report.add(alpha_id, ALL_REGIONS, sc_series.dropna().sort_values(ascending=False))
             return float(sc_series.max())
         return 0.0
 
-    def set_alpha_color(self, alpha_id, color):
-        """设置 Alpha 颜色"""
+    def _patch_alpha(self, alpha_id, params):
+        """属性更新队列的发送函数：一个 alpha 的合并字段只发一个 PATCH"""
         url = f'https://api.worldquantbrain.com/alphas/{alpha_id}'
-        try:
-            self._make_request_with_retry('patch', url, json={'color': color})
-        except Exception as e:
-            logging.warning(f"设置颜色失败: {e}")
+        resp = self._make_request_with_retry('patch', url, json=params)
+        if resp is None:
+            raise RetryLater("request failed")
+        if resp.status_code == 429 or resp.headers.get('Retry-After'):
+            retry_after = resp.headers.get('Retry-After')
+            raise RetryLater("rate limited", delay=float(retry_after) if retry_after else None)
+        if resp.status_code >= 400:
+            logging.warning(f"设置属性失败: Alpha {alpha_id} | 状态码: {resp.status_code} | 字段: {params}")
+            return False
+        return True
+
+    def set_alpha_color(self, alpha_id, color):
+        """设置 Alpha 颜色（放进后台更新队列，与同一 Alpha 的其它字段合并发送）"""
+        self.property_queue.update(alpha_id, {'color': color})
 
     def set_alpha_name(self, alpha_id, name):
-        """设置 Alpha 名称"""
-        url = f'https://api.worldquantbrain.com/alphas/{alpha_id}'
-        try:
-            self._make_request_with_retry('patch', url, json={'name': name})
-        except Exception as e:
-            logging.warning(f"设置名称失败: {e}")
+        """设置 Alpha 名称（放进后台更新队列，与同一 Alpha 的其它字段合并发送）"""
+        self.property_queue.update(alpha_id, {'name': name})
 
     def get_product_correlation(self, alpha_id, max_attempts=40):
         """获取 Alpha 的 Product Correlation (PC) - 强力取回版"""
         url = f"https://api.worldquantbrain.com/alphas/{alpha_id}/correlations/prod"
+        cached = self.result_cache.get(alpha_id, 'prod') if self.result_cache else None
+        if cached is not None:
+            return float(cached)
         for i in range(max_attempts):
             try:
                 resp = self._make_request_with_retry('get', url, timeout=15)
                 if resp and resp.status_code == 200:
                     data = resp.json()
                     if "max" in data:
+                        if self.result_cache and data["max"] is not None:
+                            self.result_cache.set(alpha_id, 'prod', float(data["max"]))
                         return float(data["max"])
                 elif resp and resp.status_code == 404:
                     pass
@@ -708,12 +753,17 @@ class BrainClient:
     def get_self_correlation(self, alpha_id, max_attempts=20):
         """获取 Alpha 的 Self Correlation (SC) - 强力取回版"""
         url = f"https://api.worldquantbrain.com/alphas/{alpha_id}/correlations/self"
+        cached = self.result_cache.get(alpha_id, 'self', self.os_watermark) if self.result_cache else None
+        if cached is not None:
+            return float(cached)
         for i in range(max_attempts):
             try:
                 resp = self._make_request_with_retry('get', url, timeout=15)
                 if resp and resp.status_code == 200:
                     data = resp.json()
                     if "max" in data:
+                        if self.result_cache and data["max"] is not None:
+                            self.result_cache.set(alpha_id, 'self', float(data["max"]), self.os_watermark)
                         return float(data["max"])
             except: pass
             time.sleep(30)
@@ -958,6 +1008,52 @@ class SmartExpression:
         return list(set(results))
 
 
+class SimSlots:
+    """
+    模拟槽位 (所有批次共用，合计在跑的模拟不超过 total)
+
+    并行坐标搜索时，正在做上位判定的位置 (提交位置) 的候选优先：窗口里后面位置的预跑候选
+    至少给它留 reserved 个槽位，并且只在提交位置没有候选排队时才能拿槽位，预跑不会拖慢关键路径。
+    position 为 None (不在窗口里的普通回测) 或提交位置未设置时，与普通信号量一样。
+    """
+
+    def __init__(self, total, reserved=1):
+        self.cond = threading.Condition()
+        self.free = total
+        self.reserved = reserved
+        self.committing = None
+        self.waiting = []  # 排队中的候选所属位置
+
+    def _is_critical(self, position):
+        return position is None or self.committing is None or position <= self.committing
+
+    def set_committing(self, position):
+        """切换提交位置 (None 表示当前没有窗口)，排队中的候选按新的提交位置重新判断优先级"""
+        with self.cond:
+            self.committing = position
+            self.cond.notify_all()
+
+    def acquire(self, position=None):
+        with self.cond:
+            self.waiting.append(position)
+            try:
+                while True:
+                    if self._is_critical(position):
+                        if self.free > 0:
+                            break
+                    elif self.free > self.reserved and not any(self._is_critical(p) for p in self.waiting):
+                        break
+                    self.cond.wait()
+            finally:
+                self.waiting.remove(position)
+            self.free -= 1
+
+    def release(self):
+        with self.cond:
+            self.free += 1
+            self.cond.notify_all()
+
+
 class AsyncOptimizer:
     def _signal_handler(self, signum, frame):
         logging.info("\n🛑 收到中断信号！正在完成当前 Alpha 的收尾工作 (染色/改名/存档)，请稍候...")
@@ -965,8 +1061,9 @@ class AsyncOptimizer:
 
     def __init__(self, alpha_id=None):
         self.alpha_id = alpha_id
-        self.auth_lock = threading.Lock() # 添加登录锁
         self.score_lock = threading.Lock() # 恢复分数锁
+        self.sim_slots = SimSlots(MAX_CONCURRENT) # 模拟槽位 (所有批次共用，提交位置优先)
+        self.submit_lock = threading.Lock() # 错开提交时间
         self.stop_requested = False # 优雅退出标志位
         
         # 注册信号处理器 (防止重复注册或报错)
@@ -1127,8 +1224,11 @@ class AsyncOptimizer:
 
 
 
-    def evaluate_batch(self, expr_list, settings=None):
-        """同步批处理评估 (修复：将 Settings 纳入缓存键)"""
+    def evaluate_batch(self, expr_list, settings=None, cancelled=None, position=None):
+        """
+        同步批处理评估 (修复：将 Settings 纳入缓存键)；cancelled (threading.Event) 置位后尚未提交的不再提交，
+        position 为并行坐标搜索中候选所属的位置 (决定槽位优先级，见 SimSlots)
+        """
         if settings is None:
             settings = self.settings
 
@@ -1153,56 +1253,63 @@ class AsyncOptimizer:
         if not to_run: return results
 
         logging.info(f"并发提交 {len(to_run)} 个模拟 (设置: {settings.get('neutralization', 'NONE')}/{settings.get('decay', 0)})...")
-        futures = {}
-        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT) as executor:
-            for expr in to_run:
-                # 增加延迟，防止提交太快触发 429
-                time.sleep(random.uniform(1.1, 2.1))
-                sim_data = {'type': 'REGULAR', 'settings': settings, 'regular': expr}
-                futures[executor.submit(self.client.submit_simulation, sim_data)] = expr
-
-        loc_map = {}
-        for f in as_completed(futures):
-            expr = futures[f]
-            try:
-                loc = f.result()
-                if loc:
-                    loc_map[loc] = expr
-                    logging.info(f"  -> 已提交: {loc}")
-                    logging.info(f"     [公式]: {expr}")
-                else:
-                    results[expr] = {'score': 0, 'url': 'Submission Failed'}
-            except Exception as e:
-                logging.warning(f"提交异常: {e}")
-
-        wait_futures = {}
         completed_count = 0
-        total_tasks = len(loc_map)
+        total_tasks = len(to_run)
 
+        # 每个模拟 提交->等待 占用一个槽位，完成即让出，不必等整批都提交完才开始等待
         with ThreadPoolExecutor(max_workers=MAX_CONCURRENT) as executor:
-            for loc, expr in loc_map.items():
-                wait_futures[executor.submit(self.client.wait_for_simulation, loc)] = (expr, loc)
-
-        for f in as_completed(wait_futures):
-            expr, loc = wait_futures[f]
-            try:
-                res = f.result()
-                # 如果结果为空，尝试最后一次抢救性查询
-                if not res:
-                    logging.warning(f"  ⚠️ [结果丢失] {loc} 返回 None，尝试最后一次查询...")
-                    time.sleep(2)
-                    res = self.client.wait_for_simulation(loc)
+            futures = {executor.submit(self._simulate, expr, settings, cancelled, position): expr for expr in to_run}
+            for f in as_completed(futures):
+                expr = futures[f]
+                try:
+                    loc, res = f.result()
+                    if not loc:
+                        # 已作废的批次不提交，也不记结果
+                        if cancelled is None or not cancelled.is_set():
+                            results[expr] = {'score': 0, 'url': 'Submission Failed'}
+                        continue
 
-                # 将结果存入字典，并由 _process_result 内部处理反转
-                self._process_result(res, expr, loc, results, settings)
+                    # 将结果存入字典，并由 _process_result 内部处理反转
+                    self._process_result(res, expr, loc, results, settings)
 
-                completed_count += 1
-                logging.info(f"   [进度] {completed_count}/{total_tasks} 批次任务已完成")
-            except Exception as e:
-                logging.warning(f"获取结果异常: {e}")
+                    completed_count += 1
+                    logging.info(f"   [进度] {completed_count}/{total_tasks} 批次任务已完成")
+                except Exception as e:
+                    logging.warning(f"获取结果异常: {e}")
 
         return results
 
+    def _simulate(self, expr, settings, cancelled=None, position=None):
+        """
+        提交并等待单个模拟，返回 (location, 结果)；提交失败或批次已作废时返回 (None, None)
+
+        整个过程占用一个模拟槽位：所有批次（包括并行推进的多个位置）合计在跑的模拟不超过 MAX_CONCURRENT，
+        提交位置的候选优先拿槽位。
+        """
+        self.sim_slots.acquire(position)
+        try:
+            if cancelled is not None and cancelled.is_set():
+                return None, None
+            # 增加延迟，防止提交太快触发 429 (全局错开，而不是每个线程各自等待)
+            with self.submit_lock:
+                time.sleep(random.uniform(1.1, 2.1))
+            sim_data = {'type': 'REGULAR', 'settings': settings, 'regular': expr}
+            loc = self.client.submit_simulation(sim_data)
+            if not loc:
+                return None, None
+            logging.info(f"  -> 已提交: {loc}")
+            logging.info(f"     [公式]: {expr}")
+
+            res = self.client.wait_for_simulation(loc)
+            # 如果结果为空，尝试最后一次抢救性查询
+            if not res:
+                logging.warning(f"  ⚠️ [结果丢失] {loc} 返回 None，尝试最后一次查询...")
+                time.sleep(2)
+                res = self.client.wait_for_simulation(loc)
+            return loc, res
+        finally:
+            self.sim_slots.release()
+
     def _process_result(self, res, expr, location, results_dict=None, settings=None):
         """处理单个结果"""
         current_settings = settings if settings is not None else self.settings
@@ -1403,12 +1510,10 @@ class AsyncOptimizer:
                         logging.info(f"   [取反跳过] 反转公式已在历史缓存中: {rev_expr}")
                     else:
                         logging.info(f"[反转] Sharpe ({sharpe:.2f}) < -1.2，正同步回测取反表达式: {rev_expr}")
-                        rev_sim_data = {'type': 'REGULAR', 'settings': current_settings, 'regular': rev_expr}
                         try:
-                            rev_loc = self.client.submit_simulation(rev_sim_data)
+                            # 同步等待反转结果 (同样占用模拟槽位)
+                            rev_loc, rev_res = self._simulate(rev_expr, current_settings)
                             if rev_loc:
-                                # 同步等待反转结果
-                                rev_res = self.client.wait_for_simulation(rev_loc)
                                 # 递归调用处理反转结果并填入字典
                                 self._process_result(rev_res, rev_expr, rev_loc, results_dict, current_settings)
                             else:
@@ -1643,13 +1748,7 @@ class AsyncOptimizer:
         n_data = len([t for t in parser.tokens if t['type'] == 'data_field'])
         if self.current_position['data_field'] < n_data:
             logging.info(f">>> 开始优化数据字段 (共 {n_data} 个位置)")
-            for i in range(self.current_position['data_field'], n_data):
-                if self.stop_requested: 
-                    logging.info("🛑 [外层中断] 停止优化数据字段")
-                    break
-                self._optimize_step(parser, 'data_field', i, alpha_id)
-                self.current_position['data_field'] = i + 1
-                self.save_checkpoint(alpha_id)
+            self._optimize_positions('data_field', '数据字段', n_data, alpha_id)
         
         # 2. 优化数值 (Number/TimeWindow - 回归 v4.4 稳健顺序)
         parser = SmartExpression(self.best_expr, self.settings, self.client)
@@ -1660,40 +1759,22 @@ class AsyncOptimizer:
         
         if self.current_position['number'] < n_nums:
             logging.info(f">>> 开始按顺序优化所有数值位置 (共 {n_nums} 个)")
-            for i in range(self.current_position['number'], n_nums):
-                if self.stop_requested: 
-                    logging.info("🛑 [外层中断] 停止优化数值位置")
-                    break
-                # 注意：统一使用 'number' 类型调用步进优化，generate_neighbors 内部会自适应处理
-                self._optimize_step(parser, 'number', i, alpha_id)
-                self.current_position['number'] = i + 1
-                self.save_checkpoint(alpha_id)
+            # 注意：统一使用 'number' 类型调用步进优化，generate_neighbors 内部会自适应处理
+            self._optimize_positions('number', '数值位置', n_nums, alpha_id)
 
         # 4. 优化分组 (Group)
         parser = SmartExpression(self.best_expr, self.settings, self.client)
         n_groups = len([t for t in parser.tokens if t['type'] == 'group'])
         if self.current_position['group'] < n_groups:
             logging.info(f">>> 开始优化分组 (共 {n_groups} 个位置)")
-            for i in range(self.current_position['group'], n_groups):
-                if self.stop_requested: 
-                    logging.info("🛑 [外层中断] 停止优化分组")
-                    break
-                self._optimize_step(parser, 'group', i, alpha_id)
-                self.current_position['group'] = i + 1
-                self.save_checkpoint(alpha_id)
+            self._optimize_positions('group', '分组', n_groups, alpha_id)
 
         # 5. 优化运算符 (Operator)
         parser = SmartExpression(self.best_expr, self.settings, self.client)
         n_ops = len([t for t in parser.tokens if t['type'] == 'operator'])
         if self.current_position['operator'] < n_ops:
             logging.info(f">>> 开始优化运算符 (共 {n_ops} 个位置)")
-            for i in range(self.current_position['operator'], n_ops):
-                if self.stop_requested: 
-                    logging.info("🛑 [外层中断] 停止优化运算符")
-                    break
-                self._optimize_step(parser, 'operator', i, alpha_id)
-                self.current_position['operator'] = i + 1
-                self.save_checkpoint(alpha_id)
+            self._optimize_positions('operator', '运算符', n_ops, alpha_id)
 
         # 优化 neutralization 参数
         if not self.stop_requested:
@@ -1772,15 +1853,52 @@ class AsyncOptimizer:
 """
             send_qq_email(subject, content)
 
-    def _optimize_step(self, parser, type_name, index, alpha_id):
-        """同步优化单个步骤 (恢复 v4.3 逻辑)"""
-        start_step_score = self.best_score
-
-        if self.best_expr != parser.original_expr:
-            parser = SmartExpression(self.best_expr, self.settings, self.client)
+    def _optimize_positions(self, type_name, label, count, alpha_id):
+        """
+        并行坐标搜索：从 current_position[type_name] 开始依次优化到第 count 个位置
+
+        按当前最优公式一次生成 POSITION_WINDOW 个位置的候选，所有批次交给同一个线程池并发回测
+        （共用 MAX_CONCURRENT 个模拟槽位，正在判定的位置优先，后面位置的候选至少给它留一个槽位；
+        前一个位置的小批次收尾时，空出的槽位由后面位置的候选补上），
+        批次最优候选的 PC 在回测线程里预取。上位判定仍按 位置 -> 批次 的顺序逐个进行，
+        同样的回测结果下与逐个位置推进一致：某个位置上位后，后面位置的候选是按旧公式生成的，
+        全部作废（尚未提交的不再提交），从下一个位置按新公式重新生成。
+        """
+        while self.current_position[type_name] < count:
+            if self.stop_requested:
+                logging.info(f"🛑 [外层中断] 停止优化{label}")
+                break
 
+            start = self.current_position[type_name]
+            base_expr = self.best_expr
+            parser = SmartExpression(base_expr, self.settings, self.client)
+            cancelled = threading.Event()
+            executor = ThreadPoolExecutor(max_workers=POSITION_WINDOW)
+            try:
+                self.sim_slots.set_committing(start)
+                plans = []
+                for index in range(start, min(start + POSITION_WINDOW, count)):
+                    start_batch = self.current_position.get('batch_offset', 0) if index == start else 0
+                    batches = [(offset, batch, batch_label, executor.submit(self._evaluate_candidates, batch, cancelled, index))
+                               for offset, batch, batch_label in self._plan_position(parser, type_name, index, start_batch)]
+                    plans.append((index, batches))
+
+                for index, batches in plans:
+                    if self.best_expr != base_expr:
+                        logging.info(f"  > 最优公式已更新，{type_name} 第 {index + 1} 个位置起按新公式重新生成候选")
+                        break
+                    self.sim_slots.set_committing(index)
+                    self._commit_position(type_name, index, batches, alpha_id, cancelled)
+            finally:
+                # 作废本窗口剩余的批次：已在跑的模拟跑完即止 (结果仍进历史缓存)
+                cancelled.set()
+                self.sim_slots.set_committing(None)
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _plan_position(self, parser, type_name, index, start_batch=0):
+        """生成单个位置的候选并切分批次，返回 [(offset, batch, 批次标签)]"""
         neighbors = parser.generate_neighbors(type_name, index)
-        if not neighbors: return
+        if not neighbors: return []
 
         logging.info(
             f"正在优化 {type_name} 第 {index + 1} 个位置，共 {len(neighbors)} 个候选项... (当前基准: {self.best_score:.4f})")
@@ -1795,131 +1913,178 @@ class AsyncOptimizer:
             current_batch_size = min(len(neighbors), 16)
             logging.info(f"  > 策略优化：针对 {type_name} 或小样本，将批量提交测试 (Size: {current_batch_size})...")
 
-        # 从检查点中存储的批次偏移量开始处理
-        start_batch = self.current_position.get('batch_offset', 0)
+        total_batches = (len(neighbors) - 1) // current_batch_size + 1
+        return [(i, neighbors[i:i + current_batch_size], f"{i // current_batch_size + 1}/{total_batches}")
+                for i in range(start_batch, len(neighbors), current_batch_size)]
 
-        for i in range(start_batch, len(neighbors), current_batch_size):
-            batch = neighbors[i:i + current_batch_size]
-            batch_index = i // current_batch_size + 1
-            total_batches = (len(neighbors) - 1) // current_batch_size + 1
-            logging.info(f"  > 处理批次 {batch_index}/{total_batches} (本批 {len(batch)} 个)... [位置: {type_name} 第 {index + 1} 个]")
+    def _best_in_batch(self, batch, results):
+        """
+        本批次中的最优解 (优先级: Pass且低SC > Pass且高SC > Fail，同级比分)
+        按批次顺序比较 (取反公式紧跟原公式)，同分时的取舍与完成顺序无关
+        """
+        ordered = []
+        for expr in batch:
+            for candidate in (expr, f"-1 * ({expr})"):
+                if candidate in results and candidate not in ordered:
+                    ordered.append(candidate)
+        ordered += [expr for expr in results if expr not in ordered]
+
+        def sort_key(expr):
+            data = results[expr]
+            stats = data.get('stats', {})
+            is_passed = stats.get('passed', False)
+            sc_val = stats.get('sc')
+            
+            # 定义层级 (越大越好)
+            if is_passed:
+                if sc_val is None or sc_val <= 0.7:
+                    tier = 2  # 第一梯队: 真正绿色
+                else:
+                    tier = 1  # 第二梯队: 蓝色 (Pass 但相关性高)
+            else:
+                tier = 0      # 第三梯队: 红色 (Fail)
+            
+            # 分数已包含SC惩罚，直接使用
+            return (tier, data['score'])
+
+        return max(ordered, key=sort_key)
+
+    def _evaluate_candidates(self, batch, cancelled, position=None):
+        """回测一个批次 (线程池中执行)，并为可能上位的批次最优候选预取 PC，返回 (results, {alpha_id: pc})"""
+        results = self.evaluate_batch(batch, cancelled=cancelled, position=position)
+        prefetched_pc = {}
+        if not results or cancelled.is_set():
+            return results, prefetched_pc
+
+        data = results[self._best_in_batch(batch, results)]
+        stats = data.get('stats', {})
+        sc_val = stats.get('sc')
+        candidate_id = data.get('alpha_id')
+        # best_base_score 只增不减：这里满足准入条件的候选，覆盖了上位判定时需要测 PC 的全部候选
+        if (candidate_id and stats.get('passed', False) and data['score'] > self.best_base_score
+                and not (sc_val is not None and sc_val > SC_CUTOFF) and stats.get('pc') is None):
+            try:
+                prefetched_pc[candidate_id] = self.client.get_product_correlation(candidate_id)
+            except Exception as e:
+                logging.warning(f"预取 PC 失败 ({candidate_id})，上位判定时重新获取: {e}")
+        return results, prefetched_pc
 
-            results = self.evaluate_batch(batch)
+    def _commit_position(self, type_name, index, batches, alpha_id, cancelled):
+        """按批次顺序对单个位置做上位判定，并推进检查点"""
+        start_step_score = self.best_score
 
-            if not results: continue
+        for offset, batch, batch_label, future in batches:
+            logging.info(f"  > 处理批次 {batch_label} (本批 {len(batch)} 个)... [位置: {type_name} 第 {index + 1} 个]")
 
-            # 找到本批次中的最优解 (优先级: Pass且低SC > Pass且高SC > Fail，同级比分)
-            def sort_key(expr):
-                data = results[expr]
-                stats = data.get('stats', {})
-                is_passed = stats.get('passed', False)
-                sc_val = stats.get('sc')
-                
-                # 定义层级 (越大越好)
-                if is_passed:
-                    if sc_val is None or sc_val <= 0.7:
-                        tier = 2  # 第一梯队: 真正绿色
-                    else:
-                        tier = 1  # 第二梯队: 蓝色 (Pass 但相关性高)
-                else:
-                    tier = 0      # 第三梯队: 红色 (Fail)
-                
-                # 分数已包含SC惩罚，直接使用
-                return (tier, data['score'])
-
-            best_in_batch_expr = max(results, key=sort_key)
-            best_in_batch_data = results[best_in_batch_expr]
-            candidate_id = best_in_batch_data.get('alpha_id')
-            # 安全获取 stats 字典
-            res_stats = best_in_batch_data.get('stats', {})
-            is_p = res_stats.get('passed', False)
-            sc_val = res_stats.get('sc')
-            pc_val = res_stats.get('pc') # 接收从 _process_result 透传来的解析值
-
-            # 准入机制升级：只有没有 fail、基础分进步 且 SC 合格，才测 PC
-            if is_p and best_in_batch_data['score'] > self.best_base_score:
-                sc_penalty = 0
-                if sc_val is not None and sc_val > SC_CUTOFF:
-                    logging.info(f"   [准入跳过] SC ({sc_val:.4f}) > {SC_CUTOFF}，不测 PC，直接进行上位挑战...")
-                    sc_penalty = (SC_CUTOFF - sc_val) * 10
-                    # 如果这时候 pc_val 为空，我们保持为空
-                elif pc_val is None:
-                    logging.info(f"   [准入通过] 基础分突破且 SC 合格 (<= {SC_CUTOFF})，开始获取 PC...")
-                    pc_val = self.client.get_product_correlation(candidate_id)
-                else:
-                    logging.info(f"   [准入通过] 基础分突破且 SC 合格，已从名字解析到 PC={pc_val}")
-                
-                # 计算最终评估总分
-                if pc_val is not None:
-                    # 再次核实官方状态 (保护历史标记)
-                    details = self.client.get_alpha_details(candidate_id)
-                    current_color = details.get('color', '')
-                    is_new_color = res_stats.get('is_newly_colored', False)
-                    
-                    # 只有在本轮新上的色，或者是无色的情况下，才允许回写改名
-                    if is_new_color or not current_color:
-                        sc_val_val = sc_val if sc_val is not None else 0.0
-                        new_name = f"PC{pc_val:.4f}-SC{sc_val_val:.4f}"
-                        self.client.set_alpha_name(candidate_id, new_name)
-                        # 补染蓝色 (如果 PC 超标)
-                        if pc_val >= 0.7:
-                            self.client.set_alpha_color(candidate_id, 'BLUE')
-                            logging.info(f"   🎨 [PC染色] Alpha {candidate_id} -> BLUE")
-                        else:
-                            logging.info(f"   📝 [PC命名] Alpha {candidate_id} -> {new_name}")
-                    else:
-                        logging.info(f"   [兼容保护] Alpha {candidate_id} 维持历史标记，跳过改名。")
-                    
-                    pc_bonus = (0.7 - pc_val) * 10
-                    new_total_score = best_in_batch_data['score'] + pc_bonus
-                    logging.info(f"   [综合评估] 总分: {new_total_score:.4f} (PC: {pc_val:.4f}, 奖惩: {pc_bonus:+.4f}) | 当前最优: {self.best_score:.4f}")
-                else:
-                    # SC > 0.7 或 PC 获取失败的情况
-                    new_total_score = best_in_batch_data['score'] + sc_penalty
-                    logging.info(f"   [SC挑战评估] 总分: {new_total_score:.4f} (SC扣分: {sc_penalty:.4f}) | 当前最优: {self.best_score:.4f}")
+            results, prefetched_pc = future.result()
 
-                # 只要总分更高，且未熔断，就上位
-                with self.score_lock:
-                    if new_total_score > self.best_score:
-                        if new_total_score < -1000: # 触发熔断
-                            logging.info(f"   ❌ 总分虽高但相关性超过熔断阈值，拒绝上位。")
-                        else:
-                            diff = new_total_score - self.best_score
-                            logging.info(f"  \033[95m\033[1m🎉 发现更优综合解! 总分: {new_total_score:.4f} (↑ {diff:+.4f})\033[0m")
-                            
-                            self.best_score = new_total_score
-                            self.best_base_score = best_in_batch_data['score']
-                            self.best_expr = best_in_batch_expr
-                            self.best_alpha_id = candidate_id # 强制更新最佳 ID
-                            self.best_pc = pc_val
-                            self.best_stats = best_in_batch_data.get('stats', {})
+            if not results: continue
 
-                            self.save_checkpoint(alpha_id)
-                            parser = SmartExpression(self.best_expr, self.settings, self.client)
-                    else:
-                        base_improvement = best_in_batch_data['score'] - self.best_base_score
-                        logging.info(f"   ❌ [判定结果] 虽然基础分提升了 {base_improvement:+.4f}，但因相关性奖惩后总分 ({new_total_score:.4f}) 未能超过当前最优 ({self.best_score:.4f})，不予上位。")
-            elif not is_p and best_in_batch_data['score'] > (self.best_base_score + 1.0):
-                # 如果是 Fail 的项，但 Sharpe 极其高（比当前 base 还要高出 1 分以上），虽然不测 PC 但我们记录一下
-                logging.info(f"   🥱 最强项 Fail 了，跳过相关性检查。 (基础分: {best_in_batch_data['score']:.4f})")
-            else:
-                logging.info(f"   🥱 基础分未突破或已 Fail，跳过相关性检查。")
+            self._commit_batch(batch, results, prefetched_pc, alpha_id)
 
             # 更新进度
-            self.current_position['batch_offset'] = i + len(batch)
+            self.current_position['batch_offset'] = offset + len(batch)
             self.save_checkpoint(alpha_id)
 
             # 优雅退出检查点
             if self.stop_requested:
-                logging.info("🛑 优雅退出：当前 Batch 及收尾工作已完成，进度已保存。")
-                import sys
+                cancelled.set()
+                logging.info("🛑 优雅退出：当前 Batch 及收尾工作已完成，进度已保存 (已提交的模拟跑完后退出)。")
                 sys.exit(0)
 
-        # 重置批次偏移量
+        # 重置批次偏移量，进入下一个位置
         self.current_position['batch_offset'] = 0
+        self.current_position[type_name] = index + 1
         self.save_checkpoint(alpha_id)
 
-        # 阶段性总结
+        if batches:
+            self._print_position_summary(type_name, index, start_step_score)
+
+    def _commit_batch(self, batch, results, prefetched_pc, alpha_id):
+        """对一个批次的最优候选做准入 (PC) 与上位判定"""
+        best_in_batch_expr = self._best_in_batch(batch, results)
+        best_in_batch_data = results[best_in_batch_expr]
+        candidate_id = best_in_batch_data.get('alpha_id')
+        # 安全获取 stats 字典
+        res_stats = best_in_batch_data.get('stats', {})
+        is_p = res_stats.get('passed', False)
+        sc_val = res_stats.get('sc')
+        pc_val = res_stats.get('pc') # 接收从 _process_result 透传来的解析值
+
+        # 准入机制升级：只有没有 fail、基础分进步 且 SC 合格，才测 PC
+        if is_p and best_in_batch_data['score'] > self.best_base_score:
+            sc_penalty = 0
+            if sc_val is not None and sc_val > SC_CUTOFF:
+                logging.info(f"   [准入跳过] SC ({sc_val:.4f}) > {SC_CUTOFF}，不测 PC，直接进行上位挑战...")
+                sc_penalty = (SC_CUTOFF - sc_val) * 10
+                # 如果这时候 pc_val 为空，我们保持为空
+            elif pc_val is None:
+                if candidate_id in prefetched_pc:
+                    pc_val = prefetched_pc[candidate_id]
+                    logging.info(f"   [准入通过] 基础分突破且 SC 合格 (<= {SC_CUTOFF})，使用回测时预取的 PC...")
+                else:
+                    logging.info(f"   [准入通过] 基础分突破且 SC 合格 (<= {SC_CUTOFF})，开始获取 PC...")
+                    pc_val = self.client.get_product_correlation(candidate_id)
+            else:
+                logging.info(f"   [准入通过] 基础分突破且 SC 合格，已从名字解析到 PC={pc_val}")
+            
+            # 计算最终评估总分
+            if pc_val is not None:
+                # 再次核实官方状态 (保护历史标记)
+                details = self.client.get_alpha_details(candidate_id)
+                current_color = details.get('color', '')
+                is_new_color = res_stats.get('is_newly_colored', False)
+                
+                # 只有在本轮新上的色，或者是无色的情况下，才允许回写改名
+                if is_new_color or not current_color:
+                    sc_val_val = sc_val if sc_val is not None else 0.0
+                    new_name = f"PC{pc_val:.4f}-SC{sc_val_val:.4f}"
+                    self.client.set_alpha_name(candidate_id, new_name)
+                    # 补染蓝色 (如果 PC 超标)
+                    if pc_val >= 0.7:
+                        self.client.set_alpha_color(candidate_id, 'BLUE')
+                        logging.info(f"   🎨 [PC染色] Alpha {candidate_id} -> BLUE")
+                    else:
+                        logging.info(f"   📝 [PC命名] Alpha {candidate_id} -> {new_name}")
+                else:
+                    logging.info(f"   [兼容保护] Alpha {candidate_id} 维持历史标记，跳过改名。")
+                
+                pc_bonus = (0.7 - pc_val) * 10
+                new_total_score = best_in_batch_data['score'] + pc_bonus
+                logging.info(f"   [综合评估] 总分: {new_total_score:.4f} (PC: {pc_val:.4f}, 奖惩: {pc_bonus:+.4f}) | 当前最优: {self.best_score:.4f}")
+            else:
+                # SC > 0.7 或 PC 获取失败的情况
+                new_total_score = best_in_batch_data['score'] + sc_penalty
+                logging.info(f"   [SC挑战评估] 总分: {new_total_score:.4f} (SC扣分: {sc_penalty:.4f}) | 当前最优: {self.best_score:.4f}")
+
+            # 只要总分更高，且未熔断，就上位
+            with self.score_lock:
+                if new_total_score > self.best_score:
+                    if new_total_score < -1000: # 触发熔断
+                        logging.info(f"   ❌ 总分虽高但相关性超过熔断阈值，拒绝上位。")
+                    else:
+                        diff = new_total_score - self.best_score
+                        logging.info(f"  \033[95m\033[1m🎉 发现更优综合解! 总分: {new_total_score:.4f} (↑ {diff:+.4f})\033[0m")
+                        
+                        self.best_score = new_total_score
+                        self.best_base_score = best_in_batch_data['score']
+                        self.best_expr = best_in_batch_expr
+                        self.best_alpha_id = candidate_id # 强制更新最佳 ID
+                        self.best_pc = pc_val
+                        self.best_stats = best_in_batch_data.get('stats', {})
+
+                        self.save_checkpoint(alpha_id)
+                else:
+                    base_improvement = best_in_batch_data['score'] - self.best_base_score
+                    logging.info(f"   ❌ [判定结果] 虽然基础分提升了 {base_improvement:+.4f}，但因相关性奖惩后总分 ({new_total_score:.4f}) 未能超过当前最优 ({self.best_score:.4f})，不予上位。")
+        elif not is_p and best_in_batch_data['score'] > (self.best_base_score + 1.0):
+            # 如果是 Fail 的项，但 Sharpe 极其高（比当前 base 还要高出 1 分以上），虽然不测 PC 但我们记录一下
+            logging.info(f"   🥱 最强项 Fail 了，跳过相关性检查。 (基础分: {best_in_batch_data['score']:.4f})")
+        else:
+            logging.info(f"   🥱 基础分未突破或已 Fail，跳过相关性检查。")
+
+    def _print_position_summary(self, type_name, index, start_step_score):
+        """阶段性总结"""
         total_improvement = self.best_score - self.initial_score
         step_improvement = self.best_score - start_step_score
         
@@ -2247,6 +2412,13 @@ class AsyncOptimizer:
                 subject = "Alpha 异步回测任务出现错误"
                 content = f"您的 Alpha 异步回测任务在运行过程中出现错误：{str(e)}"
                 send_qq_email(subject, content)
+        finally:
+            # 发出所有排队中的 name / color 更新
+            self.client.property_queue.flush()
+            # 本次运行所有候选的相关邻居一次性落盘
+            report_path = self.client.neighbor_report.flush(os.path.join(OUTPUT_DIR, 'os_alpha_neighbors'))
+            if report_path:
+                logging.info(f"📁 相关邻居报告已保存: {report_path}")
 
     def reset_optimizer_state(self):
         """重置优化器状态以准备下一轮迭代"""
@@ -13,6 +13,9 @@ import io
 import base64
 from loguru import logger
 
+from auth_manager import AuthManager
+from brain_transport import BrainTransport, new_session
+
 app = Flask(__name__, template_folder='./pnl_templates')
 brain_api_url = "https://api.worldquantbrain.com"
 
@@ -23,8 +26,7 @@ if not os.path.exists('static'):
 def login():
     try:
         username, password = "",""  # 这里需要填入实际的用户名和密码
-        session = requests.Session()
-        session.auth = (username, password)
+        session = new_session(auth=(username, password))
         response = session.post('https://api.worldquantbrain.com/authentication')
         if response.status_code == 201:
             return session
@@ -39,29 +41,16 @@ def login():
         logger.error(f"登录异常，{e}")
     return None
 
-s = login()
+# 401 时单飞重新登录，新 cookie 替换进 s（见 auth_manager.py / brain_transport.py）
+transport = BrainTransport(auth=AuthManager(login, name='pnl'))
+s = transport.session
 
 async def async_wait_get(session: requests.Session, url: str, max_retries: int = 10) -> requests.Response:
-    """带重试机制的 GET 请求（异步版本）"""
-    retries = 0
-    while retries < max_retries:
-        response = session.get(url)
-        if retries%9==0 and retries>0:
-            logger.info(f"正在请求 {url} 第{retries}次")
-        if response.status_code==401:
-            logger.info(f"url 401, retry {url}")
-            global s
-            s = login()
-            continue
-        retry_after = float(response.headers.get("Retry-After", 0))
-        if retry_after > 0:
-            await asyncio.sleep(2 ** retries)
-            retries += 1
-            continue
-        if response.status_code < 400:
-            return response
-       
-    response.raise_for_status()
+    """带重试机制的 GET 请求（异步版本）：Retry-After 轮询在事件循环中等待，请求在线程中执行"""
+    response = await transport.wait_get_async(url, max_retries=max_retries)
+    if response is not None and response.status_code >= 400:
+        logger.info(f"请求 {url} 失败: {response.status_code}")
+        response.raise_for_status()
     return response
 
 async def async_get_alpha_info(alpha_id: str):
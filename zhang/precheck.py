@@ -0,0 +1,106 @@
+"""
+本地预检查：用 listing 返回的 alpha JSON 整页复现 IS 检查项 + 本地 SC
+
+/alphas/{id}/check 是最慢的接口，而很多 alpha 明显过不了。listing 结果里已经带了
+is.checks，原来主循环还要对每个 alpha 再 GET 一次 /alphas/{id} 只为了字符串搜索 "FAIL"。
+
+这里把整页结果规整成一行一个 alpha 的表（checks 透视成列），一次性判定：
+    - 任一检查项 result == FAIL，或 status 含 FAIL（与原来的字符串搜索口径一致）；
+    - 结果为 PENDING/WARNING 但带 value/limit 的检查项，按方向表本地复算
+      （LOW_* / IS_LADDER_SHARPE 要求 value >= limit，HIGH_* / CONCENTRATED_WEIGHT 要求 value <= limit）；
+    - 其余 alpha 并发计算本地 SC，>= cutoff 的不再送去远程检查。
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+SC_CUTOFF = 0.7
+
+# 检查项方向：'min' 表示 value 不能低于 limit，'max' 表示 value 不能高于 limit
+CHECK_DIRECTION = {
+    'CONCENTRATED_WEIGHT': 'max',
+    'IS_LADDER_SHARPE': 'min',
+}
+
+
+def _direction(name: str):
+    if name in CHECK_DIRECTION:
+        return CHECK_DIRECTION[name]
+    if name.startswith('LOW_'):
+        return 'min'
+    if name.startswith('HIGH_'):
+        return 'max'
+    return None
+
+
+def checks_long(alphas: list) -> pd.DataFrame:
+    """listing 结果中的 is.checks 展开成长表：alpha_id, name, result, value, limit"""
+    rows = [
+        (alpha['id'], check.get('name'), check.get('result'), check.get('value'), check.get('limit'))
+        for alpha in alphas
+        for check in (alpha.get('is') or {}).get('checks', [])
+    ]
+    df = pd.DataFrame(rows, columns=['alpha_id', 'name', 'result', 'value', 'limit'])
+    df['value'] = pd.to_numeric(df['value'], errors='coerce')
+    df['limit'] = pd.to_numeric(df['limit'], errors='coerce')
+    return df
+
+
+def evaluate_checks(alphas: list) -> pd.DataFrame:
+    """
+    整页判定 IS 检查项。
+
+    Returns:
+        pd.DataFrame: 以 alpha_id 为索引，列 region / status / fail(bool) / fail_checks(str)
+    """
+    base = pd.DataFrame({
+        'alpha_id': [a['id'] for a in alphas],
+        'region': [(a.get('settings') or {}).get('region') for a in alphas],
+        'status': [str(a.get('status') or '') for a in alphas],
+    }).drop_duplicates('alpha_id').set_index('alpha_id')
+    if base.empty:
+        return base.assign(fail=pd.Series(dtype=bool), fail_checks=pd.Series(dtype=str))
+
+    checks = checks_long(alphas)
+    direction = checks['name'].astype(str).map(_direction)
+    pending = ~checks['result'].isin(['PASS', 'FAIL']) & checks['value'].notna() & checks['limit'].notna()
+    derived_fail = pending & np.select(
+        [direction == 'min', direction == 'max'],
+        [checks['value'] < checks['limit'], checks['value'] > checks['limit']],
+        default=False,
+    )
+    checks['fail'] = (checks['result'] == 'FAIL') | derived_fail
+
+    failed = checks[checks['fail']]
+    base['fail_checks'] = failed.groupby('alpha_id')['name'].agg(','.join).reindex(base.index).fillna('')
+    base['fail'] = (base['fail_checks'] != '') | base['status'].str.upper().str.contains('FAIL')
+    return base
+
+
+def run_precheck(alphas: list, sc_fn=None, sc_cutoff: float = SC_CUTOFF, max_workers: int = 10) -> pd.DataFrame:
+    """
+    整页预检查。
+
+    Args:
+        alphas: listing 返回的原始 alpha JSON 列表。
+        sc_fn: sc_fn(alpha) -> float，计算单个 alpha 的本地 SC；None 表示跳过 SC。
+        sc_cutoff: SC 阈值。
+        max_workers: 并发计算 SC 的线程数（主要耗时在拉取 PnL）。sc_fn 里的请求应走共用限流器
+            （brain_transport.GLOBAL_RATE_LIMITER），这里只控制并发数，不做节流。
+    Returns:
+        pd.DataFrame: evaluate_checks 的结果，另加 self_corr（未计算为 NaN）。
+    """
+    result = evaluate_checks(alphas)
+    result['self_corr'] = np.nan
+    if sc_fn is not None:
+        by_id = {a['id']: a for a in alphas}
+        todo = [aid for aid in result.index[~result['fail']]]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            values = list(executor.map(lambda aid: sc_fn(by_id[aid]), todo))
+        result.loc[todo, 'self_corr'] = values
+    high_sc = result['self_corr'] >= sc_cutoff
+    print(f"   🔎 本地预检查: {len(result)} 个alpha，检查项失败 {int(result['fail'].sum())} 个，"
+          f"SC>={sc_cutoff} {int(high_sc.sum())} 个，"
+          f"送远程检查 {int((~result['fail'] & ~high_sc).sum())} 个")
+    return result
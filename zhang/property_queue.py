@@ -0,0 +1,213 @@
+"""
+alpha 属性（name / color / tags / 描述）更新队列
+
+set_alpha_properties / async_set_alpha_properties 都是每次调用立即发一个 PATCH，
+同一个 alpha 常常被连续设置好几次（optimize_climbing 先 set_alpha_name 再 set_alpha_color，
+1check_regluar 先加描述、再按检查结果标颜色），而且都在关键路径上同步等待、遇到限流还要 sleep。
+
+这里把更新放进后台队列：
+    - update() 只把字段合并进该 alpha 的待发送字段后立即返回，后写的字段覆盖先写的
+      （与按顺序发送多个 PATCH 的最终结果一致）；
+    - 后台线程每隔 flush_interval 秒取出所有待发送 alpha，每个 alpha 只发一个合并后的 PATCH，
+      多个 alpha 并发发送（max_workers）；
+    - 被限流（Retry-After / 429）或出错的 alpha 字段放回队列，整个队列暂停到允许的时间再发，
+      超过 max_retries 次放弃；
+    - flush() 等待队列清空，进程退出时（atexit）自动 flush，保证不丢更新。
+
+发送方式由调用方传入 send(alpha_id, params)：返回真值表示成功，假值表示永久失败（不重试），
+抛出 RetryLater 表示稍后重试。requests_sender / aiohttp_sender 分别适配同步与异步会话。
+"""
+import asyncio
+import atexit
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from retry_scheduler import RetryLater
+
+ALPHA_URL = "https://api.worldquantbrain.com/alphas/{}"
+# 嵌套的描述字段按子字段合并
+_NESTED_FIELDS = ("regular", "combo", "selection")
+
+
+def merge_params(old: dict, new: dict) -> dict:
+    """合并两次 PATCH 的字段，new 优先"""
+    merged = dict(old)
+    for key, value in new.items():
+        if key in _NESTED_FIELDS and isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
+
+def build_params(name=None, color=None, tags=None, description=None, combo_desc=None, selection_desc=None) -> dict:
+    """只包含给出的字段（与 async_set_alpha_properties 的参数约定一致）"""
+    params = {}
+    if color:
+        params["color"] = color
+    if name:
+        params["name"] = name
+    if tags:
+        params["tags"] = tags
+    if description:
+        params["regular"] = {"description": description}
+    if combo_desc:
+        params["combo"] = {"description": combo_desc}
+    if selection_desc:
+        params["selection"] = {"description": selection_desc}
+    return params
+
+
+def _check_response(alpha_id, status_code, headers, text_fn, relogin=None):
+    retry_after = headers.get("Retry-After") or headers.get("retry-after")
+    if retry_after or status_code == 429:
+        raise RetryLater("rate limited", delay=float(retry_after) if retry_after else None)
+    if status_code in (401, 403):
+        if relogin is not None:
+            relogin()
+        raise RetryLater(f"HTTP {status_code}", delay=0)
+    if status_code >= 400:
+        print(f"   ❌ 更新 {alpha_id} 属性失败: HTTP {status_code} {text_fn()[:200]}")
+        return False
+    return True
+
+
+def requests_sender(session_getter, relogin=None, timeout=60):
+    """
+    基于 requests.Session 的发送函数。
+
+    Args:
+        session_getter: 返回当前 session 的函数（重新登录后能拿到新 session）。
+        relogin: 401/403 时调用的重新登录函数。
+    """
+    def _send(alpha_id, params):
+        response = session_getter().patch(ALPHA_URL.format(alpha_id), json=params, timeout=timeout)
+        return _check_response(alpha_id, response.status_code, response.headers, lambda: response.text, relogin)
+    return _send
+
+
+def aiohttp_sender(session_getter, loop, timeout=60):
+    """
+    基于 aiohttp.ClientSession 的发送函数：PATCH 提交到 loop 所在的事件循环执行，
+    队列线程等待结果。调用方需在事件循环结束前 flush（例如 await asyncio.to_thread(queue.close)）。
+    """
+    async def _patch(alpha_id, params):
+        async with session_getter().patch(ALPHA_URL.format(alpha_id), json=params) as response:
+            text = await response.text()
+            return response.status, response.headers, text
+
+    def _send(alpha_id, params):
+        future = asyncio.run_coroutine_threadsafe(_patch(alpha_id, params), loop)
+        status, headers, text = future.result(timeout=timeout)
+        return _check_response(alpha_id, status, headers, lambda: text)
+    return _send
+
+
+class PropertyUpdateQueue:
+    """按 alpha 合并字段的后台 PATCH 队列"""
+
+    def __init__(self, send, max_workers=4, flush_interval=1.0, max_retries=5):
+        """
+        Args:
+            send: send(alpha_id, params)，见模块说明。
+            max_workers: 并发发送的 PATCH 数。
+            flush_interval: 合并窗口（秒），窗口内对同一 alpha 的多次更新合并为一个 PATCH。
+            max_retries: 单个 alpha 连续失败的重试次数上限。
+        """
+        self.send = send
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.sent = 0
+        self.merged = 0
+        self.failed = 0
+        self._pending = {}
+        self._attempts = {}
+        self._in_flight = 0
+        self._not_before = 0.0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def update(self, alpha_id, params: dict) -> None:
+        """合并一次属性更新，立即返回"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("PropertyUpdateQueue 已关闭")
+            if alpha_id in self._pending:
+                self.merged += 1
+            self._pending[alpha_id] = merge_params(self._pending.get(alpha_id, {}), params)
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending) + self._in_flight
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+            # 合并窗口；被限流时整个队列暂停到允许的时间
+            time.sleep(max(self.flush_interval, self._not_before - time.time()))
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                self._in_flight += len(batch)
+            wait([self._executor.submit(self._send_one, alpha_id, params) for alpha_id, params in batch.items()])
+
+    def _send_one(self, alpha_id, params):
+        delay = None
+        try:
+            ok = bool(self.send(alpha_id, params))
+            retry = False
+        except RetryLater as e:
+            retry, ok, delay = True, False, e.delay
+        except Exception as e:
+            print(f"   ⚠️ 更新 {alpha_id} 属性异常: {str(e)[:100]}")
+            retry, ok = True, False
+
+        with self._cond:
+            self._in_flight -= 1
+            if retry:
+                attempts = self._attempts.get(alpha_id, 0) + 1
+                if attempts > self.max_retries:
+                    self._attempts.pop(alpha_id, None)
+                    self.failed += 1
+                    print(f"   ❌ 更新 {alpha_id} 属性重试 {self.max_retries} 次仍失败，放弃: {params}")
+                else:
+                    self._attempts[alpha_id] = attempts
+                    # 失败的字段放回队列，期间新到的字段优先
+                    self._pending[alpha_id] = merge_params(params, self._pending.get(alpha_id, {}))
+                    wait_time = 2 ** attempts if delay is None else delay
+                    self._not_before = max(self._not_before, time.time() + wait_time)
+            else:
+                self._attempts.pop(alpha_id, None)
+                if ok:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout=None) -> bool:
+        """等待所有更新发送完毕，返回是否在 timeout 内完成"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and self._in_flight == 0, timeout)
+
+    def close(self) -> None:
+        """发送剩余更新并停止后台线程（可重复调用）"""
+        with self._cond:
+            if self._closed:
+                return
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+        if self.sent or self.merged or self.failed:
+            print(f"   📮 属性更新: 发送 {self.sent} 个PATCH，合并 {self.merged} 次更新，失败 {self.failed} 个")
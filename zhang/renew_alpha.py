@@ -1,6 +1,7 @@
 import logging
 import os
 import pickle
+import threading
 import time
 from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -13,6 +14,8 @@ import requests
 from tqdm import tqdm
 
 from machine_lib import *
+from sc_service import SCClient
+from brain_transport import new_session, transport_for
 
 # ===================== 全局配置类 =====================
 class cfg:
@@ -25,6 +28,11 @@ class cfg:
     data_path = Path('./ppac')
     cache_path = Path('./cache')  # 新增缓存路径
 
+    # 本地 SC 服务（见 sc_service.py，--data-path ./ppac --port 8766），设为 None 则始终在进程内计算
+    # 与 1check_regluar.py 的池（--data-path .）不同，不能共用同一个服务
+    sc_service_url = 'http://127.0.0.1:8766'
+    sc_client = SCClient(sc_service_url, data_path) if sc_service_url else None
+
 # ===================== 工具函数 =====================
 def save_obj(obj: object, name: str) -> None:
     """
@@ -104,27 +112,13 @@ def wait_get(sess, url: str, max_retries: int = 10) -> "Response":
     Returns:
         Response: 请求的响应对象。
     """
-    retries = 0
-    while retries < max_retries:
-        while True:
-            simulation_progress = sess.get(url)
-            if simulation_progress.headers.get("Retry-After", 0) == 0:
-                break
-            time.sleep(float(simulation_progress.headers["Retry-After"]))
-        
-        if simulation_progress.status_code < 400:
-            break
-        else:
-            time.sleep(2 ** retries)
-            retries += 1
-    
-    return simulation_progress
+    # 统一的 Retry-After / 429 / 5xx 处理，401 时用 sign_in 重新登录（见 brain_transport.py）
+    return transport_for(sess, login=lambda: sign_in(cfg.username, cfg.password)).wait_get(url, max_retries=max_retries)
 
 # ===================== 登录与API交互函数 =====================
 def sign_in(username, password):
     """登录接口，创建带认证的Session"""
-    s = requests.Session()
-    s.auth = (username, password)
+    s = new_session(auth=(username, password))
     
     try:
         response = s.post('https://api.worldquantbrain.com/authentication')
@@ -656,7 +650,14 @@ def load_data(tag=None):
 download_data(flag_increment=True)
 
 # 加载数据， 如果需要使用不同的标签，可以传入 tag 参数， 例如 tag='PPAC' 或 tag='SelfCorr'
-os_alpha_ids, os_alpha_rets = load_data()
+# SC 服务可用时由服务计算，本进程不加载 OS 池；服务中途不可用时再按需加载
+if cfg.sc_client is not None and cfg.sc_client.available():
+    cfg.sc_client.refresh()
+    os_alpha_ids, os_alpha_rets = None, None
+else:
+    os_alpha_ids, os_alpha_rets = load_data()
+_load_data_lock = threading.Lock()
+_local_os_data = None if os_alpha_rets is None else (os_alpha_ids, os_alpha_rets)
 
 # 指定区域
 region = "GLB"
@@ -763,6 +764,20 @@ def calc_self_corr_wrapper(alpha_id, alpha_detail, alpha_pnl, os_alpha_rets, os_
         
         # 直接传递 PnL Series
         alpha_pnl_series = alpha_pnl[alpha_id]
+
+        if cfg.sc_client is not None:
+            alpha_rets = (alpha_pnl_series - alpha_pnl_series.ffill().shift(1)).dropna()
+            self_corr = cfg.sc_client.max_corr(alpha_detail['settings']['region'], alpha_id, alpha_rets)
+            if self_corr is not None:
+                return alpha_id, self_corr
+
+        if os_alpha_rets is None:
+            global _local_os_data
+            with _load_data_lock:
+                if _local_os_data is None:
+                    _local_os_data = load_data()
+            os_alpha_ids, os_alpha_rets = _local_os_data
+
         self_corr = calc_self_corr(
             alpha_id=alpha_id,
             os_alpha_rets=os_alpha_rets,
@@ -0,0 +1,149 @@
+"""
+/check、/correlations/{self,prod,power-pool}、/recordsets/yearly-stats 与 alpha 详情的持久化缓存
+
+同一个 alpha 的检查结果和相关性会被 1check_regluar / optimize_climbing / alpha_details_multi
+在不同轮次、不同工具里反复获取，每次都可能要按 Retry-After 轮询好几分钟。
+
+这里用一个 SQLite 文件（默认与本模块同目录，各工具共用）缓存结果：
+    - 键为 (alpha_id, kind)，kind 为 'check' / 'self' / 'prod' / 'power-pool' / 'yearly-stats' / 'alpha'；
+    - 每条记录带写入时间和 OS 池水位（watermark），超过 TTL 或水位变化（提交了新 alpha，
+      自相关/检查结果可能变化）即视为失效；
+    - 不传 watermark 的调用方只按 TTL 判断。
+只缓存确定的结果（登出、超时、NaN 等不缓存）。
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'result_cache.db')
+
+# 各类结果的默认有效期（秒）
+DEFAULT_TTL = {
+    'check': 6 * 3600,
+    'self': 12 * 3600,
+    'prod': 24 * 3600,
+    'power-pool': 24 * 3600,
+    # 已结束年份的年度统计不会再变，永久有效（调用方只缓存已结束的年份）
+    'yearly-stats': None,
+    # 模拟完成后 IS 指标和设置不再变化（score.locate_alpha）
+    'alpha': None,
+}
+
+
+def os_pool_watermark(os_alpha_ids) -> str | None:
+    """
+    OS 池水位：OS alpha 数量 + id 集合的摘要。
+
+    Args:
+        os_alpha_ids: {region: [alpha_id, ...]}（download_data 的格式）或 alpha_id 的可迭代对象。
+    """
+    if os_alpha_ids is None:
+        return None
+    if isinstance(os_alpha_ids, dict):
+        ids = [aid for ids in os_alpha_ids.values() for aid in ids]
+    else:
+        ids = list(os_alpha_ids)
+    digest = hashlib.sha1('\n'.join(sorted(set(ids))).encode('utf-8')).hexdigest()[:12]
+    return f'{len(set(ids))}-{digest}'
+
+
+class ResultCache:
+    """按 (alpha_id, kind) 缓存 JSON 结果，带 TTL 和 OS 池水位"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: dict | None = None):
+        """
+        Args:
+            path: SQLite 文件路径。
+            ttl: 覆盖默认有效期，例如 {'prod': 3600}。
+        """
+        self.path = str(path)
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        try:
+            # 多个工具同时读写同一个文件
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.DatabaseError as e:
+            logging.warning(f"⚠️ 结果缓存无法启用 WAL: {e}")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                alpha_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                watermark TEXT,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (alpha_id, kind)
+            )
+        ''')
+        self._conn.commit()
+
+    def get(self, alpha_id: str, kind: str, watermark: str | None = None, ttl: float | None = None):
+        """
+        读取有效的缓存结果，没有或已失效时返回 None。
+
+        Args:
+            watermark: 当前 OS 池水位，与写入时不同则失效；None 表示不比较。
+            ttl: 覆盖该类结果的有效期（秒）。
+        """
+        ttl = self.ttl.get(kind) if ttl is None else ttl
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, watermark, fetched_at FROM results WHERE alpha_id = ? AND kind = ?',
+                (alpha_id, kind)).fetchone()
+        if row is None:
+            return None
+        value, stored_watermark, fetched_at = row
+        if ttl is not None and time.time() - fetched_at > ttl:
+            return None
+        if watermark is not None and stored_watermark != watermark:
+            return None
+        return json.loads(value)
+
+    def set(self, alpha_id: str, kind: str, value, watermark: str | None = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO results (alpha_id, kind, value, watermark, fetched_at) VALUES (?, ?, ?, ?, ?)',
+                (alpha_id, kind, json.dumps(value), watermark, time.time()))
+            self._conn.commit()
+
+    def invalidate(self, alpha_id: str, kind: str | None = None) -> None:
+        with self._lock:
+            if kind is None:
+                self._conn.execute('DELETE FROM results WHERE alpha_id = ?', (alpha_id,))
+            else:
+                self._conn.execute('DELETE FROM results WHERE alpha_id = ? AND kind = ?', (alpha_id, kind))
+            self._conn.commit()
+
+    def purge(self) -> int:
+        """删除各类结果中超过有效期的记录（永久有效的类型不删），返回删除条数"""
+        now = time.time()
+        deleted = 0
+        with self._lock:
+            for kind, ttl in self.ttl.items():
+                if ttl is None:
+                    continue
+                cursor = self._conn.execute('DELETE FROM results WHERE kind = ? AND fetched_at < ?', (kind, now - ttl))
+                deleted += cursor.rowcount
+            self._conn.commit()
+        return deleted
+
+
+_DEFAULT_CACHE = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+
+def get_result_cache(path: str = DEFAULT_CACHE_PATH) -> ResultCache | None:
+    """进程内共享的默认缓存；无法打开（例如只读目录）时返回 None，调用方按无缓存处理"""
+    global _DEFAULT_CACHE
+    with _DEFAULT_CACHE_LOCK:
+        if _DEFAULT_CACHE is None or _DEFAULT_CACHE.path != str(path):
+            try:
+                _DEFAULT_CACHE = ResultCache(path)
+            except sqlite3.Error as e:
+                logging.warning(f"⚠️ 无法打开结果缓存 {path}: {e}")
+                return None
+        return _DEFAULT_CACHE
@@ -0,0 +1,182 @@
+"""
+重试调度器：按下次尝试时间排序的小顶堆 + 抖动指数退避 + 死信
+
+原来的重试写法是 sleep(100) 之后 alpha_bag.append(g)：
+    - 整个循环被一个 alpha 卡住 100 秒；
+    - 重新排到队尾（FIFO），没有次数上限，坏 alpha 可以无限循环。
+
+这里把"稍后再试"的条目放进堆里，堆元素为 (next_attempt_time, attempts, seq, ticket, item)：
+    - push 返回 ticket（按提交顺序递增），重试时沿用；drain 的结果按 ticket 返回，同一 item 提交多次互不覆盖；
+    - 取条目时只取已到期的，没到期的不占用任何工作线程/协程；
+    - 第 n 次重试的等待时间为 base * factor^(n-1)，上限 max_delay，再乘以 [1-jitter, 1+jitter] 的随机因子，
+      避免一批同时失败的条目同时重试；
+    - 超过 max_attempts 次的条目，以及处理函数抛出 RetryLater 以外异常的条目，进入 dead_letters，
+      由调用方决定如何处理；一个条目出错不会中断整个消费过程。
+
+提交检查（check_pipeline.py）、生产相关性获取（1check_regluar.py）、模拟（machine_lib_new.py）共用本模块。
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+
+class RetryLater(Exception):
+    """处理函数抛出该异常表示条目需要稍后重试"""
+
+    def __init__(self, reason: str = '', delay: float | None = None, count: bool = True):
+        """
+        Args:
+            reason: 重试原因，进入死信时一并记录。
+            delay: 指定等待时间（例如服务器给的 Retry-After），None 表示按退避策略计算。
+            count: 是否计入重试次数。服务器要求的轮询等待（Retry-After）不算失败，传 False。
+        """
+        super().__init__(reason)
+        self.reason = reason
+        self.delay = delay
+        self.count = count
+
+
+class RetryScheduler:
+    """重试条目的小顶堆"""
+
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 600.0, factor: float = 2.0,
+                 jitter: float = 0.2, max_attempts: int = 5, seed=None, clock=time.monotonic):
+        """
+        Args:
+            base_delay: 第一次重试的基础等待时间（秒）。
+            max_delay: 单次等待时间上限（秒）。
+            factor: 指数退避的倍数。
+            jitter: 抖动比例，0 表示不抖动。
+            max_attempts: 最多重试次数，超过后进入死信。
+            clock: 时间函数，默认 time.monotonic。
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.dead_letters = []  # [(item, attempts, reason)]
+        self._heap = []
+        self._seq = itertools.count()
+        self._tickets = itertools.count()
+        self._rng = random.Random(seed)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __bool__(self):
+        return bool(self._heap)
+
+    def backoff(self, attempts: int, base: float | None = None) -> float:
+        """第 attempts 次重试（从 1 开始）的等待时间"""
+        base = self.base_delay if base is None else base
+        delay = min(base * self.factor ** max(attempts - 1, 0), self.max_delay)
+        if self.jitter:
+            delay *= self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+        return delay
+
+    def push(self, item, delay: float = 0.0, attempts: int = 0, ticket: int | None = None) -> int:
+        """
+        加入条目，delay 秒后到期。
+
+        Returns:
+            int: 条目的 ticket，drain 的结果以它为键；ticket 为 None 时分配新的。
+        """
+        if ticket is None:
+            ticket = next(self._tickets)
+        heapq.heappush(self._heap, (self.clock() + delay, attempts, next(self._seq), ticket, item))
+        return ticket
+
+    def retry(self, item, attempts: int, delay: float | None = None, reason: str = '',
+              ticket: int | None = None) -> bool:
+        """
+        安排第 attempts 次重试，沿用原来的 ticket。
+
+        Returns:
+            bool: False 表示超过 max_attempts，条目已进入死信。
+        """
+        if attempts > self.max_attempts:
+            self.dead_letters.append((item, attempts - 1, reason))
+            return False
+        self.push(item, self.backoff(attempts) if delay is None else delay, attempts, ticket)
+        return True
+
+    def next_delay(self) -> float | None:
+        """距离最早一个条目到期还有多少秒，堆为空时返回 None"""
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - self.clock())
+
+    def pop_ready(self):
+        """取出一个已到期的条目，返回 (ticket, item, attempts)；没有到期条目时返回 None"""
+        if self._heap and self._heap[0][0] <= self.clock():
+            _, attempts, _, ticket, item = heapq.heappop(self._heap)
+            return ticket, item, attempts
+        return None
+
+
+def _handle_error(scheduler: RetryScheduler, ticket, item, attempts, error: Exception) -> None:
+    """RetryLater 按退避重新排队，其它异常直接进入死信"""
+    if isinstance(error, RetryLater):
+        scheduler.retry(item, attempts + error.count, delay=error.delay, reason=error.reason, ticket=ticket)
+    else:
+        scheduler.dead_letters.append((item, attempts, f"{type(error).__name__}: {error}"))
+
+
+def drain(scheduler: RetryScheduler, handler) -> dict:
+    """
+    同步消费调度器直到堆为空。
+
+    handler(item, attempts) 返回结果，或抛出 RetryLater 表示稍后重试；抛出其它异常的条目进入死信。
+    没有到期条目时 sleep 到最早的到期时间。
+
+    Returns:
+        dict: {ticket: 结果}（ticket 为 push 的返回值），进入死信的条目不在其中（见 scheduler.dead_letters）。
+    """
+    results = {}
+    while scheduler:
+        entry = scheduler.pop_ready()
+        if entry is None:
+            time.sleep(scheduler.next_delay())
+            continue
+        ticket, item, attempts = entry
+        try:
+            results[ticket] = handler(item, attempts)
+        except Exception as e:
+            _handle_error(scheduler, ticket, item, attempts, e)
+    return results
+
+
+async def drain_async(scheduler: RetryScheduler, handler, concurrency: int = 8, idle: float = 1.0) -> dict:
+    """
+    用 concurrency 个协程消费调度器，handler 为协程函数，约定同 drain。
+
+    等待重试的条目留在堆里，不占用协程；某个条目反复失败不会阻塞其它条目。
+    """
+    results = {}
+    in_flight = 0
+
+    async def _worker():
+        nonlocal in_flight
+        while True:
+            entry = scheduler.pop_ready()
+            if entry is None:
+                if not scheduler and in_flight == 0:
+                    return
+                # 其它协程可能还会放回条目，最多等 idle 秒再看一次
+                await asyncio.sleep(min(scheduler.next_delay() if scheduler else idle, idle))
+                continue
+            ticket, item, attempts = entry
+            in_flight += 1
+            try:
+                results[ticket] = await handler(item, attempts)
+            except Exception as e:
+                _handle_error(scheduler, ticket, item, attempts, e)
+            finally:
+                in_flight -= 1
+
+    await asyncio.gather(*(_worker() for _ in range(max(1, concurrency))))
+    return results
@@ -24,6 +24,10 @@ import queue
 
 import re # Added for modify_alpha_expression
 
+from auth_manager import AuthManager
+
+from brain_transport import new_session
+
 
 
 
@@ -146,7 +150,7 @@ def login():
 
     # Create a session to persistently store the headers
 
-    s = requests.Session()
+    s = new_session()  # 带连接池和 gzip（见 brain_transport.py）
 
 
 
@@ -371,38 +375,54 @@ def write_to_file(alpha, name):
 
 
 
-class SessionManager:
+class SessionManager(AuthManager):
 
-    def __init__(self, session, start_time, expiry_time):
+    """
 
-        self.session = session
+    同步会话管理（单飞登录，见 auth_manager.py）：多个线程同时发现过期只登录一次，
 
-        self.start_time = start_time
+    新 cookie 替换进原 session，不关闭正在被其它线程使用的 session。
 
-        self.expiry_time = expiry_time
+    """
 
-        self.lock = threading.Lock()  # 添加线程锁保护session刷新
+    def __init__(self, session, start_time, expiry_time):
+
+        super().__init__(login, expiry=expiry_time, name='SessionManager')
+
+        self.update_session(session)
+
+        self.login_time = start_time
 
         self.needupdate = False # Add this attribute for consistency
 
 
 
 
-    def refresh_session(self):
+    @property
+
+    def start_time(self):
 
-        with self.lock:  # 使用线程锁保护session刷新过程
+        return self.login_time
 
-            print("Session expired, logging in again...")
 
-            if self.session:
 
-                self.session.close()
 
-            self.session = login()  # 使用同步login函数
+    @property
 
-            self.start_time = time.time()
+    def expiry_time(self):
 
-            self.needupdate = False # Reset after refresh
+        return self.expiry
+
+
+
+
+    def refresh_session(self):
+
+        print("Session expired, logging in again...")
+
+        self.refresh(self.generation)
+
+        self.needupdate = False # Reset after refresh
 
 
 
@@ -665,13 +685,9 @@ def simulate_multis(session_manager, alphas, name, tags):
 
     """
 
-    if session_manager.session is None:
-
-        session_manager.refresh_session()
+    # 没有 session 或已过期时等待唯一的一次登录，快过期时提前刷新
 
-    if time.time() - session_manager.start_time > session_manager.expiry_time:
-
-        session_manager.refresh_session()
+    session_manager.get_session()
 
 
 
@@ -1427,9 +1443,7 @@ def simulate_multiple_alphas_with_retry(alpha_list, name="optimize_alpha", n_job
 
         try:
 
-            if session_manager.session:
-
-                session_manager.session.close()
+            session_manager.close()
 
         except Exception as e:
 
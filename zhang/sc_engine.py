@@ -0,0 +1,318 @@
+"""
+自相关(SC)批量计算引擎
+
+OS 池规模上到几千个 alpha 之后，每个候选都对全部 OS 序列做精确相关性计算
+成了 calc_self_corr / calculate_sc_locally 的主要耗时，而大部分候选离 0.7 很远。
+
+做法：
+    1. 对 OS 池收益率按列去均值、归一化成单位向量（缺失值置零），只做一次；
+    2. 用低秩正交基 Q（PCA 或随机投影 + 一次幂迭代）把每个 OS 序列分解为
+       投影坐标 c_j = Q^T y_j 和残差范数 r_j = |(I-QQ^T) y_j|；
+    3. 查询时 corr(x, y_j) = <c_x, c_j> + <残差x, 残差j> <= <c_x, c_j> + r_x * r_j，
+       上界由 Cauchy-Schwarz 保证，只对 上界 >= cutoff - margin 的候选
+       以及近似得分前 top_k 的候选做精确相关性（pandas corrwith，与原逻辑一致）。
+
+因此在 cutoff 处的召回是有保证的（相对零填充后的标准化序列）；
+与 corrwith 成对剔除缺失值的细微差异由 margin 兜底，可用 measure_recall 实测。
+OS 池较小时直接全量精确计算。
+"""
+import hashlib
+import logging
+import os
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+
+SC_CUTOFF = 0.7
+# OS 池小于该规模时预筛选没有收益，直接全量精确计算
+PREFILTER_MIN_POOL = 1000
+
+
+def pnl_to_rets(pnl: pd.DataFrame, years: int = 4) -> pd.DataFrame:
+    """PnL 转日收益率，只保留最近 years 年（与 C3 逻辑一致）"""
+    rets = pnl.ffill().diff()
+    if rets.empty:
+        return rets
+    index = pd.to_datetime(rets.index)
+    return rets[index > index.max() - pd.DateOffset(years=years)]
+
+
+def _standardize(mat: np.ndarray):
+    """按列去均值并归一化为单位向量，缺失值置零。返回 (unit, valid_mask)"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(mat, axis=0)
+    centered = mat - mean
+    centered[np.isnan(centered)] = 0.0
+    norms = np.sqrt((centered ** 2).sum(axis=0))
+    valid = norms > 1e-10
+    unit = np.zeros_like(centered)
+    unit[:, valid] = centered[:, valid] / norms[valid]
+    return unit, valid
+
+
+class SelfCorrEngine:
+    """单个 OS 池（通常是一个区域）的 SC 计算引擎"""
+
+    def __init__(self, os_rets: pd.DataFrame, method: str = 'pca', rank: int = 32,
+                 top_k: int = 20, cutoff: float = SC_CUTOFF, margin: float = 0.02,
+                 min_pool: int = PREFILTER_MIN_POOL, seed: int = 42):
+        """
+        Args:
+            os_rets: OS alpha 日收益率，行为日期、列为 alpha_id。
+            method: 'pca'（截断 SVD）、'random'（随机投影）或 None（关闭预筛选）。
+            rank: 低秩基的维数。
+            top_k: 无论上界如何，近似得分最高的 top_k 个候选总是做精确计算。
+            cutoff: SC 阈值，上界 >= cutoff - margin 的候选必做精确计算。
+            margin: 安全边际，覆盖缺失值处理方式带来的误差。
+            min_pool: OS 池小于该规模时不启用预筛选。
+        """
+        self.cutoff = cutoff
+        self.margin = margin
+        self.top_k = top_k
+        self.method = method
+
+        unit, valid = _standardize(os_rets.to_numpy(dtype=float, copy=True))
+        self.os_rets = os_rets.loc[:, valid]
+        self.columns = self.os_rets.columns
+        self.index = self.os_rets.index
+        self.unit = unit[:, valid]
+
+        self.basis = self._build_basis(rank, min_pool, seed)
+        if self.basis is not None:
+            self.coords = self.basis.T @ self.unit
+            self.residual = np.sqrt(np.clip(1.0 - (self.coords ** 2).sum(axis=0), 0.0, None))
+
+    @property
+    def use_prefilter(self) -> bool:
+        return self.basis is not None
+
+    def _build_basis(self, rank, min_pool, seed):
+        """构造 T x r 的正交基，规模不够或 method 为空时返回 None"""
+        n_dates, n_alphas = self.unit.shape
+        rank = min(rank, n_dates, n_alphas)
+        if self.method not in ('pca', 'random') or n_alphas < min_pool or rank <= 0:
+            return None
+        if self.method == 'pca':
+            u, _, _ = np.linalg.svd(self.unit, full_matrices=False)
+            return u[:, :rank]
+        rng = np.random.default_rng(seed)
+        sketch = self.unit @ rng.standard_normal((n_alphas, rank))
+        # 一次幂迭代，让随机子空间更贴近主成分
+        sketch = self.unit @ (self.unit.T @ sketch)
+        q, _ = np.linalg.qr(sketch)
+        return q
+
+    def _exact(self, alpha_rets: pd.Series, columns) -> pd.Series:
+        """对指定列做精确相关性计算（与原 corrwith 逻辑一致）"""
+        if len(columns) == 0:
+            return pd.Series(dtype=float)
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=RuntimeWarning)
+            return self.os_rets[columns].corrwith(alpha_rets).dropna()
+
+    def candidates(self, alpha_rets: pd.Series):
+        """返回需要精确计算的 OS alpha 列；未启用预筛选时返回全部列"""
+        if not self.use_prefilter:
+            return self.columns
+        aligned = alpha_rets.reindex(self.index).to_numpy(dtype=float, copy=True)
+        unit, valid = _standardize(aligned[:, None])
+        if not valid[0]:
+            return self.columns[:0]
+        x = unit[:, 0]
+        cx = self.basis.T @ x
+        rx = np.sqrt(max(0.0, 1.0 - float(cx @ cx)))
+        approx = cx @ self.coords
+        keep = approx + self.residual * rx >= self.cutoff - self.margin
+        k = min(self.top_k, len(approx))
+        if k > 0:
+            keep[np.argpartition(-approx, k - 1)[:k]] = True
+        return self.columns[keep]
+
+    def query(self, alpha_rets: pd.Series, exclude=None) -> pd.Series:
+        """
+        计算候选 alpha 与 OS 池的相关性。
+
+        Returns:
+            pd.Series: 被精确计算过的 OS alpha 相关性（降序）。其最大值即 SC；
+                预筛选开启时，未被计算的 OS alpha 保证低于 cutoff。
+        """
+        columns = self.candidates(alpha_rets)
+        if exclude is not None:
+            columns = columns.drop(exclude, errors='ignore')
+        return self._exact(alpha_rets, columns).sort_values(ascending=False)
+
+    def max_corr(self, alpha_rets: pd.Series, exclude=None) -> float:
+        corr = self.query(alpha_rets, exclude=exclude)
+        return float(corr.iloc[0]) if len(corr) > 0 else 0.0
+
+    def measure_recall(self, samples: dict) -> dict:
+        """
+        用样本 alpha 对比全量精确计算与预筛选计算，实测 cutoff 处的召回率。
+
+        Args:
+            samples: {alpha_id: 收益率 Series}
+        Returns:
+            dict: samples 样本数，neighbor_recall 高于 cutoff 的邻居召回率，
+                decision_agreement 是否超过 cutoff 的判定一致率，checked_ratio 平均精确计算比例。
+        """
+        total = hits = agree = n = 0
+        checked = 0.0
+        for alpha_id, rets in samples.items():
+            full = self._exact(rets, self.columns.drop(alpha_id, errors='ignore'))
+            if full.empty:
+                continue
+            columns = self.candidates(rets).drop(alpha_id, errors='ignore')
+            fast = full[full.index.isin(columns)]
+            truth = set(full[full >= self.cutoff].index)
+            total += len(truth)
+            hits += len(truth & set(fast[fast >= self.cutoff].index))
+            agree += (full.max() >= self.cutoff) == (len(fast) > 0 and fast.max() >= self.cutoff)
+            checked += len(columns) / max(len(self.columns), 1)
+            n += 1
+        return {
+            'samples': n,
+            'neighbor_recall': hits / total if total else 1.0,
+            'decision_agreement': agree / n if n else 1.0,
+            'checked_ratio': checked / n if n else 0.0,
+        }
+
+
+_ENGINE_CACHE = {}
+# 多个预检查线程同时取同一个引擎时只构建一次（构建 SVD 是秒级操作）
+_ENGINE_LOCK = threading.Lock()
+
+
+def pool_fingerprint(frame: pd.DataFrame, columns: list) -> str:
+    """
+    OS 池内容指纹：列集合 + 索引 + 各列数值校验和（普通和、按行位置加权和）
+
+    原地修改的池（追加行、改写某列的值）指纹也会变化，只取列集合/索引首尾做指纹会拿到旧引擎。
+    """
+    digest = hashlib.md5()
+    digest.update('\x1f'.join(map(str, columns)).encode('utf-8'))
+    if len(frame.index):
+        digest.update(f"{len(frame.index)}|{frame.index[0]}|{frame.index[-1]}".encode('utf-8'))
+    if columns:
+        values = frame.to_numpy(dtype=float, na_value=np.nan)[:, frame.columns.get_indexer(columns)]
+        values = np.nan_to_num(values, nan=0.0, posinf=0.0, neginf=0.0)
+        weights = np.arange(1, len(values) + 1, dtype=float)
+        digest.update(values.sum(axis=0).tobytes())
+        digest.update((weights @ values).tobytes())
+    return digest.hexdigest()
+
+
+def get_engine(frame: pd.DataFrame, alpha_ids=None, key=None, prepare=None, **kwargs) -> SelfCorrEngine:
+    """
+    获取（并缓存）SC 引擎。OS 池内容变化（增量更新或原地修改）后指纹变化会自动重建。
+
+    Args:
+        frame: OS 池数据（收益率；若给了 prepare 则为原始 PnL）。
+        alpha_ids: 只取这些列（例如某区域的 OS alpha），None 表示全部列。
+        key: 缓存键，通常为区域名。
+        prepare: 重建引擎前对数据的预处理函数，例如 pnl_to_rets。
+        **kwargs: 透传给 SelfCorrEngine。
+    """
+    if alpha_ids is None:
+        columns = list(frame.columns)
+    else:
+        existing = set(frame.columns)
+        columns = [aid for aid in alpha_ids if aid in existing]
+    fingerprint = (pool_fingerprint(frame, columns), tuple(sorted(kwargs.items())))
+    with _ENGINE_LOCK:
+        cached = _ENGINE_CACHE.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        data = frame[columns]
+        if prepare is not None:
+            data = prepare(data)
+        engine = SelfCorrEngine(data, **kwargs)
+        _ENGINE_CACHE[key] = (fingerprint, engine)
+        return engine
+
+
+class NeighborReport:
+    """
+    每个候选 alpha 的 top-k 相关 OS 邻居（id、相关性、区域）。
+
+    SC 计算时顺带记录在内存里，每轮只落盘一次，供后续做多样化筛选；
+    同一 alpha 重复计算时以最后一次为准。
+    """
+
+    COLUMNS = ['alpha_id', 'region', 'rank', 'neighbor_id', 'corr']
+
+    def __init__(self, top_k: int = 10):
+        self.top_k = top_k
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, alpha_id: str, region: str, corr: pd.Series) -> None:
+        """记录一次 SC 计算结果，corr 为按相关性降序的 Series"""
+        self.add_pairs(alpha_id, region, corr.head(self.top_k).items())
+
+    def add_pairs(self, alpha_id: str, region: str, pairs) -> None:
+        rows = [(alpha_id, region, rank, neighbor_id, float(value))
+                for rank, (neighbor_id, value) in enumerate(pairs, 1) if rank <= self.top_k]
+        with self._lock:
+            self._rows[alpha_id] = rows
+
+    def _frame(self, rows: dict) -> pd.DataFrame:
+        df = pd.DataFrame([row for alpha_rows in rows.values() for row in alpha_rows], columns=self.COLUMNS)
+        df['rank'] = df['rank'].astype('int16')
+        df['corr'] = df['corr'].astype('float32')
+        return df
+
+    def to_frame(self) -> pd.DataFrame:
+        with self._lock:
+            rows = dict(self._rows)
+        return self._frame(rows)
+
+    def flush(self, path) -> str | None:
+        """
+        与已有文件合并后写出（parquet，缺少 pyarrow 时退回 csv.gz），并清空内存。
+
+        写出前先在锁内把 _rows 换成空表，写的是换出来的那份；
+        写文件期间其他线程新记录的结果留在内存里，等下一次 flush。
+
+        Returns:
+            实际写出的文件路径，没有数据时返回 None。
+        """
+        with self._lock:
+            rows, self._rows = self._rows, {}
+        if not rows:
+            return None
+        try:
+            return self._write(self._frame(rows), path)
+        except Exception:
+            # 写失败时放回内存，不覆盖换出之后新记录的结果
+            with self._lock:
+                for alpha_id, alpha_rows in rows.items():
+                    self._rows.setdefault(alpha_id, alpha_rows)
+            raise
+
+    @staticmethod
+    def _write(df: pd.DataFrame, path) -> str:
+        base = os.path.splitext(str(path))[0]
+        try:
+            import pyarrow  # noqa: F401
+            out_path, reader, writer = base + '.parquet', pd.read_parquet, 'parquet'
+        except ImportError:
+            out_path, reader, writer = base + '.csv.gz', pd.read_csv, 'csv'
+
+        if os.path.exists(out_path):
+            try:
+                old = reader(out_path)
+                df = pd.concat([old[~old['alpha_id'].isin(df['alpha_id'])], df], ignore_index=True)
+            except Exception as e:
+                logging.warning(f"⚠️ 读取已有邻居报告失败，将覆盖: {e}")
+
+        if writer == 'parquet':
+            df.to_parquet(out_path, index=False)
+        else:
+            df.to_csv(out_path, index=False, compression='gzip')
+        return out_path
@@ -0,0 +1,370 @@
+"""
+本地自相关(SC)服务
+
+1check_regluar.py / renew_alpha.py 经常在同一台机器上同时运行，
+各自加载并准备一份 OS PnL 池，重复占用数 GB 内存、每个进程都要花几分钟预处理。
+
+本模块在 localhost 上起一个小 HTTP 服务：
+    - 常驻内存保存各区域准备好的收益率矩阵和 SC 引擎（见 sc_engine.py）；
+    - 定期检查 download_data() 写出的 pickle，只对新增的 OS alpha 做增量更新；
+    - 接受批量 "max SC / top-k 邻居" 查询。
+
+各工具通过 SCClient 访问，服务不可用时返回 None，由调用方退回进程内计算。
+
+一个服务进程只服务一个 --data-path（一个 OS 池）。客户端每次请求都带上自己的 data_path，
+服务端发现与自己加载的池不一致时返回 409，客户端退回本地计算，避免拿错池算出 SC。
+不同池请用不同端口各起一个服务：
+    python sc_service.py --data-path . --port 8765        # 1check_regluar.py
+    python sc_service.py --data-path ./ppac --port 8766   # renew_alpha.py
+"""
+import argparse
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import requests
+
+from sc_engine import SelfCorrEngine
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# 所有区域合并后的 OS 池（不区分区域的查询）
+ALL_REGIONS = 'ALL'
+
+
+def pool_key(data_path) -> str:
+    """OS 池的标识：data_path 的绝对路径（同一台机器上客户端与服务端可直接比较）"""
+    return os.path.realpath(str(data_path))
+
+
+def series_to_payload(rets: pd.Series) -> dict:
+    """收益率序列转为可 JSON 序列化的结构"""
+    rets = rets.dropna()
+    return {
+        'index': [str(i) for i in rets.index],
+        'values': [float(v) for v in rets.values],
+    }
+
+
+def payload_to_series(payload: dict) -> pd.Series:
+    index = pd.to_datetime(payload['index']).normalize()
+    return pd.Series(payload['values'], index=index, dtype=float)
+
+
+class SCStore:
+    """
+    OS 池收益率矩阵的常驻存储，按 pickle 的修改时间做增量同步
+
+    SC 引擎在 sync() 里（锁外）构建好后与收益率矩阵一起换入，query 在锁内只取引用，
+    重建 SVD 不会阻塞其它查询。同步后第一次查询的 (区域, tag) 组合在锁外按需构建，
+    之后每次 sync 都会预先重建。
+    """
+
+    def __init__(self, data_path, years: int = 4, engine_kwargs: dict | None = None):
+        self.data_path = Path(data_path)
+        self.pool = pool_key(data_path)
+        self.years = years
+        self.engine_kwargs = engine_kwargs or {}
+        self.lock = threading.Lock()
+        self.os_alpha_ids = {}
+        self.ppac_alpha_ids = set()
+        self.os_alpha_rets = pd.DataFrame()
+        self.engines = {}  # (region, tag) -> SelfCorrEngine / None（区域内没有 OS alpha）
+        self._mtime = None
+        self._sync_lock = threading.Lock()
+        self._build_locks = {}
+        self.version = 0
+
+    def _load(self, name):
+        with open(str(self.data_path / name) + '.pickle', 'rb') as f:
+            return pickle.load(f)
+
+    def _to_rets(self, pnls: pd.DataFrame) -> pd.DataFrame:
+        """与 1check_regluar.load_data 一致：pnl - pnl.ffill().shift(1)，只保留最近 years 年"""
+        rets = pnls - pnls.ffill().shift(1)
+        rets.index = pd.to_datetime(rets.index).normalize()
+        return rets[rets.index > rets.index.max() - pd.DateOffset(years=self.years)]
+
+    def sync(self) -> bool:
+        """pickle 有更新时增量合并新 alpha 并重建 SC 引擎，返回是否发生了变化"""
+        with self._sync_lock:
+            pnl_file = str(self.data_path / 'os_alpha_pnls') + '.pickle'
+            try:
+                mtime = os.path.getmtime(pnl_file)
+            except OSError:
+                logging.warning(f"⚠️ [SC服务] 未找到 {pnl_file}，请先运行 download_data()")
+                return False
+            if mtime == self._mtime:
+                return False
+
+            os_alpha_ids = self._load('os_alpha_ids')
+            os_alpha_pnls = self._load('os_alpha_pnls')
+            try:
+                ppac_alpha_ids = set(self._load('ppac_alpha_ids'))
+            except FileNotFoundError:
+                ppac_alpha_ids = set()
+
+            with self.lock:
+                old = self.os_alpha_rets
+                keys = set(self.engines)
+            same_window = not old.empty and old.index.max() == pd.to_datetime(os_alpha_pnls.index).max().normalize()
+            if same_window:
+                # 日期窗口没变，只准备新增的列
+                keep = [c for c in old.columns if c in os_alpha_pnls.columns]
+                new_cols = [c for c in os_alpha_pnls.columns if c not in set(old.columns)]
+                parts = [old[keep]]
+                if new_cols:
+                    parts.append(self._to_rets(os_alpha_pnls[new_cols]).reindex(old.index))
+                rets = pd.concat(parts, axis=1)
+                logging.info(f"🔄 [SC服务] 增量同步: 新增 {len(new_cols)} 个, 移除 {len(old.columns) - len(keep)} 个")
+            else:
+                rets = self._to_rets(os_alpha_pnls)
+                logging.info(f"🔄 [SC服务] 全量加载: {rets.shape[1]} 个 OS alpha")
+
+            # 各区域以及之前查询过的组合预先建好引擎（锁外），再和数据一起换入
+            keys |= {(region, None) for region in os_alpha_ids}
+            engines = {key: self._build_engine(rets, os_alpha_ids, ppac_alpha_ids, *key) for key in keys}
+            with self.lock:
+                self.os_alpha_rets = rets
+                self.os_alpha_ids = os_alpha_ids
+                self.ppac_alpha_ids = ppac_alpha_ids
+                self.engines = engines
+                self._mtime = mtime
+                self.version += 1
+            return True
+
+    @staticmethod
+    def _region_ids(os_alpha_ids: dict, ppac_alpha_ids: set, region: str, tag: str | None = None) -> list:
+        if region == ALL_REGIONS:
+            ids = [aid for ids in os_alpha_ids.values() for aid in ids]
+        else:
+            ids = list(os_alpha_ids.get(region, []))
+        if tag == 'PPAC':
+            ids = [aid for aid in ids if aid in ppac_alpha_ids]
+        elif tag == 'SelfCorr':
+            ids = [aid for aid in ids if aid not in ppac_alpha_ids]
+        return ids
+
+    def region_ids(self, region: str, tag: str | None = None) -> list:
+        """区域内的 OS alpha，tag 与 load_data 一致（'PPAC' / 'SelfCorr'）"""
+        return self._region_ids(self.os_alpha_ids, self.ppac_alpha_ids, region, tag)
+
+    def _build_engine(self, rets, os_alpha_ids, ppac_alpha_ids, region, tag):
+        existing = set(rets.columns)
+        ids = [aid for aid in self._region_ids(os_alpha_ids, ppac_alpha_ids, region, tag) if aid in existing]
+        return SelfCorrEngine(rets[ids], **self.engine_kwargs) if ids else None
+
+    def engine(self, region: str, tag: str | None = None):
+        """当前版本的 SC 引擎；还没建过的组合在锁外构建，同一组合只建一次"""
+        key = (region, tag)
+        with self.lock:
+            if key in self.engines:
+                return self.engines[key]
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            with self.lock:
+                if key in self.engines:
+                    return self.engines[key]
+                version = self.version
+                snapshot = self.os_alpha_rets, self.os_alpha_ids, self.ppac_alpha_ids
+            engine = self._build_engine(*snapshot, region, tag)
+            with self.lock:
+                # 构建期间发生了同步：新版本的引擎由 sync 负责，这次的结果只用于本次查询
+                if self.version == version:
+                    self.engines[key] = engine
+            return engine
+
+    def query(self, region: str, alphas: dict, top_k: int = 0, tag: str | None = None) -> dict:
+        """
+        批量查询。
+
+        Args:
+            region: 区域，或 'ALL' 表示全部 OS alpha。
+            alphas: {alpha_id: 收益率 Series}
+            top_k: 每个 alpha 返回的最相关邻居数，0 表示只返回 max。
+        Returns:
+            dict: {alpha_id: {'max': float, 'neighbors': [[os_alpha_id, corr], ...]}}
+        """
+        engine = self.engine(region, tag)
+
+        results = {}
+        for alpha_id, alpha_rets in alphas.items():
+            if engine is None:
+                results[alpha_id] = {'max': 0.0, 'neighbors': []}
+                continue
+            corr = engine.query(alpha_rets, exclude=alpha_id)
+            results[alpha_id] = {
+                'max': float(corr.iloc[0]) if len(corr) > 0 else 0.0,
+                'neighbors': [[aid, round(float(c), 4)] for aid, c in corr.head(top_k).items()],
+            }
+        return results
+
+
+class _Handler(BaseHTTPRequestHandler):
+    store: SCStore = None
+
+    def _send(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, {'status': 'ok', 'version': self.store.version, 'pool': self.store.pool,
+                             'alphas': int(self.store.os_alpha_rets.shape[1])})
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def _pool_mismatch(self, body) -> bool:
+        """请求的池与本服务加载的池不一致时回 409"""
+        if body.get('pool') == self.store.pool:
+            return False
+        self._send(409, {'error': 'pool mismatch', 'pool': self.store.pool})
+        return True
+
+    def do_POST(self):
+        try:
+            if self.path == '/query':
+                body = self._read_json()
+                if self._pool_mismatch(body):
+                    return
+                alphas = {aid: payload_to_series(p) for aid, p in body.get('alphas', {}).items()}
+                results = self.store.query(body.get('region', ALL_REGIONS), alphas,
+                                           top_k=int(body.get('top_k', 0)), tag=body.get('tag'))
+                self._send(200, {'version': self.store.version, 'results': results})
+            elif self.path == '/refresh':
+                if self._pool_mismatch(self._read_json()):
+                    return
+                changed = self.store.sync()
+                self._send(200, {'changed': changed, 'version': self.store.version})
+            else:
+                self._send(404, {'error': 'not found'})
+        except Exception as e:
+            logging.error(f"❌ [SC服务] 请求处理失败: {e}")
+            self._send(500, {'error': str(e)})
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+def serve(data_path='.', host=DEFAULT_HOST, port=DEFAULT_PORT, sync_interval=300, engine_kwargs=None):
+    """启动 SC 服务（阻塞）"""
+    store = SCStore(data_path, engine_kwargs=engine_kwargs)
+    store.sync()
+
+    def _sync_loop():
+        while True:
+            time.sleep(sync_interval)
+            try:
+                store.sync()
+            except Exception as e:
+                logging.warning(f"⚠️ [SC服务] 增量同步失败: {e}")
+
+    threading.Thread(target=_sync_loop, daemon=True).start()
+    handler = type('SCHandler', (_Handler,), {'store': store})
+    server = ThreadingHTTPServer((host, port), handler)
+    logging.info(f"✅ [SC服务] 监听 http://{host}:{port}，OS alpha 数量: {store.os_alpha_rets.shape[1]}")
+    server.serve_forever()
+
+
+class SCClient:
+    """
+    SC 服务的轻量客户端，服务不可用时所有查询返回 None，由调用方退回本地计算
+
+    data_path 是调用方自己的 OS 池目录，随每个请求发送；服务加载的是别的池时同样视为不可用。
+    """
+
+    def __init__(self, url, data_path, timeout=60, retry_interval=60):
+        self.url = url.rstrip('/')
+        self.pool = pool_key(data_path)
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.session = requests.Session()
+        self._down_since = None
+
+    def available(self) -> bool:
+        # 服务挂掉后 retry_interval 秒内不再尝试，避免每个 alpha 都等连接超时
+        if self._down_since is not None and time.time() - self._down_since < self.retry_interval:
+            return False
+        try:
+            resp = self.session.get(f'{self.url}/health', timeout=2)
+            ok = resp.status_code == 200 and self._check_pool(resp.json().get('pool'))
+        except (requests.RequestException, ValueError):
+            ok = False
+        self._down_since = None if ok else time.time()
+        return ok
+
+    def _check_pool(self, service_pool) -> bool:
+        if service_pool == self.pool:
+            return True
+        logging.warning(f"⚠️ [SC服务] {self.url} 加载的 OS 池是 {service_pool}，本进程的是 {self.pool}，退回本地计算")
+        return False
+
+    def query(self, region: str, alphas: dict, top_k: int = 0, tag: str | None = None) -> dict | None:
+        """批量查询 {alpha_id: 收益率 Series}，失败返回 None"""
+        if self._down_since is not None and time.time() - self._down_since < self.retry_interval:
+            return None
+        body = {
+            'pool': self.pool,
+            'region': region,
+            'top_k': top_k,
+            'tag': tag,
+            'alphas': {aid: series_to_payload(r) for aid, r in alphas.items()},
+        }
+        try:
+            resp = self.session.post(f'{self.url}/query', data=json.dumps(body),
+                                     headers={'Content-Type': 'application/json'}, timeout=self.timeout)
+            if resp.status_code == 200:
+                self._down_since = None
+                return resp.json()['results']
+            if resp.status_code == 409:
+                self._check_pool(resp.json().get('pool'))
+                self._down_since = time.time()
+                return None
+            logging.warning(f"⚠️ [SC服务] 查询失败: HTTP {resp.status_code}")
+        except requests.RequestException as e:
+            logging.warning(f"⚠️ [SC服务] 不可用，退回本地计算: {e}")
+            self._down_since = time.time()
+        return None
+
+    def refresh(self) -> bool:
+        """通知服务立即增量同步（例如本进程刚跑完 download_data）"""
+        try:
+            return self.session.post(f'{self.url}/refresh', data=json.dumps({'pool': self.pool}),
+                                     headers={'Content-Type': 'application/json'},
+                                     timeout=self.timeout).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def max_corr(self, region: str, alpha_id: str, alpha_rets: pd.Series, tag: str | None = None):
+        """单个 alpha 的 SC，失败返回 None"""
+        results = self.query(region, {alpha_id: alpha_rets}, tag=tag)
+        if results is None or alpha_id not in results:
+            return None
+        value = results[alpha_id]['max']
+        return 0.0 if value is None or np.isnan(value) else value
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='本地 SC 服务')
+    parser.add_argument('--data-path', default='.', help='download_data() 写出 os_alpha_*.pickle 的目录')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--sync-interval', type=int, default=300, help='增量同步间隔（秒）')
+    args = parser.parse_args()
+    serve(args.data_path, args.host, args.port, args.sync_interval)
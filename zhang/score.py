@@ -1,9 +1,21 @@
 # 导入必要的依赖模块
+import numpy as np
 import pandas as pd
-import requests
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime  # 新增：用于生成时间戳文件名
 
+from brain_transport import new_session, transport_for
+from result_cache import get_result_cache
+
+# 标的池规模映射（按顺序匹配名称中包含的第一个关键字）
+UNIVERSE_SIZES = {
+    'TOP3000': 3000, 'TOP2500': 2500, 'TOP2000': 2000, 'TOP2000U': 2000,
+    'TOP1200': 1200, 'TOP1000': 1000, 'TOP800': 800,
+    'TOP500': 500, 'TOPSP500': 500, 'TOP400': 400, 'TOP200': 200, 'TOP100': 100,
+    'MINVOL1M': 1000, 'ILLIQUID_MINVOL1M': 2000, 'TOPIDV3000': 3000
+}
+DEFAULT_UNIVERSE_SIZE = 3000
+
 def login():
     """
     实际的 WQB 平台登录函数，返回带认证的 Session 对象
@@ -13,8 +25,8 @@ def login():
     username = ""
     password = ""
  
-    # 创建会话对象（持久化存储认证信息）
-    s = requests.Session()
+    # 创建会话对象（持久化存储认证信息，带连接池和 gzip，见 brain_transport.py）
+    s = new_session()
  
     # 将凭证存入会话
     s.auth = (username, password)
@@ -24,11 +36,12 @@ def login():
     print("登录响应内容：", response.content)  # 打印响应，方便调试登录是否成功
     return s  
 
-def view_alphas(gold_bag, save_csv_path=None):
+def view_alphas(gold_bag, save_csv_path=None, max_workers=8):
     """
     批量查询 Alpha 信息，计算得分并格式化输出，支持保存为 CSV
     :param gold_bag: 列表，元素可为字符串（Alpha ID）或元组/列表 (Alpha ID, 自相关系数)
     :param save_csv_path: 可选，CSV 文件保存路径（如 "alpha_result.csv"），None 则不保存
+    :param max_workers: 并发查询 Alpha 详情的线程数
     :return: 格式化后的 DataFrame
     """
     s = login()
@@ -45,15 +58,13 @@ def view_alphas(gold_bag, save_csv_path=None):
         else:
             processed_bag.append((item, 0))
 
-    # 遍历查询每个 Alpha
-    for alpha_id, pc in processed_bag:
-        if not alpha_id:  # 过滤空的 Alpha ID
-            continue
-        info = locate_alpha(s, alpha_id)
+    # 并发查询每个 Alpha（过滤空的 Alpha ID）
+    processed_bag = [(alpha_id, pc) for alpha_id, pc in processed_bag if alpha_id]
+    infos = fetch_alphas(s, [alpha_id for alpha_id, _ in processed_bag], max_workers=max_workers)
+    for (alpha_id, pc), info in zip(processed_bag, infos):
         if info:
             info['self_corr'] = pc
             info['fail_count'] = 0  # 默认为 0
-            info['score'] = calculate_score(info)
             data.append(info)
 
     # 无数据时的提示
@@ -61,8 +72,9 @@ def view_alphas(gold_bag, save_csv_path=None):
         print("No alphas found.")
         return pd.DataFrame()  # 返回空 DataFrame 而非 None，保证返回类型统一
 
-    # 转为 DataFrame 并调整列顺序
+    # 转为 DataFrame 并批量计算得分
     df = pd.DataFrame(data)
+    df['score'] = calculate_scores(df)
     # 核心列优先展示
     cols = ['id', 'score', 'sharpe', 'fitness', 'margin', 'turnover', 'returns', 'drawdown',
             'long_count', 'short_count', 'fail_count', 'sub_universe_sharpe', 'sharpe_2y', 'universe']
@@ -98,74 +110,82 @@ def view_alphas(gold_bag, save_csv_path=None):
 
     return df
 
-def locate_alpha(s, alpha_id):
+def locate_alpha(s, alpha_id, cache=None):
     """
-    单次查询单个 Alpha 的详细信息（带重试机制）
+    查询单个 Alpha 的详细信息（429 / 5xx / 网络异常的重试、限流和 401 重新登录由 brain_transport 处理）
     :param s: 登录后的 requests.Session 对象
     :param alpha_id: Alpha 唯一标识
+    :param cache: 可选，result_cache 缓存；模拟完成后 IS 指标和设置不再变化，命中时不再请求
     :return: Alpha 信息字典 / None
     """
-    # 最多重试 5 次
-    for retry in range(5):
-        try:
-            url = f"https://api.worldquantbrain.com/alphas/{alpha_id}"
-            r = s.get(url, timeout=10)  # 增加超时限制，避免卡死
-
-            # 处理不同响应状态码
-            if r.status_code == 200:
-                data = r.json()
-                reg = data.get('regular', {})
-                iss = data.get('is', {})
-                sett = data.get('settings', {})
-                checks = iss.get('checks', [])
-
-                # 提取核心信息（所有值做空值兜底）
-                info = {
-                    'id': alpha_id,
-                    'code': reg.get('code', ''),
-                    'sharpe': iss.get('sharpe', 0.0),
-                    'fitness': iss.get('fitness', 0.0),
-                    'turnover': iss.get('turnover', 0.0),
-                    'margin': iss.get('margin', 0.0),
-                    'returns': iss.get('returns', 0.0),
-                    'drawdown': iss.get('drawdown', 0.0),
-                    'long_count': iss.get('longCount', 0),
-                    'short_count': iss.get('shortCount', 0),
-                    'dateCreated': data.get('dateCreated', ''),
-                    'decay': sett.get('decay', 0.0),
-                    'universe': sett.get('universe', 'TOP3000'),
-                    'region': sett.get('region', 'USA')
-                }
-
-                # 提取检查项（子池夏普率、2年夏普率）
-                for check in checks:
-                    check_name = check.get('name', '')
-                    if check_name == 'LOW_SUB_UNIVERSE_SHARPE':
-                        info['sub_universe_sharpe'] = check.get('value', 0.0)
-                    elif check_name == 'LOW_2Y_SHARPE':
-                        info['sharpe_2y'] = check.get('value', 0.0)
-
-                return info
-
-            elif r.status_code == 429:
-                # 处理限流：按响应头的 Retry-After 等待
-                wait_time = float(r.headers.get('Retry-After', 5))
-                print(f"请求限流，等待 {wait_time} 秒后重试（Alpha ID: {alpha_id}，重试次数: {retry+1}）")
-                time.sleep(wait_time)
-
-            else:
-                # 其他错误状态码，等待 1 秒重试
-                print(f"查询失败（状态码: {r.status_code}），Alpha ID: {alpha_id}，重试次数: {retry+1}")
-                time.sleep(1)
+    cached = cache.get(alpha_id, 'alpha') if cache is not None else None
+    if cached is not None:
+        return cached
 
-        except Exception as e:
-            # 捕获所有异常，避免单个 Alpha 查询失败中断整体流程
-            print(f"查询异常（Alpha ID: {alpha_id}，重试次数: {retry+1}）：{str(e)}")
-            time.sleep(1)
+    try:
+        url = f"https://api.worldquantbrain.com/alphas/{alpha_id}"
+        r = transport_for(s, login=login).get(url, timeout=10)  # 增加超时限制，避免卡死
+        if r is None or r.status_code != 200:
+            status = '网络异常' if r is None else f'状态码: {r.status_code}'
+            print(f"Alpha ID: {alpha_id} 查询失败（{status}），跳过")
+            return None
+
+        data = r.json()
+        reg = data.get('regular', {})
+        iss = data.get('is', {})
+        sett = data.get('settings', {})
+        checks = iss.get('checks', [])
+
+        # 提取核心信息（所有值做空值兜底）
+        info = {
+            'id': alpha_id,
+            'code': reg.get('code', ''),
+            'sharpe': iss.get('sharpe', 0.0),
+            'fitness': iss.get('fitness', 0.0),
+            'turnover': iss.get('turnover', 0.0),
+            'margin': iss.get('margin', 0.0),
+            'returns': iss.get('returns', 0.0),
+            'drawdown': iss.get('drawdown', 0.0),
+            'long_count': iss.get('longCount', 0),
+            'short_count': iss.get('shortCount', 0),
+            'dateCreated': data.get('dateCreated', ''),
+            'decay': sett.get('decay', 0.0),
+            'universe': sett.get('universe', 'TOP3000'),
+            'region': sett.get('region', 'USA')
+        }
+
+        # 提取检查项（子池夏普率、2年夏普率）
+        for check in checks:
+            check_name = check.get('name', '')
+            if check_name == 'LOW_SUB_UNIVERSE_SHARPE':
+                info['sub_universe_sharpe'] = check.get('value', 0.0)
+            elif check_name == 'LOW_2Y_SHARPE':
+                info['sharpe_2y'] = check.get('value', 0.0)
+
+    except Exception as e:
+        # 捕获所有异常，避免单个 Alpha 查询失败中断整体流程
+        print(f"查询异常（Alpha ID: {alpha_id}）：{str(e)}")
+        return None
+
+    if cache is not None:
+        cache.set(alpha_id, 'alpha', info)
+    return info
+
+def fetch_alphas(s, alpha_ids, max_workers=8):
+    """
+    并发查询多个 Alpha 的详细信息（经 brain_transport 的全局限流器，结果写入 result_cache）
+    :return: 与 alpha_ids 顺序一致的信息字典列表，查询失败的位置为 None
+    """
+    cache = get_result_cache()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda alpha_id: locate_alpha(s, alpha_id, cache), alpha_ids))
 
-    # 5 次重试失败后返回 None
-    print(f"Alpha ID: {alpha_id} 多次查询失败，跳过")
-    return None
+def universe_size_of(universe_name):
+    """按名称匹配标的池规模，未匹配时为默认规模"""
+    for k, v in UNIVERSE_SIZES.items():
+        if k in universe_name:
+            return v
+    return DEFAULT_UNIVERSE_SIZE
 
 def calculate_score(row):
     """
@@ -187,17 +207,7 @@ def calculate_score(row):
         fail_count = int(row.get('fail_count', 0))
 
         # 2. 标的池规模映射（根据名称匹配规模）
-        uni_map = {
-            'TOP3000': 3000, 'TOP2500': 2500, 'TOP2000': 2000, 'TOP2000U': 2000,
-            'TOP1200': 1200, 'TOP1000': 1000, 'TOP800': 800,
-            'TOP500': 500, 'TOPSP500': 500, 'TOP400': 400, 'TOP200': 200, 'TOP100': 100,
-            'MINVOL1M': 1000, 'ILLIQUID_MINVOL1M': 2000, 'TOPIDV3000': 3000
-        }
-        universe_size = 3000  # 默认规模
-        for k, v in uni_map.items():
-            if k in universe_name:
-                universe_size = v
-                break
+        universe_size = universe_size_of(universe_name)
 
         # 3. 异常 Alpha 直接返回 -100（标记为无效）
         # 条件1：夏普率和换手率均为 0（无有效因子）
@@ -281,6 +291,117 @@ def calculate_score(row):
         print(f"得分计算异常：{str(e)}")
         return round(-999.0, 6)
 
+def _column(df, name, default, cast):
+    """
+    取出一列转为 float 数组，并标记按异常处理（得分 -999）的行：
+    float()/int() 抛异常（同标量版），或者值为 NaN / inf（数值列里的 None 会变成 NaN；
+    标量版不把 NaN / inf 当异常，会照常代入公式）
+    :return: (values, errors)
+    """
+    n = len(df)
+    if name not in df.columns:
+        return np.full(n, float(cast(default))), np.zeros(n, dtype=bool)
+    col = df[name]
+    if pd.api.types.is_numeric_dtype(col):
+        values = col.to_numpy(dtype=float, na_value=np.nan)
+        errors = ~np.isfinite(values)
+        values = np.where(errors, 0.0, values)
+        # int() 向零取整
+        return (values if cast is float else np.trunc(values)), errors
+    # object 列（MySQL 的 DECIMAL、None、字符串等）逐个转换，与标量版的异常判断一致
+    values = np.empty(n)
+    errors = np.zeros(n, dtype=bool)
+    for i, v in enumerate(col.tolist()):
+        try:
+            values[i] = cast(v)
+        except (TypeError, ValueError, OverflowError, ArithmeticError):
+            values[i] = 0.0
+            errors[i] = True
+    errors |= ~np.isfinite(values)
+    return np.where(errors, 0.0, values), errors
+
+def calculate_scores(df):
+    """
+    calculate_score 的向量化版本：对 DataFrame 的每一行计算得分，结果与逐行调用 calculate_score 一致，
+    唯一的区别是指标为 NaN / inf 的行按异常处理得 -999（标量版会照常代入公式）
+    列名同 locate_alpha 的输出（与爬虫 alphas 表的同名列一致），缺少的列按 calculate_score 的默认值处理
+    :param df: Alpha 信息 DataFrame（view_alphas 结果、MySQL alphas 表或 Parquet 结果集）
+    :return: 得分 Series（索引与 df 一致），异常行为 -999
+    """
+    fitness, e1 = _column(df, 'fitness', 0.0, float)
+    sharpe, e2 = _column(df, 'sharpe', 0.0, float)
+    margin, e3 = _column(df, 'margin', 0.0, float)
+    turnover, e4 = _column(df, 'turnover', 0.0, float)
+    returns, e5 = _column(df, 'returns', 0.0, float)
+    drawdown, e6 = _column(df, 'drawdown', 1.0, float)
+    long_count, e7 = _column(df, 'long_count', 0, int)
+    short_count, e8 = _column(df, 'short_count', 0, int)
+    fail_count, e9 = _column(df, 'fail_count', 0, int)
+    errors = e1 | e2 | e3 | e4 | e5 | e6 | e7 | e8 | e9
+
+    # 标的池规模：只对不同的名称做一次匹配
+    if 'universe' in df.columns:
+        universe_names = df['universe'].map(lambda v: str(v).upper())
+        sizes = {name: universe_size_of(name) for name in universe_names.unique()}
+        universe_size = universe_names.map(sizes).to_numpy(dtype=float)
+    else:
+        universe_size = np.full(len(df), float(universe_size_of('TOP3000')))
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        holding_ratio = (long_count + short_count) / universe_size
+
+        # 异常 Alpha（规则同 calculate_score 第 3 步）
+        invalid = ((sharpe == 0.0) & (turnover == 0.0)) \
+            | (long_count == 0) | (short_count == 0) \
+            | (turnover >= 0.80) \
+            | ((holding_ratio < 0.30) & ((sharpe > 1.58) | (fitness > 1.0))) \
+            | ((drawdown < 0.05) & (returns > 2.0))
+
+        # 效用（加法顺序与 calculate_score 相同，保证浮点结果一致）
+        u_fitness = 0.35 * fitness
+        u_sharpe = 0.30 * sharpe
+        u_margin = np.where(margin >= 0, 0.18 * (margin / 0.0005), 0.0)
+        u_turnover = np.select(
+            [(0.05 <= turnover) & (turnover <= 0.15), (0.15 < turnover) & (turnover <= 0.30)],
+            [0.10, 0.05], 0.0)
+        ret_dd = np.where(drawdown > 0.0001, returns / drawdown, 0.0)
+        u_ret_dd = 0.07 * ret_dd
+        bonus = np.where(fail_count == 0, 0.15, 0.0)
+        utility = u_fitness + u_sharpe + u_margin + u_turnover + u_ret_dd + bonus
+
+        # 换手率惩罚
+        penalty = np.select(
+            [(0.15 < turnover) & (turnover <= 0.30),
+             (0.30 < turnover) & (turnover <= 0.70),
+             turnover > 0.70,
+             turnover < 0.02],
+            [(turnover - 0.15) / (0.30 - 0.15) * 0.3,
+             0.3 + (turnover - 0.30) / (0.70 - 0.30) * 1.2,
+             1.5 + (turnover - 0.70) * 10.0,
+             10.0],
+            0.0)
+        # 持仓比例惩罚
+        penalty = penalty + np.select(
+            [(holding_ratio >= 0.50) & (holding_ratio < 0.70),
+             (holding_ratio >= 0.30) & (holding_ratio < 0.50),
+             holding_ratio < 0.30],
+            [0.3, 0.8, 1.5], 0.0)
+        # 多空平衡惩罚
+        larger = np.maximum(long_count, short_count)
+        ls_ratio = np.where(larger > 0, np.minimum(long_count, short_count) / larger, 0.0)
+        penalty = penalty + np.select(
+            [(0.60 <= ls_ratio) & (ls_ratio < 0.80),
+             (0.40 <= ls_ratio) & (ls_ratio < 0.60),
+             (0.20 <= ls_ratio) & (ls_ratio < 0.40),
+             ls_ratio < 0.20],
+            [0.05, 0.15, 0.30, 0.50], 0.0)
+
+        final_score = utility - penalty
+
+    final_score = np.where(errors, -999.0, np.where(invalid, -100.0, final_score))
+    # np.round 先乘 10^6 再取整，个别值的末位与内置 round 不同；逐个用 round 保证与标量版一致
+    return pd.Series([round(v, 6) for v in final_score.tolist()], index=df.index, dtype=float)
+
 # ------------------- 测试示例（直接运行代码请取消注释） -------------------
 if __name__ == "__main__":
     # 第一步：先在 login() 函数中填写你的 WQB 账号和密码
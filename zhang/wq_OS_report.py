@@ -1,18 +1,23 @@
 ### From：https://www.codecopy.cn/post/ani5hi?pw=wq123
 
-import requests
-import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import pandas as pd
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 
+from brain_transport import new_session, transport_for
+from result_cache import get_result_cache
+
 ############# 配置 #################
 
 username = ""
 password = ""
 start_date = "2026-02-01"  # alpha提交日期筛选
 end_date = "2026-02-08"
+sharpe_years = ("2022", "2023")  # 报表对比的两个年份（Sharpe 2022 / Sharpe 2023 列）
+max_workers = 8  # 并发获取 yearly-stats 的线程数（经 brain_transport 的全局限流器）
 
 ####################################
 
@@ -28,23 +33,12 @@ def wait_get(url: str, sess: any, max_retries: int = 10) -> "Response":
     Returns:
         Response: 请求的响应对象。
     """
-    retries = 0
-    while retries < max_retries:
-        while True:
-            simulation_progress = sess.get(url)
-            if simulation_progress.headers.get("Retry-After", 0) == 0:
-                break
-            time.sleep(float(simulation_progress.headers["Retry-After"]))
-        if simulation_progress.status_code < 400:
-            break
-        else:
-            time.sleep(2 ** retries)
-            retries += 1
-    return simulation_progress
+    # 统一的 Retry-After / 429 / 5xx 处理，401 时用 login 重新登录（见 brain_transport.py）
+    return transport_for(sess, login=login).wait_get(url, max_retries=max_retries)
 
 def login():
     # Create a session to persistently store the headers
-    s = requests.Session()
+    s = new_session()
  
     # Save credentials into session
     s.auth = (username, password)
@@ -54,9 +48,52 @@ def login():
     print(response.content)
     return s  
 
+def parse_yearly_stats(data: dict) -> dict:
+    """
+    按 schema 的列名把 yearly-stats 解析为 {年份: {列名: 值}}，不依赖记录的位置和条数
+    """
+    names = [prop.get("name") for prop in data.get("schema", {}).get("properties", [])]
+    table = {}
+    for record in data.get("records", []):
+        row = dict(zip(names, record))
+        year = row.pop("year", None)
+        if year is not None:
+            table[str(year)] = row
+    return table
+
+def get_yearly_stats(alpha_id: str, sess, cache) -> dict:
+    """
+    获取 alpha 的年度统计 {年份: {列名: 值}}
+
+    已结束年份的统计不会再变，这些年份写入 result_cache 永久缓存；
+    缓存已覆盖报表需要的年份时不再请求。
+    """
+    closed_through = str(datetime.now().year - 1)  # 已结束的最后一个年份
+    cached = cache.get(alpha_id, "yearly-stats") if cache else None
+    if cached and cached["closed_through"] >= max(sharpe_years):
+        return cached["years"]
+
+    yearly_url = f"https://api.worldquantbrain.com/alphas/{alpha_id}/recordsets/yearly-stats"
+    table = parse_yearly_stats(wait_get(yearly_url, sess).json())
+    if cache and table:
+        cache.set(alpha_id, "yearly-stats", {
+            "closed_through": closed_through,
+            "years": {year: row for year, row in table.items() if year <= closed_through},
+        })
+    return table
+
+def get_sharpes(alpha_id: str, sess, cache) -> tuple:
+    """报表年份的 Sharpe（取不到时为 None）"""
+    try:
+        years = get_yearly_stats(alpha_id, sess, cache)
+        return tuple(years.get(year, {}).get("sharpe") for year in sharpe_years)
+    except Exception as e:
+        print(f"获取 {alpha_id} 的 yearly-stats 失败: {e}")
+        return (None,) * len(sharpe_years)
+
 def get_alphas(start_date, end_date):
     s = login()
-    output = []
+    alphas = []
     # 3E large 3C less
     count = 0
     offset = 0
@@ -94,25 +131,7 @@ def get_alphas(start_date, end_date):
                 pyramid_items = alpha.get("pyramidThemes", {}).get("pyramids", [])
                 pyramids = [item.get("name", "").split("/")[-1] for item in pyramid_items]
                 
-                # 获取年化统计数据
-                try:
-                    yearly_url = f"https://api.worldquantbrain.com/alphas/{alpha_id}/recordsets/yearly-stats"
-                    yearly_response = wait_get(yearly_url, s)
-                    records = yearly_response.json().get("records", [])
-                    
-                    if len(records) == 13:
-                        sharp2022 = records[10][6] 
-                        sharp2023 = records[12][6] 
-                    else:
-                        sharp2022 = records[9][6] 
-                        sharp2023 = records[11][6] 
-                except Exception:
-                    sharp2022 = None
-                    sharp2023 = None
-                
-                temp = (alpha_id, date_submit, region, delay, tags, pyramids, sharp2022, sharp2023)
-                print(f"第{count}条数据：{temp}")
-                output.append(temp)
+                alphas.append((alpha_id, date_submit, region, delay, tags, pyramids))
             
             # 增加偏移量
             offset += 100
@@ -122,6 +141,17 @@ def get_alphas(start_date, end_date):
 
     print(f"总共查询到 {count} 条数据")
 
+    # 并发获取年度统计（已结束年份命中本地缓存的不再请求）
+    cache = get_result_cache()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        sharpes = list(executor.map(lambda alpha: get_sharpes(alpha[0], s, cache), alphas))
+
+    output = []
+    for i, (alpha, sharpe) in enumerate(zip(alphas, sharpes), 1):
+        temp = alpha + sharpe
+        print(f"第{i}条数据：{temp}")
+        output.append(temp)
+
     return output
 
 